@@ -6,11 +6,10 @@ Simple Python API Server for testing Supabase migration
 
 import traceback
 import sys
+import threading
 import logging
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from utils.conversation_manager import ConversationManager
-from utils.data_manager import DataManager
 import json
 import os
 from datetime import datetime
@@ -19,6 +18,31 @@ from utils.data_manager import data_manager
 # Load environment variables
 load_dotenv()
 
+# Shared ConversationManager - reuse Supabase client/connection pool across requests
+_conversation_manager = None
+_conversation_manager_lock = threading.Lock()
+
+def get_conversation_manager() -> 'ConversationManager':
+    """Get process-wide ConversationManager (created on first use)"""
+    global _conversation_manager
+    if _conversation_manager is None:
+        with _conversation_manager_lock:
+            if _conversation_manager is None:
+                # Import here: supabase client stack is only loaded by the first request that needs it
+                from utils.conversation_manager import ConversationManager
+                _conversation_manager = ConversationManager()
+    return _conversation_manager
+
+_run_log_repository = None
+
+def get_run_log_repository():
+    """Get process-wide RunLogRepository (created on first use)"""
+    global _run_log_repository
+    if _run_log_repository is None:
+        from database.run_log_repository import RunLogRepository
+        _run_log_repository = RunLogRepository()
+    return _run_log_repository
+
 app = Flask(__name__)
 CORS(app, origins=['http://localhost:3000', 'http://localhost:5173', 'https://quocan.click', 'https://api.quocan.click', 'https://quocan.click'], 
      methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
@@ -38,7 +62,7 @@ def debug_test_pair():
     """Debug endpoint to test pair creation directly"""
     try:
         # Test pair creation directly in server context
-        conversation_manager = ConversationManager()
+        conversation_manager = get_conversation_manager()
         pair_manager = conversation_manager.pair_manager
         
         # Test with simple devices
@@ -354,52 +378,39 @@ def pair_devices():
         random.shuffle(devices_copy)
         
         pairs = []
-        conversation_manager = ConversationManager()
+        conversation_manager = get_conversation_manager()
         pair_manager = conversation_manager.pair_manager
         
-        for i in range(0, len(devices_copy) - 1, 2):
-            if i + 1 < len(devices_copy):
-                device1 = devices_copy[i]
-                device2 = devices_copy[i + 1]
-                
-                # Extract device IDs from device objects (consistent with frontend logic)
-                def extract_device_id(device):
-                    """Extract device ID from device object, prioritizing ip, then device_id, then id"""
-                    if isinstance(device, dict):
-                        # Priority: ip > device_id > id > name
-                        return device.get('ip') or device.get('device_id') or device.get('id') or device.get('name') or 'unknown'
-                    else:
-                        # If it's already a string/number, use as-is
-                        return device
-                
-                device1_id = extract_device_id(device1)
-                device2_id = extract_device_id(device2)
-                
-                # Create standardized pair ID using utility function
-                from utils.pair_utils import generate_pair_id
-                pair_id = generate_pair_id(device1_id, device2_id)
-                
-                # Check if pair exists or create new one
-                try:
-                    pair = pair_manager.find_or_create_pair(device1_id, device2_id)
-                    # Always use standardized pair_id as the main ID
-                    pairs.append({
-                        'device1': device1,
-                        'device2': device2,
-                        'pair_id': pair_id,  # Use standardized ID
-                        'temp_pair_id': pair.temp_pair_id,
-                        'backend_id': pair.id  # Keep backend ID for reference
-                    })
-                except Exception as pair_error:
-                    print(f"Error creating pair: {pair_error}")
-                    # Fallback to simple pair creation
-                    pairs.append({
-                        'device1': device1,
-                        'device2': device2,
-                        'pair_id': pair_id,  # Use standardized ID
-                        'temp_pair_id': None,
-                        'backend_id': None
-                    })
+        # Extract device IDs from device objects (consistent with frontend logic)
+        def extract_device_id(device):
+            """Extract device ID from device object, prioritizing ip, then device_id, then id"""
+            if isinstance(device, dict):
+                # Priority: ip > device_id > id > name
+                return device.get('ip') or device.get('device_id') or device.get('id') or device.get('name') or 'unknown'
+            else:
+                # If it's already a string/number, use as-is
+                return device
+        
+        from utils.pair_utils import generate_pair_id
+        device_pairs = [(devices_copy[i], devices_copy[i + 1]) for i in range(0, len(devices_copy) - 1, 2)]
+        device_id_pairs = [(extract_device_id(d1), extract_device_id(d2)) for d1, d2 in device_pairs]
+        
+        # Resolve/create all pairs in one batch (cache hits cost no round-trip)
+        try:
+            resolved_pairs = pair_manager.find_or_create_pairs(device_id_pairs)
+        except Exception as pair_error:
+            print(f"Error creating pairs: {pair_error}")
+            resolved_pairs = [None] * len(device_pairs)
+        
+        for (device1, device2), (device1_id, device2_id), pair in zip(device_pairs, device_id_pairs, resolved_pairs):
+            # Always use standardized pair_id as the main ID
+            pairs.append({
+                'device1': device1,
+                'device2': device2,
+                'pair_id': generate_pair_id(device1_id, device2_id),  # Use standardized ID
+                'temp_pair_id': pair.temp_pair_id if pair else None,
+                'backend_id': pair.id if pair else None  # Keep backend ID for reference
+            })
         
         # If odd number of devices, last one remains unpaired
         unpaired = []
@@ -426,7 +437,7 @@ def pair_devices():
 def get_device_pairs():
     """Get all device pairs"""
     try:
-        conversation_manager = ConversationManager()
+        conversation_manager = get_conversation_manager()
         pairs = conversation_manager.list_device_pairs()
         return jsonify({
             'success': True,
@@ -472,7 +483,7 @@ def create_device_pair():
         from utils.pair_utils import generate_pair_id
         pair_id = generate_pair_id(device_a_id, device_b_id)
         
-        conversation_manager = ConversationManager()
+        conversation_manager = get_conversation_manager()
         pair_manager = conversation_manager.pair_manager
         
         # Check if pair already exists
@@ -531,7 +542,7 @@ def process_conversation_input():
                 'error': 'device_a, device_b, and conversation_data are required'
             }), 400
         
-        conversation_manager = ConversationManager()
+        conversation_manager = get_conversation_manager()
         result = conversation_manager.process_conversation_input(
             device_a, device_b, conversation_data
         )
@@ -578,7 +589,7 @@ def submit_demo_conversation_data():
         }
         
         # Process demo conversation with dummy device names
-        conversation_manager = ConversationManager()
+        conversation_manager = get_conversation_manager()
         result = conversation_manager.process_conversation_input(
             'demo_device_a', 'demo_device_b', api_format
         )
@@ -592,7 +603,7 @@ def submit_demo_conversation_data():
 def get_pair_by_id(pair_id):
     """Get device pair by ID (supports standardized pair_id, UUID and temp_pair_id)"""
     try:
-        conversation_manager = ConversationManager()
+        conversation_manager = get_conversation_manager()
         
         # First try to get pair by temp_pair_id if it looks like a temp_pair_id
         pair = None
@@ -668,7 +679,7 @@ def submit_conversation_data(pair_id):
         }
         
         # Get device info from pair_id (could be UUID or temp_pair_id)
-        conversation_manager = ConversationManager()
+        conversation_manager = get_conversation_manager()
         
         # First try to get pair by temp_pair_id if it looks like a temp_pair_id
         pair = None
@@ -705,7 +716,7 @@ def submit_conversation_data(pair_id):
 def get_latest_summary(pair_identifier):
     """Get latest summary for device pair (supports standardized pair_id, UUID and temp_pair_id)"""
     try:
-        conversation_manager = ConversationManager()
+        conversation_manager = get_conversation_manager()
         
         # Use the updated function that handles both standardized pair_id and temp_pair_id
         summary = conversation_manager.get_latest_summary_by_pair_id(pair_identifier)
@@ -729,7 +740,7 @@ def get_latest_summary(pair_identifier):
 def get_temporary_conversation(temp_conversation_id):
     """Get temporarily stored conversation content"""
     try:
-        conversation_manager = ConversationManager()
+        conversation_manager = get_conversation_manager()
         content = conversation_manager.get_temporary_content(temp_conversation_id)
         
         if content:
@@ -752,7 +763,7 @@ def get_temporary_conversation(temp_conversation_id):
 def delete_temporary_conversation(temp_conversation_id):
     """Delete temporarily stored conversation content"""
     try:
-        conversation_manager = ConversationManager()
+        conversation_manager = get_conversation_manager()
         success = conversation_manager.clear_temporary_content(temp_conversation_id)
         
         if success:
@@ -768,13 +779,181 @@ def delete_temporary_conversation(temp_conversation_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Run Logs Endpoints
+def _run_log_filters():
+    """Parse optional run log filters from query string"""
+    return {
+        'level': request.args.get('level') or None,
+        'pair_id': request.args.get('pair_id') or None,
+        'search_term': request.args.get('q') or None
+    }
+
+@app.route('/api/runs/<run_id>/logs', methods=['GET'])
+def get_run_logs(run_id):
+    """Get one page of run logs (keyset pagination by (ts, id))"""
+    try:
+        limit = int(request.args.get('limit', 500))
+        if limit <= 0:
+            return jsonify({'success': False, 'error': 'limit must be positive'}), 400
+        cursor = request.args.get('cursor') or None
+        order = request.args.get('order', 'asc')
+        
+        page = get_run_log_repository().get_run_logs_page(
+            run_id, page_size=limit, cursor=cursor,
+            ascending=(order != 'desc'), **_run_log_filters()
+        )
+        return jsonify({
+            'success': True,
+            'data': page['data'],
+            'next_cursor': page['next_cursor']
+        })
+    except ValueError as ve:
+        return jsonify({'success': False, 'error': str(ve)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/runs/<run_id>/logs/stream', methods=['GET'])
+def stream_run_logs(run_id):
+    """Stream all logs of a run as NDJSON, fetched page by page"""
+    try:
+        page_size = int(request.args.get('page_size', 1000))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'page_size must be an integer'}), 400
+    if page_size <= 0:
+        return jsonify({'success': False, 'error': 'page_size must be positive'}), 400
+    
+    filters = _run_log_filters()
+    repository = get_run_log_repository()
+    
+    def generate():
+        try:
+            for row in repository.iter_run_logs(run_id, page_size=page_size, **filters):
+                yield json.dumps(row, ensure_ascii=False, default=str) + '\n'
+        except Exception as e:
+            yield json.dumps({'error': str(e)}, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# Metrics Endpoints
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Step/RPC metrics in Prometheus text exposition format"""
+    from utils.metrics import render_prometheus
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/metrics/report', methods=['GET'])
+def get_metrics_report():
+    """JSON report of the current/last automation run (slowest steps, devices, selectors)"""
+    try:
+        from utils.metrics import build_run_report
+        top = min(int(request.args.get('top', 20)), 200)
+        return jsonify({'success': True, 'data': build_run_report(top=top)})
+    except ValueError as ve:
+        return jsonify({'success': False, 'error': str(ve)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/trace', methods=['GET'])
+def get_run_trace():
+    """Chrome trace JSON of the current/last run (open in chrome://tracing or Perfetto)"""
+    from utils.tracing import build_chrome_trace
+    response = jsonify(build_chrome_trace())
+    response.headers['Content-Disposition'] = 'attachment; filename=run.trace.json'
+    return response
+
+# Status Endpoints
+@app.route('/api/status', methods=['GET'])
+def get_status():
+    """In-memory status of all devices in the current run (no disk/DB read)"""
+    from utils.status_hub import get_status_hub
+    return jsonify({'success': True, 'data': get_status_hub().snapshot()})
+
+@app.route('/api/status/stream', methods=['GET'])
+def stream_status():
+    """Server-Sent Events: one snapshot, then a delta (changed devices only) per status change"""
+    from utils.status_hub import get_status_hub
+    hub = get_status_hub()
+    try:
+        keepalive = min(float(request.args.get('keepalive', 15)), 60.0)
+        last_version = int(request.headers.get('Last-Event-ID') or request.args.get('since') or -1)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'keepalive/since must be numbers'}), 400
+
+    def event(name, payload):
+        return f"id: {payload['version']}\nevent: {name}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+    def generate():
+        version = last_version
+        if version < 0:
+            # Client mới: gửi toàn bộ trạng thái trước
+            snapshot = hub.snapshot()
+            version = snapshot['version']
+            yield event('snapshot', snapshot)
+        else:
+            # Reconnect (EventSource gửi Last-Event-ID): chỉ gửi phần đã đổi
+            delta = hub.changes_since(version)
+            version = delta['version']
+            if delta['devices'] or delta.get('reset'):
+                yield event('delta', delta)
+        while True:
+            delta = hub.wait_for_change(version, timeout=keepalive)
+            if delta is None:
+                yield ": keepalive\n\n"
+                continue
+            version = delta['version']
+            yield event('delta', delta)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Profiler Endpoints
+@app.route('/api/profiler', methods=['GET', 'POST'])
+def profiler_control():
+    """Toggle the sampling profiler: POST {"action": "start"|"stop", "interval_ms", "mode"}"""
+    from utils.profiler import start_profiling, stop_profiling, get_profiler
+    try:
+        if request.method == 'GET':
+            profiler = get_profiler()
+            return jsonify({'success': True, 'data': profiler.summary() if profiler else {'running': False}})
+        
+        data = request.get_json(silent=True) or {}
+        action = data.get('action')
+        if action == 'start':
+            interval = float(data.get('interval_ms', 10)) / 1000.0
+            mode = data.get('mode', 'cpu')
+            if mode not in ('cpu', 'wall'):
+                return jsonify({'success': False, 'error': 'mode must be cpu or wall'}), 400
+            profiler = start_profiling(interval=interval, mode=mode)
+            return jsonify({'success': True, 'data': profiler.summary()})
+        if action == 'stop':
+            path = stop_profiling()
+            if not path:
+                return jsonify({'success': False, 'error': 'Profiler is not running'}), 400
+            return jsonify({'success': True, 'data': {'path': path, **get_profiler().summary()}})
+        return jsonify({'success': False, 'error': 'action must be start or stop'}), 400
+    except ValueError as ve:
+        return jsonify({'success': False, 'error': str(ve)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 if __name__ == '__main__':
     print("Starting API server...")
-    print(f"DataManager initialized successfully")
+    print("[INFO] DataManager / Supabase connect on first use")
     
     # Note: Auto-sync removed - use /api/sync-devices endpoint for manual sync
     print("[INFO] Auto-sync disabled - devices will be scanned on demand")
     
+    # Optional background log retention (archive + batched delete)
+    if os.getenv('LOG_RETENTION_ENABLED', '0').lower() in ('1', 'true', 'yes'):
+        from database.log_retention import start_retention_scheduler
+        start_retention_scheduler()
+        print("[INFO] Log retention scheduler started")
+    
+    # Warm the device pair index with one bulk query
+    get_conversation_manager().pair_manager.warm_pair_index()
+    
     print("[OK] API server ready!")
     # Enable debug mode to see error stack traces
     app.run(host='0.0.0.0', port=8001, debug=True, use_reloader=False)
\ No newline at end of file
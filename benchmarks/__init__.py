@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+Offline benchmarks cho automation Zalo (không cần điện thoại).
+
+    fake_device.py   - FakeU2Device: backend uiautomator2 giả lập + state machine màn hình
+    hierarchies/     - UI dump mẫu của các màn hình (home, recents, zalo_main, search, profile, chat)
+    bench_pairs.py   - chạy N cặp end-to-end, báo cáo tin nhắn/phút và latency từng bước
+
+    python -m benchmarks.bench_pairs --pairs 4 --messages 10
+"""
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: N cặp máy Zalo giả lập chạy end-to-end
+Chạy core1.run_zalo_automation (pair threads, barrier, sync message_id, flow,
+run_conversation) trên FakeU2Device thay vì điện thoại thật, rồi báo cáo
+throughput (tin nhắn/phút) và latency từng bước từ utils.metrics.
+
+Các sleep "giống người" trong flow (đợi app, smart delay, gõ phím) được nhân
+với --time-scale để một run chỉ mất vài chục giây; latency RPC của máy giả
+lập luôn là thời gian thật. So sánh kết quả giữa các commit với cùng tham số.
+
+Toàn bộ file tạm (conversations.json, phone_mapping.json, sync/barrier,
+status.json, metrics/traces) được ghi trong một thư mục làm việc riêng.
+
+Usage:
+    python -m benchmarks.bench_pairs --pairs 4 --messages 10
+    python -m benchmarks.bench_pairs --pairs 2 --latency 50 --jitter 20 --output bench.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# Log của automation chỉ hiện từ ERROR trong benchmark (override bằng env)
+os.environ.setdefault("AUTOMATION_LOG_LEVEL", "ERROR")
+# Máy giả lập: không tạo row runs / run_logs trên Supabase thật
+os.environ.setdefault("AUTOMATION_RUN_LOGS", "0")
+
+from benchmarks.fake_device import FakeU2Device, _real_sleep
+
+PHRASES = [
+    "Cậu đang làm gì đấy",
+    "Đang xem phim nè",
+    "Phim gì thế",
+    "Phim hài vui lắm",
+    "Cho tớ link đi",
+    "Xíu gửi nha",
+    "Tối nay đi ăn không",
+    "Ok hẹn 7h nhé",
+]
+
+
+def build_workload(pairs: int, messages: int):
+    """Tạo device_pairs, conversations và phone_mapping cho N cặp"""
+    device_pairs = []
+    phone_mapping = {}
+    conversations = []
+    for pair_index in range(1, pairs + 1):
+        ips = [f"10.77.{pair_index}.{n}" for n in (1, 2)]
+        device_pairs.append(({"ip": ips[0]}, {"ip": ips[1]}))
+        for n, ip in enumerate(ips, 1):
+            phone_mapping[f"{ip}:5555"] = f"09{pair_index:04d}{n:04d}"
+        conversations.append({
+            "group_id": pair_index,
+            "messages": [
+                {"device_role": "device_a" if i % 2 == 0 else "device_b",
+                 "content": f"{PHRASES[i % len(PHRASES)]} #{i + 1}"}
+                for i in range(messages)
+            ],
+        })
+    return device_pairs, conversations, phone_mapping
+
+
+def write_workdir(workdir: str, conversations: List[Dict[str, Any]], phone_mapping: Dict[str, str]):
+    with open(os.path.join(workdir, "conversations.json"), "w", encoding="utf-8") as f:
+        json.dump({"conversations": conversations}, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(workdir, "phone_mapping.json"), "w", encoding="utf-8") as f:
+        json.dump({"phone_mapping": phone_mapping}, f, ensure_ascii=False, indent=2)
+
+
+@contextlib.contextmanager
+def scaled_sleep(scale: float):
+    """Nhân mọi time.sleep trong process với scale (latency RPC giả lập không bị ảnh hưởng)"""
+    if scale == 1.0:
+        yield
+        return
+    time.sleep = lambda seconds: _real_sleep(max(0.0, seconds) * scale)
+    try:
+        yield
+    finally:
+        time.sleep = _real_sleep
+
+
+def make_device_factory(core1, make_backend):
+    """device_factory cho run_zalo_automation: core1.Device nối với backend giả lập
+
+    make_backend(device_id) trả về object thay cho uiautomator2 device
+    (FakeU2Device, benchmarks.replay_device.ReplayDevice...).
+    """
+    from utils.metrics import instrument_device, timed_step
+    from utils.session_recorder import record_device
+
+    class SimulatedDevice(core1.Device):
+        """core1.Device dùng máy giả lập thay cho uiautomator2"""
+
+        @timed_step("connect")
+        def connect(self):
+            backend = make_backend(self.device_id)
+            # Run giả lập cũng ghi session được (AUTOMATION_RECORD_SESSION=1)
+            self.d = instrument_device(record_device(backend, self.device_id), self.device_id)
+            info = self.d.info
+            self.screen_info = {
+                'width': info['displayWidth'],
+                'height': info['displayHeight'],
+                'density': info.get('displaySizeDpX', 411)
+            }
+            return True
+
+    return SimulatedDevice
+
+
+@contextlib.contextmanager
+def isolated_run(core1, workdir: str, time_scale: float, verbose: bool = False):
+    """Chạy automation trong workdir: status.json riêng, ẩn stdout của flow, scale time.sleep"""
+    previous_cwd = os.getcwd()
+    previous_status_file = os.environ.get("AUTOMATION_STATUS_FILE")
+    os.environ["AUTOMATION_STATUS_FILE"] = os.path.join(workdir, "status.json")
+    core1.PHONE_MAP.clear()
+    try:
+        os.chdir(workdir)
+        with contextlib.ExitStack() as stack:
+            if not verbose:
+                sink = stack.enter_context(open(os.devnull, "w", encoding="utf-8"))
+                stack.enter_context(contextlib.redirect_stdout(sink))
+            stack.enter_context(scaled_sleep(time_scale))
+            yield
+    finally:
+        os.chdir(previous_cwd)
+        if previous_status_file is None:
+            os.environ.pop("AUTOMATION_STATUS_FILE", None)
+        else:
+            os.environ["AUTOMATION_STATUS_FILE"] = previous_status_file
+
+
+def summarize(report: Dict[str, Any], backends: Dict[str, FakeU2Device], results: Dict[str, Any],
+              elapsed: float, expected: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    sent = sum(len(backend.sent_messages) for backend in backends.values())
+    rpc_calls = sum(sum(backend.rpc_counts.values()) for backend in backends.values())
+    return {
+        "options": options,
+        "elapsed_seconds": round(elapsed, 3),
+        "messages_expected": expected,
+        "messages_sent": sent,
+        "messages_per_minute": round(sent / elapsed * 60, 2) if elapsed else 0.0,
+        "rpc_calls": rpc_calls,
+        "rpc_per_message": round(rpc_calls / sent, 1) if sent else None,
+        "pair_status": {name: result.get("status") for name, result in (results or {}).items()},
+        "steps": report.get("slowest_steps", []),
+        "rpc_by_method": report.get("rpc_by_method", []),
+        "metrics_report": report,
+    }
+
+
+def print_summary(summary: Dict[str, Any]):
+    options = summary["options"]
+    print(f"\n=== Zalo simulated benchmark: {options['pairs']} pairs x {options['messages']} messages "
+          f"(latency {options['latency'] * 1000:.0f}±{options['jitter'] * 1000:.0f}ms, "
+          f"time scale {options['time_scale']}) ===")
+    print(f"Elapsed:     {summary['elapsed_seconds']:.1f}s")
+    print(f"Messages:    {summary['messages_sent']}/{summary['messages_expected']}")
+    print(f"Throughput:  {summary['messages_per_minute']:.1f} messages/min")
+    print(f"RPC calls:   {summary['rpc_calls']} ({summary['rpc_per_message']} per message)")
+    print(f"Pairs:       {summary['pair_status']}")
+    print_step_tables(summary)
+
+
+def print_step_tables(summary: Dict[str, Any]):
+    """Bảng latency theo step và theo RPC method từ metrics report"""
+    print(f"\n{'step':<22}{'count':>7}{'avg (s)':>10}{'max (s)':>10}{'total (s)':>11}")
+    for row in summary["steps"]:
+        print(f"{row['step']:<22}{row['count']:>7}{row['avg_seconds']:>10.3f}"
+              f"{row['max_seconds']:>10.3f}{row['total_seconds']:>11.3f}")
+    print(f"\n{'rpc':<22}{'count':>7}{'avg (s)':>10}{'max (s)':>10}{'total (s)':>11}")
+    for row in summary["rpc_by_method"][:10]:
+        print(f"{row['method']:<22}{row['count']:>7}{row['avg_seconds']:>10.3f}"
+              f"{row['max_seconds']:>10.3f}{row['total_seconds']:>11.3f}")
+
+
+def run_benchmark(pairs: int = 2, messages: int = 10, latency: float = 0.03, jitter: float = 0.01,
+                  dump_latency: float = 0.25, time_scale: float = 0.01, seed: Optional[int] = 1,
+                  verbose: bool = False, workdir: Optional[str] = None) -> Dict[str, Any]:
+    """Chạy benchmark và trả về summary (dict)"""
+    import core1
+    from utils.metrics import build_run_report
+
+    options = {"pairs": pairs, "messages": messages, "latency": latency, "jitter": jitter,
+               "dump_latency": dump_latency, "time_scale": time_scale, "seed": seed}
+    device_pairs, conversations, phone_mapping = build_workload(pairs, messages)
+
+    keep_workdir = workdir is not None
+    workdir = os.path.abspath(workdir) if workdir else tempfile.mkdtemp(prefix="zalo_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    write_workdir(workdir, conversations, phone_mapping)
+
+    backends: Dict[str, FakeU2Device] = {}
+
+    def make_backend(device_id: str) -> FakeU2Device:
+        device_seed = None if seed is None else seed + len(backends)
+        backend = backends[device_id] = FakeU2Device(
+            device_id, seed=device_seed, latency=latency, jitter=jitter,
+            rpc_latency={"dump_hierarchy": dump_latency}, time_scale=time_scale)
+        return backend
+
+    factory = make_device_factory(core1, make_backend)
+    try:
+        with isolated_run(core1, workdir, time_scale, verbose):
+            start = time.perf_counter()
+            results = core1.run_zalo_automation(device_pairs, conversations, phone_mapping,
+                                                device_factory=factory)
+            elapsed = time.perf_counter() - start
+        report = build_run_report()
+    finally:
+        if not keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return summarize(report, backends, results, elapsed, pairs * messages, options)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark core1 flow trên các cặp máy Zalo giả lập")
+    parser.add_argument("--pairs", type=int, default=2, help="Số cặp máy (mặc định: 2)")
+    parser.add_argument("--messages", type=int, default=10, help="Số tin nhắn mỗi cặp (mặc định: 10)")
+    parser.add_argument("--latency", type=float, default=30, help="Latency mỗi RPC, ms (mặc định: 30)")
+    parser.add_argument("--jitter", type=float, default=10, help="Jitter ± mỗi RPC, ms (mặc định: 10)")
+    parser.add_argument("--dump-latency", type=float, default=250, help="Latency dump_hierarchy, ms (mặc định: 250)")
+    parser.add_argument("--time-scale", type=float, default=0.01,
+                        help="Hệ số cho time.sleep và timeout của flow (mặc định: 0.01)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed cho jitter (mặc định: 1)")
+    parser.add_argument("--workdir", help="Giữ file của run trong thư mục này (mặc định: thư mục tạm)")
+    parser.add_argument("--output", help="Ghi summary JSON (kèm metrics report) ra file")
+    parser.add_argument("--verbose", action="store_true", help="Hiện output của flow")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_arguments(argv)
+    summary = run_benchmark(pairs=args.pairs, messages=args.messages, latency=args.latency / 1000,
+                            jitter=args.jitter / 1000, dump_latency=args.dump_latency / 1000,
+                            time_scale=args.time_scale, seed=args.seed, verbose=args.verbose,
+                            workdir=args.workdir)
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2, default=str)
+        print(f"\n📊 Summary: {args.output}")
+    # Thiếu tin nhắn = flow bị hỏng, không chỉ chậm
+    return 0 if summary["messages_sent"] >= summary["messages_expected"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Replay benchmark: chạy lại core1 flow trên các session đã ghi
+Mỗi session (utils.session_recorder, AUTOMATION_RECORD_SESSION=1) trở thành
+một ReplayDevice; các device được ghép cặp lại theo group đã ghi, conversation
+và số điện thoại đối tác lấy từ meta của session. Không cần điện thoại.
+
+Dùng để:
+  - regression: flow mới có còn đi đúng chuỗi RPC đã ghi không (matched /
+    fallback / unused cho từng device)
+  - performance: thời gian run với latency RPC thật đã ghi (--timing-scale 1)
+    so với thời gian lúc ghi, và bảng latency từng bước từ utils.metrics
+
+Usage:
+    AUTOMATION_RECORD_SESSION=1 python core1.py ...           # ghi trên máy thật
+    python -m benchmarks.bench_replay sessions/
+    python -m benchmarks.bench_replay a.session.jsonl.gz b.session.jsonl.gz --timing-scale 0.5
+"""
+
+import argparse
+import contextlib
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+os.environ.setdefault("AUTOMATION_LOG_LEVEL", "ERROR")
+# Máy giả lập: không tạo row runs / run_logs trên Supabase thật
+os.environ.setdefault("AUTOMATION_RUN_LOGS", "0")
+
+from benchmarks.bench_pairs import isolated_run, make_device_factory, print_step_tables
+from benchmarks.replay_device import DEFAULT_WINDOW, ReplayDevice
+from utils.friend_cache import FriendCache, pair_key
+from utils.selector_cache import SelectorResolver
+from utils.session_recorder import Session, load_session
+
+
+class _ReplayFriendCache(FriendCache):
+    """Friend cache chỉ đọc: đúng các cặp mà session đã ghi là lấy từ cache"""
+
+    def __init__(self, known_pairs: List[Tuple[Any, Any]]):
+        super().__init__(path=None)
+        for account_a, account_b in known_pairs:
+            key = pair_key(account_a, account_b)
+            if key:
+                self._pairs[key] = {"source": "replay", "hits": 0}
+
+    def mark_friends(self, account_a: Any, account_b: Any, source: str = "detected"):
+        pass
+
+    def forget(self, account_a: Any, account_b: Any) -> bool:
+        return False
+
+
+class _PairSelectorResolver(SelectorResolver):
+    """Selector học riêng theo cặp: lúc ghi các cặp chạy song song, cặp sau không thấy selector cặp trước đã học"""
+
+    def __init__(self, pair_of: Dict[str, int]):
+        super().__init__(path=None)
+        self._pair_of = pair_of
+
+    def device_context(self, dev) -> str:
+        context = super().device_context(dev)
+        pair = self._pair_of.get(getattr(dev, "device_id", None))
+        return context if pair is None else f"pair_{pair}|{context}"
+
+
+@contextlib.contextmanager
+def isolated_caches(pairs: List[List[Session]], phone_mapping: Dict[str, str]):
+    """Thay các cache học được dùng chung cả process bằng bản riêng của lần replay
+
+    Lúc ghi, friend_cache / selector_cache được điền theo thời gian thật của
+    từng máy; với --timing-scale 0 thứ tự giữa các máy khác đi nên máy này
+    học xong thì máy kia bỏ qua bước detect / đổi thứ tự selector -> lệch chuỗi
+    RPC đã ghi. Trong lúc replay:
+      - friend cache chỉ biết các cặp session ghi "friend_status" source=cache
+        và không học thêm
+      - selector học riêng theo cặp, không đọc / ghi file thật
+      - navigation stats (vốn theo từng device) bắt đầu trống, không ghi file
+    """
+    from utils import friend_cache, navigation_stats, selector_cache
+
+    known_pairs = []
+    for pair in pairs:
+        for session in pair:
+            status = session.meta.get("friend_status") or {}
+            if status.get("source") == "cache":
+                known_pairs.append((phone_mapping.get(session.device_id), session.meta.get("target_phone")))
+    pair_of = {session.device_id: index for index, pair in enumerate(pairs, 1) for session in pair}
+
+    previous = (friend_cache.ENABLED, friend_cache._cache, selector_cache._resolver, navigation_stats._stats)
+    friend_cache.ENABLED = True
+    friend_cache._cache = _ReplayFriendCache(known_pairs)
+    selector_cache._resolver = _PairSelectorResolver(pair_of)
+    navigation_stats._stats = navigation_stats.NavigationStats(path=None)
+    try:
+        yield
+    finally:
+        (friend_cache.ENABLED, friend_cache._cache,
+         selector_cache._resolver, navigation_stats._stats) = previous
+
+
+def find_sessions(paths: List[str]) -> List[str]:
+    """File session từ danh sách file/thư mục"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(sorted(glob.glob(os.path.join(path, "*.session.jsonl*"))))
+        else:
+            found.append(path)
+    return found
+
+
+def pair_sessions(sessions: List[Session]) -> List[List[Session]]:
+    """Ghép lại các cặp theo group đã ghi (meta conversation), còn lại ghép theo thứ tự"""
+    groups: Dict[Any, List[Session]] = defaultdict(list)
+    loose = []
+    for session in sessions:
+        conversation = session.meta.get("conversation")
+        if conversation and conversation.get("group_id") is not None:
+            groups[conversation["group_id"]].append(session)
+        else:
+            loose.append(session)
+    pairs = []
+    for group_id in sorted(groups, key=str):
+        members = sorted(groups[group_id], key=lambda s: s.meta["conversation"].get("role_in_group", 0))
+        pairs.append(members[:2])
+        loose.extend(members[2:])
+    pairs.extend(loose[i:i + 2] for i in range(0, len(loose), 2))
+    return [pair for pair in pairs if len(pair) == 2]
+
+
+def build_replay_workload(pairs: List[List[Session]]):
+    """device_pairs, conversation_data.json và phone_mapping từ meta của các session"""
+    device_pairs = []
+    conversation_data = {}
+    phone_mapping = {}
+    for pair_index, (first, second) in enumerate(pairs, 1):
+        device_pairs.append(({"ip": first.device_id}, {"ip": second.device_id}))
+        conversation = first.meta.get("conversation") or second.meta.get("conversation") or {}
+        conversation_data[f"pair_{pair_index}"] = {"conversation": conversation.get("messages", [])}
+        # flow tra số của đối tác qua PHONE_MAP[ip đối tác]
+        for session, partner in ((first, second), (second, first)):
+            if session.meta.get("target_phone"):
+                phone_mapping[partner.device_id] = session.meta["target_phone"]
+    return device_pairs, conversation_data, phone_mapping
+
+
+def run_replay(paths: List[str], timing_scale: float = 1.0, time_scale: float = 0.01,
+               window: int = DEFAULT_WINDOW, verbose: bool = False,
+               workdir: Optional[str] = None) -> Dict[str, Any]:
+    """Replay các session và trả về summary (dict)"""
+    import core1
+    from utils.metrics import build_run_report
+
+    sessions = [load_session(path) for path in find_sessions(paths)]
+    pairs = pair_sessions(sessions)
+    if not pairs:
+        raise ValueError("Cần ít nhất 2 session (một cặp) để replay")
+    device_pairs, conversation_data, phone_mapping = build_replay_workload(pairs)
+    by_device = {session.device_id: session for pair in pairs for session in pair}
+
+    keep_workdir = workdir is not None
+    workdir = os.path.abspath(workdir) if workdir else tempfile.mkdtemp(prefix="zalo_replay_")
+    os.makedirs(workdir, exist_ok=True)
+    with open(os.path.join(workdir, "conversation_data.json"), "w", encoding="utf-8") as f:
+        json.dump({"conversations": conversation_data}, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(workdir, "phone_mapping.json"), "w", encoding="utf-8") as f:
+        json.dump({"phone_mapping": phone_mapping}, f, ensure_ascii=False, indent=2)
+
+    devices: Dict[str, ReplayDevice] = {}
+
+    def make_backend(device_id: str) -> ReplayDevice:
+        device = devices[device_id] = ReplayDevice(by_device[device_id], timing_scale=timing_scale,
+                                                   time_scale=time_scale, window=window)
+        return device
+
+    factory = make_device_factory(core1, make_backend)
+    try:
+        with isolated_run(core1, workdir, time_scale, verbose), isolated_caches(pairs, phone_mapping):
+            start = time.perf_counter()
+            results = core1.run_zalo_automation(device_pairs, [], phone_mapping, device_factory=factory)
+            elapsed = time.perf_counter() - start
+        report = build_run_report()
+    finally:
+        if not keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    device_stats = [device.stats() for device in devices.values()]
+    recorded = max((stats["recorded_seconds"] for stats in device_stats), default=0.0)
+    return {
+        "options": {"sessions": len(sessions), "pairs": len(pairs), "timing_scale": timing_scale,
+                    "time_scale": time_scale, "window": window},
+        "elapsed_seconds": round(elapsed, 3),
+        "recorded_seconds": recorded,
+        "matched": sum(stats["matched"] for stats in device_stats),
+        "fallback": sum(stats["fallback"] for stats in device_stats),
+        "unused": sum(stats["unused"] for stats in device_stats),
+        "devices": device_stats,
+        "pair_status": {name: result.get("status") for name, result in (results or {}).items()},
+        "steps": report.get("slowest_steps", []),
+        "rpc_by_method": report.get("rpc_by_method", []),
+        "metrics_report": report,
+    }
+
+
+def print_summary(summary: Dict[str, Any]):
+    options = summary["options"]
+    print(f"\n=== Zalo session replay: {options['pairs']} pairs "
+          f"(timing scale {options['timing_scale']}, time scale {options['time_scale']}) ===")
+    print(f"Elapsed:     {summary['elapsed_seconds']:.1f}s (recorded: {summary['recorded_seconds']:.1f}s)")
+    print(f"RPC matched: {summary['matched']}, fallback: {summary['fallback']}, unused: {summary['unused']}")
+    print(f"Pairs:       {summary['pair_status']}")
+    print(f"\n{'device':<24}{'recorded':>10}{'matched':>9}{'fallback':>10}{'unused':>8}")
+    for stats in summary["devices"]:
+        print(f"{stats['device']:<24}{stats['recorded_rpcs']:>10}{stats['matched']:>9}"
+              f"{stats['fallback']:>10}{stats['unused']:>8}")
+        for divergence in stats["divergences"][:3]:
+            print(f"    ↳ diverged at #{divergence['at']}: {divergence['method']} {divergence['selector'] or ''}")
+    print_step_tables(summary)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Replay core1 flow trên các session đã ghi")
+    parser.add_argument("sessions", nargs="+", help="File session hoặc thư mục chứa *.session.jsonl.gz")
+    parser.add_argument("--timing-scale", type=float, default=1.0,
+                        help="Hệ số cho thời gian RPC đã ghi (mặc định: 1, 0 = không đợi)")
+    parser.add_argument("--time-scale", type=float, default=0.01,
+                        help="Hệ số cho time.sleep và timeout của flow (mặc định: 0.01)")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW,
+                        help=f"Số RPC tìm tiếp để khớp bản ghi (mặc định: {DEFAULT_WINDOW})")
+    parser.add_argument("--workdir", help="Giữ file của run trong thư mục này (mặc định: thư mục tạm)")
+    parser.add_argument("--output", help="Ghi summary JSON (kèm metrics report) ra file")
+    parser.add_argument("--verbose", action="store_true", help="Hiện output của flow")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_arguments(argv)
+    summary = run_replay(args.sessions, timing_scale=args.timing_scale, time_scale=args.time_scale,
+                         window=args.window, verbose=args.verbose, workdir=args.workdir)
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2, default=str)
+        print(f"\n📊 Summary: {args.output}")
+    # Flow lệch bản ghi, cặp không hoàn thành hay RPC đã ghi không được dùng = regression cần xem lại
+    failed_pairs = {name: status for name, status in summary["pair_status"].items() if status != "completed"}
+    if failed_pairs:
+        print(f"\n❌ Cặp không hoàn thành: {failed_pairs}")
+    if summary["unused"]:
+        print(f"❌ {summary['unused']} RPC đã ghi không được replay")
+    return 0 if summary["fallback"] == 0 and summary["unused"] == 0 and not failed_pairs else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
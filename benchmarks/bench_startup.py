@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: thời gian khởi động (import) của các entry point
+Mỗi target được import trong một process Python mới (không có cache module)
+với `-X importtime`, lặp --repeat lần, báo cáo:
+
+  - thời gian import (median / min) đo trong process con
+  - module tốn nhiều thời gian nhất (cumulative, từ -X importtime)
+  - backend lười (utils.lazy) đã bị khởi tạo ngay lúc import - mong đợi rỗng:
+    import core1 / api_server / main_gui không được kết nối Supabase hay
+    import uiautomator2
+
+Target thiếu dependency (flask, PyQt6...) được báo lỗi chứ không dừng cả
+benchmark. --history ghi thêm một dòng JSON mỗi lần chạy và so với lần trước
+để theo dõi thời gian khởi động qua các commit.
+
+Usage:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup core1 api_server --repeat 5 --history metrics_reports/startup.jsonl
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_TARGETS = ["core1", "api_server", "main_gui"]
+RESULT_MARKER = "__bench_startup__"
+
+# Chạy trong process con: đo import target, in kết quả JSON trên một dòng
+CHILD_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+error = None
+try:
+    import {target}
+except BaseException as e:
+    error = f"{{type(e).__name__}}: {{e}}"
+elapsed = time.perf_counter() - started
+initialized = []
+if "utils.lazy" in sys.modules:
+    initialized = sys.modules["utils.lazy"].initialized_objects()
+print("{marker}" + json.dumps({{"seconds": elapsed, "error": error, "initialized": initialized,
+                                "heavy": [m for m in ("uiautomator2", "supabase", "httpx") if m in sys.modules]}}))
+"""
+
+_IMPORTTIME = re.compile(r"^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)")
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """Các dòng -X importtime -> [{"module", "self_ms", "cumulative_ms", "depth"}]"""
+    rows = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append({"module": module, "self_ms": int(self_us) / 1000,
+                         "cumulative_ms": int(cumulative_us) / 1000, "depth": (len(indent) - 1) // 2})
+    return rows
+
+
+def target_tree(rows: List[Dict[str, Any]], target: str) -> List[Dict[str, Any]]:
+    """Các dòng thuộc cây import của target (importtime in con trước cha)"""
+    pending: List[Dict[str, Any]] = []
+    for row in rows:
+        pending.append(row)
+        if row["depth"] == 0:
+            if row["module"] == target:
+                return pending
+            pending = []
+    return []
+
+
+def measure_once(target: str, timeout: float = 120) -> Dict[str, Any]:
+    """Import target trong một process mới, trả kết quả + bảng importtime"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1", AUTOMATION_LOG_LEVEL="ERROR")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_ROOT, env.get("PYTHONPATH")]))
+    script = CHILD_SCRIPT.format(target=target, marker=RESULT_MARKER)
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", script], cwd=REPO_ROOT, env=env,
+                             capture_output=True, text=True, timeout=timeout)
+    wall = time.perf_counter() - started
+    result = {"seconds": None, "error": f"exit {process.returncode}", "initialized": [], "heavy": []}
+    for line in process.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            result = json.loads(line[len(RESULT_MARKER):])
+    result["wall_seconds"] = wall
+    result["imports"] = parse_importtime(process.stderr)
+    return result
+
+
+def measure(target: str, repeat: int = 3, top: int = 10) -> Dict[str, Any]:
+    """Đo target repeat lần; bảng module lấy từ lần chạy nhanh nhất"""
+    runs = [measure_once(target) for _ in range(max(1, repeat))]
+    ok_runs = [run for run in runs if run["error"] is None]
+    summary: Dict[str, Any] = {"target": target, "repeat": len(runs)}
+    if not ok_runs:
+        summary["error"] = runs[-1]["error"]
+        return summary
+    seconds = [run["seconds"] for run in ok_runs]
+    best = min(ok_runs, key=lambda run: run["seconds"])
+    # Module của target (không tính module khởi động của interpreter: site, encodings...)
+    own = [row for row in target_tree(best["imports"], target) if row["depth"] <= 2]
+    summary.update({
+        "error": None,
+        "median_seconds": round(statistics.median(seconds), 4),
+        "min_seconds": round(min(seconds), 4),
+        "wall_median_seconds": round(statistics.median(run["wall_seconds"] for run in ok_runs), 4),
+        "module_count": len(target_tree(best["imports"], target)),
+        "initialized_at_import": best["initialized"],
+        "heavy_modules_at_import": best["heavy"],
+        "top_modules": sorted(own, key=lambda row: -row["cumulative_ms"])[:top],
+    })
+    return summary
+
+
+def load_last_history(path: str) -> Optional[Dict[str, Any]]:
+    if not path or not os.path.exists(path):
+        return None
+    last = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                last = json.loads(line)
+    return last
+
+
+def append_history(path: str, results: List[Dict[str, Any]]):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    record = {"timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+              "targets": {r["target"]: {k: r.get(k) for k in ("median_seconds", "min_seconds", "error")}
+                          for r in results}}
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def print_results(results: List[Dict[str, Any]], previous: Optional[Dict[str, Any]] = None):
+    for result in results:
+        target = result["target"]
+        if result.get("error"):
+            print(f"\n❌ {target}: {result['error']}")
+            continue
+        line = f"\n🚀 {target}: median {result['median_seconds'] * 1000:.0f} ms, min {result['min_seconds'] * 1000:.0f} ms"
+        before = (previous or {}).get("targets", {}).get(target, {}).get("median_seconds")
+        if before:
+            line += f" (lần trước {before * 1000:.0f} ms, {result['median_seconds'] / before - 1:+.0%})"
+        print(line + f", {result['module_count']} module")
+        if result["initialized_at_import"]:
+            print(f"   ⚠️ Backend khởi tạo lúc import: {', '.join(result['initialized_at_import'])}")
+        if result["heavy_modules_at_import"]:
+            print(f"   ⚠️ Module nặng bị import: {', '.join(result['heavy_modules_at_import'])}")
+        print(f"   {'module':<40}{'cumulative (ms)':>16}{'self (ms)':>11}")
+        for row in result["top_modules"]:
+            name = "  " * row["depth"] + row["module"]
+            print(f"   {name:<40}{row['cumulative_ms']:>16.1f}{row['self_ms']:>11.1f}")
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark thời gian import các entry point")
+    parser.add_argument("targets", nargs="*", default=DEFAULT_TARGETS,
+                        help=f"Module cần đo (mặc định: {' '.join(DEFAULT_TARGETS)})")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần import mỗi target (mặc định: 3)")
+    parser.add_argument("--top", type=int, default=10, help="Số module chậm nhất hiển thị (mặc định: 10)")
+    parser.add_argument("--history", help="File JSONL: so với lần chạy trước rồi ghi thêm kết quả lần này")
+    parser.add_argument("--output", help="Ghi kết quả JSON ra file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_arguments(argv)
+    results = [measure(target, repeat=args.repeat, top=args.top) for target in args.targets]
+    previous = load_last_history(args.history) if args.history else None
+    print_results(results, previous)
+    if args.history:
+        append_history(args.history, results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n📊 Kết quả: {args.output}")
+    # Backend bị khởi tạo lúc import là regression của lazy init
+    return 1 if any(r.get("initialized_at_import") for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
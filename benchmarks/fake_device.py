@@ -0,0 +1,736 @@
+# -*- coding: utf-8 -*-
+"""
+Fake Zalo Device
+Backend giả lập uiautomator2 để chạy core1.flow() không cần điện thoại.
+
+Màn hình được dựng từ các UI dump mẫu trong benchmarks/hierarchies/*.xml
+(home, recents, zalo_main, search, profile, chat) và chuyển trạng thái bằng
+một state machine nhỏ: click/press/set_text/app_start thay đổi màn hình hiện
+tại giống như trên máy thật.
+
+Mỗi RPC (selector.exists, click, set_text, dump_hierarchy, info, press...)
+tốn latency + jitter cấu hình được. Các lần đợi element không tồn tại
+(exists(timeout=3), wait(timeout=...)) tốn timeout * time_scale, vì trạng
+thái của máy chỉ thay đổi qua chính các RPC của nó.
+
+Usage:
+    d = FakeU2Device("10.77.1.1:5555", latency=0.03, jitter=0.01)
+    d.app_start("com.zing.zalo")
+    d(resourceId="com.zing.zalo:id/action_bar_search_btn").click()
+"""
+
+import copy
+import os
+import random
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import Counter, namedtuple
+from typing import Any, Dict, List, Optional, Tuple
+
+HIERARCHY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hierarchies")
+ZALO_PKG = "com.zing.zalo"
+LAUNCHER_PKG = "com.sec.android.app.launcher"
+ZALO_LINK_PREFIX = "https://zalo.me/"
+ZALO_SCREENS = {"zalo_main", "search", "profile", "chat"}
+KEYCODES = {3: "home", 4: "back", 66: "enter", 84: "search", 187: "recent"}
+MAX_CHAT_BUBBLES = 30
+
+# Latency mặc định theo RPC (giây); RPC không có trong bảng dùng "default"
+DEFAULT_RPC_LATENCY = {"default": 0.03, "dump_hierarchy": 0.25, "screenshot": 0.2}
+
+# Chụp sleep gốc trước khi benchmark scale time.sleep: latency RPC luôn là thời gian thật
+_real_sleep = time.sleep
+
+ShellResponse = namedtuple("ShellResponse", ["output", "exit_code"])
+
+_SELECTOR_ATTRS = {
+    "text": "text",
+    "resourceId": "resource-id",
+    "className": "class",
+    "packageName": "package",
+    "description": "content-desc",
+}
+_BOOL_ATTRS = {
+    "clickable": "clickable",
+    "enabled": "enabled",
+    "focusable": "focusable",
+    "focused": "focused",
+    "scrollable": "scrollable",
+    "checkable": "checkable",
+    "checked": "checked",
+    "selected": "selected",
+    "longClickable": "long-clickable",
+}
+_BOUNDS_PATTERN = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+
+_templates: Dict[str, ET.Element] = {}
+_templates_lock = threading.Lock()
+
+
+class UiObjectNotFoundError(Exception):
+    """Giống uiautomator2.exceptions.UiObjectNotFoundError"""
+
+
+def load_hierarchy(screen: str) -> ET.Element:
+    """Bản sao hierarchy của màn hình (file XML chỉ được parse một lần)"""
+    with _templates_lock:
+        template = _templates.get(screen)
+        if template is None:
+            template = _templates[screen] = ET.parse(os.path.join(HIERARCHY_DIR, f"{screen}.xml")).getroot()
+    return copy.deepcopy(template)
+
+
+def _node(parent: ET.Element, **attrs) -> ET.Element:
+    """Thêm node con với các thuộc tính mặc định như uiautomator dump"""
+    values = {"index": str(len(parent)), "text": "", "resource-id": "", "class": "android.widget.TextView",
+              "package": ZALO_PKG, "content-desc": "", "checkable": "false", "checked": "false",
+              "clickable": "false", "enabled": "true", "focusable": "false", "focused": "false",
+              "scrollable": "false", "long-clickable": "false", "password": "false", "selected": "false",
+              "bounds": parent.get("bounds", "[0,0][0,0]")}
+    values.update(attrs)
+    return ET.SubElement(parent, "node", values)
+
+
+def _bounds(node: ET.Element) -> Tuple[int, int, int, int]:
+    match = _BOUNDS_PATTERN.match(node.get("bounds", ""))
+    return tuple(int(v) for v in match.groups()) if match else (0, 0, 0, 0)
+
+
+def match_selector(node: ET.Element, selector: Dict[str, Any]) -> bool:
+    """Kiểm tra node khớp selector kiểu uiautomator2 (text, resourceId, textContains...)"""
+    for key, value in selector.items():
+        if key == "instance":
+            continue
+        if key in _SELECTOR_ATTRS:
+            if node.get(_SELECTOR_ATTRS[key], "") != value:
+                return False
+        elif key in _BOOL_ATTRS:
+            if node.get(_BOOL_ATTRS[key], "false") != str(bool(value)).lower():
+                return False
+        else:
+            for suffix, test in (("Contains", lambda a, v: v in a),
+                                 ("StartsWith", lambda a, v: a.startswith(v)),
+                                 ("Matches", lambda a, v: re.fullmatch(v, a) is not None)):
+                base = key[:-len(suffix)]
+                if key.endswith(suffix) and base in _SELECTOR_ATTRS:
+                    if not test(node.get(_SELECTOR_ATTRS[base], ""), value):
+                        return False
+                    break
+            else:
+                return False  # selector không hỗ trợ -> không khớp
+    return True
+
+
+def query(root: ET.Element, chain: List[Dict[str, Any]]) -> List[ET.Element]:
+    """Các node khớp chuỗi selector [d(...), .child(...), ...] hoặc [{"xpath": expr}]"""
+    if chain and "xpath" in chain[0]:
+        expr = chain[0]["xpath"]
+        try:
+            return [n for n in root.iterfind("." + expr if expr.startswith("//") else expr) if n.tag == "node"]
+        except SyntaxError:
+            return []  # biểu thức ElementTree không hỗ trợ -> coi như không khớp
+    candidates = list(root.iter("node"))
+    for depth, selector in enumerate(chain):
+        found = [n for n in candidates if match_selector(n, selector)]
+        instance = selector.get("instance")
+        if instance is not None:
+            found = found[instance:instance + 1]
+        if depth == len(chain) - 1:
+            return found
+        if not found:
+            return []
+        anchor = found[0]
+        candidates = [n for n in anchor.iter("node") if n is not anchor]
+    return candidates
+
+
+def node_info(node: ET.Element) -> Dict[str, Any]:
+    left, top, right, bottom = _bounds(node)
+    bounds = {"left": left, "top": top, "right": right, "bottom": bottom}
+    return {
+        "bounds": bounds,
+        "visibleBounds": dict(bounds),
+        "childCount": len(node),
+        "className": node.get("class"),
+        "contentDescription": node.get("content-desc") or None,
+        "packageName": node.get("package"),
+        "resourceName": node.get("resource-id") or None,
+        "text": node.get("text", ""),
+        "checkable": node.get("checkable") == "true",
+        "checked": node.get("checked") == "true",
+        "clickable": node.get("clickable") == "true",
+        "enabled": node.get("enabled") == "true",
+        "focusable": node.get("focusable") == "true",
+        "focused": node.get("focused") == "true",
+        "longClickable": node.get("long-clickable") == "true",
+        "scrollable": node.get("scrollable") == "true",
+        "selected": node.get("selected") == "true",
+    }
+
+
+class ZaloScreenMachine:
+    """State machine của máy giả lập: launcher, recents và các màn hình Zalo
+
+    Không thread-safe; FakeU2Device giữ lock khi gọi vào.
+    """
+
+    def __init__(self, friends: bool = True):
+        self.friends = friends
+        self.zalo_running = False
+        self.stack: List[str] = []       # màn hình Zalo, phần tử cuối là màn hình đang mở
+        self.screen = "home"
+        self.root = load_hierarchy("home")
+        self.chat_title = ""
+        self.sent_messages: List[str] = []
+        self.friend_requests = 0
+        self._trees: Dict[str, ET.Element] = {}
+
+    # ---------------- Screens ----------------
+    def _show(self, screen: str):
+        self.screen = screen
+        if screen in ZALO_SCREENS:
+            tree = self._trees.get(screen)
+            if tree is None:
+                tree = self._trees[screen] = load_hierarchy(screen)
+            self.root = tree
+        else:
+            self.root = load_hierarchy(screen)
+            if screen == "recents" and not self.zalo_running:
+                self._remove(resource_id="com.sec.android.app.launcher:id/snapshot")
+
+    def _push(self, screen: str):
+        self.stack.append(screen)
+        self._show(screen)
+
+    def _open_chat(self, title: str):
+        """Mở chat với title; chat khác title thì tạo hội thoại mới"""
+        if title != self.chat_title:
+            self._trees.pop("chat", None)
+            self.chat_title = title
+        self._push("chat")
+        self.find(resource_id="com.zing.zalo:id/action_bar_title").set("text", title)
+
+    def _open_profile(self):
+        self._trees.pop("profile", None)
+        self._push("profile")
+        self.find(resource_id="com.zing.zalo:id/tv_profile_name").set("text", self.chat_title)
+        if self.friends:
+            self._remove(resource_id="com.zing.zalo:id/btn_send_friend_request")
+
+    def go_home(self):
+        self._show("home")
+
+    def back(self):
+        if self.screen in ZALO_SCREENS and self.stack:
+            self.stack.pop()
+            if self.stack:
+                self._show(self.stack[-1])
+                return
+        self.go_home()
+
+    def app_start(self, package: str):
+        if package != ZALO_PKG:
+            return
+        if not self.zalo_running or not self.stack:
+            self.zalo_running = True
+            self._trees.clear()
+            self.stack = []
+            self._push("zalo_main")
+        else:
+            self._show(self.stack[-1])
+
+    def open_link(self, url: str) -> bool:
+        """Deep link https://zalo.me/<sđt>: mở chat (đã là bạn) hoặc profile của đối tác"""
+        if not url.startswith(ZALO_LINK_PREFIX):
+            return False
+        title = url[len(ZALO_LINK_PREFIX):].strip("/")
+        self.app_start(ZALO_PKG)
+        if self.friends:
+            self._open_chat(title)
+        else:
+            self.chat_title = title
+            self._open_profile()
+        return True
+
+    def app_stop(self, package: str):
+        if package != ZALO_PKG:
+            return
+        self.zalo_running = False
+        self.stack = []
+        self._trees.clear()
+        self.chat_title = ""
+        if self.screen in ZALO_SCREENS:
+            self.go_home()
+
+    @property
+    def current_package(self) -> str:
+        return ZALO_PKG if self.screen in ZALO_SCREENS else LAUNCHER_PKG
+
+    # ---------------- Nodes ----------------
+    def nodes(self):
+        return self.root.iter("node")
+
+    def find(self, resource_id: str) -> Optional[ET.Element]:
+        for node in self.nodes():
+            if node.get("resource-id") == resource_id:
+                return node
+        return None
+
+    def _remove(self, resource_id: str):
+        for parent in self.root.iter():
+            for child in list(parent):
+                if child.get("resource-id") == resource_id:
+                    parent.remove(child)
+
+    def focused_input(self) -> Optional[ET.Element]:
+        if self.screen == "search":
+            return self.find("com.zing.zalo:id/search_src_text")
+        if self.screen == "chat":
+            return self.find("com.zing.zalo:id/chatinput_text")
+        return None
+
+    def hit_test(self, x: int, y: int) -> Optional[ET.Element]:
+        """Node clickable sâu nhất chứa điểm (x, y)"""
+        hit = None
+        for node in self.nodes():
+            left, top, right, bottom = _bounds(node)
+            if node.get("clickable") == "true" and left <= x < right and top <= y < bottom:
+                hit = node
+        return hit
+
+    # ---------------- Events ----------------
+    def click(self, node: ET.Element):
+        rid = node.get("resource-id", "")
+        text = node.get("text", "")
+
+        if rid == "com.android.systemui:id/recent_apps":
+            self._show("recents")
+        elif rid == "com.android.systemui:id/home":
+            self.go_home()
+        elif rid in ("com.android.systemui:id/back", "com.zing.zalo:id/action_bar_back_btn"):
+            self.back()
+        elif rid == "com.sec.android.app.launcher:id/clear_all":
+            self.app_stop(ZALO_PKG)
+            self.go_home()
+        elif rid == "com.sec.android.app.launcher:id/snapshot" or (self.screen == "home" and text == "Zalo"):
+            self.app_start(ZALO_PKG)
+        elif self.screen == "zalo_main" and (rid == "com.zing.zalo:id/action_bar_search_btn" or text == "Tìm kiếm"):
+            self._push("search")
+        elif rid == "com.zing.zalo:id/conversation_item":
+            title = next((n.get("text") for n in node.iter("node") if n.get("text")), "")
+            self._open_chat(title)
+        elif rid in ("com.zing.zalo:id/btn_search_result", "com.zing.zalo:id/search_result_item"):
+            title = self.find("com.zing.zalo:id/search_src_text").get("text", "")
+            if self.friends:
+                self._open_chat(title)
+            else:
+                self.chat_title = title
+                self._open_profile()
+        elif rid == "com.zing.zalo:id/action_bar_avatar":
+            self._open_profile()
+        elif rid == "com.zing.zalo:id/btn_send_friend_request":
+            self.friend_requests += 1
+            self.friends = True
+            self._remove(resource_id=rid)
+        elif rid == "com.zing.zalo:id/btn_send_message":
+            if len(self.stack) >= 2 and self.stack[-2] == "chat":
+                self.back()
+            else:
+                self.stack.pop()
+                self._open_chat(self.chat_title)
+        elif rid == "com.zing.zalo:id/new_chat_input_btn_chat_send":
+            self.send()
+
+    def press(self, key: str):
+        if key == "home":
+            self.go_home()
+        elif key == "back":
+            self.back()
+        elif key in ("recent", "recents"):
+            self._show("recents")
+        elif key == "enter" and self.screen == "chat":
+            self.send()
+        elif key == "search" and self.screen == "zalo_main":
+            self._push("search")
+
+    def set_text(self, node: ET.Element, text: str):
+        node.set("text", text)
+        if node.get("resource-id") == "com.zing.zalo:id/search_src_text":
+            self._update_search_results(text)
+
+    def _update_search_results(self, query: str):
+        """Zalo tìm kiếm ngay khi gõ: mỗi query khác rỗng có một kết quả"""
+        results = self.find("com.zing.zalo:id/search_result_list")
+        for child in list(results):
+            results.remove(child)
+        if not query:
+            return
+        row = _node(results, **{"resource-id": "com.zing.zalo:id/search_result_item",
+                                "class": "android.widget.FrameLayout", "clickable": "true",
+                                "focusable": "true", "bounds": "[0,231][1080,431]"})
+        _node(row, text=query, **{"resource-id": "com.zing.zalo:id/tv_search_title",
+                                  "bounds": "[200,260][880,330]"})
+        _node(row, text="Nhắn tin", **{"resource-id": "com.zing.zalo:id/btn_search_result",
+                                       "class": "android.widget.Button", "clickable": "true",
+                                       "focusable": "true", "bounds": "[880,271][1060,391]"})
+
+    def send(self):
+        """Gửi nội dung ô nhập: thêm bubble vào message_list và xóa ô nhập"""
+        edit = self.find("com.zing.zalo:id/chatinput_text")
+        text = edit.get("text", "") if edit is not None else ""
+        if not text:
+            return
+        messages = self.find("com.zing.zalo:id/message_list")
+        while len(messages) >= MAX_CHAT_BUBBLES:
+            messages.remove(messages[0])
+        _node(messages, text=text, **{"resource-id": "com.zing.zalo:id/chat_message_text",
+                                      "bounds": "[300,1700][1040,1800]"})
+        edit.set("text", "")
+        self.sent_messages.append(text)
+
+
+class _Exists:
+    """selector.exists: dùng như bool hoặc gọi exists(timeout=...) như uiautomator2"""
+
+    __slots__ = ("_selector",)
+
+    def __init__(self, selector: "FakeSelector"):
+        self._selector = selector
+
+    def __bool__(self):
+        return self._selector._exists_now()
+
+    def __call__(self, timeout: float = 0):
+        if timeout:
+            return self._selector.wait(timeout=timeout)
+        return self._selector._exists_now()
+
+
+class FakeSelector:
+    """Tương đương UiObject của uiautomator2 trên hierarchy giả lập"""
+
+    def __init__(self, device: "FakeU2Device", selector: Dict[str, Any], parent: Optional["FakeSelector"] = None):
+        self._device = device
+        self._selector = selector
+        self._parent = parent
+
+    def _all(self) -> List[ET.Element]:
+        machine = self._device.machine
+        if self._parent is not None:
+            anchor = self._parent._first()
+            if anchor is None:
+                return []
+            candidates = [n for n in anchor.iter("node") if n is not anchor]
+        else:
+            candidates = machine.nodes()
+        return [n for n in candidates if match_selector(n, self._selector)]
+
+    def _first(self) -> Optional[ET.Element]:
+        found = self._all()
+        instance = self._selector.get("instance", 0)
+        return found[instance] if instance < len(found) else None
+
+    def _require(self, timeout: Optional[float]) -> ET.Element:
+        node = self._first()
+        if node is None:
+            self._device._wait(self._device.wait_timeout if timeout is None else timeout)
+            raise UiObjectNotFoundError(f"UiObject not found: {self._selector}")
+        return node
+
+    def _exists_now(self) -> bool:
+        with self._device._rpc("exists"):
+            return self._first() is not None
+
+    @property
+    def exists(self) -> _Exists:
+        return _Exists(self)
+
+    def wait(self, exists: bool = True, timeout: Optional[float] = None) -> bool:
+        with self._device._rpc("wait"):
+            if (self._first() is not None) == exists:
+                return True
+        self._device._wait(self._device.wait_timeout if timeout is None else timeout)
+        return False
+
+    def wait_gone(self, timeout: Optional[float] = None) -> bool:
+        return self.wait(exists=False, timeout=timeout)
+
+    def click(self, timeout: Optional[float] = None, offset=None):
+        with self._device._rpc("click"):
+            self._device.machine.click(self._require(timeout))
+
+    def click_exists(self, timeout: float = 0) -> bool:
+        if self.exists(timeout=timeout):
+            self.click()
+            return True
+        return False
+
+    def long_click(self, duration: Optional[float] = None, timeout: Optional[float] = None):
+        self.click(timeout=timeout)
+
+    def set_text(self, text: str, timeout: Optional[float] = None):
+        with self._device._rpc("set_text"):
+            self._device.machine.set_text(self._require(timeout), text or "")
+
+    def clear_text(self, timeout: Optional[float] = None):
+        self.set_text("", timeout=timeout)
+
+    send_keys = set_text
+
+    def get_text(self, timeout: Optional[float] = None) -> str:
+        with self._device._rpc("get_text"):
+            return self._require(timeout).get("text", "")
+
+    @property
+    def info(self) -> Dict[str, Any]:
+        with self._device._rpc("info"):
+            return node_info(self._require(0))
+
+    @property
+    def count(self) -> int:
+        with self._device._rpc("count"):
+            return len(self._all())
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index: int) -> "FakeSelector":
+        return FakeSelector(self._device, {**self._selector, "instance": index}, self._parent)
+
+    def child(self, **kwargs) -> "FakeSelector":
+        return FakeSelector(self._device, kwargs, parent=self)
+
+    def center(self) -> Tuple[int, int]:
+        with self._device._rpc("info"):
+            left, top, right, bottom = _bounds(self._require(0))
+        return (left + right) // 2, (top + bottom) // 2
+
+
+class FakeXPathSelector:
+    """d.xpath(expr) cho các biểu thức đơn giản như //*[@text="Search"]"""
+
+    def __init__(self, device: "FakeU2Device", xpath: str):
+        self._device = device
+        self._xpath = xpath
+
+    def _first(self) -> Optional[ET.Element]:
+        found = query(self._device.machine.root, [{"xpath": self._xpath}])
+        return found[0] if found else None
+
+    @property
+    def exists(self) -> bool:
+        with self._device._rpc("xpath.exists"):
+            return self._first() is not None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        with self._device._rpc("xpath.wait"):
+            if self._first() is not None:
+                return True
+        self._device._wait(self._device.wait_timeout if timeout is None else timeout)
+        return False
+
+    def click(self, timeout: Optional[float] = None):
+        with self._device._rpc("xpath.click"):
+            node = self._first()
+            if node is None:
+                raise UiObjectNotFoundError(f"XPath not found: {self._xpath}")
+            self._device.machine.click(node)
+
+    def click_exists(self, timeout: float = 0) -> bool:
+        if self.wait(timeout=timeout):
+            self.click()
+            return True
+        return False
+
+    def get_text(self) -> str:
+        with self._device._rpc("xpath.get_text"):
+            node = self._first()
+            return node.get("text", "") if node is not None else ""
+
+
+class _RpcCall:
+    """Context manager cho một RPC: giữ lock của máy và tốn latency + jitter"""
+
+    __slots__ = ("_device", "_method")
+
+    def __init__(self, device: "FakeU2Device", method: str):
+        self._device = device
+        self._method = method
+
+    def __enter__(self):
+        device = self._device
+        device._lock.acquire()
+        device.rpc_counts[self._method] += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        device = self._device
+        device._lock.release()
+        base = device.rpc_latency.get(self._method, device.rpc_latency["default"])
+        delay = base + device._random.uniform(-device.jitter, device.jitter)
+        if delay > 0:
+            _real_sleep(delay)
+        return False
+
+
+class FakeU2Device:
+    """Máy Zalo giả lập với API giống uiautomator2.Device
+
+    Args:
+        serial: device id (IP:port)
+        latency: latency mặc định mỗi RPC (giây)
+        jitter: dao động ngẫu nhiên ±jitter cho mỗi RPC (giây)
+        rpc_latency: override latency theo RPC, ví dụ {"dump_hierarchy": 0.3}
+        time_scale: hệ số cho các lần đợi (timeout, app cold start)
+        app_start_seconds: thời gian cold start của Zalo trước khi scale
+        friends: True nếu đối tác đã là bạn (kết quả tìm kiếm mở thẳng chat)
+        battery_level: % pin trả về trong dumpsys battery (không sạc)
+        seed: seed cho jitter để các lần chạy lặp lại được
+    """
+
+    def __init__(self, serial: str = "emulator-5554", latency: float = 0.03, jitter: float = 0.01,
+                 rpc_latency: Optional[Dict[str, float]] = None, time_scale: float = 1.0,
+                 app_start_seconds: float = 1.5, friends: bool = True, battery_level: int = 100,
+                 seed: Optional[int] = None):
+        self.serial = serial
+        self.jitter = jitter
+        self.rpc_latency = dict(DEFAULT_RPC_LATENCY)
+        self.rpc_latency["default"] = latency
+        self.rpc_latency.update(rpc_latency or {})
+        self.time_scale = time_scale
+        self.app_start_seconds = app_start_seconds
+        self.battery_level = battery_level
+        self.wait_timeout = 20.0
+        self.machine = ZaloScreenMachine(friends=friends)
+        self.rpc_counts: Counter = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+
+    def _rpc(self, method: str) -> _RpcCall:
+        return _RpcCall(self, method)
+
+    def _wait(self, seconds: float):
+        if seconds and seconds > 0:
+            _real_sleep(seconds * self.time_scale)
+
+    @property
+    def sent_messages(self) -> List[str]:
+        return list(self.machine.sent_messages)
+
+    # ---------------- Selectors ----------------
+    def __call__(self, **kwargs) -> FakeSelector:
+        return FakeSelector(self, kwargs)
+
+    def xpath(self, xpath: str) -> FakeXPathSelector:
+        return FakeXPathSelector(self, xpath)
+
+    # ---------------- Device RPCs ----------------
+    @property
+    def info(self) -> Dict[str, Any]:
+        with self._rpc("info"):
+            return {
+                "currentPackageName": self.machine.current_package,
+                "displayHeight": 2220,
+                "displayWidth": 1080,
+                "displayRotation": 0,
+                "displaySizeDpX": 411,
+                "displaySizeDpY": 845,
+                "naturalOrientation": True,
+                "productName": "zalo_sim",
+                "screenOn": True,
+                "sdkInt": 30,
+                "inputMethodShown": self.machine.focused_input() is not None,
+            }
+
+    def dump_hierarchy(self, compressed: bool = False, pretty: bool = False, max_depth: Optional[int] = None) -> str:
+        with self._rpc("dump_hierarchy"):
+            body = ET.tostring(self.machine.root, encoding="unicode")
+        return "<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>\n" + body
+
+    def press(self, key, meta=None):
+        with self._rpc("press"):
+            self.machine.press(KEYCODES.get(key, key) if isinstance(key, int) else str(key).lower())
+        return True
+
+    def click(self, x: int, y: int):
+        with self._rpc("click"):
+            node = self.machine.hit_test(int(x), int(y))
+            if node is not None:
+                self.machine.click(node)
+
+    def swipe(self, fx, fy, tx, ty, duration: Optional[float] = None, steps: Optional[int] = None):
+        with self._rpc("swipe"):
+            pass
+
+    def send_keys(self, text: str, clear: bool = False):
+        with self._rpc("send_keys"):
+            node = self.machine.focused_input()
+            if node is not None:
+                current = "" if clear else node.get("text", "")
+                self.machine.set_text(node, current + text)
+
+    def app_start(self, package_name: str, activity: Optional[str] = None, wait: bool = False, stop: bool = False):
+        with self._rpc("app_start"):
+            if stop:
+                self.machine.app_stop(package_name)
+            cold = package_name == ZALO_PKG and not self.machine.zalo_running
+            self.machine.app_start(package_name)
+        if cold:
+            self._wait(self.app_start_seconds)
+
+    def app_stop(self, package_name: str):
+        with self._rpc("app_stop"):
+            self.machine.app_stop(package_name)
+
+    def screen_on(self):
+        with self._rpc("screen_on"):
+            pass
+
+    def unlock(self):
+        with self._rpc("unlock"):
+            pass
+
+    def app_current(self) -> Dict[str, str]:
+        with self._rpc("app_current"):
+            return {"package": self.machine.current_package, "activity": f".{self.machine.screen}"}
+
+    def screenshot(self, filename: Optional[str] = None, format: str = "pillow"):
+        with self._rpc("screenshot"):
+            # format="raw" trả về bytes PNG như uiautomator2 (ảnh rỗng, chỉ header)
+            return b"\x89PNG\r\n\x1a\n" if format == "raw" else None
+
+    def shell(self, cmdargs, timeout: float = 60) -> ShellResponse:
+        """Hỗ trợ các lệnh automation dùng (nối bằng ';' trong một lần gọi): am force-stop <pkg>,
+        am kill-all, am start -a VIEW -d <zalo.me link>, input keyevent <code>, echo <text>,
+        dumpsys battery, dumpsys window policy"""
+        command = cmdargs if isinstance(cmdargs, str) else " ".join(cmdargs)
+        output = []
+        cold = False
+        with self._rpc("shell"):
+            for part in command.split(";"):
+                parts = part.split()
+                if parts[:2] == ["am", "force-stop"] and len(parts) > 2:
+                    self.machine.app_stop(parts[2])
+                elif parts[:2] == ["am", "start"] and "-d" in parts:
+                    url = parts[parts.index("-d") + 1] if parts.index("-d") + 1 < len(parts) else ""
+                    was_running = self.machine.zalo_running
+                    if self.machine.open_link(url):
+                        cold = cold or not was_running
+                        output.append(f"Starting: Intent {{ act=android.intent.action.VIEW dat={url} }}\nStatus: ok\n")
+                    else:
+                        output.append("Error: Activity not started, unable to resolve Intent\n")
+                elif parts[:2] == ["input", "keyevent"] and len(parts) > 2 and parts[2].isdigit():
+                    self.machine.press(KEYCODES.get(int(parts[2]), parts[2]))
+                elif parts[:2] == ["dumpsys", "battery"]:
+                    output.append(f"Current Battery Service state:\n  AC powered: false\n  USB powered: false\n"
+                                  f"  level: {self.battery_level}\n")
+                elif parts[:3] == ["dumpsys", "window", "policy"]:
+                    output.append("    KeyguardServiceDelegate\n      showing=false\n")
+                elif parts[:1] == ["echo"]:
+                    output.append(" ".join(parts[1:]) + "\n")
+                # am kill-all: chỉ dừng process nền, máy giả lập không có
+        if cold:
+            self._wait(self.app_start_seconds)
+        return ShellResponse("".join(output), 0)
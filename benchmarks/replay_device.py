@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Replay Device
+Phát lại một session đã ghi bằng utils.session_recorder như một uiautomator2
+device, để chạy core1.flow() không cần điện thoại (regression + performance).
+
+Mỗi RPC của flow được khớp với RPC kế tiếp trong bản ghi có cùng method và
+chuỗi selector (tìm tiến trong một cửa sổ từ vị trí hiện tại). Khi khớp: đợi
+đúng thời gian đã ghi (nhân --timing-scale), trả response/exception đã ghi.
+
+Khi flow đã rẽ khác bản ghi (selector mới, thứ tự khác), response được tính
+từ UI hierarchy mới nhất đã ghi: exists/wait/info/get_text đánh giá selector
+trên snapshot, thao tác (click, set_text, press...) là no-op. Số RPC khớp /
+fallback cho biết flow mới lệch bản ghi bao nhiêu.
+
+Usage:
+    from utils.session_recorder import load_session
+    d = ReplayDevice(load_session("sessions/10_0_0_1_5555_20240101_120000.session.jsonl.gz"))
+    d(resourceId="com.zing.zalo:id/action_bar_search_btn").click()
+"""
+
+import json
+import threading
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from typing import Any, Dict, List, Optional
+
+from benchmarks.fake_device import ShellResponse, UiObjectNotFoundError, _real_sleep, node_info, query
+from utils.session_recorder import Session
+
+# namedtuple đã ghi ({"__type__": ...}) -> class dựng lại khi replay
+RECORDED_TYPES = {"ShellResponse": ShellResponse}
+DEFAULT_WINDOW = 200
+MAX_DIVERGENCES = 50
+# RPC chỉ đọc: khi lệch bản ghi thì đánh giá trên snapshot, còn lại là no-op
+_SELECTOR_READS = {"exists", "wait", "wait_gone", "info", "count", "get_text", "click_exists"}
+# Method của uiautomator2.Device; tên khác (vd. d.enter) phải lỗi AttributeError như máy thật
+DEVICE_METHODS = {"dump_hierarchy", "press", "click", "double_click", "long_click", "swipe", "drag",
+                  "send_keys", "clear_text", "app_start", "app_stop", "app_current", "app_clear",
+                  "screenshot", "shell", "keyevent", "screen_on", "screen_off", "unlock",
+                  "window_size", "set_fastinput_ime", "implicitly_wait"}
+# Property của uiautomator2.Device mà việc đọc là một RPC (ghi như method không selector)
+DEVICE_PROPERTIES = {"device_info", "wlan_ip", "orientation", "clipboard"}
+
+
+def _normalize(value: Any) -> Any:
+    """Cùng dạng JSON như lúc ghi để so sánh selector/args"""
+    return json.loads(json.dumps(value, ensure_ascii=False, default=repr))
+
+
+class _ReplayExists:
+    """selector.exists khi replay: dùng như bool hoặc gọi exists(timeout=...)"""
+
+    __slots__ = ("_selector",)
+
+    def __init__(self, selector: "ReplaySelector"):
+        self._selector = selector
+
+    def __bool__(self):
+        return bool(self._selector._call("exists"))
+
+    def __call__(self, *args, **kwargs):
+        return self._selector._call("exists", args, kwargs)
+
+
+class ReplaySelector:
+    """UiObject / XPathSelector trả lời từ session đã ghi"""
+
+    def __init__(self, device: "ReplayDevice", chain: List[Dict[str, Any]]):
+        self._device = device
+        self._chain = chain
+
+    def _call(self, name: str, args=(), kwargs=None):
+        return self._device._replay(f"selector.{name}", self._chain, args, kwargs or {})
+
+    @property
+    def exists(self) -> _ReplayExists:
+        return _ReplayExists(self)
+
+    @property
+    def info(self) -> Dict[str, Any]:
+        return self._call("info")
+
+    @property
+    def count(self) -> int:
+        return self._call("count")
+
+    def __len__(self):
+        return self._call("count")
+
+    def child(self, **kwargs) -> "ReplaySelector":
+        return ReplaySelector(self._device, self._chain + [_normalize(kwargs)])
+
+    def __getitem__(self, index: int) -> "ReplaySelector":
+        last = dict(self._chain[-1]) if self._chain else {}
+        last["instance"] = index
+        return ReplaySelector(self._device, self._chain[:-1] + [last])
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self._call(name, args, kwargs)
+
+
+class ReplayDevice:
+    """uiautomator2.Device phát lại từ một Session"""
+
+    def __init__(self, session: Session, timing_scale: float = 1.0, time_scale: float = 1.0,
+                 window: int = DEFAULT_WINDOW, fallback_latency: float = 0.0):
+        self.session = session
+        self.serial = session.device_id
+        self.timing_scale = timing_scale
+        self.time_scale = time_scale
+        self.window = window
+        self.fallback_latency = fallback_latency
+        self.wait_timeout = 20
+        self.matched = 0
+        self.fallback = 0
+        self.divergences: List[Dict[str, Any]] = []
+        self._cursor = 0
+        self._snapshot_id = session.snapshot_at[0] if session.snapshot_at else None
+        self._roots: Dict[str, ET.Element] = {}
+        self._methods = DEVICE_METHODS | {r["method"] for r in session.rpcs if "selector" not in r}
+        self._last_info = next((r["result"] for r in session.rpcs
+                                if r["method"] == "info" and isinstance(r.get("result"), dict)), None)
+        self._lock = threading.Lock()
+
+    # --- khớp bản ghi ---
+
+    def _find(self, method: str, chain: Optional[List[Dict[str, Any]]]) -> Optional[int]:
+        rpcs = self.session.rpcs
+        for index in range(self._cursor, min(len(rpcs), self._cursor + self.window)):
+            record = rpcs[index]
+            if record["method"] == method and record.get("selector") == chain:
+                return index
+        return None
+
+    def _replay(self, method: str, chain: Optional[List[Dict[str, Any]]], args, kwargs):
+        with self._lock:
+            index = self._find(method, chain)
+            if index is None:
+                self.fallback += 1
+                if len(self.divergences) < MAX_DIVERGENCES:
+                    self.divergences.append({"at": self._cursor, "method": method, "selector": chain})
+                record = None
+            else:
+                self.matched += 1
+                self._cursor = index + 1
+                record = self.session.rpcs[index]
+                latest = self.session.snapshot_at[index + 1] if index + 1 < len(self.session.rpcs) else None
+                result = record.get("result")
+                if isinstance(result, dict) and "$snapshot" in result:
+                    latest = result["$snapshot"]
+                latest = record.get("after") or latest
+                if latest:
+                    self._snapshot_id = latest
+
+        if record is None:
+            if self.fallback_latency:
+                _real_sleep(self.fallback_latency)
+            return self._evaluate(method, chain, args, kwargs)
+
+        if self.timing_scale:
+            _real_sleep(record.get("dur", 0.0) * self.timing_scale)
+        if "error" in record:
+            message = record.get("message", "")
+            if record["error"] == "UiObjectNotFoundError":
+                raise UiObjectNotFoundError(message)
+            if record["error"] == "AttributeError":
+                raise AttributeError(message)
+            raise RuntimeError(f"{record['error']}: {message}")
+        result = self._decode(record.get("result"))
+        if method == "shell" and isinstance(result, list) and len(result) == 2:
+            # Session ghi trước khi có "__type__": ShellResponse bị lưu thành list
+            result = ShellResponse(*result)
+        return result
+
+    def _decode(self, result: Any) -> Any:
+        if isinstance(result, dict):
+            if "$snapshot" in result:
+                return self.session.snapshots.get(result["$snapshot"], "")
+            if "$repr" in result or "$bytes" in result:
+                return None
+            if "__type__" in result:
+                fields = {k: self._decode(v) for k, v in result.items() if k != "__type__"}
+                cls = RECORDED_TYPES.get(result["__type__"])
+                if cls is None:
+                    cls = namedtuple(result["__type__"], list(fields))
+                return cls(**fields)
+            return {k: self._decode(v) for k, v in result.items()}
+        if isinstance(result, list):
+            return [self._decode(v) for v in result]
+        return result
+
+    # --- fallback trên snapshot ---
+
+    def _root(self) -> Optional[ET.Element]:
+        if not self._snapshot_id:
+            return None
+        root = self._roots.get(self._snapshot_id)
+        if root is None:
+            xml = self.session.snapshots.get(self._snapshot_id)
+            if xml is None:
+                return None
+            root = self._roots[self._snapshot_id] = ET.fromstring(xml)
+        return root
+
+    def _wait(self, timeout: Optional[float]):
+        # Hierarchy không đổi khi lệch bản ghi -> đợi hết timeout (đã scale)
+        timeout = self.wait_timeout if timeout is None else timeout
+        if timeout and self.time_scale:
+            _real_sleep(float(timeout) * self.time_scale)
+
+    def _evaluate(self, method: str, chain, args, kwargs):
+        if chain is None:
+            if method == "dump_hierarchy":
+                return self.session.snapshots.get(self._snapshot_id, "<hierarchy/>")
+            if method == "info":
+                return dict(self._last_info or {})
+            return None
+
+        root = self._root()
+        found = query(root, chain) if root is not None else []
+        name = method.rsplit(".", 1)[-1]
+        timeout = kwargs.get("timeout", args[0] if args and name in ("exists", "click_exists") else None)
+        if name == "count":
+            return len(found)
+        if name in ("exists", "click_exists"):
+            if not found and timeout:
+                self._wait(timeout)
+            return bool(found)
+        if name == "wait":
+            expected = kwargs.get("exists", True)
+            if bool(found) != expected:
+                self._wait(timeout)
+                return False
+            return True
+        if name == "wait_gone":
+            if found:
+                self._wait(timeout)
+                return False
+            return True
+        if not found:
+            if name not in _SELECTOR_READS:
+                self._wait(timeout)
+            raise UiObjectNotFoundError(f"UiObject not found (replay): {chain}")
+        if name == "info":
+            return node_info(found[0])
+        if name == "get_text":
+            return found[0].get("text", "")
+        return None
+
+    # --- API uiautomator2 ---
+
+    def __call__(self, **kwargs) -> ReplaySelector:
+        return ReplaySelector(self, [_normalize(kwargs)])
+
+    def xpath(self, xpath: str, *args, **kwargs) -> ReplaySelector:
+        return ReplaySelector(self, [{"xpath": xpath}])
+
+    @property
+    def info(self) -> Dict[str, Any]:
+        return self._replay("info", None, (), {})
+
+    def __getattr__(self, name):
+        if name in DEVICE_PROPERTIES and name in self._methods:
+            return self._replay(name, None, (), {})
+        if name.startswith("_") or name not in self._methods:
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self._replay(name, None, args, kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        rpcs = self.session.rpcs
+        return {
+            "device": self.serial,
+            "recorded_rpcs": len(rpcs),
+            "recorded_seconds": round(rpcs[-1]["t"] + rpcs[-1].get("dur", 0.0), 3) if rpcs else 0.0,
+            "matched": self.matched,
+            "fallback": self.fallback,
+            "unused": len(rpcs) - self.matched,
+            "divergences": self.divergences[:20],
+        }
@@ -8,9 +8,18 @@ Chứa các core modules cho Android Automation GUI
 __version__ = "1.0.0"
 __author__ = "Android Automation Team"
 
-from .device_manager import DeviceManager, Device, DeviceWorker
-from .flow_manager import FlowManager, FlowExecutionHandler
-from .config_manager import ConfigManager
+import importlib
+
+# Import lười (PEP 562): core.device_lifecycle dùng được từ CLI (core1.py) mà
+# không kéo PyQt6/watchdog của các manager GUI vào
+_EXPORTS = {
+    'DeviceManager': '.device_manager',
+    'Device': '.device_manager',
+    'DeviceWorker': '.device_manager',
+    'FlowManager': '.flow_manager',
+    'FlowExecutionHandler': '.flow_manager',
+    'ConfigManager': '.config_manager',
+}
 
 __all__ = [
     'DeviceManager',
@@ -19,4 +28,17 @@ __all__ = [
     'FlowManager',
     'FlowExecutionHandler',
     'ConfigManager'
-]
\ No newline at end of file
+]
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
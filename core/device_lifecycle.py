@@ -4,15 +4,43 @@ Device Lifecycle Management
 
 Xử lý vòng đời uiautomator2 để tránh lỗi "UiAutomationService already registered"
 Theo task T1 trong task.md
+
+Agent được coi là sẵn sàng khi HTTP endpoint /version của atx-agent (port
+7912) trả lời - không parse netstat. Agent đang khỏe thì không kill/restart.
+prepare_devices() chuẩn bị nhiều device song song (pool có giới hạn) và báo
+từng device ngay khi xong; core1.run_zalo_automation gọi trước preflight khi
+bật AUTOMATION_PREPARE_DEVICES=1 (mặc định tắt).
+
+uiautomator2 3.x chạy không cần atx-agent (và xóa /data/local/tmp/atx-agent),
+nên host dùng uiautomator2 3.x hoặc device không có binary atx-agent thì
+không kill/restart gì cả - việc
+device có dùng được hay không do preflight (check rpc) quyết định.
+
+Port adb forward (device USB) được cache theo serial và bị bỏ khi probe
+thất bại (adb restart / cắm lại device làm forward cũ mất hiệu lực).
 """
 
+import os
 import time
 import subprocess
 import logging
-from typing import Optional
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Optional
 
 logger = logging.getLogger(__name__)
 
+ATX_AGENT_PORT = 7912
+ATX_AGENT_BIN = "/data/local/tmp/atx-agent"
+PROBE_TIMEOUT = 1.0
+DEFAULT_WORKERS = int(os.environ.get("AUTOMATION_PREPARE_WORKERS", "8"))
+ENABLED = os.environ.get("AUTOMATION_PREPARE_DEVICES", "0").lower() not in ("0", "false", "no")
+
+# serial -> local port đã adb forward tới 7912 (device USB)
+_forwarded_ports: Dict[str, int] = {}
+_forward_lock = threading.Lock()
+
 def adb_s(serial: str, command: str) -> str:
     """Execute ADB command for specific device serial"""
     try:
@@ -34,20 +62,78 @@ def adb_s(serial: str, command: str) -> str:
         logger.error(f"ADB command error: {cmd}, error: {e}")
         raise
 
+def adb_shell(serial: str, script: str, timeout: int = 10) -> str:
+    """Chạy một script shell (nhiều lệnh nối bằng ';') trong MỘT lần adb shell, không qua shell local"""
+    result = subprocess.run(["adb", "-s", serial, "shell", script],
+                            capture_output=True, text=True, timeout=timeout)
+    if result.returncode != 0:
+        logger.warning(f"adb shell failed on {serial}: {script}, stderr: {result.stderr}")
+    return result.stdout.strip()
+
+def agent_url(serial: str) -> str:
+    """Base URL của atx-agent: device mạng (ip:port) gọi thẳng ip:7912, device USB qua adb forward"""
+    host = serial.split(":")[0]
+    if ":" in serial and host.replace(".", "").isdigit():
+        return f"http://{host}:{ATX_AGENT_PORT}"
+    with _forward_lock:
+        port = _forwarded_ports.get(serial)
+        if port is None:
+            output = subprocess.run(["adb", "-s", serial, "forward", "tcp:0", f"tcp:{ATX_AGENT_PORT}"],
+                                    capture_output=True, text=True, timeout=10).stdout.strip()
+            port = _forwarded_ports[serial] = int(output)
+    return f"http://127.0.0.1:{port}"
+
+def forget_forward(serial: str):
+    """Bỏ port adb forward đã cache của serial (lần probe sau forward lại)"""
+    with _forward_lock:
+        port = _forwarded_ports.pop(serial, None)
+    if port is None:
+        return
+    try:
+        subprocess.run(["adb", "-s", serial, "forward", "--remove", f"tcp:{port}"],
+                       capture_output=True, text=True, timeout=10)
+    except Exception:
+        pass
+
+def probe_atx_agent(serial: str, timeout: float = PROBE_TIMEOUT) -> Optional[str]:
+    """GET /version của atx-agent; trả về version nếu agent trả lời, None nếu không"""
+    try:
+        with urllib.request.urlopen(f"{agent_url(serial)}/version", timeout=timeout) as response:
+            if response.status == 200:
+                return response.read().decode("utf-8", "replace").strip() or "unknown"
+    except Exception:
+        pass
+    # Forward cũ có thể đã mất (adb restart, device cắm lại): lần sau tạo lại
+    forget_forward(serial)
+    return None
+
+def host_uses_atx_agent() -> bool:
+    """uiautomator2 cài trên máy host còn dùng atx-agent không (bản < 3)"""
+    try:
+        from importlib.metadata import version
+        return int(version("uiautomator2").split(".")[0]) < 3
+    except Exception:
+        return False
+
+def atx_agent_installed(serial: str) -> bool:
+    """Device có binary atx-agent không (uiautomator2 < 3)"""
+    if not host_uses_atx_agent():
+        return False
+    try:
+        return adb_shell(serial, f"[ -x {ATX_AGENT_BIN} ] && echo yes") == "yes"
+    except Exception as e:
+        logger.warning(f"Could not check atx-agent on {serial}: {e}")
+        return False
+
 def kill_uiautomator_processes(serial: str) -> bool:
-    """Kill all uiautomator related processes"""
+    """Kill all uiautomator related processes (một lần adb shell cho cả batch)"""
     try:
         logger.info(f"Killing uiautomator processes on {serial}")
         
-        # Kill uiautomator processes
-        adb_s(serial, "shell 'pidof uiautomator | xargs -r kill -9'")
-        
-        # Kill atx-agent processes
-        adb_s(serial, "shell 'pidof atx-agent | xargs -r kill -9'")
-        
-        # Force stop uiautomator packages
-        adb_s(serial, "shell am force-stop com.github.uiautomator")
-        adb_s(serial, "shell am force-stop com.github.uiautomator.test")
+        adb_shell(serial, "pidof uiautomator | xargs -r kill -9; "
+                          "pidof atx-agent | xargs -r kill -9; "
+                          "am force-stop com.github.uiautomator; "
+                          "am force-stop com.github.uiautomator.test")
         
         logger.info(f"Successfully killed uiautomator processes on {serial}")
         return True
@@ -61,12 +147,8 @@ def start_atx_agent(serial: str) -> bool:
     try:
         logger.info(f"Starting atx-agent on {serial}")
         
-        # Stop any existing atx-agent
-        adb_s(serial, "shell '/data/local/tmp/atx-agent server --stop || true'")
-        time.sleep(0.5)
-        
-        # Start atx-agent in daemon mode
-        adb_s(serial, "shell '/data/local/tmp/atx-agent server -d'")
+        # Stop agent cũ (nếu có) rồi start daemon trong cùng một lần adb shell
+        adb_shell(serial, f"{ATX_AGENT_BIN} server --stop || true; {ATX_AGENT_BIN} server -d")
         
         logger.info(f"Successfully started atx-agent on {serial}")
         return True
@@ -76,36 +158,32 @@ def start_atx_agent(serial: str) -> bool:
         return False
 
 def check_atx_agent_ready(serial: str, timeout: int = 5) -> bool:
-    """Check if atx-agent is ready on port 7912"""
-    try:
-        logger.info(f"Checking atx-agent readiness on {serial}")
-        
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            try:
-                # Check if port 7912 is listening
-                result = adb_s(serial, "shell 'netstat -an | grep :7912'")
-                if "7912" in result:
-                    logger.info(f"atx-agent ready on {serial}")
-                    return True
-            except:
-                pass
-            time.sleep(0.5)
-        
-        logger.warning(f"atx-agent not ready on {serial} after {timeout}s")
-        return False
-        
-    except Exception as e:
-        logger.error(f"Failed to check atx-agent readiness on {serial}: {e}")
-        return False
+    """Đợi atx-agent trả lời HTTP trên port 7912 (poll với backoff 0.1s -> 0.5s)"""
+    logger.info(f"Checking atx-agent readiness on {serial}")
+    
+    deadline = time.time() + timeout
+    interval = 0.1
+    while True:
+        version = probe_atx_agent(serial)
+        if version:
+            logger.info(f"atx-agent {version} ready on {serial}")
+            return True
+        if time.time() + interval >= deadline:
+            break
+        time.sleep(interval)
+        interval = min(interval * 2, 0.5)
+    
+    logger.warning(f"atx-agent not ready on {serial} after {timeout}s")
+    return False
 
-def ensure_uia2_ready(serial: str, retries: int = 2) -> bool:
+def ensure_uia2_ready(serial: str, retries: int = 2, skip_if_healthy: bool = True) -> bool:
     """
     Ensure uiautomator2 is ready for use
     
     Args:
         serial: Device serial number
         retries: Number of retry attempts
+        skip_if_healthy: Agent đã trả lời HTTP thì không kill/restart
         
     Returns:
         bool: True if successful, False otherwise
@@ -115,6 +193,12 @@ def ensure_uia2_ready(serial: str, retries: int = 2) -> bool:
     """
     logger.info(f"Ensuring uia2 ready for device {serial} (retries: {retries})")
     
+    # Agent đang khỏe -> không kill/restart
+    version = probe_atx_agent(serial) if skip_if_healthy else None
+    if version:
+        logger.info(f"atx-agent {version} already healthy on {serial}, skip restart")
+        return True
+    
     for attempt in range(retries + 1):
         try:
             logger.info(f"Attempt {attempt + 1}/{retries + 1} for {serial}")
@@ -126,22 +210,21 @@ def ensure_uia2_ready(serial: str, retries: int = 2) -> bool:
                     time.sleep(1.5)
                     continue
             
-            # Step 2: Wait a bit for cleanup
-            time.sleep(1)
-            
-            # Step 3: Start atx-agent
+            # Step 2: Start atx-agent
             if not start_atx_agent(serial):
                 logger.warning(f"Failed to start atx-agent on attempt {attempt + 1}")
                 if attempt < retries:
                     time.sleep(1.5)
                     continue
             
-            # Step 4: Check if atx-agent is ready
+            # Step 3: Đợi agent trả lời HTTP
             if not check_atx_agent_ready(serial):
                 logger.warning(f"atx-agent not ready on attempt {attempt + 1}")
                 if attempt < retries:
                     time.sleep(1.5)
                     continue
+                # Lần cuối vẫn chưa sẵn sàng -> không báo thành công
+                break
             
             logger.info(f"Successfully prepared uia2 for {serial}")
             return True
@@ -156,6 +239,51 @@ def ensure_uia2_ready(serial: str, retries: int = 2) -> bool:
     logger.error(error_msg)
     raise RuntimeError(error_msg)
 
+def prepare_device(serial: str, retries: int = 2) -> Dict[str, object]:
+    """ensure_uia2_ready cho một device, trả về kết quả kèm thời gian chuẩn bị
+
+    Không có atx-agent trên device (uiautomator2 3.x) -> action "no-agent",
+    không đụng tới tiến trình uiautomator đang chạy.
+    """
+    started = time.perf_counter()
+    healthy = probe_atx_agent(serial) is not None
+    result = {"serial": serial, "ok": True, "action": "healthy" if healthy else "restarted", "error": None}
+    if not healthy and not atx_agent_installed(serial):
+        result["action"] = "no-agent"
+    elif not healthy:
+        try:
+            ensure_uia2_ready(serial, retries=retries, skip_if_healthy=False)
+        except Exception as e:
+            result.update(ok=False, action="failed", error=str(e))
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+def prepare_devices(serials: Iterable[str], max_workers: int = DEFAULT_WORKERS, retries: int = 2,
+                    on_ready: Optional[Callable[[Dict[str, object]], None]] = None) -> Dict[str, Dict[str, object]]:
+    """Chuẩn bị nhiều device song song (tối đa max_workers cùng lúc)
+
+    on_ready(result) được gọi ngay khi từng device xong (thành công hay không),
+    để caller bắt đầu dùng device đã sẵn sàng mà không đợi cả nhóm.
+    Returns {serial: {"ok", "action": healthy|restarted|no-agent|failed, "seconds", "error"}}.
+    """
+    serials = list(dict.fromkeys(serials))
+    results: Dict[str, Dict[str, object]] = {}
+    if not serials:
+        return results
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(serials)),
+                            thread_name_prefix="device-prepare") as executor:
+        futures = {executor.submit(prepare_device, serial, retries): serial for serial in serials}
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            logger.info(f"Prepared {result['serial']}: {result['action']} in {result['seconds']}s")
+            if on_ready:
+                try:
+                    on_ready(result)
+                except Exception as e:
+                    logger.error(f"on_ready callback failed for {result['serial']}: {e}")
+    return results
+
 def cleanup_device(serial: str) -> bool:
     """Cleanup device resources"""
     try:
@@ -165,7 +293,7 @@ def cleanup_device(serial: str) -> bool:
         kill_uiautomator_processes(serial)
         
         # Stop atx-agent
-        adb_s(serial, "shell '/data/local/tmp/atx-agent server --stop || true'")
+        adb_shell(serial, f"{ATX_AGENT_BIN} server --stop || true")
         
         logger.info(f"Successfully cleaned up device {serial}")
         return True
@@ -180,15 +308,15 @@ if __name__ == "__main__":
     
     logging.basicConfig(level=logging.INFO)
     
-    if len(sys.argv) != 2:
-        print("Usage: python device_lifecycle.py <device_serial>")
+    if len(sys.argv) < 2:
+        print("Usage: python device_lifecycle.py <device_serial> [<device_serial> ...]")
         sys.exit(1)
     
-    serial = sys.argv[1]
-    
-    try:
-        ensure_uia2_ready(serial)
-        print(f"✅ Device {serial} is ready")
-    except RuntimeError as e:
-        print(f"❌ Failed to prepare device {serial}: {e}")
-        sys.exit(1)
\ No newline at end of file
+    results = prepare_devices(sys.argv[1:])
+    for serial in sys.argv[1:]:
+        result = results[serial]
+        if result["ok"]:
+            print(f"✅ Device {serial} is ready ({result['action']}, {result['seconds']:.2f}s)")
+        else:
+            print(f"❌ Failed to prepare device {serial} ({result['seconds']:.2f}s): {result['error']}")
+    sys.exit(0 if all(r["ok"] for r in results.values()) else 1)
@@ -13,8 +13,11 @@ import json
 import os
 from typing import List, Dict, Optional, Tuple
 from PyQt6.QtCore import QObject, pyqtSignal, QThread
-import uiautomator2 as u2
 from utils.data_manager import data_manager
+from utils.lazy import lazy_import
+
+# uiautomator2 chỉ import khi connect device đầu tiên (GUI mở nhanh hơn)
+u2 = lazy_import("uiautomator2")
 from database import get_device_repository, get_log_repository
 
 class Device:
@@ -15,6 +15,8 @@ from PyQt6.QtCore import QObject, pyqtSignal, QFileSystemWatcher
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+from utils.flow_loader import FLOW_PATTERN, get_flow_cache, source_digest
+
 class FlowExecutionHandler(FileSystemEventHandler):
     """Handler cho hot-reload flows"""
     
@@ -50,9 +52,12 @@ class FlowManager(QObject):
         self.flows = {}  # flow_name -> flow_function
         self.flow_files = {}  # flow_name -> file_path
         self.flow_contents = {}  # flow_name -> source_code
+        self.flow_digests = {}  # flow_name -> sha256 source flow đã load
+        # Hot reload cập nhật các dict trên từ thread compile/watchdog
+        self._flows_lock = threading.RLock()
         self.flows_directory = "flows"
         self.observer = None
-        self.flow_pattern = re.compile(r"#\s*===\s*FLOW START\s*===\s*(.*?)#\s*===\s*FLOW END\s*===", re.S)
+        self.flow_pattern = FLOW_PATTERN
         
         # Ensure flows directory exists
         os.makedirs(self.flows_directory, exist_ok=True)
@@ -90,11 +95,13 @@ class FlowManager(QObject):
             flow_name = os.path.splitext(os.path.basename(file_path))[0]
             
             # Tìm flow function trong file
-            flow_function = self.extract_flow_function(content)
+            flow_function = self.extract_flow_function(content, filename=os.path.abspath(file_path))
             if flow_function:
-                self.flows[flow_name] = flow_function
-                self.flow_files[flow_name] = file_path
-                self.flow_contents[flow_name] = content
+                with self._flows_lock:
+                    self.flows[flow_name] = flow_function
+                    self.flow_files[flow_name] = file_path
+                    self.flow_contents[flow_name] = content
+                    self.flow_digests[flow_name] = source_digest(content, require_markers=False)
                 
                 self.flow_loaded.emit(flow_name, content)
                 self.log_message.emit(f"✅ Đã load flow: {flow_name}", "SUCCESS")
@@ -108,16 +115,14 @@ class FlowManager(QObject):
             self.flow_error.emit(flow_name if 'flow_name' in locals() else file_path, str(e))
             return False
     
-    def extract_flow_function(self, content: str) -> Optional[Callable]:
-        """Extract flow function từ source code"""
+    def extract_flow_function(self, content: str, filename: str = "<flow>") -> Optional[Callable]:
+        """Extract flow function từ source code
+        
+        Vùng FLOW START/END (không có markers thì cả file) được compile qua
+        flow cache dùng chung: nội dung đã gặp thì không compile lại.
+        """
         try:
-            # Tìm vùng FLOW START/END
-            match = self.flow_pattern.search(content)
-            if match:
-                flow_code = match.group(1)
-            else:
-                # Nếu không có markers, sử dụng toàn bộ file
-                flow_code = content
+            flow_code = get_flow_cache().compile_source(content, filename, require_markers=False).code
             
             # Tạo namespace để exec code
             namespace = {
@@ -154,12 +159,29 @@ class FlowManager(QObject):
             return None
     
     def reload_flow_file(self, file_path: str):
-        """Reload flow từ file (hot-reload)"""
+        """Reload flow từ file (hot-reload)
+        
+        Compile ở thread nền của flow cache nên watchdog event không chặn việc
+        launch device; nội dung không đổi (lưu lại, touch) thì bỏ qua, lỗi cú
+        pháp thì giữ flow cũ và báo flow_error.
+        """
         flow_name = os.path.splitext(os.path.basename(file_path))[0]
         
-        if self.load_flow_from_file(file_path):
-            self.flow_reloaded.emit(flow_name)
-            self.log_message.emit(f"🔄 Đã reload flow: {flow_name}", "INFO")
+        def on_compiled(compiled, error):
+            if error is not None:
+                self.log_message.emit(f"❌ Lỗi reload flow {flow_name}: {error}", "ERROR")
+                self.flow_error.emit(flow_name, str(error))
+                return
+            with self._flows_lock:
+                if self.flow_digests.get(flow_name) == compiled.digest:
+                    return
+            # Code object đã có trong cache -> load chỉ còn exec
+            if self.load_flow_from_file(file_path):
+                self.flow_reloaded.emit(flow_name)
+                self.log_message.emit(f"🔄 Đã reload flow: {flow_name} (compile {compiled.seconds:.3f}s)", "INFO")
+        
+        get_flow_cache().revalidate_async(file_path, require_markers=False, keep_last_good=False,
+                                          callback=on_compiled)
     
     def create_new_flow(self, flow_name: str, template: str = "basic") -> str:
         """Tạo flow mới từ template"""
@@ -301,14 +323,17 @@ def flow(device, all_devices=None):
     def delete_flow(self, flow_name: str) -> bool:
         """Xóa flow"""
         try:
-            if flow_name in self.flow_files:
-                file_path = self.flow_files[flow_name]
+            with self._flows_lock:
+                file_path = self.flow_files.get(flow_name)
+            if file_path is not None:
                 os.remove(file_path)
                 
                 # Remove from memory
-                del self.flows[flow_name]
-                del self.flow_files[flow_name]
-                del self.flow_contents[flow_name]
+                with self._flows_lock:
+                    self.flows.pop(flow_name, None)
+                    self.flow_files.pop(flow_name, None)
+                    self.flow_contents.pop(flow_name, None)
+                    self.flow_digests.pop(flow_name, None)
                 
                 self.log_message.emit(f"🗑️ Đã xóa flow: {flow_name}", "INFO")
                 return True
@@ -322,15 +347,18 @@ def flow(device, all_devices=None):
     
     def get_flow_function(self, flow_name: str) -> Optional[Callable]:
         """Lấy flow function"""
-        return self.flows.get(flow_name)
+        with self._flows_lock:
+            return self.flows.get(flow_name)
     
     def get_flow_content(self, flow_name: str) -> str:
         """Lấy flow source code"""
-        return self.flow_contents.get(flow_name, "")
+        with self._flows_lock:
+            return self.flow_contents.get(flow_name, "")
     
     def get_available_flows(self) -> List[str]:
         """Lấy danh sách flows có sẵn"""
-        return list(self.flows.keys())
+        with self._flows_lock:
+            return list(self.flows.keys())
     
     def validate_flow_syntax(self, content: str) -> tuple[bool, str]:
         """Validate flow syntax"""
@@ -348,6 +376,8 @@ def flow(device, all_devices=None):
             self.observer.stop()
             self.observer.join()
         
-        self.flows.clear()
-        self.flow_files.clear()
-        self.flow_contents.clear()
\ No newline at end of file
+        with self._flows_lock:
+            self.flows.clear()
+            self.flow_files.clear()
+            self.flow_contents.clear()
+            self.flow_digests.clear()
\ No newline at end of file
@@ -15,18 +15,41 @@ import subprocess
 import random
 import re
 import argparse
+import logging
 from datetime import datetime
-import uiautomator2 as u2
 from typing import Dict, List, Optional, Any
 
-# === SUPABASE IMPORTS ===
-from utils.supabase_data_manager import SupabaseDataManager
-from database.supabase_manager import SupabaseManager
-from database.device_repository import DeviceRepository
-from database.log_repository import LogRepository
+# === STRUCTURED LOGGING ===
+from utils.log_pipeline import get_logger, start_run_logs, finish_run_logs
+from utils.metrics import instrument_device, timed_step, start_run, write_run_report
+from utils.tracing import start_trace, export_chrome_trace
+from utils.session_recorder import record_device, close_session
+from utils.capture_store import start_capture_run, store_capture
+from utils.screenshot_service import get_screenshot_service, request_screenshot
+from utils.status_hub import get_status_hub
+from utils.selector_cache import get_selector_resolver
+from utils import preflight
+from core import device_lifecycle
+from utils.flow_loader import get_flow_cache
+from utils.lazy import LazyObject, lazy_import
+from utils.conversation_plan import get_plan_registry, ConversationPlanError
 
-# Initialize Supabase data manager
-supabase_data_manager = SupabaseDataManager()
+# uiautomator2 (kéo theo requests, adbutils, PIL...) chỉ import khi connect device đầu tiên
+u2 = lazy_import("uiautomator2")
+
+log = get_logger()
+
+# === SUPABASE (khởi tạo ở lần dùng đầu, không phải lúc import) ===
+def _create_supabase_data_manager():
+    """SupabaseDataManager (None khi chưa cấu hình -> các hàm tự fallback về JSON)"""
+    try:
+        from utils.supabase_data_manager import SupabaseDataManager
+        return SupabaseDataManager()
+    except Exception as e:
+        log.warning("⚠️ Supabase data manager không khả dụng, dùng JSON fallback: %s", e)
+        return None
+
+supabase_data_manager = LazyObject(_create_supabase_data_manager, "supabase_data_manager")
 
 
 # === UI DUMP FUNCTION FOR DEBUGGING ===
@@ -42,35 +65,24 @@ def dump_ui_and_log(dev, debug=False):
         device_ip = dev.device_id if hasattr(dev, 'device_id') else str(dev.d._host)
         
         if debug:
-            print(f"[DEBUG] Dumping UI hierarchy for device {device_ip}")
+            log.debug("Dumping UI hierarchy for device %s", device_ip)
         
         # Dump UI hiện tại sử dụng dev object đã kết nối
         xml_data = dev.d.dump_hierarchy()
 
         # Xuất trực tiếp ra log
-        print(f"[DEBUG] ======= UI Dump for {device_ip} =======")
+        log.debug("======= UI Dump for %s =======", device_ip)
         lines = xml_data.splitlines()
-        print("\n".join(lines[:50]))  # chỉ in 50 dòng đầu để tránh tràn log
-        print("[DEBUG] ======= END UI Dump =======")
+        log.info("%s", '\n'.join(lines[:50]))  # chỉ in 50 dòng đầu để tránh tràn log
+        log.debug("======= END UI Dump =======")
 
-        # Lưu ra file để phân tích với thư mục debug_dumps
-        timestamp = int(time.time())
-        
-        # Tạo thư mục debug_dumps nếu chưa có
-        os.makedirs("debug_dumps", exist_ok=True)
-        
-        filename = f"debug_dumps/ui_dump_{device_ip.replace('.', '_').replace(':', '_')}_{timestamp}.xml"
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(xml_data)
-        print(f"[DEBUG] UI dump saved to {filename}")
+        # Lưu vào capture store (nén, dedup hierarchy giống nhau) thay cho file rời trong debug_dumps
+        ref = store_capture(device_ip, "friend_check", "hierarchy", xml_data)
+        log.debug("UI dump saved to %s", ref)
 
-        # Tùy chọn chụp ảnh màn hình
-        try:
-            screenshot_file = f"debug_dumps/screenshot_{device_ip.replace('.', '_').replace(':', '_')}_{timestamp}.png"
-            dev.d.screenshot(screenshot_file)
-            print(f"[DEBUG] Screenshot saved to {screenshot_file}")
-        except Exception as screenshot_error:
-            print(f"[DEBUG] Screenshot failed: {screenshot_error}")
+        # Screenshot chụp + lưu ở background (rate limit theo device)
+        if request_screenshot(dev.d, device_ip, "friend_check") is not None:
+            log.debug("Screenshot queued for %s", device_ip)
             
         return True
 
@@ -80,7 +92,7 @@ def dump_ui_and_log(dev, debug=False):
             device_ip = dev.device_id if hasattr(dev, 'device_id') else str(dev.d._host)
         except:
             pass
-        print(f"[ERROR] Failed to dump UI for {device_ip}: {e}")
+        log.error("Failed to dump UI for %s: %s", device_ip, e)
         return False
 
 ENC = "utf-8"
@@ -102,6 +114,7 @@ class Device:
         self.role_in_group = None
         self.group_devices = None
         
+    @timed_step("connect")
     def connect(self):
         """Kết nối tới device qua uiautomator2"""
         try:
@@ -110,13 +123,13 @@ class Device:
                 kill_cmd = ["adb", "-s", self.device_id, "shell", "am", "force-stop", "com.genfarmer.uiautomator"]
                 kill_result = subprocess.run(kill_cmd, capture_output=True, text=True, timeout=10)
                 if kill_result.returncode == 0:
-                    print(f"🧹 Đã dừng com.genfarmer.uiautomator trên {self.device_id}")
+                    log.info("🧹 Đã dừng com.genfarmer.uiautomator trên %s", self.device_id)
                 else:
                     stderr_output = (kill_result.stderr or "").strip()
                     if stderr_output:
-                        print(f"⚠️ Không thể dừng com.genfarmer.uiautomator trên {self.device_id}: {stderr_output}")
+                        log.warning("⚠️ Không thể dừng com.genfarmer.uiautomator trên %s: %s", self.device_id, stderr_output)
             except Exception as kill_error:
-                print(f"⚠️ Lỗi khi dừng com.genfarmer.uiautomator trên {self.device_id}: {kill_error}")
+                log.warning("⚠️ Lỗi khi dừng com.genfarmer.uiautomator trên %s: %s", self.device_id, kill_error)
             
             # Kết nối device SAU khi đã kill process
             if ":" in self.device_id:
@@ -126,6 +139,12 @@ class Device:
                 # USB device
                 self.d = u2.connect_usb(self.device_id)
             
+            # Ghi session để replay (AUTOMATION_RECORD_SESSION=1) và đo thời gian mọi RPC
+            # uiautomator2 (tắt bằng AUTOMATION_METRICS=0)
+            self.d = instrument_device(record_device(self.d, self.device_id), self.device_id)
+            # Zalo có thể đã update từ lần connect trước -> tính lại context của selector cache
+            get_selector_resolver().forget_device(self.device_id)
+            
             # Lấy thông tin device
             info = self.d.info
             self.screen_info = {
@@ -134,15 +153,16 @@ class Device:
                 'density': info.get('displaySizeDpX', 411)
             }
             
-            print(f"📱 Connected: {info['productName']} ({self.screen_info['width']}x{self.screen_info['height']})")
+            log.info("📱 Connected: %s (%sx%s)", info['productName'], self.screen_info['width'], self.screen_info['height'])
             return True
             
         except Exception as e:
-            print(f"❌ Lỗi kết nối device {self.device_id}: {e}")
+            log.error("❌ Lỗi kết nối device %s: %s", self.device_id, e)
             return False
     
     def disconnect(self):
         """Ngắt kết nối"""
+        close_session(self.device_id)
         if self.d:
             try:
                 # UIAutomator2 tự động cleanup
@@ -216,10 +236,14 @@ class Device:
         except Exception as e:
             return f"[ERR] App start failed: {e}"
     
-    def screencap(self, out_path="screen.png"):
-        """Chụp screenshot"""
+    def screencap(self, out_path="screen.png", scale=1.0, wait=True):
+        """Chụp screenshot qua screenshot service (scale < 1 -> ảnh nhỏ hơn, wait=False -> không chờ lưu xong)"""
         try:
-            self.d.screenshot(out_path)
+            future = get_screenshot_service().request(self.d, self.device_id, "screencap",
+                                                      out_path=out_path, scale=scale, force=True)
+            if not wait:
+                return f"[OK] Screenshot queued: {out_path}"
+            future.result(timeout=60)
             return f"[OK] Screenshot saved: {out_path}"
         except Exception as e:
             return f"[ERR] Screenshot failed: {e}"
@@ -238,7 +262,7 @@ class Device:
         """Click element bằng text - Modern UIAutomator2 way"""
         try:
             if debug:
-                print(f"[DEBUG] Searching for text: {text}")
+                log.debug("Searching for text: %s", text)
             
             # Sử dụng UIAutomator2 selector
             element = self.d(text=text)
@@ -246,23 +270,23 @@ class Device:
             if element.wait(timeout=timeout):
                 element.click()
                 if debug:
-                    print(f"[DEBUG] ✅ Clicked text: {text}")
+                    log.debug("✅ Clicked text: %s", text)
                 return True
             else:
                 if debug:
-                    print(f"[DEBUG] ❌ Text not found: {text}")
+                    log.debug("❌ Text not found: %s", text)
                 return False
                 
         except Exception as e:
             if debug:
-                print(f"[DEBUG] ❌ Error clicking text: {e}")
+                log.debug("❌ Error clicking text: %s", e)
             return False
     
     def click_by_resource_id(self, resource_id: str, timeout=10, debug=False):
         """Click element bằng resource-id - Modern UIAutomator2 way"""
         try:
             if debug:
-                print(f"[DEBUG] Searching for resource-id: {resource_id}")
+                log.debug("Searching for resource-id: %s", resource_id)
             
             # Sử dụng UIAutomator2 selector
             element = self.d(resourceId=resource_id)
@@ -270,23 +294,23 @@ class Device:
             if element.wait(timeout=timeout):
                 element.click()
                 if debug:
-                    print(f"[DEBUG] ✅ Clicked resource-id: {resource_id}")
+                    log.debug("✅ Clicked resource-id: %s", resource_id)
                 return True
             else:
                 if debug:
-                    print(f"[DEBUG] ❌ Resource-id not found: {resource_id}")
+                    log.debug("❌ Resource-id not found: %s", resource_id)
                 return False
                 
         except Exception as e:
             if debug:
-                print(f"[DEBUG] ❌ Error clicking resource-id: {e}")
+                log.debug("❌ Error clicking resource-id: %s", e)
             return False
     
     def click_by_xpath(self, xpath: str, timeout=10, debug=False):
         """Click element bằng XPath - UIAutomator2 way"""
         try:
             if debug:
-                print(f"[DEBUG] Searching for xpath: {xpath}")
+                log.debug("Searching for xpath: %s", xpath)
             
             # UIAutomator2 hỗ trợ XPath
             element = self.d.xpath(xpath)
@@ -294,39 +318,39 @@ class Device:
             if element.wait(timeout=timeout):
                 element.click()
                 if debug:
-                    print(f"[DEBUG] ✅ Clicked xpath: {xpath}")
+                    log.debug("✅ Clicked xpath: %s", xpath)
                 return True
             else:
                 if debug:
-                    print(f"[DEBUG] ❌ XPath not found: {xpath}")
+                    log.debug("❌ XPath not found: %s", xpath)
                 return False
                 
         except Exception as e:
             if debug:
-                print(f"[DEBUG] ❌ Error clicking xpath: {e}")
+                log.debug("❌ Error clicking xpath: %s", e)
             return False
     
     def click_by_description(self, desc: str, timeout=10, debug=False):
         """Click element bằng content description"""
         try:
             if debug:
-                print(f"[DEBUG] Searching for description: {desc}")
+                log.debug("Searching for description: %s", desc)
             
             element = self.d(description=desc)
             
             if element.wait(timeout=timeout):
                 element.click()
                 if debug:
-                    print(f"[DEBUG] ✅ Clicked description: {desc}")
+                    log.debug("✅ Clicked description: %s", desc)
                 return True
             else:
                 if debug:
-                    print(f"[DEBUG] ❌ Description not found: {desc}")
+                    log.debug("❌ Description not found: %s", desc)
                 return False
                 
         except Exception as e:
             if debug:
-                print(f"[DEBUG] ❌ Error clicking description: {e}")
+                log.debug("❌ Error clicking description: %s", e)
             return False
     
     def wait_for_element(self, **kwargs):
@@ -438,7 +462,7 @@ class Device:
                 }
             return None
         except Exception as e:
-            print(f"[ERR] Get device info failed: {e}")
+            log.info("[ERR] Get device info failed: %s", e)
             return None
     
     def handle_friend_request_flow(self, debug=False):
@@ -459,10 +483,10 @@ class Device:
         
         for attempt in range(max_retries + 1):
             try:
-                if debug: print(f"🔄 Bắt đầu flow kết bạn (lần thử {attempt + 1}/{max_retries + 1})...")
+                if debug: log.debug("🔄 Bắt đầu flow kết bạn (lần thử %s/%s)...", attempt + 1, max_retries + 1)
                 
                 # Bước 2.1: Click btn_send_friend_request
-                if debug: print("🔍 Tìm nút btn_send_friend_request...")
+                if debug: log.debug("🔍 Tìm nút btn_send_friend_request...")
                 
                 # Sử dụng UI dump analysis thay vì element_exists để detect NAF elements
                 device_serial = getattr(self, 'device_id', None)
@@ -479,78 +503,78 @@ class Device:
                     has_friend_btn = check_btn_send_friend_request_in_dump(device_serial, debug=debug)
                     
                     if not has_friend_btn:
-                        if debug: print("❌ Không tìm thấy btn_send_friend_request trong UI dump")
+                        if debug: log.error("❌ Không tìm thấy btn_send_friend_request trong UI dump")
                         return False
                 else:
                     # Fallback về phương thức cũ nếu không có device_serial
                     if not self.element_exists(resourceId="com.zing.zalo:id/btn_send_friend_request", timeout=3):
-                        if debug: print("❌ Không tìm thấy btn_send_friend_request (fallback)")
+                        if debug: log.error("❌ Không tìm thấy btn_send_friend_request (fallback)")
                         return False
                     
-                if debug: print("✅ Tìm thấy btn_send_friend_request, đang click...")
+                if debug: log.debug("✅ Tìm thấy btn_send_friend_request, đang click...")
                 if not self.click_by_resource_id("com.zing.zalo:id/btn_send_friend_request", timeout=5, debug=debug):
-                    if debug: print("❌ Không thể click btn_send_friend_request")
+                    if debug: log.error("❌ Không thể click btn_send_friend_request")
                     if attempt < max_retries:
-                        if debug: print(f"🔄 Thử lại lần {attempt + 2}...")
+                        if debug: log.debug("🔄 Thử lại lần %s...", attempt + 2)
                         time.sleep(1)
                         continue
                     return False
                     
-                if debug: print("✅ Đã click btn_send_friend_request")
+                if debug: log.debug("✅ Đã click btn_send_friend_request")
                     
                 # Bước 2.2: Delay 2-3 giây chờ load
-                if debug: print("⏳ Chờ 2.5 giây để giao diện load...")
+                if debug: log.debug("⏳ Chờ 2.5 giây để giao diện load...")
                 time.sleep(2.5)
                 
                 # Bước 2.3: Tìm và click btnSendInvitation với retry
-                if debug: print("🔍 Tìm nút btnSendInvitation...")
+                if debug: log.debug("🔍 Tìm nút btnSendInvitation...")
                 
                 invitation_found = False
                 for retry in range(2):  # Thử tìm btnSendInvitation tối đa 2 lần
                     if self.element_exists(resourceId="com.zing.zalo:id/btnSendInvitation", timeout=3):
                         invitation_found = True
-                        if debug: print("✅ Tìm thấy btnSendInvitation, đang click...")
+                        if debug: log.debug("✅ Tìm thấy btnSendInvitation, đang click...")
                         if self.click_by_resource_id("com.zing.zalo:id/btnSendInvitation", timeout=5, debug=debug):
-                            if debug: print("✅ Gửi lời mời kết bạn thành công")
+                            if debug: log.debug("✅ Gửi lời mời kết bạn thành công")
                             break
                         else:
-                            if debug: print("❌ Không thể click btnSendInvitation")
+                            if debug: log.error("❌ Không thể click btnSendInvitation")
                             if retry < 1:
-                                if debug: print("🔄 Thử click lại...")
+                                if debug: log.debug("🔄 Thử click lại...")
                                 time.sleep(1)
                     else:
                         if retry < 1:
-                            if debug: print("⏳ Chờ thêm 1 giây và thử lại...")
+                            if debug: log.debug("⏳ Chờ thêm 1 giây và thử lại...")
                             time.sleep(1)
                 
                 if not invitation_found:
                     # Bước 2.4: Xử lý trường hợp đặc biệt
-                    if debug: print("⚠️ Không tìm thấy nút btnSendInvitation")
+                    if debug: log.warning("⚠️ Không tìm thấy nút btnSendInvitation")
                     
                     # Kiểm tra các trường hợp đặc biệt
                     if self.element_exists(text="Đã gửi lời mời", timeout=2):
-                        if debug: print("ℹ️ Đã gửi lời mời kết bạn trước đó")
+                        if debug: log.debug("ℹ️ Đã gửi lời mời kết bạn trước đó")
                     elif self.element_exists(text="Tài khoản bị hạn chế", timeout=2):
-                        if debug: print("⚠️ Tài khoản bị hạn chế gửi lời mời")
+                        if debug: log.warning("⚠️ Tài khoản bị hạn chế gửi lời mời")
                     elif self.element_exists(text="Không thể kết nối", timeout=2):
-                        if debug: print("⚠️ Mạng chậm hoặc không ổn định")
+                        if debug: log.warning("⚠️ Mạng chậm hoặc không ổn định")
                         if attempt < max_retries:
-                            if debug: print(f"🔄 Thử lại do mạng chậm (lần {attempt + 2})...")
+                            if debug: log.debug("🔄 Thử lại do mạng chậm (lần %s)...", attempt + 2)
                             time.sleep(2)
                             continue
                     else:
-                        if debug: print("⚠️ Trạng thái không xác định, có thể đã gửi trước đó hoặc bị hạn chế")
+                        if debug: log.warning("⚠️ Trạng thái không xác định, có thể đã gửi trước đó hoặc bị hạn chế")
                     
                 # Bước 2.5: Back về màn hình trước
-                if debug: print("🔙 Quay lại màn hình trước...")
+                if debug: log.debug("🔙 Quay lại màn hình trước...")
                 self.key('KEYCODE_BACK')
                 time.sleep(1)  # Chờ UI ổn định
                 
-                if debug: print("✅ Hoàn thành flow kết bạn")
+                if debug: log.debug("✅ Hoàn thành flow kết bạn")
                 return True
                 
             except Exception as e:
-                if debug: print(f"❌ Lỗi trong flow kết bạn (lần thử {attempt + 1}): {e}")
+                if debug: log.error("❌ Lỗi trong flow kết bạn (lần thử %s): %s", attempt + 1, e)
                 
                 # Đảm bảo luôn back về màn hình trước khi có lỗi
                 try:
@@ -560,11 +584,11 @@ class Device:
                     pass
                 
                 if attempt < max_retries:
-                    if debug: print(f"🔄 Thử lại sau lỗi (lần {attempt + 2})...")
+                    if debug: log.debug("🔄 Thử lại sau lỗi (lần %s)...", attempt + 2)
                     time.sleep(1)
                     continue
                 else:
-                    if debug: print("❌ Đã thử tối đa, dừng flow kết bạn")
+                    if debug: log.error("❌ Đã thử tối đa, dừng flow kết bạn")
                     return False
         
         return False
@@ -637,19 +661,14 @@ def parse_devices_from_env():
     return devices
 
 # ---------------- Hot-reload FLOW: đọc chính file này, exec vùng flow ----------------
-FLOW_PATTERN = re.compile(r"#\s*===\s*FLOW START\s*===\s*(.*?)#\s*===\s*FLOW END\s*===", re.S)
+# Vùng FLOW được compile một lần mỗi nội dung file (utils.flow_loader) và dùng chung
+# code object cho mọi worker; sửa file + lưu thì lần load sau compile lại.
 
 def load_flow_from_self():
-    with open(SELF_PATH, "r", encoding="utf-8") as f:
-        src = f.read()
-    m = FLOW_PATTERN.search(src)
-    if not m:
-        raise RuntimeError("Không tìm thấy vùng FLOW trong file (markers).")
-    code = m.group(1)
     ns = {}
     # Chúng ta cung cấp Device và time trong ns để code flow dùng
-    ns.update({"Device": Device, "time": time, "u2": u2})
-    exec(code, ns, ns)
+    ns.update({"Device": Device, "time": time, "u2": u2, "supabase_data_manager": supabase_data_manager})
+    get_flow_cache().load(SELF_PATH, ns)
     if "flow" not in ns or not callable(ns["flow"]):
         raise RuntimeError("Trong vùng FLOW phải định nghĩa hàm flow(dev).")
     return ns["flow"]
@@ -666,16 +685,9 @@ class DeviceWorker:
         self.thread = None
         
     def log(self, message: str, level: str = "INFO"):
-        """Log với prefix device name"""
-        prefix = f"[{self.device_name}]"
-        if level == "ERROR":
-            print(f"\033[91m{prefix} {message}\033[0m")  # Red
-        elif level == "SUCCESS":
-            print(f"\033[92m{prefix} {message}\033[0m")  # Green
-        elif level == "WARNING":
-            print(f"\033[93m{prefix} {message}\033[0m")  # Yellow
-        else:
-            print(f"\033[94m{prefix} {message}\033[0m")  # Blue
+        """Log với context device name (màu theo level do sink console/Qt xử lý)"""
+        levels = {"ERROR": logging.ERROR, "WARNING": logging.WARNING}
+        log.log(levels.get(level, logging.INFO), "%s", message, extra={"device": self.device_name})
     
     def initialize_device(self):
         """Khởi tạo device"""
@@ -755,10 +767,10 @@ def run_flow_once(flow_fn, dev: Device, all_devices=None):
             result = flow_fn(dev)
         # Nếu flow trả về "LOGIN_REQUIRED", thoát tool ngay lập tức
         if result == "LOGIN_REQUIRED":
-            print("\n🛑 Tool thoát. Vui lòng đăng nhập Zalo và chạy lại tool.")
+            log.info("🛑 Tool thoát. Vui lòng đăng nhập Zalo và chạy lại tool.")
             sys.exit(0)  # Thoát tool hoàn toàn
     except Exception:
-        print("[ERR] Flow crashed:")
+        log.info("[ERR] Flow crashed:")
         traceback.print_exc()
 
 def main_single_device(device_id, all_devices=None):
@@ -793,8 +805,11 @@ def main_multi_device(selected_devices):
         ip = device_id.split(":")[0] if ":" in device_id else device_id
         all_device_ips.append(ip)
     
-    print(f"🔗 Group-based execution với {len(selected_devices)} devices")
-    print(f"📋 Device IPs: {all_device_ips}")
+    log.info("🔗 Group-based execution với %s devices", len(selected_devices))
+    log.info("📋 Device IPs: %s", all_device_ips)
+    
+    # Compile vùng FLOW ở thread nền trong lúc các worker connect device
+    get_flow_cache().revalidate_async(SELF_PATH)
     
     # Tạo workers cho từng device
     for i, device_id in enumerate(selected_devices):
@@ -830,13 +845,13 @@ PHONE_MAP = {}
 def load_phone_map_from_file():
     """Load phone mapping từ Supabase - thay thế JSON operations"""
     try:
-        print("📡 Loading phone mapping từ Supabase...")
+        log.info("📡 Loading phone mapping từ Supabase...")
         phone_mapping = supabase_data_manager.load_phone_mapping()
-        print(f"✅ Loaded {len(phone_mapping)} phone mappings từ Supabase")
+        log.info("✅ Loaded %s phone mappings từ Supabase", len(phone_mapping))
         return phone_mapping
     except Exception as e:
-        print(f"⚠️ Lỗi load phone mapping từ Supabase: {e}")
-        print("🔄 Fallback về JSON file...")
+        log.warning("⚠️ Lỗi load phone mapping từ Supabase: %s", e)
+        log.info("🔄 Fallback về JSON file...")
         
         # Fallback về JSON nếu Supabase fail
         try:
@@ -845,29 +860,29 @@ def load_phone_map_from_file():
                 with open(PHONE_CONFIG_FILE, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                     phone_mapping = data.get('phone_mapping', {})
-                    print(f"⚠️ Loaded phone mapping từ JSON fallback: {len(phone_mapping)} devices")
+                    log.warning("⚠️ Loaded phone mapping từ JSON fallback: %s devices", len(phone_mapping))
                     return phone_mapping
         except Exception as json_error:
-            print(f"❌ Lỗi JSON fallback: {json_error}")
+            log.error("❌ Lỗi JSON fallback: %s", json_error)
         
         return {}
 
 def save_phone_map_to_file(phone_map):
     """Lưu phone mapping vào Supabase với fallback JSON"""
     try:
-        print("📡 Saving phone mapping vào Supabase...")
+        log.info("📡 Saving phone mapping vào Supabase...")
         success = supabase_data_manager.save_phone_mapping(phone_map, created_by="core1.py CLI")
         
         if success:
-            print(f"✅ Đã lưu {len(phone_map)} phone mappings vào Supabase")
+            log.info("✅ Đã lưu %s phone mappings vào Supabase", len(phone_map))
             return True
         else:
-            print("❌ Lỗi lưu phone mapping vào Supabase")
+            log.error("❌ Lỗi lưu phone mapping vào Supabase")
             return False
             
     except Exception as e:
-        print(f"⚠️ Lỗi save phone mapping vào Supabase: {e}")
-        print("🔄 Fallback về JSON file...")
+        log.warning("⚠️ Lỗi save phone mapping vào Supabase: %s", e)
+        log.info("🔄 Fallback về JSON file...")
         
         # Fallback về JSON nếu Supabase fail
         try:
@@ -884,11 +899,11 @@ def save_phone_map_to_file(phone_map):
             with open(PHONE_CONFIG_FILE, 'w', encoding='utf-8') as f:
                 json.dump(data, f, indent=2, ensure_ascii=False)
             
-            print(f"⚠️ Đã lưu phone mapping vào JSON fallback")
+            log.warning("⚠️ Đã lưu phone mapping vào JSON fallback")
             return True
             
         except Exception as json_error:
-            print(f"❌ Lỗi JSON fallback: {json_error}")
+            log.error("❌ Lỗi JSON fallback: %s", json_error)
             return False
 
 def parse_device_map_string(device_map_str):
@@ -1421,6 +1436,7 @@ def parse_arguments():
   python core1.py -ld                                # Liệt kê devices
   python core1.py --quick-setup                      # Quick setup mode
   python core1.py --show-config                      # Hiển thị config hiện tại
+  python core1.py --profile                          # Chạy kèm sampling profiler
         """
     )
     
@@ -1480,6 +1496,26 @@ def parse_arguments():
         help='Reset phone mapping về default và thoát'
     )
     
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Bật sampling profiler cho toàn bộ run, ghi collapsed stacks vào profiles/'
+    )
+    
+    parser.add_argument(
+        '--profile-interval',
+        type=float,
+        default=10.0,
+        help='Chu kỳ lấy mẫu của profiler (ms), mặc định 10'
+    )
+    
+    parser.add_argument(
+        '--profile-mode',
+        choices=['cpu', 'wall'],
+        default='cpu',
+        help='cpu: chỉ tính thread đang dùng CPU; wall: tính mọi thread'
+    )
+    
     return parser.parse_args()
 
 def show_current_config():
@@ -1548,6 +1584,17 @@ def main():
     # Parse command line arguments
     args = parse_arguments()
     
+    if not getattr(args, 'profile', False):
+        return _run_main(args)
+    
+    from utils.profiler import start_profiling, stop_profiling
+    start_profiling(interval=args.profile_interval / 1000.0, mode=args.profile_mode)
+    try:
+        return _run_main(args)
+    finally:
+        stop_profiling()
+
+def _run_main(args):
     # Load phone mapping trước
     load_phone_map()
     
@@ -1717,27 +1764,33 @@ def run_device_automation(dev, device_index, delay, done_event, result_queue=Non
     """Wrapper function to run automation on a single device"""
     device_ip = dev.device_id
     result = {"status": "error", "result": None}
+    dlog = log.bind(device=device_ip, pair=getattr(dev, 'group_id', None))
     
     try:
-        print(f"[DEBUG] Starting run_device_automation for device {device_ip} (index {device_index}) with delay {delay}s")
+        dlog.debug("Starting run_device_automation (index %s) with delay %ss", device_index, delay)
         
         # Apply delay before starting
         if delay > 0:
-            print(f"[DEBUG] Device {device_ip} waiting {delay}s before start...")
+            dlog.debug("Waiting %ss before start...", delay)
             time.sleep(delay)
         
         # Check if we should stop before starting
         if done_event and done_event.is_set():
-            print(f"[DEBUG] Stop signal received for device {device_ip}")
+            dlog.debug("Stop signal received")
             result = {"status": "stopped", "result": "Stop signal received"}
             return
         
-        print(f"[DEBUG] Device {device_ip} starting flow execution...")
+        dlog.debug("Starting flow execution...")
         
         # Call the main flow function
         flow_result = flow(dev)
         
-        print(f"[DEBUG] Flow completed for device {device_ip} with result: {flow_result}")
+        dlog.debug("Flow completed with result: %s", flow_result)
+        
+        # flow() trả về chuỗi ("SUCCESS", "APP_OPEN_FAILED", ...) - chuẩn hóa về dict
+        if isinstance(flow_result, str):
+            flow_result = {"status": "completed" if flow_result == "SUCCESS" else flow_result.lower(),
+                           "result": flow_result}
         
         # Determine result status based on flow result
         if flow_result and flow_result.get("status") == "completed":
@@ -1751,9 +1804,7 @@ def run_device_automation(dev, device_index, delay, done_event, result_queue=Non
         
     except Exception as e:
         error_msg = f"Exception in run_device_automation for device {device_ip}: {e}"
-        print(f"[ERROR] {error_msg}")
-        import traceback
-        traceback.print_exc()
+        dlog.exception(error_msg)
         result = {"status": "error", "result": error_msg}
     
     finally:
@@ -1761,18 +1812,100 @@ def run_device_automation(dev, device_index, delay, done_event, result_queue=Non
         if result_queue:
             try:
                 result_queue.put((device_ip, result))
-                print(f"[DEBUG] Device {device_ip} result added to queue: {result['status']}")
+                dlog.debug("Result added to queue: %s", result['status'])
             except Exception as e:
-                print(f"[ERROR] Failed to put result in queue for {device_ip}: {e}")
+                dlog.error("Failed to put result in queue: %s", e)
         
         # Signal that this device is done
         if done_event:
             done_event.set()
-            print(f"[DEBUG] Device {device_ip} done_event set")
+            dlog.debug("done_event set")
         
-        print(f"[DEBUG] Device {device_ip} automation completed with status: {result['status']}")
+        dlog.debug("Automation completed with status: %s", result['status'])
+
+def pair_device_ip(device_info):
+    """IP:5555 của device trong device_pairs (serial adb / key của preflight)"""
+    device_ip = device_info['ip']
+    return device_ip if ':' in device_ip else f"{device_ip}:5555"
+
+def prepare_pair_devices(device_pairs, progress_callback=None):
+    """Chuẩn bị atx-agent/uiautomator2 cho mọi device song song trước khi connect
 
-def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_callback=None, stop_event=None, status_callback=None):
+    Device đang khỏe hoặc không có atx-agent không bị restart
+    (core.device_lifecycle). Returns {device_ip: lý do} của các device không
+    chuẩn bị được - preflight quyết định có chạy chúng hay không.
+    """
+    device_ips = list(dict.fromkeys(pair_device_ip(info) for pair in device_pairs for info in pair))
+    if progress_callback:
+        progress_callback(f"🛠️ Chuẩn bị uiautomator2 cho {len(device_ips)} thiết bị song song...")
+
+    def on_ready(result):
+        if result["ok"]:
+            log.info("🛠️ %s sẵn sàng (%s, %.1fs)", result["serial"], result["action"], result["seconds"])
+        else:
+            log.warning("🛠️ %s không chuẩn bị được uiautomator2: %s", result["serial"], result["error"])
+
+    results = device_lifecycle.prepare_devices(device_ips, on_ready=on_ready)
+    return {device_ip: f"prepare: {result['error']}" for device_ip, result in results.items() if not result["ok"]}
+
+def preflight_device_pairs(device_pairs, device_factory=None, progress_callback=None, suspect=None):
+    """Preflight song song tất cả device trước khi ghép cặp
+
+    suspect: device_ip của các device bước trước (prepare) báo lỗi - luôn được
+    probe (kể cả khi AUTOMATION_PREFLIGHT=0), check rpc quyết định có chạy
+    hay không. Preflight tắt thì các device còn lại không bị probe.
+
+    Returns (scheduled_pairs [(pair_index, device1, device2)], kết quả các cặp bị loại
+    {pair_name: result}, device đã connect bởi preflight {device_ip: Device}).
+    """
+    normalize = pair_device_ip
+    suspect = set(suspect or ())
+    device_ips = [normalize(info) for pair in device_pairs for info in pair]
+    probe_ips = [device_ip for device_ip in device_ips if preflight.ENABLED or device_ip in suspect]
+    results = {device_ip: {"ok": True, "reason": None, "skipped": True} for device_ip in device_ips}
+    preconnected = {}
+    if probe_ips:
+        if progress_callback:
+            progress_callback(f"🩺 Preflight {len(set(probe_ips))} thiết bị song song...")
+        connect = device_factory or Device
+        # Device giả lập (device_factory) không có trong adb
+        probed, preconnected = preflight.get_preflight_service().check_devices(
+            probe_ips, connect, adb_check=device_factory is None, force=bool(suspect))
+        results.update(probed)
+
+    hub = get_status_hub()
+    for device_ip, result in results.items():
+        if result.get("skipped"):
+            continue
+        if result["ok"]:
+            log.info("🩺 %s OK%s", device_ip, " (cache)" if result.get("cached") else "")
+        else:
+            log.error("🩺 %s không đạt preflight: %s", device_ip, result["reason"])
+            hub.publish(device_ip, 'error', f"Preflight: {result['reason']}", 0)
+            if progress_callback:
+                progress_callback(f"🩺 ❌ {device_ip}: {result['reason']}")
+
+    scheduled, unpaired = preflight.schedule_healthy_pairs(
+        device_pairs, lambda info: results[normalize(info)]["ok"])
+    used_indexes = {pair_index for pair_index, _, _ in scheduled}
+    skipped = {}
+    for pair_index, (device1, device2) in enumerate(device_pairs, 1):
+        if pair_index in used_indexes:
+            continue
+        skipped[f"pair_{pair_index}"] = {
+            "status": "preflight_failed",
+            "devices": {normalize(info): results[normalize(info)]["reason"] or "máy cùng cặp không đạt preflight"
+                        for info in (device1, device2)},
+        }
+    for _, device_info in unpaired:
+        dev = preconnected.pop(normalize(device_info), None)
+        if dev is not None:
+            dev.disconnect()
+    if progress_callback and skipped:
+        progress_callback(f"🩺 Chạy {len(scheduled)}/{len(device_pairs)} cặp (bỏ {len(skipped)} cặp có máy lỗi)")
+    return scheduled, skipped, preconnected
+
+def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_callback=None, stop_event=None, status_callback=None, device_factory=None):
     """
     Hàm chính để chạy automation từ GUI Zalo
     
@@ -1781,30 +1914,37 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
         conversations: List[str] - Danh sách hội thoại
         phone_mapping: Dict[str, str] - Mapping IP -> số điện thoại
         progress_callback: callable - Callback để báo cáo tiến trình
+        device_factory: callable(device_ip) -> Device - Tạo device (mặc định Device, benchmark dùng máy giả lập)
     
     Returns:
         dict: Kết quả automation với format {"pair_1": {"status": "completed"}, ...}
     """
     global PHONE_MAP
+    run_log_id = None
     try:
         if progress_callback:
             progress_callback("🚀 Bắt đầu automation từ Zalo GUI...")
         
-        print(f"\n🚀 Bắt đầu Zalo automation với {len(device_pairs)} cặp thiết bị")
-        print(f"💬 Có {len(conversations)} hội thoại")
-        print(f"📞 Có {len(phone_mapping)} mapping số điện thoại")
+        # Row runs + sink run_logs cho lần chạy này (cùng run_id với metrics report)
+        run_log_id = start_run_logs(pair_count=len(device_pairs), device_count=2 * len(device_pairs),
+                                    created_by="zalo_gui")
+        start_run(run_log_id, pairs=len(device_pairs))
+        start_trace(pairs=len(device_pairs))
+        start_capture_run()
+        get_status_hub().reset()
         
-        # Debug logs chi tiết
-        print("\n[DEBUG] ===== AUTOMATION DEBUG INFO =====")
-        print(f"[DEBUG] Device pairs received: {len(device_pairs)}")
-        for i, (d1, d2) in enumerate(device_pairs):
-            print(f"[DEBUG] Pair {i+1}: {d1['ip']} ↔ {d2['ip']}")
+        log.info("🚀 Bắt đầu Zalo automation với %d cặp thiết bị", len(device_pairs))
+        log.info("💬 Có %d hội thoại", len(conversations))
+        log.info("📞 Có %d mapping số điện thoại", len(phone_mapping))
         
-        print(f"[DEBUG] Conversations: {conversations}")
-        print(f"[DEBUG] Phone mapping: {phone_mapping}")
-        print(f"[DEBUG] Progress callback: {'Available' if progress_callback else 'None'}")
-        print(f"[DEBUG] Current global PHONE_MAP: {PHONE_MAP}")
-        print("[DEBUG] =====================================\n")
+        # Debug logs chi tiết
+        if log.isEnabledFor(logging.DEBUG):
+            for i, (d1, d2) in enumerate(device_pairs):
+                log.debug("Pair %d: %s ↔ %s", i + 1, d1['ip'], d2['ip'])
+            log.debug("Conversations: %s", conversations)
+            log.debug("Phone mapping: %s", phone_mapping)
+            log.debug("Progress callback: %s", 'Available' if progress_callback else 'None')
+            log.debug("Current global PHONE_MAP: %s", PHONE_MAP)
         
         # Cập nhật global PHONE_MAP với mapping từ GUI
         PHONE_MAP.update(phone_mapping)
@@ -1824,9 +1964,21 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
         pair_results_queue = queue.Queue()
         pair_threads = []
         
+        # Preflight: chỉ ghép cặp các máy khỏe, máy lỗi không bắt máy cùng cặp đợi barrier
+        scheduled_pairs = [(pair_index, d1, d2) for pair_index, (d1, d2) in enumerate(device_pairs, 1)]
+        skipped_pairs = {}
+        preconnected = {}
+        # Chuẩn bị uiautomator2 song song trước khi connect (device giả lập không có adb)
+        unprepared = {}
+        if device_factory is None and device_lifecycle.ENABLED:
+            unprepared = prepare_pair_devices(device_pairs, progress_callback)
+        if preflight.ENABLED or unprepared:
+            scheduled_pairs, skipped_pairs, preconnected = preflight_device_pairs(
+                device_pairs, device_factory, progress_callback, suspect=unprepared)
+        
         # Thông báo bắt đầu parallel mode
         if progress_callback:
-            progress_callback(f"🚀 Bắt đầu chạy {len(device_pairs)} cặp đồng thời (Parallel Mode)")
+            progress_callback(f"🚀 Bắt đầu chạy {len(scheduled_pairs)} cặp đồng thời (Parallel Mode)")
         
         def process_pair(pair_index, device1, device2):
             """Xử lý một cặp thiết bị trong thread riêng biệt"""
@@ -1841,7 +1993,8 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
             if progress_callback:
                 progress_callback(f"🔄 Khởi tạo cặp {pair_index}/{len(device_pairs)}: {device1['ip']} ↔ {device2['ip']} (Parallel Mode)")
             
-            print(f"\n📱 Cặp {pair_index}: {device1['ip']} ↔ {device2['ip']}")
+            plog = log.bind(pair=pair_index)
+            plog.info("📱 Cặp %s: %s ↔ %s", pair_index, device1['ip'], device2['ip'])
             
             # Chuẩn bị danh sách devices cho cặp này với format IP:5555
             device_ips = []
@@ -1851,6 +2004,23 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
                     device_ip = f"{device_ip}:5555"
                 device_ips.append(device_ip)
             
+            # Compile hội thoại của cặp một lần (load + chuẩn hóa + kiểm tra), hai máy dùng chung plan
+            try:
+                conversation_plan = get_plan_registry().get_or_compile(
+                    pair_index, load_conversation_from_file, refresh=True)
+                plog.info("💬 Cặp %s: plan %d tin nhắn (%s)", pair_index,
+                          len(conversation_plan.messages), conversation_plan.digest)
+            except ConversationPlanError as e:
+                plog.error("❌ Cặp %s: cuộc hội thoại không hợp lệ: %s", pair_index, e)
+                if progress_callback:
+                    progress_callback(f"❌ Cặp {pair_index}: cuộc hội thoại không hợp lệ: {e}")
+                for device_ip in device_ips:
+                    dev = preconnected.pop(device_ip, None)
+                    if dev is not None:
+                        dev.disconnect()
+                pair_results_queue.put((pair_name, {"status": "plan_invalid", "error": str(e)}))
+                return
+            
             # Kết nối devices
             connected_devices = []
             connection_results = {}
@@ -1862,28 +2032,31 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
                     device_ip = f"{device_ip}:5555"
                 
                 try:
-                    if progress_callback:
-                        progress_callback(f"🔌 Kết nối {device_ip}...")
-                    
-                    print(f"🔌 Kết nối device: {device_ip}")
-                    dev = Device(device_ip)
-                    if dev.connect():
+                    # Device đã connect trong preflight thì dùng lại
+                    dev = preconnected.pop(device_ip, None)
+                    reused = dev is not None
+                    if not reused:
+                        if progress_callback:
+                            progress_callback(f"🔌 Kết nối {device_ip}...")
+                        plog.info("🔌 Kết nối device: %s", device_ip)
+                        dev = device_factory(device_ip) if device_factory else Device(device_ip)
+                    if reused or dev.connect():
                         connected_devices.append(dev)
                         dev.group_id = pair_index
                         dev.group_devices = device_ips
                         dev.role_in_group = len(connected_devices)
                         connection_results[device_ip] = {"status": "connected", "result": None}
-                        print(f"✅ Kết nối thành công: {device_ip}")
+                        plog.info("✅ Kết nối thành công: %s", device_ip)
                     else:
                         connection_results[device_ip] = {"status": "connection_failed", "result": None}
-                        print(f"❌ Kết nối thất bại: {device_ip}")
+                        plog.error("❌ Kết nối thất bại: %s", device_ip)
                 except Exception as e:
                     connection_results[device_ip] = {"status": "error", "result": str(e)}
-                    print(f"❌ Lỗi kết nối {device_ip}: {e}")
+                    plog.error("❌ Lỗi kết nối %s: %s", device_ip, e)
             
             if len(connected_devices) < 2:
                 error_msg = f"Chỉ kết nối được {len(connected_devices)}/2 devices trong cặp {pair_index}"
-                print(f"❌ {error_msg}")
+                plog.error("❌ %s", error_msg)
                 pair_result = {"status": "connection_failed", "error": error_msg}
                 pair_results_queue.put((pair_name, pair_result))
                 
@@ -1900,7 +2073,7 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
                 if progress_callback:
                     progress_callback(f"🎯 Cặp {pair_index} bắt đầu automation đồng thời...")
                 
-                print(f"🎯 Bắt đầu automation cặp {pair_index} với {len(connected_devices)} devices")
+                plog.info("🎯 Bắt đầu automation cặp %s với %d devices", pair_index, len(connected_devices))
                 
                 # Chạy automation trên từng device trong cặp với parallel processing
                 pair_results = {}
@@ -1909,27 +2082,22 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
                 done_events = []
                 
                 # Tạo và start threads với staggered delays
-                print(f"[DEBUG] ===== THREAD CREATION FOR PAIR {pair_index} =====")
-                print(f"[DEBUG] Connected devices count: {len(connected_devices)}")
-                for i, dev in enumerate(connected_devices):
-                    print(f"[DEBUG] Device {i+1}: {dev.device_id}")
-                print(f"[DEBUG] ============================================")
+                plog.debug("Thread creation: %d connected devices %s",
+                           len(connected_devices), [dev.device_id for dev in connected_devices])
                 
                 for device_index, dev in enumerate(connected_devices):
                     dev.group_id = pair_index
                     dev.role_in_group = device_index + 1
                     dev.group_devices = device_ips
+                    dev.conversation_plan = conversation_plan
 
                     done_event = threading.Event()
                     done_events.append(done_event)
                     
                     delay = device_index * 2  # 2s delay giữa các devices
                     
-                    print(f"[DEBUG] Creating thread for device {dev.device_id}:")
-                    print(f"[DEBUG]   - device_index: {device_index}")
-                    print(f"[DEBUG]   - delay: {delay}s")
-                    print(f"[DEBUG]   - group_id: {dev.group_id}")
-                    print(f"[DEBUG]   - role_in_group: {dev.role_in_group}")
+                    plog.debug("Creating thread for %s: index=%s delay=%ss group_id=%s role=%s",
+                               dev.device_id, device_index, delay, dev.group_id, dev.role_in_group)
                     
                     thread = threading.Thread(
                         target=run_device_automation,
@@ -1938,15 +2106,12 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
                     )
                     threads.append(thread)
                     
-                    print(f"[DEBUG] Starting thread for device {dev.device_id}...")
                     thread.start()
-                    print(f"🚀 Started thread cho device {dev.device_id} với delay {delay}s (result_queue passed)")
-                    print(f"[DEBUG] Thread {thread.name} is_alive: {thread.is_alive()}")
+                    plog.info("🚀 Started thread cho device %s với delay %ss", dev.device_id, delay)
                     
-                print(f"[DEBUG] Total threads created: {len(threads)}")
-                print(f"[DEBUG] Total done_events created: {len(done_events)}")
+                plog.debug("Total threads created: %d, done_events: %d", len(threads), len(done_events))
                 
-                print(f"⏳ Cặp {pair_index}: Đợi {len(threads)} devices hoàn thành...")
+                plog.info("⏳ Cặp %s: Đợi %d devices hoàn thành...", pair_index, len(threads))
                 if progress_callback:
                     progress_callback(f"⏳ Cặp {pair_index}: Đợi {len(threads)} devices hoàn thành...")
                 
@@ -1959,7 +2124,7 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
                 while time.time() - wait_start < max_wait_time:
                     # Check stop signal
                     if stop_event and stop_event.is_set():
-                        print(f"⏹️ Stop signal received, breaking wait loop")
+                        plog.info("⏹️ Stop signal received, breaking wait loop")
                         break
                     
                     # Kiểm tra done_events thay vì thread.is_alive()
@@ -1969,19 +2134,21 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
                     if pending_events == 0:
                         all_threads_completed = True
                         elapsed_total = time.time() - wait_start
-                        print(f"✅ [THREAD_WAIT] Tất cả {len(done_events)} done_events đã được signaled sau {elapsed_total:.1f}s")
+                        plog.info("✅ [THREAD_WAIT] Tất cả %d done_events đã được signaled sau %.1fs", len(done_events), elapsed_total)
                         break
                     
                     # Enhanced logging mỗi 10 giây với chi tiết thread status
                     current_time = time.time()
                     elapsed = current_time - wait_start
                     if current_time - last_log_time >= 10:
-                        print(f"⏳ [THREAD_WAIT] Còn {pending_events}/{len(done_events)} events chưa completed ({elapsed:.0f}s/{max_wait_time}s)")
+                        plog.info("⏳ [THREAD_WAIT] Còn %d/%d events chưa completed (%.0fs/%ss)",
+                                  pending_events, len(done_events), elapsed, max_wait_time)
                         
                         # Log chi tiết thread status
-                        for i, (thread, done_event) in enumerate(zip(threads, done_events)):
-                            status = "✅ DONE" if done_event.is_set() else ("🔄 ALIVE" if thread.is_alive() else "❌ DEAD")
-                            print(f"  Thread {i+1} ({thread.name}): {status}")
+                        if plog.isEnabledFor(logging.DEBUG):
+                            for i, (thread, done_event) in enumerate(zip(threads, done_events)):
+                                status = "✅ DONE" if done_event.is_set() else ("🔄 ALIVE" if thread.is_alive() else "❌ DEAD")
+                                plog.debug("  Thread %d (%s): %s", i + 1, thread.name, status)
                         
                         last_log_time = current_time
                     
@@ -1990,14 +2157,14 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
                 # Force cleanup logic với enhanced logging
                 if not all_threads_completed:
                     elapsed_total = time.time() - wait_start
-                    print(f"⚠️ [FORCE_CLEANUP] Timeout waiting for done_events after {elapsed_total:.1f}s")
-                    print(f"🔧 [FORCE_CLEANUP] Bắt đầu force cleanup cho {len(threads)} threads...")
+                    log.warning("⚠️ [FORCE_CLEANUP] Timeout waiting for done_events after %.1fs", elapsed_total)
+                    log.info("🔧 [FORCE_CLEANUP] Bắt đầu force cleanup cho %s threads...", len(threads))
                     
                     # Force join remaining threads với improved logging và stacktrace
                     for i, thread in enumerate(threads):
                         if thread.is_alive():
                             done_status = "SET" if done_events[i].is_set() else "NOT_SET"
-                            print(f"🔧 [FORCE_CLEANUP] Force joining thread {thread.name} (done_event: {done_status})")
+                            log.info("🔧 [FORCE_CLEANUP] Force joining thread %s (done_event: %s)", thread.name, done_status)
                             
                             # Log stacktrace cho debugging
                             try:
@@ -2006,21 +2173,21 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
                                 frame = sys._current_frames().get(thread.ident)
                                 if frame:
                                     stack = traceback.format_stack(frame)
-                                    print(f"📊 [STACKTRACE] Thread {thread.name} stack:")
+                                    log.info("📊 [STACKTRACE] Thread %s stack:", thread.name)
                                     for line in stack[-3:]:  # Chỉ log 3 dòng cuối
-                                        print(f"    {line.strip()}")
+                                        log.info("    %s", line.strip())
                             except Exception as e:
-                                print(f"⚠️ [STACKTRACE] Không thể lấy stacktrace cho {thread.name}: {e}")
+                                log.warning("⚠️ [STACKTRACE] Không thể lấy stacktrace cho %s: %s", thread.name, e)
                             
                             thread.join(timeout=5.0)
                             if thread.is_alive():
-                                print(f"⚠️ [FORCE_CLEANUP] Thread {thread.name} vẫn đang chạy sau force join 5s")
+                                log.warning("⚠️ [FORCE_CLEANUP] Thread %s vẫn đang chạy sau force join 5s", thread.name)
                             else:
-                                print(f"✅ [FORCE_CLEANUP] Thread {thread.name} đã join thành công")
+                                log.info("✅ [FORCE_CLEANUP] Thread %s đã join thành công", thread.name)
                         else:
-                            print(f"✅ [FORCE_CLEANUP] Thread {thread.name} đã tự động kết thúc")
+                            log.info("✅ [FORCE_CLEANUP] Thread %s đã tự động kết thúc", thread.name)
                     
-                    print(f"🏁 [FORCE_CLEANUP] Hoàn thành force cleanup sau {time.time() - wait_start:.1f}s")
+                    log.info("🏁 [FORCE_CLEANUP] Hoàn thành force cleanup sau %.1fs", time.time() - wait_start)
                 
                 # Thu thập kết quả từ queue
                 while not result_queue.empty():
@@ -2034,7 +2201,7 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
                         app_open_failures.append(device_ip)
                 
                 if app_open_failures:
-                    print(f"⚠️ Một số devices không mở được Zalo app: {app_open_failures}")
+                    log.warning("⚠️ Một số devices không mở được Zalo app: %s", app_open_failures)
                     if progress_callback:
                         progress_callback(f"⚠️ Devices không mở được app: {', '.join(app_open_failures)}")
                 
@@ -2051,7 +2218,7 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
                 
             except Exception as e:
                 error_msg = f"Lỗi automation cặp {pair_index}: {str(e)}"
-                print(f"❌ {error_msg}")
+                plog.error("❌ %s", error_msg)
                 pair_result = {"status": "error", "error": error_msg}
                 if progress_callback:
                     progress_callback(f"❌ Cặp {pair_index}: {error_msg}")
@@ -2067,7 +2234,7 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
             pair_results_queue.put((pair_name, pair_result))
         
         # Tạo threads cho từng cặp thiết bị
-        for pair_index, (device1, device2) in enumerate(device_pairs, 1):
+        for position, (pair_index, device1, device2) in enumerate(scheduled_pairs, 1):
             thread = threading.Thread(
                 target=process_pair,
                 args=(pair_index, device1, device2),
@@ -2077,7 +2244,7 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
             thread.start()
             
             # Staggered start để tránh overload
-            if pair_index < len(device_pairs):
+            if position < len(scheduled_pairs):
                 time.sleep(1)  # Delay 1s giữa các cặp
         
         # Chờ tất cả threads hoàn thành
@@ -2085,7 +2252,7 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
             thread.join()
         
         # Thu thập kết quả từ queue
-        results = {}
+        results = dict(skipped_pairs)
         while not pair_results_queue.empty():
             pair_name, pair_result = pair_results_queue.get()
             results[pair_name] = pair_result
@@ -2095,7 +2262,14 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
         success_pairs = sum(1 for r in results.values() if r["status"] == "completed")
         
         final_message = f"Hoàn thành: {success_pairs}/{total_pairs} thành công."
-        print(f"\n🏁 {final_message}")
+        log.info("🏁 %s", final_message)
+        
+        report_path = write_run_report()
+        if report_path:
+            log.info("📊 Metrics report: %s", report_path)
+        trace_path = export_chrome_trace()
+        if trace_path:
+            log.info("🧭 Chrome trace: %s", trace_path)
         
         # Chỉ báo hoàn thành khi tất cả threads thực sự đã hoàn thành
         if progress_callback:
@@ -2103,13 +2277,15 @@ def run_zalo_automation(device_pairs, conversations, phone_mapping, progress_cal
             # Đảm bảo báo cáo cuối cùng sau khi tất cả đã hoàn thành
             time.sleep(0.5)  # Delay nhỏ để đảm bảo UI cập nhật đúng
         
+        finish_run_logs(run_log_id, "stopped" if stop_event and stop_event.is_set() else "completed")
         return results
         
     except Exception as e:
         error_msg = f"Lỗi chung trong automation: {str(e)}"
-        print(f"❌ {error_msg}")
+        log.error("❌ %s", error_msg)
         if progress_callback:
             progress_callback(f"❌ {error_msg}")
+        finish_run_logs(run_log_id, "failed")
         return {"error": error_msg}
 
 if __name__ == "__main__":
@@ -2118,6 +2294,23 @@ if __name__ == "__main__":
 # ===================== EDIT PHÍA DƯỚI NÀY =====================
 # === FLOW START ===
 
+from utils.log_pipeline import get_logger
+from utils.metrics import step_timer, timed_step, bind_device
+from utils.tracing import span as trace_span
+from utils.session_recorder import annotate as annotate_session
+from utils.capture_store import store_capture
+from utils.screenshot_service import request_diagnostics, request_screenshot
+from utils.status_hub import get_status_hub
+from utils.selector_cache import ordered_selectors, remember_selector
+from utils.navigation_stats import get_navigation_stats, zalo_chat_link
+from utils.app_reset import get_reset_profile, shell_reset, build_reset_command
+from utils.friend_cache import get_friend_cache
+from utils.bubble_diff import take_snapshot, outgoing_bubble_added, input_cleared
+from utils.conversation_plan import get_plan_registry, smart_delay, ConversationPlanError
+
+# Log của flow đi qua pipeline (device/pair lấy từ bind_device của thread)
+log = get_logger()
+
 PKG = "com.zing.zalo"
 RID_SEARCH_BTN   = "com.zing.zalo:id/action_bar_search_btn"
 RID_ACTION_BAR   = "com.zing.zalo:id/zalo_action_bar"
@@ -2136,16 +2329,17 @@ RID_SEND_MSG     = "com.zing.zalo:id/btn_send_message"
 
 TEXT_SEARCH_PLACEHOLDER = "Tìm kiếm"
 
+@timed_step("login_check")
 def is_login_required(dev, debug=False):
     """Kiểm tra có cần đăng nhập không - UIAutomator2 way"""
     try:
         # Kiểm tra login buttons
         if dev.element_exists(resourceId="com.zing.zalo:id/btnLogin"):
-            if debug: print("[DEBUG] Login button found")
+            if debug: log.debug("Login button found")
             return True
         
         if dev.element_exists(text="btnRegisterUsingPhoneNumber"):
-            if debug: print("[DEBUG] Register button found")
+            if debug: log.debug("Register button found")
             return True
         
         # Kiểm tra main layout
@@ -2157,9 +2351,10 @@ def is_login_required(dev, debug=False):
             
         return False
     except Exception as e:
-        if debug: print(f"[DEBUG] Error checking login: {e}")
+        if debug: log.debug("Error checking login: %s", e)
         return False
 
+@timed_step("messages_tab")
 def ensure_on_messages_tab(dev, debug=False):
     """Ép về tab 'Tin nhắn' để có action bar & search đúng ngữ cảnh - UIAutomator2 way"""
     try:
@@ -2179,7 +2374,7 @@ def ensure_on_messages_tab(dev, debug=False):
         
         return True  # không tìm thấy thì vẫn tiếp tục (tránh block)
     except Exception as e:
-        if debug: print(f"[DEBUG] Error ensuring messages tab: {e}")
+        if debug: log.debug("Error ensuring messages tab: %s", e)
         return True
 
 def verify_search_opened(dev, timeout=3, debug=False):
@@ -2194,45 +2389,45 @@ def verify_search_opened(dev, timeout=3, debug=False):
             {"className": "androidx.appcompat.widget.SearchView$SearchAutoComplete"}
         ]
         
-        for selector in search_selectors:
+        for selector in ordered_selectors(dev, "search_input", search_selectors):
             if dev.d(**selector).wait(timeout=timeout):
-                if debug: print(f"[DEBUG] Search opened - found: {selector}")
+                remember_selector(dev, "search_input", selector)
+                if debug: log.debug("Search opened - found: %s", selector)
                 return True
         
         # Kiểm tra IME (keyboard) hiển thị
         try:
             ime_info = dev.d.info.get('inputMethodShown', False)
             if ime_info:
-                if debug: print("[DEBUG] Search opened - IME shown")
+                if debug: log.debug("Search opened - IME shown")
                 return True
         except:
             pass
         
         return False
     except Exception as e:
-        if debug: print(f"[DEBUG] Error verifying search: {e}")
+        if debug: log.debug("Error verifying search: %s", e)
         return False
 
+@timed_step("search_open")
 def open_search_strong(dev, debug=False):
     """Mở search interface - UIAutomator2 optimized"""
     
-    # Method 1: Click search button by resource-id (most reliable)
-    if dev.click_by_resource_id(RID_SEARCH_BTN, timeout=5, debug=False):
-        if verify_search_opened(dev, debug=False):
-            if debug: print("[DEBUG] ✅ Search opened successfully")
-            return True
-    
-    # Method 2: Quick fallback methods
-    fallback_methods = [
+    # Method 1 + 2: resource-id (most reliable) rồi các fallback nhanh; cách đã thành công
+    # trên loại máy này được thử trước
+    click_methods = [
+        ("resource_id", RID_SEARCH_BTN),
         ("text", "Search"),
         ("text", "Tìm kiếm"),
         ("xpath", '//*[@text="Search"]'),
         ("description", "Search")
     ]
     
-    for method_type, selector in fallback_methods:
+    for method_type, selector in ordered_selectors(dev, "search_button", click_methods):
         try:
-            if method_type == "text":
+            if method_type == "resource_id":
+                success = dev.click_by_resource_id(selector, timeout=5, debug=False)
+            elif method_type == "text":
                 success = dev.click_by_text(selector, timeout=2, debug=False)
             elif method_type == "xpath":
                 success = dev.click_by_xpath(selector, timeout=2, debug=False)
@@ -2240,7 +2435,8 @@ def open_search_strong(dev, debug=False):
                 success = dev.click_by_description(selector, timeout=2, debug=False)
             
             if success and verify_search_opened(dev, debug=False):
-                if debug: print(f"[DEBUG] ✅ Search opened via {method_type}: {selector}")
+                remember_selector(dev, "search_button", (method_type, selector))
+                if debug: log.debug("✅ Search opened via %s: %s", method_type, selector)
                 return True
         except:
             continue
@@ -2251,18 +2447,19 @@ def open_search_strong(dev, debug=False):
         dev.tap_adaptive(base_x, base_y)
         time.sleep(0.5)
         if verify_search_opened(dev, debug=False):
-            if debug: print(f"[DEBUG] ✅ Search opened via coordinates: ({base_x}, {base_y})")
+            if debug: log.debug("✅ Search opened via coordinates: (%s, %s)", base_x, base_y)
             return True
     
     # Method 4: Search key fallback
     dev.key(84)  # SEARCH key
     if verify_search_opened(dev, debug=False):
-        if debug: print("[DEBUG] ✅ Search opened via search key")
+        if debug: log.debug("✅ Search opened via search key")
         return True
     
-    if debug: print("[DEBUG] ❌ Could not open search")
+    if debug: log.debug("❌ Could not open search")
     return False
 
+@timed_step("search_query")
 def enter_query_and_submit(dev, text, debug=False):
     """Nhập query và submit - UIAutomator2 optimized"""
     try:
@@ -2274,14 +2471,15 @@ def enter_query_and_submit(dev, text, debug=False):
             {"className": "android.widget.EditText"}
         ]
         
-        for selector in search_selectors:
+        for selector in ordered_selectors(dev, "search_input", search_selectors):
             if dev.d(**selector).exists:
+                remember_selector(dev, "search_input", selector)
                 # Set text và submit
                 dev.d(**selector).set_text(text)
                 time.sleep(0.3)
                 dev.key(66)  # ENTER
                 time.sleep(1)
-                if debug: print(f"[DEBUG] ✅ Entered text: {text}")
+                if debug: log.debug("✅ Entered text: %s", text)
                 return True
         
         # Fallback: send keys directly
@@ -2289,74 +2487,130 @@ def enter_query_and_submit(dev, text, debug=False):
         time.sleep(0.3)
         dev.key(66)  # ENTER
         time.sleep(1)
-        if debug: print(f"[DEBUG] ✅ Entered text (fallback): {text}")
+        if debug: log.debug("✅ Entered text (fallback): %s", text)
         return True
         
     except Exception as e:
-        if debug: print(f"[DEBUG] ❌ Error entering text: {e}")
+        if debug: log.debug("❌ Error entering text: %s", e)
+        return False
+
+def own_account(dev):
+    """Số điện thoại của tài khoản Zalo trên device (theo PHONE_MAP), None nếu chưa map
+
+    Không fallback về device_id: chữ số của IP sẽ thành một "số điện thoại" giả
+    làm key friend cache sai.
+    """
+    device_id = getattr(dev, 'device_id', "") or ""
+    ip = device_id.split(':')[0]
+    return PHONE_MAP.get(device_id) or PHONE_MAP.get(ip) or PHONE_MAP.get(f"{ip}:5555") or None
+
+def known_friend_chat_ready(dev, partner_phone, debug=False):
+    """Cặp đã biết là bạn bè (friend cache) và ô nhập chat đang hiện -> bỏ qua phát hiện kết bạn
+
+    Kiểm tra lại lười: đã biết là bạn mà không thấy ô chat thì xóa entry để
+    lần này phát hiện đầy đủ lại.
+    """
+    own = own_account(dev)
+    if not partner_phone or not own:
+        # Device chưa có trong PHONE_MAP: không dùng friend cache
+        return False
+    cache = get_friend_cache()
+    if not cache.is_friends(own, partner_phone):
         return False
+    if dev.d(resourceId=RID_EDIT_TEXT).wait(timeout=3):
+        if debug: log.debug("⚡ %s ↔ %s đã là bạn (friend cache) → bỏ qua kiểm tra kết bạn", own, partner_phone)
+        annotate_session(dev.device_id, "friend_status", {"source": "cache", "friends": True})
+        return True
+    if debug: log.debug("⚠️ Friend cache: %s ↔ %s là bạn nhưng không thấy ô chat → kiểm tra lại", own, partner_phone)
+    cache.forget(own, partner_phone)
+    return False
+
+def handle_friend_branch(dev, partner_phone=None, debug=False):
+    """Điểm tách nhánh sau khi vào chat/profile đối tác: chưa là bạn bè -> chạy flow kết bạn
 
+    Cặp đã có trong friend cache thì không dump UI. Returns False nếu flow kết bạn thất bại.
+    """
+    if known_friend_chat_ready(dev, partner_phone, debug=debug):
+        return True
+
+    time.sleep(1)  # Đợi UI load
+    # Chỉ True khi detection không thấy nút kết bạn (không tính lúc vừa gửi lời mời)
+    detected_friends = False
+
+    if debug: log.debug("🔍 Kiểm tra btn_send_friend_request để quyết định flow...")
+
+    # Sử dụng UI dump analysis thay vì element_exists để detect NAF elements
+    device_serial = getattr(dev, 'device_id', None)
+    if device_serial:
+        # Convert device_id format if needed
+        if '_' in device_serial and device_serial.count('_') >= 4:
+            parts = device_serial.split('_')
+            if len(parts) >= 5:
+                ip_parts = parts[:4]
+                port = parts[4] if len(parts) > 4 else '5555'
+                device_serial = ".".join(ip_parts) + ":" + port
+
+        # Check UI dump for btn_send_friend_request
+        has_friend_btn = check_btn_send_friend_request_in_dump(device_serial, debug=debug)
+
+        if has_friend_btn:
+            if debug: log.debug("✅ Tìm thấy btn_send_friend_request trong UI dump → chuyển sang flow kết bạn")
+
+            # Thực hiện flow kết bạn ngay tại đây
+            friend_flow_success = dev.handle_friend_request_flow(debug=debug)
+
+            if friend_flow_success:
+                if debug: log.debug("✅ Hoàn thành flow kết bạn → tiếp tục flow chính")
+            else:
+                if debug: log.debug("❌ Flow kết bạn thất bại")
+                return False
+        else:
+            if debug: log.debug("ℹ️ Không tìm thấy btn_send_friend_request trong UI dump → đã là bạn bè, tiếp tục flow chính")
+            detected_friends = True
+    else:
+        if debug: log.debug("⚠️ Không lấy được device_serial, fallback về element_exists")
+        # Fallback về phương thức cũ nếu không có device_serial
+        if dev.element_exists(resourceId="com.zing.zalo:id/btn_send_friend_request", timeout=3):
+            if debug: log.debug("✅ Tìm thấy btn_send_friend_request (fallback) → chuyển sang flow kết bạn")
+
+            # Thực hiện flow kết bạn ngay tại đây
+            friend_flow_success = dev.handle_friend_request_flow(debug=debug)
+
+            if friend_flow_success:
+                if debug: log.debug("✅ Hoàn thành flow kết bạn (fallback) → tiếp tục flow chính")
+            else:
+                if debug: log.debug("❌ Flow kết bạn thất bại (fallback)")
+                return False
+        else:
+            if debug: log.debug("ℹ️ Không tìm thấy btn_send_friend_request (fallback) → đã là bạn bè, tiếp tục flow chính")
+            detected_friends = True
+
+    # Chỉ ghi nhận là bạn khi detection không thấy nút kết bạn VÀ thấy ô chat (dump lỗi
+    # cũng trả "không có nút kết bạn"). Vừa gửi lời mời thì chưa phải bạn: chat người lạ
+    # cũng có ô nhập, cache sai sẽ làm cả hai máy bỏ qua detection về sau.
+    own = own_account(dev)
+    if detected_friends and partner_phone and own and dev.element_exists(resourceId=RID_EDIT_TEXT):
+        get_friend_cache().mark_friends(own, partner_phone)
+        annotate_session(dev.device_id, "friend_status", {"source": "detected", "friends": True})
+    return True
+
+@timed_step("open_chat")
 def click_first_search_result(dev, preferred_text=None, debug=False):
     """Click first search result và implement điểm tách nhánh theo yêu cầu"""
     try:
         # Method 1: Click by search result button resource-id (most reliable)
         if dev.click_by_resource_id("com.zing.zalo:id/btn_search_result", timeout=3, debug=False):
-            if debug: print("[DEBUG] ✅ Clicked search result button")
+            if debug: log.debug("✅ Clicked search result button")
             
             # ĐIỂM TÁCH NHÁNH: Kiểm tra btn_send_friend_request sau khi click btn_search_result
-            time.sleep(1)  # Đợi UI load
-            
-            if debug: print("[DEBUG] 🔍 Kiểm tra btn_send_friend_request để quyết định flow...")
-            
-            # Sử dụng UI dump analysis thay vì element_exists để detect NAF elements
-            device_serial = getattr(dev, 'device_id', None)
-            if device_serial:
-                # Convert device_id format if needed
-                if '_' in device_serial and device_serial.count('_') >= 4:
-                    parts = device_serial.split('_')
-                    if len(parts) >= 5:
-                        ip_parts = parts[:4]
-                        port = parts[4] if len(parts) > 4 else '5555'
-                        device_serial = ".".join(ip_parts) + ":" + port
-                
-                # Check UI dump for btn_send_friend_request
-                has_friend_btn = check_btn_send_friend_request_in_dump(device_serial, debug=debug)
-                
-                if has_friend_btn:
-                    if debug: print("[DEBUG] ✅ Tìm thấy btn_send_friend_request trong UI dump → chuyển sang flow kết bạn")
-                    
-                    # Thực hiện flow kết bạn ngay tại đây
-                    friend_flow_success = dev.handle_friend_request_flow(debug=debug)
-                    
-                    if friend_flow_success:
-                        if debug: print("[DEBUG] ✅ Hoàn thành flow kết bạn → tiếp tục flow chính")
-                    else:
-                        if debug: print("[DEBUG] ❌ Flow kết bạn thất bại")
-                        return False
-                else:
-                    if debug: print("[DEBUG] ℹ️ Không tìm thấy btn_send_friend_request trong UI dump → đã là bạn bè, tiếp tục flow chính")
-            else:
-                if debug: print("[DEBUG] ⚠️ Không lấy được device_serial, fallback về element_exists")
-                # Fallback về phương thức cũ nếu không có device_serial
-                if dev.element_exists(resourceId="com.zing.zalo:id/btn_send_friend_request", timeout=3):
-                    if debug: print("[DEBUG] ✅ Tìm thấy btn_send_friend_request (fallback) → chuyển sang flow kết bạn")
-                    
-                    # Thực hiện flow kết bạn ngay tại đây
-                    friend_flow_success = dev.handle_friend_request_flow(debug=debug)
-                    
-                    if friend_flow_success:
-                        if debug: print("[DEBUG] ✅ Hoàn thành flow kết bạn (fallback) → tiếp tục flow chính")
-                    else:
-                        if debug: print("[DEBUG] ❌ Flow kết bạn thất bại (fallback)")
-                        return False
-                else:
-                    if debug: print("[DEBUG] ℹ️ Không tìm thấy btn_send_friend_request (fallback) → đã là bạn bè, tiếp tục flow chính")
+            if not handle_friend_branch(dev, partner_phone=preferred_text, debug=debug):
+                return False
             
             return True
         
         # Method 2: Click by preferred text
         if preferred_text and dev.click_by_text(preferred_text, timeout=3, debug=False):
-            if debug: print(f"[DEBUG] ✅ Found and clicked: {preferred_text}")
+            if debug: log.debug("✅ Found and clicked: %s", preferred_text)
             return True
         
         # Method 3: Click first item in message list
@@ -2366,25 +2620,153 @@ def click_first_search_result(dev, preferred_text=None, debug=False):
                 first_child = recyclerview.child(clickable=True)
                 if first_child.exists:
                     first_child.click()
-                    if debug: print("[DEBUG] ✅ Clicked first search result")
+                    if debug: log.debug("✅ Clicked first search result")
                     return True
         
         # Method 4: Click first clickable item
         clickable_items = dev.d(clickable=True)
         if clickable_items.exists:
             clickable_items.click()
-            if debug: print("[DEBUG] ✅ Clicked first available result")
+            if debug: log.debug("✅ Clicked first available result")
             return True
         
         # Method 5: Fallback coordinates
         dev.tap(540, 960)
-        if debug: print("[DEBUG] ✅ Used fallback tap")
+        if debug: log.debug("✅ Used fallback tap")
         return True
         
     except Exception as e:
-        if debug: print(f"[DEBUG] ❌ Error clicking result: {e}")
+        if debug: log.debug("❌ Error clicking result: %s", e)
+        return False
+
+def open_chat_via_intent(dev, phone, timeout=8, debug=False):
+    """Mở thẳng chat với đối tác bằng deep link zalo.me qua am start - bỏ qua tab tin nhắn và UI tìm kiếm"""
+    link = zalo_chat_link(phone)
+    if not link:
+        return False
+    try:
+        response = dev.d.shell(["am", "start", "-W", "-a", "android.intent.action.VIEW",
+                                "-d", link, "-p", PKG], timeout=timeout + 5)
+        output = getattr(response, "output", "") or ""
+        if "Error" in output:
+            if debug: log.debug("❌ am start %s thất bại: %s", link, output.strip())
+            return False
+    except Exception as e:
+        if debug: log.debug("❌ Không gửi được intent %s: %s", link, e)
+        return False
+    
+    # Zalo mở chat (đã là bạn) hoặc profile đối tác (nút Nhắn tin / Kết bạn)
+    landed = None
+    deadline = time.time() + timeout
+    while landed is None and time.time() < deadline:
+        if dev.element_exists(resourceId=RID_EDIT_TEXT):
+            landed = "chat"
+        elif dev.element_exists(resourceId=RID_SEND_MSG) or dev.element_exists(resourceId=RID_ADD_FRIEND):
+            landed = "profile"
+        else:
+            time.sleep(0.5)
+    if landed is None:
+        if debug: log.debug("❌ Intent %s: không thấy chat/profile sau %ss", link, timeout)
+        return False
+    if debug: log.debug("✅ Intent %s → %s", link, landed)
+    
+    if not handle_friend_branch(dev, partner_phone=phone, debug=debug):
         return False
+    if landed == "profile" and not dev.element_exists(resourceId=RID_EDIT_TEXT):
+        if not dev.click_by_resource_id(RID_SEND_MSG, timeout=3, debug=False):
+            return False
+    return bool(dev.d(resourceId=RID_EDIT_TEXT).wait(timeout=5))
+
+def open_chat_via_search(dev, target_phone, stop_event=None, debug=False):
+    """Mở chat qua UI: tab Tin nhắn -> ô tìm kiếm -> nhập số -> chọn kết quả đầu tiên"""
+    # Ép về tab Tin nhắn trước
+    ensure_on_messages_tab(dev, debug=debug)
+    time.sleep(0.4)
+    
+    # Kiểm tra stop signal trước mở search
+    if stop_event and stop_event.is_set():
+        log.debug("Stop signal received before opening search for %s", dev.device_id)
+        return "STOPPED"
+    
+    log.info("• Mở ô tìm kiếm…")
+    if not open_search_strong(dev, debug=debug):
+        log.error("❌ Không mở được ô tìm kiếm. Thử bấm thêm một lần nữa với key SEARCH…")
+        dev.key(84)  # SEARCH key
+        time.sleep(0.6)
+        if not verify_search_opened(dev, debug=debug):
+            log.error("❌ Không mở được ô tìm kiếm.")
+            return False
+    
+    # Kiểm tra stop signal trước nhập số
+    if stop_event and stop_event.is_set():
+        log.debug("Stop signal received before entering phone number for %s", dev.device_id)
+        return "STOPPED"
+    
+    # Nhập số điện thoại của partner để tìm kiếm
+    if target_phone:
+        log.info("• Nhập số đối tác: %s", target_phone)
+        enter_query_and_submit(dev, target_phone, debug=debug)
+    else:
+        log.info("• Không có số trong map, nhập 'gxe'")
+        enter_query_and_submit(dev, "gxe", debug=debug)
+    
+    # Kiểm tra stop signal trước click search result
+    if stop_event and stop_event.is_set():
+        log.debug("Stop signal received before clicking search result for %s", dev.device_id)
+        return "STOPPED"
+    
+    log.info("• Chọn kết quả đầu tiên…")
+    return click_first_search_result(dev, preferred_text=target_phone, debug=debug)
+
+def return_to_zalo_main(dev, debug=False):
+    """Back về màn hình chính Zalo sau khi một cách mở chat thất bại giữa chừng"""
+    for _ in range(3):
+        if dev.element_exists(resourceId=RID_TAB_MESSAGE) or dev.element_exists(resourceId=RID_MSG_LIST):
+            return True
+        dev.back()
+        time.sleep(0.5)
+    # Đã ra khỏi Zalo -> mở lại app
+    dev.app(PKG)
+    return dev.element_exists(resourceId=RID_TAB_MESSAGE)
 
+def navigate_to_partner_chat(dev, target_phone, stop_event=None, debug=False):
+    """Vào chat với đối tác bằng strategy nhanh nhất của device, các strategy còn lại làm fallback
+
+    Thời gian + kết quả từng lần thử được ghi vào navigation stats (quyết định
+    thứ tự lần sau) và metrics (step navigate_<strategy>).
+    Returns True / False / "STOPPED".
+    """
+    stats = get_navigation_stats()
+    strategies = stats.order(dev.device_id)
+    if not zalo_chat_link(target_phone):
+        strategies = [s for s in strategies if s != "intent"]
+    
+    for index, strategy in enumerate(strategies):
+        if stop_event and stop_event.is_set():
+            return "STOPPED"
+        if index > 0:
+            log.info("↩️ Fallback sang strategy '%s'", strategy)
+            return_to_zalo_main(dev, debug=debug)
+        
+        started = time.perf_counter()
+        with step_timer(dev, f"navigate_{strategy}"):
+            if strategy == "intent":
+                log.info("• Mở chat trực tiếp qua intent: %s", target_phone)
+                result = open_chat_via_intent(dev, target_phone, debug=debug)
+            else:
+                result = open_chat_via_search(dev, target_phone, stop_event=stop_event, debug=debug)
+        if result == "STOPPED":
+            return result
+        elapsed = time.perf_counter() - started
+        stats.record(dev.device_id, strategy, bool(result), elapsed)
+        annotate_session(dev.device_id, "chat_navigation", {"strategy": strategy, "ok": bool(result),
+                                                            "seconds": round(elapsed, 3)})
+        log.info("%s Vào chat bằng '%s' sau %.2fs", '✅' if result else '❌', strategy, elapsed)
+        if result:
+            return True
+    return False
+
+@timed_step("typing")
 def send_message_human_like(dev, message, debug=False, max_retries=3):
     """Gửi tin nhắn với human-like typing simulation và enhanced error handling"""
     import random
@@ -2393,11 +2775,11 @@ def send_message_human_like(dev, message, debug=False, max_retries=3):
     for attempt in range(max_retries):
         try:
             if debug and attempt > 0:
-                print(f"[DEBUG] 🔄 Retry sending message (attempt {attempt + 1}/{max_retries}): {message[:30]}...")
+                log.debug("🔄 Retry sending message (attempt %s/%s): %s...", attempt + 1, max_retries, message[:30])
             
             # Đảm bảo chat ready trước khi gửi
             if not ensure_chat_ready(dev, debug=debug):
-                if debug: print(f"[DEBUG] ⚠️ Chat not ready, attempt {attempt + 1}")
+                if debug: log.debug("⚠️ Chat not ready, attempt %s", attempt + 1)
                 if attempt < max_retries - 1:
                     time_module.sleep(2)
                     continue
@@ -2413,9 +2795,10 @@ def send_message_human_like(dev, message, debug=False, max_retries=3):
             ]
             
             input_found = False
-            for selector in input_selectors:
+            for selector in ordered_selectors(dev, "chat_input", input_selectors):
                 if dev.d(**selector).exists(timeout=3):
                     input_found = True
+                    remember_selector(dev, "chat_input", selector)
                     # Clear input field với retry
                     for clear_attempt in range(2):
                         try:
@@ -2423,12 +2806,12 @@ def send_message_human_like(dev, message, debug=False, max_retries=3):
                             time_module.sleep(0.2)
                             break
                         except Exception as clear_e:
-                            if debug: print(f"[DEBUG] ⚠️ Clear text failed (attempt {clear_attempt + 1}): {clear_e}")
+                            if debug: log.debug("⚠️ Clear text failed (attempt %s): %s", clear_attempt + 1, clear_e)
                             if clear_attempt == 1:
                                 raise clear_e
                     
                     # Human-like typing simulation
-                    if debug: print(f"[DEBUG] 🎯 Bắt đầu gõ: {message}")
+                    if debug: log.debug("🎯 Bắt đầu gõ: %s", message)
                     
                     # Gõ từng ký tự với delay ngẫu nhiên và error handling
                     for i, char in enumerate(message):
@@ -2445,7 +2828,7 @@ def send_message_human_like(dev, message, debug=False, max_retries=3):
                                 think_delay = random.uniform(0.3, 1.0)
                                 time_module.sleep(think_delay)
                         except Exception as type_e:
-                            if debug: print(f"[DEBUG] ⚠️ Typing error at char {i}: {type_e}")
+                            if debug: log.debug("⚠️ Typing error at char %s: %s", i, type_e)
                             # Fallback: set toàn bộ text
                             dev.d(**selector).set_text(message)
                             break
@@ -2464,16 +2847,17 @@ def send_message_human_like(dev, message, debug=False, max_retries=3):
                     ]
                     
                     send_success = False
-                    for send_selector in send_selectors:
+                    for send_selector in ordered_selectors(dev, "send_button", send_selectors):
                         if dev.d(**send_selector).exists(timeout=2):
                             try:
                                 dev.d(**send_selector).click()
+                                remember_selector(dev, "send_button", send_selector)
                                 time_module.sleep(0.5)  # Wait for send to process
                                 send_success = True
-                                if debug: print(f"[DEBUG] ✅ Sent message (human-like): {message}")
+                                if debug: log.debug("✅ Sent message (human-like): %s", message)
                                 return True
                             except Exception as send_e:
-                                if debug: print(f"[DEBUG] ⚠️ Send button click failed: {send_e}")
+                                if debug: log.debug("⚠️ Send button click failed: %s", send_e)
                                 continue
                     
                     if not send_success:
@@ -2481,10 +2865,10 @@ def send_message_human_like(dev, message, debug=False, max_retries=3):
                         try:
                             dev.key(66)  # ENTER
                             time_module.sleep(0.5)
-                            if debug: print(f"[DEBUG] ✅ Sent message (Enter): {message}")
+                            if debug: log.debug("✅ Sent message (Enter): %s", message)
                             return True
                         except Exception as enter_e:
-                            if debug: print(f"[DEBUG] ⚠️ Enter key failed: {enter_e}")
+                            if debug: log.debug("⚠️ Enter key failed: %s", enter_e)
                             raise enter_e
                     
                     break  # Exit input selector loop if we found input
@@ -2494,7 +2878,7 @@ def send_message_human_like(dev, message, debug=False, max_retries=3):
         
         except Exception as e:
             error_msg = str(e)
-            if debug: print(f"[DEBUG] ❌ Error sending message (attempt {attempt + 1}): {error_msg}")
+            if debug: log.debug("❌ Error sending message (attempt %s): %s", attempt + 1, error_msg)
             
             # Capture error state on final attempt
             if attempt == max_retries - 1:
@@ -2506,7 +2890,7 @@ def send_message_human_like(dev, message, debug=False, max_retries=3):
             else:
                 # Wait before retry with exponential backoff
                 backoff_time = min(2 ** attempt, 8)
-                if debug: print(f"[DEBUG] ⏸️ Waiting {backoff_time}s before retry...")
+                if debug: log.debug("⏸️ Waiting %ss before retry...", backoff_time)
                 time_module.sleep(backoff_time)
     
     return False
@@ -2520,18 +2904,18 @@ def send_message(dev, message, debug=False):
 def load_conversation_from_file(group_id):
     """Load cuộc hội thoại từ Supabase - thay thế JSON operations"""
     try:
-        print(f"📡 Loading conversation cho group {group_id} từ Supabase...")
+        log.info("📡 Loading conversation cho group %s từ Supabase...", group_id)
         conversation = supabase_data_manager.load_conversation_by_group(group_id)
         
         if conversation:
-            print(f"✅ Loaded {len(conversation)} messages cho group {group_id} từ Supabase")
+            log.info("✅ Loaded %s messages cho group %s từ Supabase", len(conversation), group_id)
             return conversation
         else:
-            print(f"⚠️ Không tìm thấy conversation cho group {group_id} trong Supabase")
+            log.warning("⚠️ Không tìm thấy conversation cho group %s trong Supabase", group_id)
             
     except Exception as e:
-        print(f"⚠️ Lỗi load conversation từ Supabase: {e}")
-        print("🔄 Fallback về JSON file...")
+        log.warning("⚠️ Lỗi load conversation từ Supabase: %s", e)
+        log.info("🔄 Fallback về JSON file...")
     
     # Fallback về JSON operations
     try:
@@ -2555,7 +2939,7 @@ def load_conversation_from_file(group_id):
                                 "device_number": 1 if msg.get('device_role') == 'device_a' else 2,
                                 "content": msg.get('content', '')
                             })
-                        print(f"⚠️ Loaded {len(converted_messages)} messages từ conversations.json")
+                        log.warning("⚠️ Loaded %s messages từ conversations.json", len(converted_messages))
                         return converted_messages
         
         # Fallback về conversation_data.json
@@ -2569,14 +2953,14 @@ def load_conversation_from_file(group_id):
             
             if pair_key in conversations:
                 messages = conversations[pair_key].get('conversation', [])
-                print(f"⚠️ Loaded {len(messages)} messages từ conversation_data.json")
+                log.warning("⚠️ Loaded %s messages từ conversation_data.json", len(messages))
                 return messages
                 
     except Exception as e:
-        print(f"❌ Lỗi load từ JSON fallback: {e}")
+        log.error("❌ Lỗi load từ JSON fallback: %s", e)
     
     # Fallback conversation đơn giản nếu không load được
-    print("⚠️ Sử dụng fallback conversation mặc định")
+    log.warning("⚠️ Sử dụng fallback conversation mặc định")
     return [
         {"message_id": 1, "device_number": 1, "content": "Cậu đang làm gì đấy"},
         {"message_id": 2, "device_number": 2, "content": "Đang xem phim nè"},
@@ -2604,15 +2988,15 @@ def send_friend_request(dev, debug=False):
     import time
     from ui_friend_status_fix import send_friend_request as send_friend_request_fix
     
-    if debug: print("[DEBUG] 🚀 Bắt đầu send_friend_request function với NAF handling")
+    if debug: log.debug("🚀 Bắt đầu send_friend_request function với NAF handling")
     
     try:
         # Dump UI trước khi thực hiện để có thông tin bounds
         try:
-            if debug: print("[DEBUG] 📸 Dumping UI để lấy thông tin bounds...")
+            if debug: log.debug("📸 Dumping UI để lấy thông tin bounds...")
             dump_ui_and_log(dev, debug=debug)
         except Exception as e:
-            if debug: print(f"[DEBUG] ⚠️ Không thể dump UI: {e}")
+            if debug: log.debug("⚠️ Không thể dump UI: %s", e)
         
         # Sử dụng hàm từ ui_friend_status_fix.py với khả năng xử lý NAF
         device_serial = dev.device_id
@@ -2626,7 +3010,7 @@ def send_friend_request(dev, debug=False):
                 ip_parts = parts[:4]  # First 4 parts are IP
                 port = parts[4] if len(parts) > 4 else '5555'
                 device_serial = ".".join(ip_parts) + ":" + port
-                if debug: print(f"[DEBUG] 🔧 Converted device_serial: {dev.device_id} -> {device_serial}")
+                if debug: log.debug("🔧 Converted device_serial: %s -> %s", dev.device_id, device_serial)
         
         result = send_friend_request_fix(device_serial, max_retries=3, debug=debug)
         
@@ -2636,7 +3020,7 @@ def send_friend_request(dev, debug=False):
         else:
             result = 'SEND_FAILED'
         
-        if debug: print(f"[DEBUG] 📋 Kết quả từ send_friend_request_fix: {result}")
+        if debug: log.debug("📋 Kết quả từ send_friend_request_fix: %s", result)
         
         # Verify kết quả bằng cách kiểm tra UI state
         time.sleep(1)
@@ -2644,48 +3028,52 @@ def send_friend_request(dev, debug=False):
         if result == 'FRIEND_REQUEST_SENT':
             # Double check bằng cách kiểm tra UI state
             if dev.element_exists(resourceId="com.zing.zalo:id/chatinput_text", timeout=2):
-                if debug: print("[DEBUG] ✅ Phát hiện chatinput_text sau khi gửi - đã kết bạn ngay lập tức")
+                if debug: log.debug("✅ Phát hiện chatinput_text sau khi gửi - đã kết bạn ngay lập tức")
                 return 'ALREADY_FRIENDS'
             
             # Kiểm tra nút gửi lời mời đã biến mất chưa
             if not dev.element_exists(resourceId="com.zing.zalo:id/btn_send_friend_request", timeout=1):
-                if debug: print("[DEBUG] ✅ Xác nhận: nút btn_send_friend_request đã biến mất")
+                if debug: log.debug("✅ Xác nhận: nút btn_send_friend_request đã biến mất")
                 return 'FRIEND_REQUEST_SENT'
             
             # Kiểm tra có text indicator thành công
             sent_indicators = ["Đã gửi", "Sent", "Pending", "Chờ xác nhận"]
             for indicator in sent_indicators:
                 if dev.element_exists(text=indicator, timeout=1):
-                    if debug: print(f"[DEBUG] ✅ Xác nhận: tìm thấy indicator '{indicator}'")
+                    if debug: log.debug("✅ Xác nhận: tìm thấy indicator '%s'", indicator)
                     return 'FRIEND_REQUEST_SENT'
         
         return result
         
     except Exception as e:
-        if debug: print(f"[DEBUG] ❌ Lỗi trong send_friend_request: {e}")
+        if debug: log.debug("❌ Lỗi trong send_friend_request: %s", e)
         
         # Fallback về logic cũ nếu có lỗi
-        if debug: print("[DEBUG] 🔄 Fallback về logic click cũ...")
+        if debug: log.debug("🔄 Fallback về logic click cũ...")
         
         try:
             if dev.element_exists(resourceId="com.zing.zalo:id/btn_send_friend_request", timeout=3):
                 if dev.click(resourceId="com.zing.zalo:id/btn_send_friend_request"):
-                    if debug: print("[DEBUG] ✅ Fallback click thành công")
+                    if debug: log.debug("✅ Fallback click thành công")
                     time.sleep(2)
                     return 'FRIEND_REQUEST_SENT'
                 else:
-                    if debug: print("[DEBUG] ❌ Fallback click thất bại")
+                    if debug: log.debug("❌ Fallback click thất bại")
                     return 'SEND_FAILED'
             else:
-                if debug: print("[DEBUG] ❌ Không tìm thấy nút trong fallback")
+                if debug: log.debug("❌ Không tìm thấy nút trong fallback")
                 return 'SEND_FAILED'
         except Exception as fallback_error:
-            if debug: print(f"[DEBUG] ❌ Lỗi trong fallback: {fallback_error}")
+            if debug: log.debug("❌ Lỗi trong fallback: %s", fallback_error)
             return 'UI_ERROR'
 
-def check_and_add_friend(dev, debug=False):
+@timed_step("friend_check")
+def check_and_add_friend(dev, partner_phone=None, debug=False):
     """Kiểm tra và thêm bạn nếu cần thiết với logic phát hiện theo phân tích document
     
+    Có partner_phone thì cặp đã có trong friend cache trả ngay 'ALREADY_FRIENDS'
+    (không dump UI, không đợi), kết quả 'ALREADY_FRIENDS' mới được ghi vào cache.
+    
     Returns:
         'ALREADY_FRIENDS': Đã kết bạn rồi (có thể tiếp tục flow conversation)
         'FRIEND_REQUEST_SENT': Đã gửi lời mời kết bạn (cần tách sang flow phụ)
@@ -2693,18 +3081,29 @@ def check_and_add_friend(dev, debug=False):
         'NEED_FRIEND_REQUEST': Chưa kết bạn, cần gửi lời mời (cần tách sang flow phụ)
         False: Có lỗi xảy ra
     """
+    if known_friend_chat_ready(dev, partner_phone, debug=debug):
+        return 'ALREADY_FRIENDS'
+    
+    status = _detect_and_add_friend(dev, debug=debug)
+    own = own_account(dev)
+    if status == 'ALREADY_FRIENDS' and partner_phone and own and dev.element_exists(resourceId=RID_EDIT_TEXT):
+        get_friend_cache().mark_friends(own, partner_phone)
+    return status
+
+def _detect_and_add_friend(dev, debug=False):
+    """Phát hiện đầy đủ trạng thái kết bạn (dump UI + các selector) - xem check_and_add_friend"""
     import time
     from ui_friend_status_fix import check_friend_status_from_dump
     
     try:
-        if debug: print("[DEBUG] 🔍 Kiểm tra trạng thái kết bạn theo logic phân tích document...")
+        if debug: log.debug("🔍 Kiểm tra trạng thái kết bạn theo logic phân tích document...")
         
         # Gọi hàm dump UI ngay trước khi bắt đầu check theo hướng dẫn document
         try:
-            print("[DEBUG] Dumping UI before friend status check")
+            log.debug("Dumping UI before friend status check")
             dump_ui_and_log(dev, debug=True)
         except Exception as e:
-            print(f"[DEBUG] Failed to dump UI: {e}")
+            log.debug("Failed to dump UI: %s", e)
         
         # Đợi UI load hoàn toàn
         time.sleep(2)
@@ -2713,16 +3112,16 @@ def check_and_add_friend(dev, debug=False):
         
         # Case 1: Kiểm tra đã kết bạn - có chat input (CHÍNH XÁC NHẤT)
         if dev.element_exists(resourceId="com.zing.zalo:id/chatinput_text", timeout=3):
-            if debug: print("[DEBUG] ✅ Phát hiện chatinput_text - XÁC NHẬN đã kết bạn")
+            if debug: log.debug("✅ Phát hiện chatinput_text - XÁC NHẬN đã kết bạn")
             return 'ALREADY_FRIENDS'
         
         # Case 2: Kiểm tra chưa kết bạn - có nút kết bạn
         elif dev.element_exists(resourceId="com.zing.zalo:id/btn_send_friend_request", timeout=3):
-            if debug: print("[DEBUG] 👥 Phát hiện btn_send_friend_request - chưa kết bạn, thực hiện gửi lời mời")
+            if debug: log.debug("👥 Phát hiện btn_send_friend_request - chưa kết bạn, thực hiện gửi lời mời")
             
             # Click nút kết bạn
             if dev.click_by_resource_id("com.zing.zalo:id/btn_send_friend_request", timeout=5, debug=debug):
-                if debug: print("[DEBUG] ✅ Đã click nút 'Kết bạn'")
+                if debug: log.debug("✅ Đã click nút 'Kết bạn'")
                 
                 # Đợi popup xác nhận xuất hiện
                 time.sleep(1.5)
@@ -2739,10 +3138,11 @@ def check_and_add_friend(dev, debug=False):
                     RID_CONFIRM_POPUP if 'RID_CONFIRM_POPUP' in globals() else None
                 ]
                 
-                for popup_id in popup_ids:
-                    if popup_id and dev.element_exists(resourceId=popup_id, timeout=2):
+                for popup_id in ordered_selectors(dev, "friend_request_popup", [p for p in popup_ids if p]):
+                    if dev.element_exists(resourceId=popup_id, timeout=2):
                         if dev.click_by_resource_id(popup_id, timeout=3, debug=debug):
-                            if debug: print(f"[DEBUG] ✅ Đã xác nhận popup với {popup_id}")
+                            remember_selector(dev, "friend_request_popup", popup_id)
+                            if debug: log.debug("✅ Đã xác nhận popup với %s", popup_id)
                             popup_handled = True
                             break
                 
@@ -2752,12 +3152,12 @@ def check_and_add_friend(dev, debug=False):
                     for text in confirm_texts:
                         if dev.element_exists(text=text, timeout=1):
                             if dev.click_by_text(text, timeout=3, debug=debug):
-                                if debug: print(f"[DEBUG] ✅ Đã xác nhận popup với text '{text}'")
+                                if debug: log.debug("✅ Đã xác nhận popup với text '%s'", text)
                                 popup_handled = True
                                 break
                 
                 if not popup_handled:
-                    if debug: print("[DEBUG] ⚠️ Không tìm thấy popup xác nhận, có thể đã gửi thành công")
+                    if debug: log.debug("⚠️ Không tìm thấy popup xác nhận, có thể đã gửi thành công")
                 
                 # Đợi xử lý hoàn tất
                 time.sleep(2)
@@ -2766,34 +3166,35 @@ def check_and_add_friend(dev, debug=False):
                 success_indicators = ["Đã gửi lời mời", "Lời mời đã gửi", "Đã gửi yêu cầu"]
                 for indicator in success_indicators:
                     if dev.element_exists(text=indicator, timeout=2):
-                        if debug: print(f"[DEBUG] ✅ Xác nhận thành công: '{indicator}'")
+                        if debug: log.debug("✅ Xác nhận thành công: '%s'", indicator)
                         return 'FRIEND_REQUEST_SENT'
                 
-                if debug: print("[DEBUG] ✅ Đã hoàn thành gửi lời mời kết bạn")
+                if debug: log.debug("✅ Đã hoàn thành gửi lời mời kết bạn")
                 return 'FRIEND_REQUEST_SENT'
                 
             else:
-                if debug: print("[DEBUG] ❌ Không thể click nút 'Kết bạn'")
+                if debug: log.debug("❌ Không thể click nút 'Kết bạn'")
                 return False
         
         # Case 3: Kiểm tra nút "Chấp nhận" (bên kia đã gửi lời mời)
         elif dev.element_exists(resourceId=RID_ACCEPT if 'RID_ACCEPT' in globals() else "com.zing.zalo:id/btn_accept", timeout=3):
             accept_id = RID_ACCEPT if 'RID_ACCEPT' in globals() else "com.zing.zalo:id/btn_accept"
-            if debug: print("[DEBUG] 🤝 Phát hiện nút 'Chấp nhận' - có lời mời kết bạn")
+            if debug: log.debug("🤝 Phát hiện nút 'Chấp nhận' - có lời mời kết bạn")
             
             # Click nút chấp nhận
             if dev.click_by_resource_id(accept_id, timeout=5, debug=debug):
-                if debug: print("[DEBUG] ✅ Đã chấp nhận lời mời kết bạn")
+                if debug: log.debug("✅ Đã chấp nhận lời mời kết bạn")
                 
                 # Đợi xử lý hoàn tất
                 time.sleep(2)
                 
                 # Kiểm tra popup xác nhận nếu có
                 popup_ids = ["com.zing.zalo:id/btn_ok", "android:id/button1"]
-                for popup_id in popup_ids:
+                for popup_id in ordered_selectors(dev, "friend_accept_popup", popup_ids):
                     if dev.element_exists(resourceId=popup_id, timeout=2):
                         if dev.click_by_resource_id(popup_id, timeout=3, debug=debug):
-                            if debug: print(f"[DEBUG] ✅ Đã xác nhận popup với {popup_id}")
+                            remember_selector(dev, "friend_accept_popup", popup_id)
+                            if debug: log.debug("✅ Đã xác nhận popup với %s", popup_id)
                             break
                 
                 # Đợi thêm để UI cập nhật
@@ -2801,12 +3202,12 @@ def check_and_add_friend(dev, debug=False):
                 return 'FRIEND_REQUEST_ACCEPTED'
                 
             else:
-                if debug: print("[DEBUG] ❌ Không thể click nút 'Chấp nhận'")
+                if debug: log.debug("❌ Không thể click nút 'Chấp nhận'")
                 return False
         
         # Case 4: Kiểm tra các indicators khác để xác nhận đã kết bạn
         else:
-            if debug: print("[DEBUG] ❓ Không tìm thấy chatinput_text hoặc btn_send_friend_request - kiểm tra thêm...")
+            if debug: log.debug("❓ Không tìm thấy chatinput_text hoặc btn_send_friend_request - kiểm tra thêm...")
             
             # Kiểm tra các indicators khác cho việc đã kết bạn
             friend_indicators = [
@@ -2824,31 +3225,31 @@ def check_and_add_friend(dev, debug=False):
                 if indicator_value:
                     if indicator_type == "resourceId":
                         if dev.element_exists(resourceId=indicator_value, timeout=2):
-                            if debug: print(f"[DEBUG] ✅ Tìm thấy {indicator_value} - XÁC NHẬN đã kết bạn")
+                            if debug: log.debug("✅ Tìm thấy %s - XÁC NHẬN đã kết bạn", indicator_value)
                             return 'ALREADY_FRIENDS'
                     elif indicator_type == "text":
                         if dev.element_exists(text=indicator_value, timeout=1):
-                            if debug: print(f"[DEBUG] ✅ Tìm thấy text '{indicator_value}' - XÁC NHẬN đã kết bạn")
+                            if debug: log.debug("✅ Tìm thấy text '%s' - XÁC NHẬN đã kết bạn", indicator_value)
                             return 'ALREADY_FRIENDS'
             
             # Kiểm tra các text cho trạng thái đã gửi lời mời
             sent_request_indicators = ["Đã gửi lời mời", "Lời mời đã gửi", "Đã gửi yêu cầu"]
             for indicator in sent_request_indicators:
                 if dev.element_exists(text=indicator, timeout=1):
-                    if debug: print(f"[DEBUG] 📤 Tìm thấy text '{indicator}' - đã gửi lời mời")
+                    if debug: log.debug("📤 Tìm thấy text '%s' - đã gửi lời mời", indicator)
                     return 'FRIEND_REQUEST_SENT'
             
             # Kiểm tra các text cho chưa kết bạn và thực hiện gửi lời mời nếu cần
             non_friend_indicators = ["Kết bạn", "Gửi lời mời", "Thêm bạn bè"]
             for indicator in non_friend_indicators:
                 if dev.element_exists(text=indicator, timeout=1):
-                    if debug: print(f"[DEBUG] ⚠️ Tìm thấy text '{indicator}' - chưa kết bạn, thực hiện gửi lời mời...")
+                    if debug: log.debug("⚠️ Tìm thấy text '%s' - chưa kết bạn, thực hiện gửi lời mời...", indicator)
                     
                     # Thực hiện click vào nút gửi lời mời
                     try:
                         # Thử click vào text indicator trước
                         if dev.click_element(text=indicator, timeout=3):
-                            if debug: print(f"[DEBUG] ✅ Đã click vào '{indicator}'")
+                            if debug: log.debug("✅ Đã click vào '%s'", indicator)
                             time.sleep(2)  # Đợi UI phản hồi
                             
                             # Kiểm tra và xử lý popup xác nhận nếu có
@@ -2856,40 +3257,40 @@ def check_and_add_friend(dev, debug=False):
                             for confirm_text in confirm_texts:
                                 if dev.element_exists(text=confirm_text, timeout=2):
                                     if dev.click_element(text=confirm_text, timeout=2):
-                                        if debug: print(f"[DEBUG] ✅ Đã xác nhận gửi lời mời với '{confirm_text}'")
+                                        if debug: log.debug("✅ Đã xác nhận gửi lời mời với '%s'", confirm_text)
                                         time.sleep(2)
                                         break
                             
                             # Kiểm tra kết quả sau khi gửi
                             time.sleep(1)
                             if dev.element_exists(text="Đã gửi lời mời", timeout=3) or dev.element_exists(text="Lời mời đã gửi", timeout=2):
-                                if debug: print("[DEBUG] ✅ Xác nhận đã gửi lời mời thành công")
+                                if debug: log.debug("✅ Xác nhận đã gửi lời mời thành công")
                                 return 'FRIEND_REQUEST_SENT'
                             elif dev.element_exists(resourceId="com.zing.zalo:id/chatinput_text", timeout=3):
-                                if debug: print("[DEBUG] ✅ Đã kết bạn thành công ngay lập tức")
+                                if debug: log.debug("✅ Đã kết bạn thành công ngay lập tức")
                                 return 'ALREADY_FRIENDS'
                             else:
-                                if debug: print("[DEBUG] ⚠️ Gửi lời mời nhưng không xác định được kết quả")
+                                if debug: log.debug("⚠️ Gửi lời mời nhưng không xác định được kết quả")
                                 return 'FRIEND_REQUEST_SENT'  # Assume thành công
                         else:
-                            if debug: print(f"[DEBUG] ❌ Không thể click vào '{indicator}'")
+                            if debug: log.debug("❌ Không thể click vào '%s'", indicator)
                             return 'NEED_FRIEND_REQUEST'  # Trả về trạng thái ban đầu
                     except Exception as e:
-                        if debug: print(f"[DEBUG] ❌ Lỗi khi gửi lời mời: {e}")
+                        if debug: log.debug("❌ Lỗi khi gửi lời mời: %s", e)
                         return 'NEED_FRIEND_REQUEST'  # Trả về trạng thái ban đầu
             
             # Nếu không tìm thấy indicators rõ ràng nào, sử dụng UI dump analysis
-            if debug: print("[DEBUG] ❓ Không tìm thấy indicators rõ ràng - sử dụng UI dump analysis")
+            if debug: log.debug("❓ Không tìm thấy indicators rõ ràng - sử dụng UI dump analysis")
             
             # Lấy device serial từ dev object - sử dụng device_id
             device_serial = getattr(dev, 'device_id', None)
             if not device_serial:
-                if debug: print("[DEBUG] ⚠️ Không có device_id - fallback UNKNOWN")
+                if debug: log.debug("⚠️ Không có device_id - fallback UNKNOWN")
                 return 'UNKNOWN'
             
             # Sử dụng hàm phân tích UI dump
             dump_result = check_friend_status_from_dump(device_serial)
-            if debug: print(f"[DEBUG] 🔍 UI dump analysis result: {dump_result}")
+            if debug: log.debug("🔍 UI dump analysis result: %s", dump_result)
             
             # Chuyển đổi kết quả từ dump analysis sang format hiện tại
             if dump_result == "ALREADY_FRIEND":
@@ -2897,11 +3298,11 @@ def check_and_add_friend(dev, debug=False):
             elif dump_result == "NEED_FRIEND_REQUEST":
                 return 'NEED_FRIEND_REQUEST'
             else:  # UNKNOWN - không thể xác định được
-                if debug: print("[DEBUG] ⚠️ UI dump analysis trả về UNKNOWN - cần debug thêm")
+                if debug: log.debug("⚠️ UI dump analysis trả về UNKNOWN - cần debug thêm")
                 return 'UNKNOWN'
         
     except Exception as e:
-        if debug: print(f"[DEBUG] ❌ Lỗi trong check_and_add_friend: {e}")
+        if debug: log.debug("❌ Lỗi trong check_and_add_friend: %s", e)
         return False
 
 def determine_group_and_role(device_ip, all_devices):
@@ -2934,7 +3335,7 @@ def read_current_message_id(group_id):
         if sync_data:
             return sync_data.get('current_message_id', 1)
     except Exception as e:
-        print(f"⚠️ Lỗi đọc sync data từ Supabase: {e}")
+        log.warning("⚠️ Lỗi đọc sync data từ Supabase: %s", e)
         
     # Fallback về JSON file
     try:
@@ -2960,10 +3361,10 @@ def update_current_message_id(group_id, message_id):
         }
         success = supabase_data_manager.update_sync_data(group_id, data)
         if success:
-            print(f"📡 Nhóm {group_id} - Broadcast signal cho message_id {message_id} (Supabase)")
+            log.info("📡 Nhóm %s - Broadcast signal cho message_id %s (Supabase)", group_id, message_id)
             return True
     except Exception as e:
-        print(f"⚠️ Lỗi cập nhật sync data vào Supabase: {e}")
+        log.warning("⚠️ Lỗi cập nhật sync data vào Supabase: %s", e)
         
     # Fallback về JSON file
     try:
@@ -2976,11 +3377,12 @@ def update_current_message_id(group_id, message_id):
         }
         with open(sync_file, 'w', encoding='utf-8') as f:
             json.dump(data, f)
-        print(f"📡 Nhóm {group_id} - Broadcast signal cho message_id {message_id} (JSON fallback)")
+        log.info("📡 Nhóm %s - Broadcast signal cho message_id %s (JSON fallback)", group_id, message_id)
         return True
     except Exception:
         return False
 
+@timed_step("turn_wait", trace_args=("group_id", "target_message_id"))
 def wait_for_message_turn(group_id, target_message_id, role_in_group, timeout=600):
     """Đợi đến lượt gửi message_id cụ thể với timeout và broadcast signal detection
     
@@ -2995,14 +3397,12 @@ def wait_for_message_turn(group_id, target_message_id, role_in_group, timeout=60
         # Đọc sync data từ Supabase trước, fallback đến JSON file
         try:
             # Thử đọc từ Supabase trước
-            from utils.supabase_data_manager import SupabaseDataManager
-            supabase_manager = SupabaseDataManager()
-            sync_data = supabase_manager.get_sync_data(group_id)
+            sync_data = supabase_data_manager.get_sync_data(group_id)
             
             if sync_data:
                 current_id = sync_data.get('current_message_id', 1)
                 broadcast_signal = sync_data.get('broadcast_signal')
-                print(f"📡 Nhóm {group_id} - Đọc sync data từ Supabase (current_id: {current_id})")
+                log.info("📡 Nhóm %s - Đọc sync data từ Supabase (current_id: %s)", group_id, current_id)
             else:
                 # Fallback đến JSON file
                 sync_file = get_sync_file_path(group_id)
@@ -3011,7 +3411,7 @@ def wait_for_message_turn(group_id, target_message_id, role_in_group, timeout=60
                         data = json.load(f)
                         current_id = data.get('current_message_id', 1)
                         broadcast_signal = data.get('broadcast_signal')
-                        print(f"📡 Nhóm {group_id} - Đọc sync data từ JSON fallback (current_id: {current_id})")
+                        log.info("📡 Nhóm %s - Đọc sync data từ JSON fallback (current_id: %s)", group_id, current_id)
                 else:
                     current_id = 1
                     broadcast_signal = None
@@ -3020,11 +3420,11 @@ def wait_for_message_turn(group_id, target_message_id, role_in_group, timeout=60
             # Fallback cuối cùng
             current_id = read_current_message_id(group_id)
             broadcast_signal = None
-            print(f"⚠️ Nhóm {group_id} - Lỗi đọc sync data, fallback: {e}")
+            log.warning("⚠️ Nhóm %s - Lỗi đọc sync data, fallback: %s", group_id, e)
         
         # Kiểm tra broadcast signal mới
         if broadcast_signal and broadcast_signal != last_broadcast_signal:
-            print(f"📡 Nhóm {group_id} - Nhận broadcast signal: {broadcast_signal}")
+            log.info("📡 Nhóm %s - Nhận broadcast signal: %s", group_id, broadcast_signal)
             last_broadcast_signal = broadcast_signal
         
         if current_id == target_message_id:
@@ -3035,7 +3435,7 @@ def wait_for_message_turn(group_id, target_message_id, role_in_group, timeout=60
         if current_time - last_log_time >= 30:
             elapsed = current_time - start_time
             remaining = timeout - elapsed
-            print(f"⏳ Nhóm {group_id} - Đợi message_id {target_message_id} (current: {current_id}, elapsed: {elapsed:.0f}s, remaining: {remaining:.0f}s)")
+            log.info("⏳ Nhóm %s - Đợi message_id %s (current: %s, elapsed: %.0fs, remaining: %.0fs)", group_id, target_message_id, current_id, elapsed, remaining)
             last_log_time = current_time
         
         # Timeout nhỏ 5-10s cho mỗi vòng check thay vì đợi vô hạn
@@ -3046,22 +3446,17 @@ def wait_for_message_turn(group_id, target_message_id, role_in_group, timeout=60
         # Delay ngắn trước khi check lại với timeout nhỏ
         time_module.sleep(min(0.5, check_timeout))
     
-    print(f"⚠️ Nhóm {group_id} - Timeout đợi message_id {target_message_id} sau {timeout}s (current_id: {read_current_message_id(group_id)})")
+    log.warning("⚠️ Nhóm %s - Timeout đợi message_id %s sau %ss (current_id: %s)", group_id, target_message_id, timeout, read_current_message_id(group_id))
     return False
 
 def calculate_smart_delay(message_length, is_first_message=False):
-    """Tính delay thông minh dựa trên độ dài tin nhắn với random delay patterns"""
-    import random
-    
-    if is_first_message:
-        return random.uniform(1, 3)  # Delay ngắn cho tin nhắn đầu
+    """Tính delay thông minh dựa trên độ dài tin nhắn với random delay patterns
     
-    # Random delay pattern: 70% tin nhắn nhanh (5-15s), 30% tin nhắn chậm (30-60s)
-    if random.random() < 0.7:  # 70% chance for fast messages
-        return random.uniform(5, 15)
-    else:  # 30% chance for slow messages
-        return random.uniform(30, 60)
+    Plan hội thoại (utils.conversation_plan) đã tính sẵn delay cho từng tin nhắn.
+    """
+    return smart_delay(is_first_message)
 
+@timed_step("conversation")
 def run_conversation(dev, device_role, debug=False, all_devices=None, stop_event=None, status_callback=None, context=None):
     """Chạy cuộc hội thoại với message_id synchronization và smart timing"""
     import random
@@ -3080,7 +3475,7 @@ def run_conversation(dev, device_role, debug=False, all_devices=None, stop_event
         context.log_info("Conversation cancelled before starting")
         return False
     if stop_event and stop_event.is_set():
-        print(f"[DEBUG] Stop signal received before starting conversation for {device_ip}")
+        log.debug("Stop signal received before starting conversation for %s", device_ip)
         return False
 
     group_id_attr = getattr(dev, "group_id", None)
@@ -3120,59 +3515,42 @@ def run_conversation(dev, device_role, debug=False, all_devices=None, stop_event
     dev.group_id = group_id
     dev.role_in_group = role_in_group
     dev.group_devices = list(all_devices)
+    bind_device(device_ip, group_id)
 
-    print(f"💬 Device {device_ip} - Nhóm {group_id}, Role {role_in_group}")
-    
-    # Load conversation từ file như trong main.py
-    conversation_data = load_conversation_from_file(group_id)
-    
-    # Convert format từ main.py sang format cần thiết với message_id support
-    conversation = []
-    for msg_data in conversation_data:
-        if isinstance(msg_data, dict):
-            if 'message_id' in msg_data and 'device_number' in msg_data and 'content' in msg_data:
-                # Format mới với message_id: {"message_id": 1, "device_number": 1, "content": "message"}
-                conversation.append({
-                    "message_id": msg_data['message_id'],
-                    "sender": msg_data['device_number'],
-                    "message": msg_data['content']
-                })
-            elif 'device_number' in msg_data and 'content' in msg_data:
-                # Format từ main.py: {"device_number": 1, "content": "message"} - tự tạo message_id
-                conversation.append({
-                    "message_id": len(conversation) + 1,
-                    "sender": msg_data['device_number'],
-                    "message": msg_data['content']
-                })
-            elif 'sender' in msg_data and 'message' in msg_data:
-                # Format cũ: {"sender": 1, "message": "text"} - tự tạo message_id
-                conversation.append({
-                    "message_id": len(conversation) + 1,
-                    "sender": msg_data['sender'],
-                    "message": msg_data['message']
-                })
+    log.info("💬 Device %s - Nhóm %s, Role %s", device_ip, group_id, role_in_group)
     
-    if not conversation:
-        print(f"❌ Nhóm {group_id} - Không có cuộc hội thoại")
-        return False
+    # Plan hội thoại do scheduler compile sẵn cho cả cặp; chạy lẻ (main_multi_device)
+    # thì máy đầu của nhóm load + compile, máy còn lại dùng chung
+    plan = getattr(dev, "conversation_plan", None)
+    if plan is None or plan.group_id != group_id:
+        try:
+            plan = get_plan_registry().get_or_compile(group_id, load_conversation_from_file)
+        except ConversationPlanError as e:
+            log.error("❌ Nhóm %s - Cuộc hội thoại không hợp lệ: %s", group_id, e)
+            return False
+    conversation = plan.messages
+    annotate_session(device_identifier, "conversation", {
+        "group_id": group_id, "role_in_group": role_in_group,
+        "group_devices": list(all_devices), "messages": plan.as_records(), "plan_digest": plan.digest
+    })
     
-    print(f"📋 Nhóm {group_id} - Bắt đầu cuộc hội thoại với {len(conversation)} tin nhắn (message_id sync enabled)")
+    log.info("📋 Nhóm %s - Bắt đầu cuộc hội thoại với %s tin nhắn (message_id sync enabled)", group_id, len(conversation))
     
     # Khởi tạo sync file nếu là device đầu tiên
     if role_in_group == 1:
         update_current_message_id(group_id, 1)
-        print(f"🔄 Nhóm {group_id} - Khởi tạo sync với message_id = 1")
+        log.info("🔄 Nhóm %s - Khởi tạo sync với message_id = 1", group_id)
     
     # Duyệt qua conversation của nhóm với message_id synchronization
     for msg in conversation:
-        message_id = msg["message_id"]
+        message_id = msg.message_id
         
         # Kiểm tra stop signal và cancel_event trước xử lý mỗi message
         if context and context.is_cancelled():
             context.log_info(f"Conversation cancelled during message {message_id}")
             return False
         if stop_event and stop_event.is_set():
-            print(f"[DEBUG] Stop signal received during conversation for {device_ip}")
+            log.debug("Stop signal received during conversation for %s", device_ip)
             return False
         
         # Emit status update cho message hiện tại
@@ -3180,17 +3558,17 @@ def run_conversation(dev, device_role, debug=False, all_devices=None, stop_event
             status_callback('message_status_updated', {
                 'device_ip': device_ip,
                 'message_id': message_id,
-                'content': msg['message'],
+                'content': msg.text,
                 'status': 'processing',
-                'sender': msg['sender'],
+                'sender': msg.sender,
                 'role_in_group': role_in_group
             })
         
-        if msg["sender"] == role_in_group:
+        if msg.sender == role_in_group:
             # Đợi đến lượt message_id này
-            print(f"⏳ Nhóm {group_id} - Đợi lượt message_id {message_id}...")
+            log.info("⏳ Nhóm %s - Đợi lượt message_id %s...", group_id, message_id)
             if not wait_for_message_turn(group_id, message_id, role_in_group):
-                print(f"❌ Nhóm {group_id} - Timeout đợi message_id {message_id}, bỏ qua")
+                log.error("❌ Nhóm %s - Timeout đợi message_id %s, bỏ qua", group_id, message_id)
                 continue
             
             # Kiểm tra stop signal và cancel_event sau wait
@@ -3198,25 +3576,24 @@ def run_conversation(dev, device_role, debug=False, all_devices=None, stop_event
                 context.log_info(f"Conversation cancelled after waiting for message {message_id}")
                 return False
             if stop_event and stop_event.is_set():
-                print(f"[DEBUG] Stop signal received after waiting for message turn for {device_ip}")
+                log.debug("Stop signal received after waiting for message turn for %s", device_ip)
                 return False
             
-            # Tính delay thông minh
-            is_first = (message_id == 1)
-            smart_delay = calculate_smart_delay(msg['message'], is_first)
+            # Smart delay đã tính sẵn trong plan (tin nhắn đầu không delay)
+            smart_delay = msg.delay
             
-            if not is_first:
-                print(f"⏳ Nhóm {group_id} - Smart delay {smart_delay:.1f}s cho message_id {message_id}...")
+            if smart_delay > 0:
+                log.info("⏳ Nhóm %s - Smart delay %.1fs cho message_id %s...", group_id, smart_delay, message_id)
                 
                 # Emit status update cho delay
                 if status_callback:
                     status_callback('message_status_updated', {
                         'device_ip': device_ip,
                         'message_id': message_id,
-                        'content': msg['message'],
+                        'content': msg.text,
                         'status': 'delaying',
                         'delay_time': smart_delay,
-                        'sender': msg['sender'],
+                        'sender': msg.sender,
                         'role_in_group': role_in_group
                     })
                 
@@ -3225,93 +3602,98 @@ def run_conversation(dev, device_role, debug=False, all_devices=None, stop_event
                     context.log_info(f"Conversation cancelled during delay for message {message_id}")
                     return False
                 if stop_event and stop_event.is_set():
-                    print(f"[DEBUG] Stop signal received during smart delay for {device_ip}")
+                    log.debug("Stop signal received during smart delay for %s", device_ip)
                     return False
                 
-                time_module.sleep(smart_delay)
+                with trace_span("smart_delay", "delay", message_id=message_id):
+                    time_module.sleep(smart_delay)
             
-            print(f"📤 Nhóm {group_id} - Máy {role_in_group} gửi message_id {message_id}: {msg['message']}")
+            log.info("📤 Nhóm %s - Máy %s gửi message_id %s: %s", group_id, role_in_group, message_id, msg.text)
             
             # Emit status update cho việc gửi
             if status_callback:
                 status_callback('message_status_updated', {
                     'device_ip': device_ip,
                     'message_id': message_id,
-                    'content': msg['message'],
+                    'content': msg.text,
                     'status': 'sending',
-                    'sender': msg['sender'],
+                    'sender': msg.sender,
                     'role_in_group': role_in_group
                 })
             
             # Kiểm tra UI sẵn sàng trước khi gửi tin nhắn
             if not ensure_chat_ready(dev, timeout=15, debug=debug):
-                print(f"⚠️ Nhóm {group_id} - Chat không sẵn sàng cho message_id {message_id}, thử lại...")
+                log.warning("⚠️ Nhóm %s - Chat không sẵn sàng cho message_id %s, thử lại...", group_id, message_id)
                 time_module.sleep(2)
                 if not ensure_chat_ready(dev, timeout=10, debug=debug):
-                    print(f"❌ Nhóm {group_id} - Chat vẫn không sẵn sàng, bỏ qua message_id {message_id}")
+                    log.error("❌ Nhóm %s - Chat vẫn không sẵn sàng, bỏ qua message_id %s", group_id, message_id)
                     # Vẫn cập nhật message_id để không block các device khác
                     update_current_message_id(group_id, message_id + 1)
                     continue
             
             # Kiểm tra edit text sẵn sàng
             if not wait_for_edit_text(dev, timeout=10, debug=debug):
-                print(f"⚠️ Nhóm {group_id} - Edit text không sẵn sàng cho message_id {message_id}")
+                log.warning("⚠️ Nhóm %s - Edit text không sẵn sàng cho message_id %s", group_id, message_id)
                 # Vẫn cập nhật message_id để không block các device khác
                 update_current_message_id(group_id, message_id + 1)
                 continue
             
             # Gửi tin nhắn với safe operation wrapper
             def send_message_operation():
+                # Snapshot message list trước khi gửi để diff bubble khi xác minh
+                before_send = message_list_snapshot(dev)
+                
                 # Gửi tin nhắn với human-like typing
-                if not send_message(dev, msg["message"], debug=debug):
-                    raise Exception(f"Không thể gửi tin nhắn: {msg['message'][:30]}...")
+                if not send_message(dev, msg.text, debug=debug):
+                    raise Exception(f"Không thể gửi tin nhắn: {msg.text[:30]}...")
                 
                 # Xác minh tin nhắn đã gửi thành công
-                if not verify_message_sent(dev, msg["message"], timeout=5, debug=debug):
-                    raise Exception(f"Không thể xác minh tin nhắn đã gửi: {msg['message'][:30]}...")
+                if not verify_message_sent(dev, msg.text, timeout=5, debug=debug, before=before_send):
+                    raise Exception(f"Không thể xác minh tin nhắn đã gửi: {msg.text[:30]}...")
                 
                 return True
             
             # Thực hiện gửi tin nhắn với safe wrapper
-            send_result = safe_ui_operation(
-                dev, 
-                send_message_operation, 
-                f"Gửi tin nhắn message_id {message_id}", 
-                max_retries=3, 
-                debug=debug
-            )
+            with trace_span("send_message", "ui", device=device_ip, group=group_id, message_id=message_id):
+                send_result = safe_ui_operation(
+                    dev, 
+                    send_message_operation, 
+                    f"Gửi tin nhắn message_id {message_id}", 
+                    max_retries=3, 
+                    debug=debug
+                )
             
             if send_result:
-                print(f"✅ Nhóm {group_id} - Đã gửi và xác minh message_id {message_id}: {msg['message']}")
+                log.info("✅ Nhóm %s - Đã gửi và xác minh message_id %s: %s", group_id, message_id, msg.text)
                 
                 # Emit status update cho việc gửi thành công
                 if status_callback:
                     status_callback('message_status_updated', {
                         'device_ip': device_ip,
                         'message_id': message_id,
-                        'content': msg['message'],
+                        'content': msg.text,
                         'status': 'sent',
-                        'sender': msg['sender'],
+                        'sender': msg.sender,
                         'role_in_group': role_in_group
                     })
                 
                 # Cập nhật current_message_id để device khác có thể tiếp tục
                 next_message_id = message_id + 1
                 update_current_message_id(group_id, next_message_id)
-                print(f"🔄 Nhóm {group_id} - Cập nhật current_message_id = {next_message_id}")
+                log.info("🔄 Nhóm %s - Cập nhật current_message_id = %s", group_id, next_message_id)
                 
                 # Delay ngẫu nhiên sau khi gửi để tránh chạy quá nhanh (2-5 giây)
                 post_send_wait = random.uniform(2, 5)
-                print(f"⏸️ Nhóm {group_id} - Nghỉ {post_send_wait:.1f}s sau message_id {message_id}...")
+                log.info("⏸️ Nhóm %s - Nghỉ %.1fs sau message_id %s...", group_id, post_send_wait, message_id)
                 
                 # Kiểm tra stop signal trước post send delay
                 if stop_event and stop_event.is_set():
-                    print(f"[DEBUG] Stop signal received during post send delay for {device_ip}")
+                    log.debug("Stop signal received during post send delay for %s", device_ip)
                     return False
                 
                 time_module.sleep(post_send_wait)
             else:
-                print(f"❌ Nhóm {group_id} - Thất bại gửi message_id {message_id} sau nhiều lần thử: {msg['message']}")
+                log.error("❌ Nhóm %s - Thất bại gửi message_id %s sau nhiều lần thử: %s", group_id, message_id, msg.text)
                 
                 # Cập nhật trạng thái lỗi
                 update_shared_status(dev.device_id, "error", f"Lỗi gửi message_id {message_id}", 0)
@@ -3320,17 +3702,17 @@ def run_conversation(dev, device_role, debug=False, all_devices=None, stop_event
                 update_current_message_id(group_id, message_id + 1)
                 break
         else:
-            # Không phải lượt của mình trong nhóm - chỉ log
-            print(f"📥 Nhóm {group_id} - Đợi Máy {msg['sender']} gửi message_id {message_id}: {msg['message']}")
+            # Không phải lượt của mình trong nhóm
+            if debug: log.debug("📥 Nhóm %s - Đợi Máy %s gửi message_id %s: %s", group_id, msg.sender, message_id, msg.text)
     
-    print(f"✅ Nhóm {group_id} - Hoàn thành cuộc hội thoại")
+    log.info("✅ Nhóm %s - Hoàn thành cuộc hội thoại", group_id)
     
     # Cleanup sync file khi hoàn thành
     try:
         sync_file = get_sync_file_path(group_id)
         if os.path.exists(sync_file):
             os.remove(sync_file)
-            print(f"🧹 Nhóm {group_id} - Đã cleanup sync file")
+            log.info("🧹 Nhóm %s - Đã cleanup sync file", group_id)
     except Exception:
         pass
     
@@ -3353,7 +3735,7 @@ def load_phone_map_from_file():
                 data = json.load(f)
                 return data.get('phone_mapping', {})
     except Exception as e:
-        print(f"⚠️ Lỗi đọc file config: {e}")
+        log.warning("⚠️ Lỗi đọc file config: %s", e)
     return {}
 
 def save_phone_map_to_file(phone_map):
@@ -3366,10 +3748,10 @@ def save_phone_map_to_file(phone_map):
         }
         with open(PHONE_CONFIG_FILE, 'w', encoding='utf-8') as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
-        print(f"✅ Đã lưu phone mapping vào {PHONE_CONFIG_FILE}")
+        log.info("✅ Đã lưu phone mapping vào %s", PHONE_CONFIG_FILE)
         return True
     except Exception as e:
-        print(f"❌ Lỗi lưu file config: {e}")
+        log.error("❌ Lỗi lưu file config: %s", e)
         return False
 
 def parse_device_map_string(device_map_str):
@@ -3453,6 +3835,7 @@ def parse_arguments():
   python core1.py -i                                 # Interactive phone mapping
   python core1.py -dm "192.168.5.74:569924311,192.168.5.82:583563439"  # CLI phone mapping
   python core1.py --show-config                      # Hiển thị config hiện tại
+  python core1.py --profile                          # Chạy kèm sampling profiler
         """
     )
     
@@ -3480,6 +3863,26 @@ def parse_arguments():
         help='Reset phone mapping về default và thoát'
     )
     
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Bật sampling profiler cho toàn bộ run, ghi collapsed stacks vào profiles/'
+    )
+    
+    parser.add_argument(
+        '--profile-interval',
+        type=float,
+        default=10.0,
+        help='Chu kỳ lấy mẫu của profiler (ms), mặc định 10'
+    )
+    
+    parser.add_argument(
+        '--profile-mode',
+        choices=['cpu', 'wall'],
+        default='cpu',
+        help='cpu: chỉ tính thread đang dùng CPU; wall: tính mọi thread'
+    )
+    
     return parser.parse_args()
 
 def show_current_config():
@@ -3512,6 +3915,7 @@ def get_barrier_file_path(group_id):
     """Lấy đường dẫn file barrier cho nhóm"""
     return f"barrier_group_{group_id}.json"
 
+@timed_step("barrier_wait", trace_args=("group_id", "device_count"))
 def wait_for_group_barrier(group_id, device_count, timeout=60):
     """Đợi tất cả devices trong nhóm sẵn sàng trước khi mở Zalo - Enhanced version với detailed logging"""
     import json
@@ -3523,9 +3927,9 @@ def wait_for_group_barrier(group_id, device_count, timeout=60):
     last_progress_log = 0
     last_detailed_log = 0
     
-    print(f"🚀 [SYNC-START] Nhóm {group_id} - Bắt đầu đợi {device_count} devices tại barrier")
-    print(f"📁 [SYNC-INFO] Nhóm {group_id} - Barrier file: {barrier_file}")
-    print(f"⏰ [SYNC-INFO] Nhóm {group_id} - Timeout: {timeout}s, Start: {time_module.strftime('%H:%M:%S')}")
+    log.info("🚀 [SYNC-START] Nhóm %s - Bắt đầu đợi %s devices tại barrier", group_id, device_count)
+    log.info("📁 [SYNC-INFO] Nhóm %s - Barrier file: %s", group_id, barrier_file)
+    log.info("⏰ [SYNC-INFO] Nhóm %s - Timeout: %ss, Start: %s", group_id, timeout, time_module.strftime('%H:%M:%S'))
     
     # Enhanced polling với adaptive interval
     check_interval = 0.2  # Bắt đầu với interval ngắn
@@ -3546,25 +3950,25 @@ def wait_for_group_barrier(group_id, device_count, timeout=60):
                     
                     # Kiểm tra freshness của data (trong vòng 30s)
                     if current_time - last_update > 30:
-                        print(f"⚠️ [SYNC-WARNING] Nhóm {group_id} - Barrier data cũ ({current_time - last_update:.1f}s), có thể cần reset")
+                        log.warning("⚠️ [SYNC-WARNING] Nhóm %s - Barrier data cũ (%.1fs), có thể cần reset", group_id, current_time - last_update)
                     
                     if ready_count >= device_count:
-                        print(f"✅ [SYNC-SUCCESS] Nhóm {group_id} - Tất cả {device_count} devices đã sẵn sàng!")
-                        print(f"📋 [SYNC-SUCCESS] Nhóm {group_id} - Final devices: {ready_devices}")
-                        print(f"⏱️ [SYNC-SUCCESS] Nhóm {group_id} - Thời gian đồng bộ: {elapsed:.2f}s")
-                        print(f"🎯 [SYNC-SUCCESS] Nhóm {group_id} - Đồng bộ hoàn tất, tất cả máy sẽ mở Zalo cùng lúc!")
+                        log.info("✅ [SYNC-SUCCESS] Nhóm %s - Tất cả %s devices đã sẵn sàng!", group_id, device_count)
+                        log.info("📋 [SYNC-SUCCESS] Nhóm %s - Final devices: %s", group_id, ready_devices)
+                        log.info("⏱️ [SYNC-SUCCESS] Nhóm %s - Thời gian đồng bộ: %.2fs", group_id, elapsed)
+                        log.info("🎯 [SYNC-SUCCESS] Nhóm %s - Đồng bộ hoàn tất, tất cả máy sẽ mở Zalo cùng lúc!", group_id)
                         return True
                     else:
                         # Log progress mỗi 3 giây
                         if current_time - last_progress_log >= 3:
-                            print(f"📊 [SYNC-PROGRESS] Nhóm {group_id} - {ready_count}/{device_count} devices ({elapsed:.1f}s)")
+                            log.info("📊 [SYNC-PROGRESS] Nhóm %s - %s/%s devices (%.1fs)", group_id, ready_count, device_count, elapsed)
                             last_progress_log = current_time
                         
                         # Log chi tiết mỗi 10 giây
                         if current_time - last_detailed_log >= 10:
-                            print(f"📋 [SYNC-DETAIL] Nhóm {group_id} - Devices sẵn sàng: {ready_devices}")
-                            print(f"🕐 [SYNC-DETAIL] Nhóm {group_id} - Thời gian chờ: {elapsed:.1f}s/{timeout}s")
-                            print(f"📈 [SYNC-DETAIL] Nhóm {group_id} - Check interval: {check_interval:.2f}s")
+                            log.info("📋 [SYNC-DETAIL] Nhóm %s - Devices sẵn sàng: %s", group_id, ready_devices)
+                            log.info("🕐 [SYNC-DETAIL] Nhóm %s - Thời gian chờ: %.1fs/%ss", group_id, elapsed, timeout)
+                            log.info("📈 [SYNC-DETAIL] Nhóm %s - Check interval: %.2fs", group_id, check_interval)
                             last_detailed_log = current_time
                         
                         # Reset retry count khi có progress
@@ -3572,7 +3976,7 @@ def wait_for_group_barrier(group_id, device_count, timeout=60):
             else:
                 # Log khi barrier file chưa tồn tại
                 if current_time - last_progress_log >= 5:
-                    print(f"📂 [SYNC-WAITING] Nhóm {group_id} - Chờ barrier file được tạo ({elapsed:.1f}s)...")
+                    log.info("📂 [SYNC-WAITING] Nhóm %s - Chờ barrier file được tạo (%.1fs)...", group_id, elapsed)
                     last_progress_log = current_time
             
             # Adaptive sleep interval
@@ -3585,19 +3989,20 @@ def wait_for_group_barrier(group_id, device_count, timeout=60):
         except Exception as e:
             retry_count += 1
             elapsed = time_module.time() - start_time
-            print(f"⚠️ [SYNC-ERROR] Nhóm {group_id} - Lỗi đọc barrier file (retry {retry_count}, {elapsed:.1f}s): {e}")
+            log.warning("⚠️ [SYNC-ERROR] Nhóm %s - Lỗi đọc barrier file (retry %s, %.1fs): %s", group_id, retry_count, elapsed, e)
             
             # Exponential backoff cho error cases
             error_delay = min(0.5 * (2 ** min(retry_count, 4)), 5.0)
-            print(f"🔄 [SYNC-ERROR] Nhóm {group_id} - Retry sau {error_delay:.2f}s...")
+            log.info("🔄 [SYNC-ERROR] Nhóm %s - Retry sau %.2fs...", group_id, error_delay)
             time_module.sleep(error_delay)
     
     elapsed = time_module.time() - start_time
-    print(f"⏰ [SYNC-TIMEOUT] Nhóm {group_id} - Timeout đợi barrier sau {elapsed:.1f}s (timeout: {timeout}s)")
-    print(f"📊 [SYNC-TIMEOUT] Nhóm {group_id} - Không đủ {device_count} devices trong thời gian cho phép")
-    print(f"💡 [SYNC-TIMEOUT] Nhóm {group_id} - Máy sẽ tiếp tục chạy độc lập để tránh block toàn bộ hệ thống")
+    log.info("⏰ [SYNC-TIMEOUT] Nhóm %s - Timeout đợi barrier sau %.1fs (timeout: %ss)", group_id, elapsed, timeout)
+    log.info("📊 [SYNC-TIMEOUT] Nhóm %s - Không đủ %s devices trong thời gian cho phép", group_id, device_count)
+    log.info("💡 [SYNC-TIMEOUT] Nhóm %s - Máy sẽ tiếp tục chạy độc lập để tránh block toàn bộ hệ thống", group_id)
     return False
 
+@timed_step("barrier_signal", trace_args=("group_id",))
 def signal_ready_at_barrier(group_id, device_ip):
     """Báo hiệu device sẵn sàng tại barrier - Enhanced with better synchronization"""
     import json
@@ -3631,7 +4036,7 @@ def signal_ready_at_barrier(group_id, device_ip):
                         if isinstance(existing_data, dict):
                             data.update(existing_data)
                 except (json.JSONDecodeError, IOError, UnicodeDecodeError) as e:
-                    print(f"⚠️ Barrier file corrupted, recreating: {e}")
+                    log.warning("⚠️ Barrier file corrupted, recreating: %s", e)
             
             # Thêm device vào danh sách ready với validation
             ready_devices = data.get('ready_devices', [])
@@ -3671,12 +4076,12 @@ def signal_ready_at_barrier(group_id, device_ip):
                 else:  # Unix/Linux
                     os.rename(temp_file, barrier_file)
                 
-                print(f"✅ Nhóm {group_id} - Device {device_ip} đã signal ready ({len(ready_devices)} devices) [Enhanced Sync]")
-                print(f"📊 Devices sẵn sàng: {ready_devices}")
-                print(f"🕐 Timestamp: {time_module.strftime('%H:%M:%S', time_module.localtime())}")
+                log.info("✅ Nhóm %s - Device %s đã signal ready (%s devices) [Enhanced Sync]", group_id, device_ip, len(ready_devices))
+                log.info("📊 Devices sẵn sàng: %s", ready_devices)
+                log.info("🕐 Timestamp: %s", time_module.strftime('%H:%M:%S', time_module.localtime()))
             else:
-                print(f"ℹ️ Nhóm {group_id} - Device {device_ip} đã có trong barrier ({len(ready_devices)} devices)")
-                print(f"📊 Trạng thái hiện tại: {ready_devices}")
+                log.info("ℹ️ Nhóm %s - Device %s đã có trong barrier (%s devices)", group_id, device_ip, len(ready_devices))
+                log.info("📊 Trạng thái hiện tại: %s", ready_devices)
             
             # Cleanup temp file nếu còn tồn tại
             if os.path.exists(temp_file):
@@ -3699,12 +4104,12 @@ def signal_ready_at_barrier(group_id, device_ip):
             if attempt < max_retries - 1:
                 # Exponential backoff với jitter
                 delay = base_delay * (2 ** attempt) + (time.time() % 0.01)
-                print(f"⚠️ Lỗi signal barrier (attempt {attempt + 1}/{max_retries}): {e}")
-                print(f"🔄 Retry sau {delay:.3f}s...")
+                log.warning("⚠️ Lỗi signal barrier (attempt %s/%s): %s", attempt + 1, max_retries, e)
+                log.info("🔄 Retry sau %.3fs...", delay)
                 time_module.sleep(delay)
             else:
-                print(f"❌ Lỗi signal barrier sau {max_retries} attempts: {e}")
-                print(f"💡 Device {device_ip} sẽ tiếp tục chạy mà không đợi barrier")
+                log.error("❌ Lỗi signal barrier sau %s attempts: %s", max_retries, e)
+                log.info("💡 Device %s sẽ tiếp tục chạy mà không đợi barrier", device_ip)
                 return False
     
     return False
@@ -3715,14 +4120,17 @@ def cleanup_barrier_file(group_id):
         barrier_file = get_barrier_file_path(group_id)
         if os.path.exists(barrier_file):
             os.remove(barrier_file)
-            print(f"🧹 Nhóm {group_id} - Đã cleanup barrier file")
+            log.info("🧹 Nhóm %s - Đã cleanup barrier file", group_id)
     except Exception:
         pass
 
 # === SHARED STATUS MANAGEMENT ===
 def get_status_file_path():
-    """Lấy đường dẫn file status chung"""
+    """Lấy đường dẫn file status chung (override bằng AUTOMATION_STATUS_FILE)"""
     import os
+    override = os.environ.get("AUTOMATION_STATUS_FILE")
+    if override:
+        return override
     try:
         # Thử dùng __file__ trước
         return os.path.join(os.path.dirname(__file__), 'status.json')
@@ -3734,14 +4142,11 @@ def get_status_file_path():
 
 def update_shared_status(device_ip, status, message="", progress=0, current_message_id=None):
     """Cập nhật trạng thái shared cho device - sử dụng Supabase"""
+    slog = get_logger(device=device_ip)
+    # Push vào status hub in-process trước: GUI/SSE nhận delta ngay, không đọc file/DB
+    get_status_hub().publish(device_ip, status, message, progress, current_message_id)
     try:
-        print(f"[DEBUG] ===== STATUS UPDATE =====")
-        print(f"[DEBUG] Device: {device_ip}")
-        print(f"[DEBUG] Status: {status}")
-        print(f"[DEBUG] Message: {message}")
-        print(f"[DEBUG] Progress: {progress}")
-        print(f"[DEBUG] ============================")
-        print(f"📡 Updating device status vào Supabase: {device_ip} -> {status}")
+        slog.debug("Status update: status=%s progress=%s message=%s", status, progress, message)
         
         # Cập nhật status vào Supabase
         success = supabase_data_manager.update_device_status(
@@ -3753,15 +4158,14 @@ def update_shared_status(device_ip, status, message="", progress=0, current_mess
         )
         
         if success:
-            print(f"✅ Đã cập nhật status cho {device_ip}")
+            slog.debug("✅ Đã cập nhật status")
             return True
         else:
-            print(f"❌ Lỗi cập nhật status cho {device_ip}")
+            slog.error("❌ Lỗi cập nhật status")
             return False
             
     except Exception as e:
-        print(f"⚠️ Lỗi update status vào Supabase: {e}")
-        print("🔄 Fallback về JSON file...")
+        slog.warning("⚠️ Lỗi update status vào Supabase: %s - fallback về JSON file", e)
         
         # Fallback về JSON operations
         import json
@@ -3812,22 +4216,26 @@ def update_shared_status(device_ip, status, message="", progress=0, current_mess
                 with open(status_file, 'w', encoding='utf-8') as f:
                     json.dump(data, f, indent=2, ensure_ascii=False)
                 
-                print(f"⚠️ Đã cập nhật status vào JSON fallback")
+                slog.debug("Đã cập nhật status vào JSON fallback")
                 return True
                 
             except Exception as retry_error:
                 if attempt < max_retries - 1:
                     time_module.sleep(0.1 * (attempt + 1))
                 else:
-                    print(f"❌ Lỗi JSON fallback: {retry_error}")
+                    slog.error("❌ Lỗi JSON fallback: %s", retry_error)
                     return False
         
         return False
 
 def read_shared_status():
-    """Đọc trạng thái shared hiện tại từ Supabase với fallback JSON"""
+    """Đọc trạng thái shared hiện tại: status hub (run trong process này), rồi Supabase, fallback JSON"""
+    hub_status = get_status_hub().snapshot()
+    if hub_status['devices']:
+        return hub_status
+    
     try:
-        print("📡 Reading shared status từ Supabase...")
+        log.info("📡 Reading shared status từ Supabase...")
         status_data = supabase_data_manager.get_all_device_status()
         
         # Convert Supabase format về format cũ
@@ -3861,12 +4269,12 @@ def read_shared_status():
             'last_update': max([d.get('last_update', 0) for d in devices.values()], default=0)
         }
         
-        print(f"✅ Loaded status cho {len(devices)} devices từ Supabase")
+        log.info("✅ Loaded status cho %s devices từ Supabase", len(devices))
         return result
         
     except Exception as e:
-        print(f"⚠️ Lỗi read status từ Supabase: {e}")
-        print("🔄 Fallback về JSON file...")
+        log.warning("⚠️ Lỗi read status từ Supabase: %s", e)
+        log.info("🔄 Fallback về JSON file...")
         
         # Fallback về JSON
         import json
@@ -3877,36 +4285,37 @@ def read_shared_status():
             if os.path.exists(status_file):
                 with open(status_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
-                print(f"⚠️ Loaded status từ JSON fallback")
+                log.warning("⚠️ Loaded status từ JSON fallback")
                 return data
             else:
                 return {'devices': {}, 'overall_status': 'idle', 'last_update': 0}
         except Exception as json_error:
-            print(f"❌ Lỗi JSON fallback: {json_error}")
+            log.error("❌ Lỗi JSON fallback: %s", json_error)
             return {'devices': {}, 'overall_status': 'error', 'last_update': 0}
 
 def cleanup_shared_status():
     """Cleanup shared status file"""
     import os
+    get_status_hub().reset()
     status_file = get_status_file_path()
     try:
         if os.path.exists(status_file):
             os.remove(status_file)
-            print(f"🧹 Đã cleanup shared status file")
+            log.info("🧹 Đã cleanup shared status file")
     except Exception as e:
-        print(f"⚠️ Lỗi cleanup shared status: {e}")
+        log.warning("⚠️ Lỗi cleanup shared status: %s", e)
 
 def get_device_status(device_ip):
     """Lấy trạng thái của device cụ thể từ Supabase"""
     try:
-        print(f"📡 Getting device status từ Supabase: {device_ip}")
+        log.info("📡 Getting device status từ Supabase: %s", device_ip)
         device_status = supabase_data_manager.get_device_status(device_ip)
         
         if device_status:
-            print(f"✅ Found status cho {device_ip}: {device_status['status']}")
+            log.info("✅ Found status cho %s: %s", device_ip, device_status['status'])
             return device_status
         else:
-            print(f"⚠️ Không tìm thấy status cho {device_ip} trong Supabase")
+            log.warning("⚠️ Không tìm thấy status cho %s trong Supabase", device_ip)
             return {
                 'status': 'unknown',
                 'message': '',
@@ -3915,8 +4324,8 @@ def get_device_status(device_ip):
                 'last_update': 0
             }
     except Exception as e:
-        print(f"⚠️ Lỗi get device status từ Supabase: {e}")
-        print("🔄 Fallback về JSON file...")
+        log.warning("⚠️ Lỗi get device status từ Supabase: %s", e)
+        log.info("🔄 Fallback về JSON file...")
         
         # Fallback về JSON
         data = read_shared_status()
@@ -3947,29 +4356,29 @@ def wait_for_edit_text(dev, timeout=10, debug=False):
             for edit_elem in edit_elements:
                 if edit_elem.exists:
                     if debug:
-                        print(f"✅ Tìm thấy edit text: {edit_elem.info}")
+                        log.debug("✅ Tìm thấy edit text: %s", edit_elem.info)
                     
                     # Kiểm tra element có clickable và enabled không
                     info = edit_elem.info
                     if info.get('clickable', False) and info.get('enabled', True):
                         if debug:
-                            print(f"✅ Edit text sẵn sàng để nhập")
+                            log.debug("✅ Edit text sẵn sàng để nhập")
                         return True
                     else:
                         if debug:
-                            print(f"⚠️ Edit text chưa sẵn sàng: clickable={info.get('clickable')}, enabled={info.get('enabled')}")
+                            log.warning("⚠️ Edit text chưa sẵn sàng: clickable=%s, enabled=%s", info.get('clickable'), info.get('enabled'))
             
             if debug:
-                print(f"⏳ Đợi edit text... ({time.time() - start_time:.1f}s)")
+                log.debug("⏳ Đợi edit text... (%.1fs)", time.time() - start_time)
             time_module.sleep(0.5)
             
         except Exception as e:
             if debug:
-                print(f"⚠️ Lỗi kiểm tra edit text: {e}")
+                log.warning("⚠️ Lỗi kiểm tra edit text: %s", e)
             time_module.sleep(0.5)
     
     if debug:
-        print(f"❌ Timeout đợi edit text sau {timeout}s")
+        log.error("❌ Timeout đợi edit text sau %ss", timeout)
     return False
 
 def ensure_chat_ready(dev, timeout=15, debug=False):
@@ -3977,7 +4386,7 @@ def ensure_chat_ready(dev, timeout=15, debug=False):
     import time as time_module
     
     if debug:
-        print(f"🔍 Kiểm tra chat sẵn sàng...")
+        log.debug("🔍 Kiểm tra chat sẵn sàng...")
     
     start_time = time.time()
     while time.time() - start_time < timeout:
@@ -4002,27 +4411,27 @@ def ensure_chat_ready(dev, timeout=15, debug=False):
                     ready_count += 1
             
             if debug:
-                print(f"📊 Chat readiness: {ready_count}/{len(chat_indicators)} indicators found")
+                log.debug("📊 Chat readiness: %s/%s indicators found", ready_count, len(chat_indicators))
             
             # Cần ít nhất 2 indicators để coi như ready
             if ready_count >= 2:
                 # Kiểm tra thêm edit text có thể nhập được không
                 if wait_for_edit_text(dev, timeout=2, debug=debug):
                     if debug:
-                        print(f"✅ Chat đã sẵn sàng")
+                        log.debug("✅ Chat đã sẵn sàng")
                     return True
             
             if debug:
-                print(f"⏳ Chat chưa sẵn sàng, đợi thêm... ({time.time() - start_time:.1f}s)")
+                log.debug("⏳ Chat chưa sẵn sàng, đợi thêm... (%.1fs)", time.time() - start_time)
             time_module.sleep(1)
             
         except Exception as e:
             if debug:
-                print(f"⚠️ Lỗi kiểm tra chat ready: {e}")
+                log.warning("⚠️ Lỗi kiểm tra chat ready: %s", e)
             time_module.sleep(1)
     
     if debug:
-        print(f"❌ Timeout kiểm tra chat ready sau {timeout}s")
+        log.error("❌ Timeout kiểm tra chat ready sau %ss", timeout)
     return False
 
 def wait_for_ui_ready(dev, timeout=10, debug=False):
@@ -4045,7 +4454,7 @@ def wait_for_ui_ready(dev, timeout=10, debug=False):
                         elem = dev.d(resourceId=indicator)
                         if elem.exists and elem.info.get('enabled', True):
                             if debug:
-                                print(f"✅ UI ready - found: {indicator}")
+                                log.debug("✅ UI ready - found: %s", indicator)
                             return True
                     except Exception:
                         continue
@@ -4055,159 +4464,158 @@ def wait_for_ui_ready(dev, timeout=10, debug=False):
                 
             except Exception as e:
                 if debug:
-                    print(f"⚠️ Error checking UI readiness: {e}")
+                    log.warning("⚠️ Error checking UI readiness: %s", e)
                 time_module.sleep(0.5)
         
         if debug:
-            print(f"❌ UI not ready after {timeout}s timeout")
+            log.error("❌ UI not ready after %ss timeout", timeout)
         return False
         
     except Exception as e:
         if debug:
-            print(f"❌ Error in wait_for_ui_ready: {e}")
+            log.error("❌ Error in wait_for_ui_ready: %s", e)
         return False
 
-def verify_message_sent(dev, message_text, timeout=5, debug=False):
-    """Xác minh tin nhắn đã được gửi thành công"""
-    import time as time_module
-    
+def message_list_snapshot(dev):
+    """Snapshot bubble của chat hiện tại bằng một lần dump_hierarchy (None nếu lỗi)"""
+    try:
+        return take_snapshot(dev.d.dump_hierarchy())
+    except Exception:
+        return None
+
+@timed_step("verify_message_sent")
+def verify_message_sent(dev, message_text, timeout=5, debug=False, before=None, interval=0.3):
+    """Xác minh tin nhắn đã được gửi thành công
+
+    So sánh snapshot message list trước khi gửi (before, lấy bằng
+    message_list_snapshot) với snapshot sau khi gửi: có bubble gửi đi mới đúng
+    nội dung thì trả True ngay. Hết timeout mà diff chưa dương thì chỉ dựa
+    vào việc ô nhập đã xóa (như cách cũ) để không gửi lặp lại tin nhắn.
+    """
     if debug:
-        print(f"🔍 Xác minh tin nhắn đã gửi: '{message_text[:30]}...'")
+        log.debug("🔍 Xác minh tin nhắn đã gửi: '%s...'", message_text[:30])
     
     start_time = time.time()
-    while time.time() - start_time < timeout:
-        try:
-            # Tìm tin nhắn vừa gửi trong chat
-            message_elements = [
-                dev.d(text=message_text),
-                dev.d(textContains=message_text[:20]),  # Tìm theo 20 ký tự đầu
-                dev.d(className="android.widget.TextView", textContains=message_text[:15])
-            ]
-            
-            for msg_elem in message_elements:
-                if msg_elem.exists:
-                    if debug:
-                        print(f"✅ Tin nhắn đã xuất hiện trong chat")
-                    return True
-            
-            # Kiểm tra edit text đã clear chưa (dấu hiệu tin nhắn đã gửi)
-            edit_elem = dev.d(resourceId=RID_EDIT_TEXT)
-            if edit_elem.exists:
-                current_text = edit_elem.get_text()
-                if not current_text or current_text.strip() == "":
-                    if debug:
-                        print(f"✅ Edit text đã clear, tin nhắn có thể đã gửi")
-                    return True
-            
-            time_module.sleep(0.5)
-            
-        except Exception as e:
+    snapshots = 0
+    after = None
+    while True:
+        after = message_list_snapshot(dev)
+        snapshots += 1
+        if outgoing_bubble_added(before, after, message_text):
             if debug:
-                print(f"⚠️ Lỗi xác minh tin nhắn: {e}")
-            time_module.sleep(0.5)
+                log.debug("✅ Bubble tin nhắn mới đã xuất hiện trong chat (%s snapshot)", snapshots)
+            annotate_session(dev.device_id, "message_verified", {"method": "bubble_diff", "snapshots": snapshots})
+            return True
+        if time.time() - start_time + interval >= timeout:
+            break
+        time.sleep(interval)
+    
+    if input_cleared(after, message_text):
+        if debug:
+            log.warning("⚠️ Không thấy bubble mới sau %ss nhưng ô nhập đã xóa - coi như đã gửi", timeout)
+        annotate_session(dev.device_id, "message_verified", {"method": "input_cleared", "snapshots": snapshots})
+        return True
     
     if debug:
-        print(f"❌ Không thể xác minh tin nhắn sau {timeout}s")
+        log.error("❌ Không thể xác minh tin nhắn sau %ss", timeout)
     return False
 
 # === ERROR CAPTURE AND DEBUGGING ===
 def capture_error_state(dev, error_context="unknown", debug=False):
-    """Capture ảnh màn hình và UI dump khi có lỗi để debug"""
-    import time as time_module
-    import os
-    
+    """Capture ảnh màn hình và UI dump khi có lỗi để debug
+
+    Capture được lưu vào capture store (utils.capture_store, nén + dedup) và
+    tra lại bằng: python -m utils.capture_store list --step <error_context>.
+    Toàn bộ RPC chẩn đoán chạy ở worker của screenshot service, automation
+    thread chỉ xếp job: 'screenshot' là Future của screenshot, 'diagnostics' là
+    Future trả về {'ui_dump', 'device_info'} (None nếu bị rate limit).
+    """
     try:
-        # Tạo thư mục error_logs nếu chưa có
-        error_dir = "error_logs"
-        if not os.path.exists(error_dir):
-            os.makedirs(error_dir)
-        
-        # Tạo timestamp cho file
         timestamp = time.strftime("%Y%m%d_%H%M%S")
-        device_id = dev.device_id.replace(":", "_")
+        device_id = dev.device_id
         
-        # Capture screenshot
-        screenshot_path = os.path.join(error_dir, f"error_{device_id}_{error_context}_{timestamp}.png")
-        try:
-            dev.screenshot(screenshot_path)
-            if debug:
-                print(f"📸 Đã capture screenshot: {screenshot_path}")
-        except Exception as e:
-            if debug:
-                print(f"⚠️ Lỗi capture screenshot: {e}")
-        
-        # Capture UI dump
-        ui_dump_path = os.path.join(error_dir, f"ui_dump_{device_id}_{error_context}_{timestamp}.xml")
-        try:
-            ui_dump = dev.dump_hierarchy()
-            with open(ui_dump_path, 'w', encoding='utf-8') as f:
-                f.write(ui_dump)
-            if debug:
-                print(f"📄 Đã capture UI dump: {ui_dump_path}")
-        except Exception as e:
-            if debug:
-                print(f"⚠️ Lỗi capture UI dump: {e}")
-        
-        # Log device info
-        info_path = os.path.join(error_dir, f"device_info_{device_id}_{error_context}_{timestamp}.txt")
-        try:
-            with open(info_path, 'w', encoding='utf-8') as f:
-                f.write(f"Error Context: {error_context}\n")
-                f.write(f"Timestamp: {timestamp}\n")
-                f.write(f"Device ID: {dev.device_id}\n")
-                f.write(f"Device Info: {dev.device_info}\n")
-                f.write(f"Window Size: {dev.window_size()}\n")
-                
-                # Thêm thông tin về current activity
-                try:
-                    current_app = dev.app_current()
-                    f.write(f"Current App: {current_app}\n")
-                except:
-                    f.write("Current App: Unable to get\n")
-                
-                # Thêm thông tin về các element hiện tại
-                try:
-                    elements_info = []
-                    # Kiểm tra các element quan trọng
-                    important_elements = [
-                        ("Edit Text", RID_EDIT_TEXT),
-                        ("Send Button", RID_SEND_BTN),
-                        ("Action Bar", RID_ACTION_BAR),
-                        ("Search Box", RID_SEARCH_BOX)
-                    ]
-                    
-                    for name, resource_id in important_elements:
-                        elem = dev.d(resourceId=resource_id)
-                        if elem.exists:
-                            elements_info.append(f"{name}: EXISTS - {elem.info}")
-                        else:
-                            elements_info.append(f"{name}: NOT FOUND")
-                    
-                    f.write("\nImportant Elements:\n")
-                    f.write("\n".join(elements_info))
-                    
-                except Exception as elem_e:
-                    f.write(f"\nError getting elements info: {elem_e}")
-            
-            if debug:
-                print(f"📝 Đã log device info: {info_path}")
-                
-        except Exception as e:
-            if debug:
-                print(f"⚠️ Lỗi log device info: {e}")
+        # Capture ở background: không cộng thêm vài giây vào retry path
+        screenshot_job = request_screenshot(dev.d, device_id, error_context)
+        diagnostics_job = request_diagnostics(
+            device_id, lambda: collect_error_diagnostics(dev, error_context, timestamp, debug))
+        if debug and (screenshot_job is not None or diagnostics_job is not None):
+            log.debug("📸 Đã xếp capture error state cho %s", device_id)
         
         return {
-            'screenshot': screenshot_path if 'screenshot_path' in locals() else None,
-            'ui_dump': ui_dump_path if 'ui_dump_path' in locals() else None,
-            'device_info': info_path if 'info_path' in locals() else None,
+            'screenshot': screenshot_job,
+            'diagnostics': diagnostics_job,
             'timestamp': timestamp
         }
         
     except Exception as e:
         if debug:
-            print(f"❌ Lỗi capture error state: {e}")
+            log.error("❌ Lỗi capture error state: %s", e)
         return None
 
+def collect_error_diagnostics(dev, error_context, timestamp, debug=False):
+    """UI dump + device/app/element info lúc lỗi (chạy trên worker của screenshot service)"""
+    device_id = dev.device_id
+    ui_dump_ref = info_ref = None
+    
+    # Capture UI dump
+    try:
+        ui_dump_ref = store_capture(device_id, error_context, "hierarchy", dev.d.dump_hierarchy())
+        if debug:
+            log.debug("📄 Đã capture UI dump: %s", ui_dump_ref, extra={"device": device_id})
+    except Exception as e:
+        if debug:
+            log.warning("⚠️ Lỗi capture UI dump: %s", e, extra={"device": device_id})
+    
+    # Log device info
+    try:
+        lines = [
+            f"Error Context: {error_context}",
+            f"Timestamp: {timestamp}",
+            f"Device ID: {dev.device_id}",
+            f"Device Info: {dev.device_info()}",
+            f"Screen Info: {dev.screen_info}",
+        ]
+        
+        # Thêm thông tin về current activity
+        try:
+            lines.append(f"Current App: {dev.d.app_current()}")
+        except Exception:
+            lines.append("Current App: Unable to get")
+        
+        # Thêm thông tin về các element hiện tại
+        try:
+            elements_info = []
+            # Kiểm tra các element quan trọng
+            important_elements = [
+                ("Edit Text", RID_EDIT_TEXT),
+                ("Send Button", RID_SEND_BTN),
+                ("Action Bar", RID_ACTION_BAR),
+                ("Search Box", RID_SEARCH_BOX)
+            ]
+            
+            for name, resource_id in important_elements:
+                elem = dev.d(resourceId=resource_id)
+                if elem.exists:
+                    elements_info.append(f"{name}: EXISTS - {elem.info}")
+                else:
+                    elements_info.append(f"{name}: NOT FOUND")
+            
+            lines.append("\nImportant Elements:")
+            lines.extend(elements_info)
+            
+        except Exception as elem_e:
+            lines.append(f"\nError getting elements info: {elem_e}")
+        
+        info_ref = store_capture(device_id, error_context, "info", "\n".join(lines) + "\n")
+        if debug:
+            log.debug("📝 Đã log device info: %s", info_ref, extra={"device": device_id})
+            
+    except Exception as e:
+        if debug:
+            log.warning("⚠️ Lỗi log device info: %s", e, extra={"device": device_id})
+    
+    return {'ui_dump': ui_dump_ref, 'device_info': info_ref}
+
 def safe_ui_operation(dev, operation_func, operation_name="UI Operation", max_retries=5, debug=False):
     """Wrapper để thực hiện UI operation một cách an toàn với enhanced error handling và exponential backoff"""
     import time as time_module
@@ -4216,7 +4624,7 @@ def safe_ui_operation(dev, operation_func, operation_name="UI Operation", max_re
     for attempt in range(max_retries):
         try:
             if debug:
-                print(f"🔄 Thử {operation_name} (lần {attempt + 1}/{max_retries})")
+                log.debug("🔄 Thử %s (lần %s/%s)", operation_name, attempt + 1, max_retries)
             
             # Thêm timeout wrapper cho operation sử dụng threading.Timer (Windows compatible)
             operation_completed = threading.Event()
@@ -4254,7 +4662,7 @@ def safe_ui_operation(dev, operation_func, operation_name="UI Operation", max_re
                     raise operation_error[0]
                 
                 if debug:
-                    print(f"✅ {operation_name} thành công")
+                    log.debug("✅ %s thành công", operation_name)
                 return operation_result[0]
             except TimeoutError as te:
                 timeout_timer.cancel()
@@ -4263,12 +4671,12 @@ def safe_ui_operation(dev, operation_func, operation_name="UI Operation", max_re
         except Exception as e:
             error_msg = str(e)
             if debug:
-                print(f"⚠️ {operation_name} thất bại (lần {attempt + 1}): {error_msg}")
+                log.warning("⚠️ %s thất bại (lần %s): %s", operation_name, attempt + 1, error_msg)
             
             # Capture error state cho lần thử cuối
             if attempt == max_retries - 1:
                 if debug:
-                    print(f"📸 Capture error state cho {operation_name}")
+                    log.debug("📸 Capture error state cho %s", operation_name)
                 try:
                     capture_error_state(dev, f"{operation_name.lower().replace(' ', '_')}_failed", debug=debug)
                 except:
@@ -4277,11 +4685,11 @@ def safe_ui_operation(dev, operation_func, operation_name="UI Operation", max_re
                 # Exponential backoff: 1s, 2s, 4s, 8s
                 backoff_time = min(2 ** attempt, 8)
                 if debug:
-                    print(f"⏸️ Đợi {backoff_time}s trước khi thử lại...")
+                    log.debug("⏸️ Đợi %ss trước khi thử lại...", backoff_time)
                 time_module.sleep(backoff_time)
     
     if debug:
-        print(f"❌ {operation_name} thất bại sau {max_retries} lần thử")
+        log.error("❌ %s thất bại sau %s lần thử", operation_name, max_retries)
     return None
 
 def check_recent_apps_empty(dev):
@@ -4310,13 +4718,13 @@ def check_recent_apps_empty(dev):
         # Check for text-based empty indicators
         for indicator in empty_indicators[:6]:  # Text indicators
             if dev.d(text=indicator).exists(timeout=1):
-                print(f"[DEBUG] Empty recent apps detected by text: {indicator}")
+                log.debug("Empty recent apps detected by text: %s", indicator)
                 return True
                 
         # Check for resource ID-based empty indicators
         for indicator in empty_indicators[6:]:  # Resource ID indicators
             if dev.d(resourceId=indicator).exists(timeout=1):
-                print(f"[DEBUG] Empty recent apps detected by resource ID: {indicator}")
+                log.debug("Empty recent apps detected by resource ID: %s", indicator)
                 return True
         
         # Check if there are any app cards/items in recent apps
@@ -4330,28 +4738,84 @@ def check_recent_apps_empty(dev):
         
         for selector in app_item_selectors:
             if dev.d(resourceId=selector).exists(timeout=1):
-                print(f"[DEBUG] Found app items in recent apps: {selector}")
+                log.debug("Found app items in recent apps: %s", selector)
                 return False
                 
         # If no clear indicators found, assume there might be apps
         # This is safer approach - only return True if we're certain it's empty
-        print(f"[DEBUG] Cannot determine recent apps state clearly, assuming not empty")
+        log.debug("Cannot determine recent apps state clearly, assuming not empty")
         return False
         
     except Exception as e:
-        print(f"[DEBUG] Error checking recent apps empty state: {e}")
+        log.debug("Error checking recent apps empty state: %s", e)
         return False
 
+def clear_apps_via_recents(dev):
+    """Dọn app qua UI: Recent apps -> Clear all (hoặc center_group) - fallback của shell reset"""
+    try:
+        # Bấm nút recent apps
+        recent_apps_element = dev.d(resourceId="com.android.systemui:id/recent_apps")
+        if recent_apps_element.exists(timeout=5):
+            recent_apps_element.click()
+            log.debug("Recent apps button clicked")
+            time.sleep(3)
+
+            # Kiểm tra xem có nút clear_all không
+            clear_all_element = dev.d(resourceId="com.sec.android.app.launcher:id/clear_all")
+            if clear_all_element.exists(timeout=5):
+                # Có nút clear_all -> click vào
+                clear_all_element.click()
+                log.debug("Clear all button clicked successfully")
+                time.sleep(2)
+            else:
+                # Không có nút clear_all -> click center_group 2 lần
+                center_group_element = dev.d(resourceId="com.android.systemui:id/center_group")
+                if center_group_element.exists(timeout=3):
+                    center_group_element.click()
+                    log.debug("Center group clicked (1st time)")
+                    time.sleep(1)
+                    center_group_element.click()
+                    log.debug("Center group clicked (2nd time)")
+                    time.sleep(1)
+                else:
+                    log.debug("Center group not found")
+        else:
+            log.debug("Recent apps button not found")
+
+        log.debug("Apps clearing completed on %s", dev.device_id)
+
+    except Exception as e:
+        log.debug("Error during clear apps: %s", e)
+
+def reset_apps(dev, debug=False):
+    """Dọn app trước khi mở Zalo theo profile của máy: shell batch, fallback UI recents
+
+    Returns method đã dùng ("shell" / "ui").
+    """
+    profile = get_reset_profile(dev)
+    if profile["method"] == "shell":
+        with step_timer(dev, "app_reset_shell"):
+            reset_ok = shell_reset(dev, profile)
+        if reset_ok:
+            if debug: log.debug("Apps reset via shell on %s: %s", dev.device_id, build_reset_command(profile))
+            return "shell"
+        log.debug("Shell app reset failed on %s, fallback to recents UI", dev.device_id)
+    with step_timer(dev, "app_reset_ui"):
+        clear_apps_via_recents(dev)
+    return "ui"
+
+@timed_step("flow")
 def flow(dev, all_devices=None, stop_event=None, status_callback=None, context=None):
     """Main flow function - UIAutomator2 version với group-based conversation automation"""
     
     # DEBUG: Log thông tin device
     device_ip = dev.device_id
-    print(f"[DEBUG] ===== FLOW START FOR DEVICE {device_ip} =====")
-    print(f"[DEBUG] Starting flow for device: {device_ip}")
-    print(f"[DEBUG] All devices passed to flow: {all_devices}")
-    print(f"[DEBUG] Thread ID: {threading.get_ident()}")
-    print(f"[DEBUG] ================================================")
+    bind_device(device_ip)
+    log.debug("===== FLOW START FOR DEVICE %s =====", device_ip)
+    log.debug("Starting flow for device: %s", device_ip)
+    log.debug("All devices passed to flow: %s", all_devices)
+    log.debug("Thread ID: %s", threading.get_ident())
+    log.debug("================================================")
     
     # Log với context nếu có
     if context:
@@ -4363,11 +4827,11 @@ def flow(dev, all_devices=None, stop_event=None, status_callback=None, context=N
         context.log_info("Flow cancelled before starting")
         return "CANCELLED"
     if stop_event and stop_event.is_set():
-        print(f"[DEBUG] Stop signal received before starting flow for {device_ip}")
+        log.debug("Stop signal received before starting flow for %s", device_ip)
         return "STOPPED"
     
     # Cập nhật trạng thái ban đầu
-    print(f"[DEBUG] Updating status for {device_ip} to 'running'")
+    log.debug("Updating status for %s to 'running'", device_ip)
     update_shared_status(device_ip, 'running', 'Khởi tạo automation...', 0)
     
     # Xác định nhóm và số lượng devices trong nhóm để setup barrier - Enhanced Sync
@@ -4375,12 +4839,13 @@ def flow(dev, all_devices=None, stop_event=None, status_callback=None, context=N
         ip = device_ip.split(":")[0] if ":" in device_ip else device_ip
         normalized_devices = [d.split(':')[0] if ':' in d else d for d in all_devices]
         group_id, role_in_group = determine_group_and_role(ip, normalized_devices)
+        bind_device(device_ip, group_id)
         
         # Tính số devices trong nhóm này (mỗi nhóm tối đa 2 devices)
         devices_in_group = 2 if len(normalized_devices) >= 2 else 1
         
-        print(f"🚧 Nhóm {group_id} - Thiết lập Enhanced Barrier cho {devices_in_group} devices")
-        print(f"📋 Nhóm {group_id} - Devices trong nhóm: {normalized_devices[:devices_in_group]}")
+        log.info("🚧 Nhóm %s - Thiết lập Enhanced Barrier cho %s devices", group_id, devices_in_group)
+        log.info("📋 Nhóm %s - Devices trong nhóm: %s", group_id, normalized_devices[:devices_in_group])
         update_shared_status(device_ip, 'running', f'Đồng bộ Enhanced với nhóm {group_id}...', 10)
         
         # Enhanced barrier synchronization với multiple retry attempts
@@ -4389,53 +4854,53 @@ def flow(dev, all_devices=None, stop_event=None, status_callback=None, context=N
         
         for barrier_attempt in range(barrier_attempts):
             try:
-                print(f"🔄 Nhóm {group_id} - Barrier attempt {barrier_attempt + 1}/{barrier_attempts}")
+                log.info("🔄 Nhóm %s - Barrier attempt %s/%s", group_id, barrier_attempt + 1, barrier_attempts)
                 
                 # Signal ready tại barrier với retry
                 signal_success = signal_ready_at_barrier(group_id, ip)
                 if not signal_success:
-                    print(f"⚠️ Nhóm {group_id} - Signal failed on attempt {barrier_attempt + 1}")
+                    log.warning("⚠️ Nhóm %s - Signal failed on attempt %s", group_id, barrier_attempt + 1)
                     if barrier_attempt < barrier_attempts - 1:
                         time.sleep(2)  # Wait before retry
                         continue
                 
                 # Đợi tất cả devices trong nhóm sẵn sàng với adaptive timeout
                 barrier_timeout = 90 + (barrier_attempt * 30)  # Tăng timeout theo attempt
-                print(f"⏱️ Nhóm {group_id} - Đợi barrier với timeout {barrier_timeout}s")
+                log.info("⏱️ Nhóm %s - Đợi barrier với timeout %ss", group_id, barrier_timeout)
                 
                 if wait_for_group_barrier(group_id, devices_in_group, timeout=barrier_timeout):
-                    print(f"✅ Nhóm {group_id} - Barrier thành công sau {barrier_attempt + 1} attempts")
+                    log.info("✅ Nhóm %s - Barrier thành công sau %s attempts", group_id, barrier_attempt + 1)
                     barrier_success = True
                     update_shared_status(device_ip, 'completed', f'Đã đồng bộ với nhóm {group_id}', 20)
                     break
                 else:
-                    print(f"⚠️ Nhóm {group_id} - Barrier timeout on attempt {barrier_attempt + 1}")
+                    log.warning("⚠️ Nhóm %s - Barrier timeout on attempt %s", group_id, barrier_attempt + 1)
                     if barrier_attempt < barrier_attempts - 1:
-                        print(f"🔄 Nhóm {group_id} - Cleaning up và retry barrier...")
+                        log.info("🔄 Nhóm %s - Cleaning up và retry barrier...", group_id)
                         cleanup_barrier_file(group_id)
                         time.sleep(5)  # Wait before retry
                     
             except Exception as e:
-                print(f"❌ Nhóm {group_id} - Barrier error on attempt {barrier_attempt + 1}: {e}")
+                log.error("❌ Nhóm %s - Barrier error on attempt %s: %s", group_id, barrier_attempt + 1, e)
                 if barrier_attempt < barrier_attempts - 1:
                     cleanup_barrier_file(group_id)
                     time.sleep(3)
         
         if not barrier_success:
-            print(f"⚠️ Nhóm {group_id} - Không thể đồng bộ sau {barrier_attempts} attempts, tiếp tục độc lập...")
-            print(f"💡 Nhóm {group_id} - Máy sẽ chạy với delay ngẫu nhiên để tránh conflict")
+            log.warning("⚠️ Nhóm %s - Không thể đồng bộ sau %s attempts, tiếp tục độc lập...", group_id, barrier_attempts)
+            log.info("💡 Nhóm %s - Máy sẽ chạy với delay ngẫu nhiên để tránh conflict", group_id)
             update_shared_status(device_ip, 'running', 'Chạy độc lập (không đồng bộ)', 15)
             
             # Thêm delay ngẫu nhiên lớn hơn khi không đồng bộ được
             import random
             fallback_delay = random.uniform(3, 8)
-            print(f"🕐 Nhóm {group_id} - Fallback delay: {fallback_delay:.2f}s")
+            log.info("🕐 Nhóm %s - Fallback delay: %.2fs", group_id, fallback_delay)
             time.sleep(fallback_delay)
         
         # Thêm delay ngẫu nhiên nhỏ sau barrier để tránh conflict
         import random
         post_barrier_delay = random.uniform(0.5, 1.5)
-        print(f"[DEBUG] Post-barrier delay: {post_barrier_delay:.2f}s")
+        log.debug("Post-barrier delay: %.2fs", post_barrier_delay)
         
         # Kiểm tra stop signal và cancel_event trước delay
         if context and context.is_cancelled():
@@ -4444,7 +4909,7 @@ def flow(dev, all_devices=None, stop_event=None, status_callback=None, context=N
             update_shared_status(device_ip, 'error', 'Đã dừng theo yêu cầu', 0)
             return "CANCELLED"
         if stop_event and stop_event.is_set():
-            print(f"[DEBUG] Stop signal received during post-barrier delay for {device_ip}")
+            log.debug("Stop signal received during post-barrier delay for %s", device_ip)
             cleanup_barrier_file(group_id)
             update_shared_status(device_ip, 'error', 'Đã dừng theo yêu cầu', 0)
             return "STOPPED"
@@ -4454,21 +4919,21 @@ def flow(dev, all_devices=None, stop_event=None, status_callback=None, context=N
         # Single device mode - không cần barrier
         import random
         initial_delay = random.uniform(1, 3)
-        print(f"[DEBUG] Single device mode - Initial delay: {initial_delay:.2f}s")
+        log.debug("Single device mode - Initial delay: %.2fs", initial_delay)
         
         # Kiểm tra stop signal và cancel_event trước delay
         if context and context.is_cancelled():
             context.log_info("Flow cancelled during initial delay")
             return "CANCELLED"
         if stop_event and stop_event.is_set():
-            print(f"[DEBUG] Stop signal received during initial delay for {device_ip}")
+            log.debug("Stop signal received during initial delay for %s", device_ip)
             return "STOPPED"
         
         time.sleep(initial_delay)
     
     # BARRIER SYNC TRƯỚC KHI CLEAR APPS - Đảm bảo tất cả máy bắt đầu clear apps ĐỒNG THỜI
     if all_devices and len(all_devices) > 1:
-        print(f"[DEBUG] Waiting for all devices to be ready to clear apps (pre-clear barrier sync)...")
+        log.debug("Waiting for all devices to be ready to clear apps (pre-clear barrier sync)...")
         update_shared_status(device_ip, 'running', 'Đợi tất cả máy sẵn sàng clear apps...', 22)
         
         try:
@@ -4483,63 +4948,32 @@ def flow(dev, all_devices=None, stop_event=None, status_callback=None, context=N
             )
             
             if not barrier_result:
-                print(f"[WARNING] Pre-clear barrier timeout, continuing anyway...")
+                log.warning("Pre-clear barrier timeout, continuing anyway...")
             else:
-                print(f"[DEBUG] 🚀 ALL DEVICES READY - CLEARING APPS SIMULTANEOUSLY!")
+                log.debug("🚀 ALL DEVICES READY - CLEARING APPS SIMULTANEOUSLY!")
                 
         except Exception as e:
-            print(f"[WARNING] Error during pre-clear barrier sync: {e}, continuing anyway...")
+            log.warning("Error during pre-clear barrier sync: %s, continuing anyway...", e)
     
     # Clear apps trước khi mở Zalo với logic đơn giản - ĐỒNG BỘ
-    print(f"[DEBUG] Clearing apps before opening Zalo on {device_ip}...")
+    log.debug("Clearing apps before opening Zalo on %s...", device_ip)
     update_shared_status(device_ip, 'running', 'Đang clear apps đồng bộ...', 23)
     
-    try:
-        # Bấm nút recent apps
-        recent_apps_element = dev.d(resourceId="com.android.systemui:id/recent_apps")
-        if recent_apps_element.exists(timeout=5):
-            recent_apps_element.click()
-            print(f"[DEBUG] Recent apps button clicked")
-            time.sleep(3)
-            
-            # Kiểm tra xem có nút clear_all không
-            clear_all_element = dev.d(resourceId="com.sec.android.app.launcher:id/clear_all")
-            if clear_all_element.exists(timeout=5):
-                # Có nút clear_all -> click vào
-                clear_all_element.click()
-                print(f"[DEBUG] Clear all button clicked successfully")
-                time.sleep(2)
-            else:
-                # Không có nút clear_all -> click center_group 2 lần
-                center_group_element = dev.d(resourceId="com.android.systemui:id/center_group")
-                if center_group_element.exists(timeout=3):
-                    center_group_element.click()
-                    print(f"[DEBUG] Center group clicked (1st time)")
-                    time.sleep(1)
-                    center_group_element.click()
-                    print(f"[DEBUG] Center group clicked (2nd time)")
-                    time.sleep(1)
-                else:
-                    print(f"[DEBUG] Center group not found")
-        else:
-            print(f"[DEBUG] Recent apps button not found")
-            
-        print(f"[DEBUG] Apps clearing completed on {device_ip}")
-        
-    except Exception as e:
-        print(f"[DEBUG] Error during clear apps: {e}")
+    with step_timer(dev, "clear_recents"):
+        reset_method = reset_apps(dev, debug=True)
+    annotate_session(device_ip, "app_reset", reset_method)
         
     # Ensure we're on home screen before opening Zalo
     try:
         dev.d.press("home")
         time.sleep(1)
-        print(f"[DEBUG] Returned to home screen on {device_ip}")
+        log.debug("Returned to home screen on %s", device_ip)
     except Exception as e:
-        print(f"[DEBUG] Error returning to home: {e}")
+        log.debug("Error returning to home: %s", e)
     
     # BARRIER SYNC TRƯỚC KHI MỞ ZALO - Đảm bảo tất cả máy mở Zalo ĐỒNG THỜI
     if all_devices and len(all_devices) > 1:
-        print(f"[DEBUG] Waiting for all devices to be ready to open Zalo (pre-open barrier sync)...")
+        log.debug("Waiting for all devices to be ready to open Zalo (pre-open barrier sync)...")
         update_shared_status(device_ip, 'running', 'Đợi tất cả máy sẵn sàng mở Zalo...', 24)
         
         try:
@@ -4554,103 +4988,104 @@ def flow(dev, all_devices=None, stop_event=None, status_callback=None, context=N
             )
             
             if not barrier_result:
-                print(f"[WARNING] Pre-open barrier timeout, continuing anyway...")
+                log.warning("Pre-open barrier timeout, continuing anyway...")
             else:
-                print(f"[DEBUG] 🚀 ALL DEVICES READY - OPENING ZALO SIMULTANEOUSLY!")
+                log.debug("🚀 ALL DEVICES READY - OPENING ZALO SIMULTANEOUSLY!")
                 
         except Exception as e:
-            print(f"[WARNING] Error during pre-open barrier sync: {e}, continuing anyway...")
+            log.warning("Error during pre-open barrier sync: %s, continuing anyway...", e)
     
     # Mở app Zalo với retry logic và delay - ĐỒNG BỘ
-    print(f"[DEBUG] Opening Zalo app on {device_ip}...")
+    log.debug("Opening Zalo app on %s...", device_ip)
     update_shared_status(device_ip, 'running', 'Đang mở ứng dụng Zalo đồng bộ...', 25)
     
     # Enhanced retry logic cho việc mở app với better error handling
-    max_retries = 5  # Tăng số lần retry
-    app_opened_successfully = False
+    with step_timer(dev, "app_open"):
+        max_retries = 5  # Tăng số lần retry
+        app_opened_successfully = False
     
-    for attempt in range(max_retries):
-        try:
-            print(f"[DEBUG] Attempt {attempt + 1}/{max_retries} to open Zalo on {device_ip}")
+        for attempt in range(max_retries):
+            try:
+                log.debug("Attempt %s/%s to open Zalo on %s", attempt + 1, max_retries, device_ip)
             
-            # Thử force stop app trước khi mở lại (trừ lần đầu)
-            if attempt > 0:
-                try:
-                    dev.app_stop(PKG)
-                    time.sleep(1)
-                    print(f"[DEBUG] Force stopped Zalo app before retry")
-                except:
-                    pass
+                # Thử force stop app trước khi mở lại (trừ lần đầu)
+                if attempt > 0:
+                    try:
+                        dev.app_stop(PKG)
+                        time.sleep(1)
+                        log.debug("Force stopped Zalo app before retry")
+                    except:
+                        pass
             
-            # Mở app
-            dev.app(PKG)
+                # Mở app
+                dev.app(PKG)
             
-            # Đợi app mở hoàn toàn với progressive delay
-            base_delay = 4 + (attempt * 1)  # Tăng delay theo số lần retry
-            app_open_delay = base_delay + random.uniform(0, 2)
-            print(f"[DEBUG] Waiting {app_open_delay:.2f}s for app to fully load...")
+                # Đợi app mở hoàn toàn với progressive delay
+                base_delay = 4 + (attempt * 1)  # Tăng delay theo số lần retry
+                app_open_delay = base_delay + random.uniform(0, 2)
+                log.debug("Waiting %.2fs for app to fully load...", app_open_delay)
             
-            # Kiểm tra stop signal trước delay
-            if stop_event and stop_event.is_set():
-                print(f"[DEBUG] Stop signal received during app open delay for {device_ip}")
-                return "STOPPED"
+                # Kiểm tra stop signal trước delay
+                if stop_event and stop_event.is_set():
+                    log.debug("Stop signal received during app open delay for %s", device_ip)
+                    return "STOPPED"
             
-            time.sleep(app_open_delay)
+                time.sleep(app_open_delay)
             
-            # Kiểm tra app đã mở thành công chưa với multiple checks
-            success_indicators = [
-                ("maintab_root_layout", "com.zing.zalo:id/maintab_root_layout"),
-                ("message_list", RID_MSG_LIST),
-                ("login_button", "com.zing.zalo:id/btnLogin"),
-                ("action_bar", RID_ACTION_BAR),
-                ("tab_message", RID_TAB_MESSAGE)
-            ]
+                # Kiểm tra app đã mở thành công chưa với multiple checks
+                success_indicators = [
+                    ("maintab_root_layout", "com.zing.zalo:id/maintab_root_layout"),
+                    ("message_list", RID_MSG_LIST),
+                    ("login_button", "com.zing.zalo:id/btnLogin"),
+                    ("action_bar", RID_ACTION_BAR),
+                    ("tab_message", RID_TAB_MESSAGE)
+                ]
             
-            found_indicator = None
-            for indicator_name, resource_id in success_indicators:
-                if dev.element_exists(resourceId=resource_id):
-                    found_indicator = indicator_name
-                    break
+                found_indicator = None
+                for indicator_name, resource_id in success_indicators:
+                    if dev.element_exists(resourceId=resource_id):
+                        found_indicator = indicator_name
+                        break
             
-            if found_indicator:
-                print(f"[DEBUG] Zalo app opened successfully on {device_ip} (found: {found_indicator})")
-                app_opened_successfully = True
-                break
-            else:
-                print(f"[DEBUG] App not fully loaded on attempt {attempt + 1}, no success indicators found")
-                if attempt < max_retries - 1:
-                    retry_delay = 2 + (attempt * 1)  # Progressive retry delay
-                    print(f"[DEBUG] Waiting {retry_delay}s before retry...")
+                if found_indicator:
+                    log.debug("Zalo app opened successfully on %s (found: %s)", device_ip, found_indicator)
+                    app_opened_successfully = True
+                    break
+                else:
+                    log.debug("App not fully loaded on attempt %s, no success indicators found", attempt + 1)
+                    if attempt < max_retries - 1:
+                        retry_delay = 2 + (attempt * 1)  # Progressive retry delay
+                        log.debug("Waiting %ss before retry...", retry_delay)
                     
-                    # Kiểm tra stop signal trước retry delay
-                    if stop_event and stop_event.is_set():
-                        print(f"[DEBUG] Stop signal received during retry delay for {device_ip}")
-                        return "STOPPED"
+                        # Kiểm tra stop signal trước retry delay
+                        if stop_event and stop_event.is_set():
+                            log.debug("Stop signal received during retry delay for %s", device_ip)
+                            return "STOPPED"
                     
-                    time.sleep(retry_delay)
+                        time.sleep(retry_delay)
                     
-        except Exception as e:
-            print(f"[DEBUG] Error opening app on attempt {attempt + 1}: {e}")
-            if attempt < max_retries - 1:
-                retry_delay = 3 + (attempt * 1)
-                print(f"[DEBUG] Exception occurred, waiting {retry_delay}s before retry...")
+            except Exception as e:
+                log.debug("Error opening app on attempt %s: %s", attempt + 1, e)
+                if attempt < max_retries - 1:
+                    retry_delay = 3 + (attempt * 1)
+                    log.debug("Exception occurred, waiting %ss before retry...", retry_delay)
                 
-                # Kiểm tra stop signal trước exception retry delay
-                if stop_event and stop_event.is_set():
-                    print(f"[DEBUG] Stop signal received during exception retry delay for {device_ip}")
-                    return "STOPPED"
+                    # Kiểm tra stop signal trước exception retry delay
+                    if stop_event and stop_event.is_set():
+                        log.debug("Stop signal received during exception retry delay for %s", device_ip)
+                        return "STOPPED"
                 
-                time.sleep(retry_delay)
+                    time.sleep(retry_delay)
     
     if not app_opened_successfully:
-        print(f"[ERROR] Failed to open Zalo app after {max_retries} attempts on {device_ip}")
+        log.error("Failed to open Zalo app after %s attempts on %s", max_retries, device_ip)
         update_shared_status(device_ip, 'error', 'Không thể mở ứng dụng Zalo', 0)
         return "APP_OPEN_FAILED"
     
-    print(f"[DEBUG] Zalo app opening process completed on {device_ip}")
+    log.debug("Zalo app opening process completed on %s", device_ip)
     
     # Barrier sync sau khi mở app thành công để đảm bảo cả 2 máy đều đã mở Zalo
-    print(f"[DEBUG] Waiting for all devices to open Zalo app (barrier sync)...")
+    log.debug("Waiting for all devices to open Zalo app (barrier sync)...")
     update_shared_status(device_ip, 'running', 'Đợi tất cả máy mở Zalo...', 30)
     
     try:
@@ -4664,33 +5099,33 @@ def flow(dev, all_devices=None, stop_event=None, status_callback=None, context=N
         )
         
         if barrier_result == "STOPPED":
-            print(f"[DEBUG] Stop signal received during app open barrier sync for {device_ip}")
+            log.debug("Stop signal received during app open barrier sync for %s", device_ip)
             return "STOPPED"
         elif barrier_result == "TIMEOUT":
-            print(f"[WARNING] Timeout waiting for other devices to open app, continuing anyway...")
+            log.warning("Timeout waiting for other devices to open app, continuing anyway...")
         else:
-            print(f"[DEBUG] All devices have opened Zalo app successfully")
+            log.debug("All devices have opened Zalo app successfully")
     except Exception as e:
-        print(f"[WARNING] Error during app open barrier sync: {e}, continuing anyway...")
+        log.warning("Error during app open barrier sync: %s, continuing anyway...", e)
     
     # Kiểm tra đăng nhập
-    print(f"[DEBUG] Checking login status for {device_ip}...")
+    log.debug("Checking login status for %s...", device_ip)
     update_shared_status(device_ip, 'running', 'Kiểm tra trạng thái đăng nhập...', 35)
     
     if is_login_required(dev, debug=True):
         ip = dev.device_id.split(":")[0] if ":" in dev.device_id else dev.device_id
-        print(f"[DEBUG] Login required for {device_ip}")
-        print(f"IP: {ip} - chưa đăng nhập → thoát flow.")
+        log.debug("Login required for %s", device_ip)
+        log.info("IP: %s - chưa đăng nhập → thoát flow.", ip)
         update_shared_status(device_ip, 'error', 'Cần đăng nhập Zalo', 0)
         return "LOGIN_REQUIRED"
     
     ip = dev.device_id.split(":")[0] if ":" in dev.device_id else dev.device_id
-    print(f"[DEBUG] Login check passed for {device_ip}")
-    print(f"IP: {ip} - đã đăng nhập. Bắt đầu flow…")
+    log.debug("Login check passed for %s", device_ip)
+    log.info("IP: %s - đã đăng nhập. Bắt đầu flow…", ip)
     
     # DEBUG: Log thông tin đầu vào
-    print(f"[DEBUG] Current IP: {ip}")
-    print(f"[DEBUG] All devices: {all_devices}")
+    log.debug("Current IP: %s", ip)
+    log.debug("All devices: %s", all_devices)
     
     # Inline load phone mapping từ file để đảm bảo có mapping mới nhất
     try:
@@ -4703,13 +5138,13 @@ def flow(dev, all_devices=None, stop_event=None, status_callback=None, context=N
                 file_map = data.get('phone_mapping', {})
                 # Update PHONE_MAP với data từ file
                 PHONE_MAP.update(file_map)
-                print(f"[DEBUG] Loaded phone mapping from file: {file_map}")
+                log.debug("Loaded phone mapping from file: %s", file_map)
         else:
-            print(f"[DEBUG] Phone config file not found: {PHONE_CONFIG_FILE}")
+            log.debug("Phone config file not found: %s", PHONE_CONFIG_FILE)
     except Exception as e:
-        print(f"[DEBUG] Error loading phone mapping: {e}")
+        log.debug("Error loading phone mapping: %s", e)
     
-    print(f"[DEBUG] Current PHONE_MAP after reload: {PHONE_MAP}")
+    log.debug("Current PHONE_MAP after reload: %s", PHONE_MAP)
     
     group_id_attr = getattr(dev, "group_id", None)
     role_in_group_attr = getattr(dev, "role_in_group", None)
@@ -4738,23 +5173,23 @@ def flow(dev, all_devices=None, stop_event=None, status_callback=None, context=N
         dev.group_devices = list(effective_all_devices)
         device_role = role_in_group
 
-        print(f"📱 Device {ip} - Nhóm {group_id}, Role {role_in_group}")
-        print(f"[DEBUG] All devices: {effective_all_devices}")
-        print(f"[DEBUG] Normalized devices: {normalized_devices}")
+        log.info("📱 Device %s - Nhóm %s, Role %s", ip, group_id, role_in_group)
+        log.debug("All devices: %s", effective_all_devices)
+        log.debug("Normalized devices: %s", normalized_devices)
 
         sorted_devices = sorted(normalized_devices)
-        print(f"[DEBUG] Sorted devices: {sorted_devices}")
-        print(f"[DEBUG] Current device IP: {ip}")
+        log.debug("Sorted devices: %s", sorted_devices)
+        log.debug("Current device IP: %s", ip)
 
         try:
             device_index = sorted_devices.index(ip)
-            print(f"[DEBUG] Device index: {device_index}")
+            log.debug("Device index: %s", device_index)
         except ValueError:
-            print(f"[DEBUG] IP {ip} not found in sorted_devices")
+            log.debug("IP %s not found in sorted_devices", ip)
             target_phone = ""
             partner_ip = ""
             device_role = 1
-            print(f"[DEBUG] Fallback: target_phone={target_phone}, partner_ip={partner_ip}")
+            log.debug("Fallback: target_phone=%s, partner_ip=%s", target_phone, partner_ip)
             return "SUCCESS"
 
         # Ghép cặp: device 0 <-> device 1, device 2 <-> device 3, device 4 <-> device 5
@@ -4765,29 +5200,29 @@ def flow(dev, all_devices=None, stop_event=None, status_callback=None, context=N
             # Device lẻ ghép với device chẵn trước đó
             partner_index = device_index - 1
 
-        print(f"[DEBUG] Device index: {device_index}, Partner index: {partner_index}")
+        log.debug("Device index: %s, Partner index: %s", device_index, partner_index)
 
         if 0 <= partner_index < len(sorted_devices):
             partner_ip = sorted_devices[partner_index]
             # Tìm target_phone trong PHONE_MAP với cả 2 format: có port và không có port
             partner_ip_with_port = f"{partner_ip}:5555"
             target_phone = PHONE_MAP.get(partner_ip_with_port, "") or PHONE_MAP.get(partner_ip, "")
-            print(f"[DEBUG] Partner IP: {partner_ip}")
-            print(f"[DEBUG] Trying PHONE_MAP keys: {partner_ip_with_port}, {partner_ip}")
-            print(f"[DEBUG] Target phone from PHONE_MAP: {target_phone}")
+            log.debug("Partner IP: %s", partner_ip)
+            log.debug("Trying PHONE_MAP keys: %s, %s", partner_ip_with_port, partner_ip)
+            log.debug("Target phone from PHONE_MAP: %s", target_phone)
 
             if not target_phone:
-                print(f"[DEBUG] No phone mapping found for partner {partner_ip}")
-                print(f"[DEBUG] Available PHONE_MAP keys: {list(PHONE_MAP.keys())}")
+                log.debug("No phone mapping found for partner %s", partner_ip)
+                log.debug("Available PHONE_MAP keys: %s", list(PHONE_MAP.keys()))
                 # Lấy phone đầu tiên có sẵn trong PHONE_MAP
                 available_phones = [v for v in PHONE_MAP.values() if v]
                 if available_phones:
                     target_phone = available_phones[0]
-                    print(f"[DEBUG] Using fallback phone: {target_phone}")
+                    log.debug("Using fallback phone: %s", target_phone)
         else:
             target_phone = ""
             partner_ip = ""
-            print(f"[DEBUG] Partner index {partner_index} out of range (total devices: {len(sorted_devices)})")
+            log.debug("Partner index %s out of range (total devices: %s)", partner_index, len(sorted_devices))
     else:
         # Fallback về logic cũ cho 1 máy hoặc không có all_devices
         if group_id is None:
@@ -4799,101 +5234,71 @@ def flow(dev, all_devices=None, stop_event=None, status_callback=None, context=N
         dev.group_devices = list(group_devices_attr) if group_devices_attr else [dev.device_id]
         device_role = role_in_group
 
-        print(f"[DEBUG] Using fallback mode - single device or no all_devices list")
+        log.debug("Using fallback mode - single device or no all_devices list")
         # Lấy phone đầu tiên có sẵn trong PHONE_MAP
         available_phones = [v for v in PHONE_MAP.values() if v]
         if available_phones:
             target_phone = available_phones[0]
-            print(f"[DEBUG] Fallback target_phone: {target_phone}")
+            log.debug("Fallback target_phone: %s", target_phone)
         else:
             target_phone = "569924311"  # Hard fallback
-            print(f"[DEBUG] Hard fallback target_phone: {target_phone}")
+            log.debug("Hard fallback target_phone: %s", target_phone)
 
-    # Kiểm tra stop signal trước chuyển tab
-    if stop_event and stop_event.is_set():
-        print(f"[DEBUG] Stop signal received before switching to messages tab for {device_ip}")
-        return "STOPPED"
-    
-    # Ép về tab Tin nhắn trước
-    ensure_on_messages_tab(dev, debug=True)
-    time.sleep(0.4)
-    
-    # Kiểm tra stop signal trước mở search
+    annotate_session(device_ip, "target_phone", target_phone)
+
+    # Kiểm tra stop signal trước khi mở chat
     if stop_event and stop_event.is_set():
-        print(f"[DEBUG] Stop signal received before opening search for {device_ip}")
+        log.debug("Stop signal received before opening partner chat for %s", device_ip)
         return "STOPPED"
     
-    print("• Mở ô tìm kiếm…")
-    if not open_search_strong(dev, debug=True):
-        print("❌ Không mở được ô tìm kiếm. Thử bấm thêm một lần nữa với key SEARCH…")
-        dev.key(84)  # SEARCH key
-        time.sleep(0.6)
-        if not verify_search_opened(dev, debug=True):
-            print("❌ Không mở được ô tìm kiếm. Thoát flow.")
-            return "SUCCESS"
+    effective_all_devices_for_convo = getattr(dev, "group_devices", None) or effective_all_devices or all_devices
     
-    # Kiểm tra stop signal trước nhập số
-    if stop_event and stop_event.is_set():
-        print(f"[DEBUG] Stop signal received before entering phone number for {device_ip}")
+    # Mở chat với đối tác: intent deep link hoặc UI tìm kiếm (theo navigation stats)
+    chat_opened = navigate_to_partner_chat(dev, target_phone, stop_event=stop_event, debug=True)
+    if chat_opened == "STOPPED":
         return "STOPPED"
-    
-    # Nhập số điện thoại của partner để tìm kiếm
-    if target_phone:
-        print(f"• Nhập số đối tác: {target_phone}")
-        enter_query_and_submit(dev, target_phone, debug=True)
-    else:
-        print("• Không có số trong map, nhập 'gxe'")
-        enter_query_and_submit(dev, "gxe", debug=True)
-    
-    # Kiểm tra stop signal trước click search result
-    if stop_event and stop_event.is_set():
-        print(f"[DEBUG] Stop signal received before clicking search result for {device_ip}")
-        return "STOPPED"
-    
-    print("• Chọn kết quả đầu tiên…")
-    if click_first_search_result(dev, preferred_text=target_phone, debug=True):
-        print("✅ Đã vào chat. Kiểm tra và kết bạn nếu cần...")
+    if chat_opened:
+        log.info("✅ Đã vào chat. Kiểm tra và kết bạn nếu cần...")
         
         # Kiểm tra stop signal trước check friend
         if stop_event and stop_event.is_set():
-            print(f"[DEBUG] Stop signal received before friend check for {device_ip}")
+            log.debug("Stop signal received before friend check for %s", device_ip)
             return "STOPPED"
         
-        # Flow kết bạn đã được xử lý trong click_first_search_result
+        # Flow kết bạn đã được xử lý khi mở chat (handle_friend_branch)
         # Chỉ cần đợi UI ổn định và tiếp tục conversation
-        print("✅ Flow kết bạn đã được xử lý (nếu cần) - chuẩn bị conversation")
+        log.info("✅ Flow kết bạn đã được xử lý (nếu cần) - chuẩn bị conversation")
         update_shared_status(device_ip, 'running', 'Sẵn sàng cho cuộc hội thoại', 80)
         
-        print("✅ Đợi 3 giây trước khi bắt đầu cuộc hội thoại...")
+        log.info("✅ Đợi 3 giây trước khi bắt đầu cuộc hội thoại...")
         
         # Kiểm tra stop signal trước delay
         if stop_event and stop_event.is_set():
-            print(f"[DEBUG] Stop signal received before conversation delay for {device_ip}")
+            log.debug("Stop signal received before conversation delay for %s", device_ip)
             return "STOPPED"
         
         time.sleep(3)
         
         # Kiểm tra stop signal trước bắt đầu conversation
         if stop_event and stop_event.is_set():
-            print(f"[DEBUG] Stop signal received before starting conversation for {device_ip}")
+            log.debug("Stop signal received before starting conversation for %s", device_ip)
             return "STOPPED"
         
         # Bắt đầu cuộc hội thoại với group support
-        print("💬 Bắt đầu cuộc hội thoại tự động...")
+        log.info("💬 Bắt đầu cuộc hội thoại tự động...")
         update_shared_status(device_ip, 'running', 'Đang chạy cuộc hội thoại...', 50)
         
-        effective_all_devices_for_convo = getattr(dev, "group_devices", None) or effective_all_devices or all_devices
-        print(f"[DEBUG] Calling run_conversation with device_role=1, all_devices={effective_all_devices_for_convo}")
+        log.debug("Calling run_conversation with device_role=1, all_devices=%s", effective_all_devices_for_convo)
         if context:
             context.log_info(f"Starting conversation with devices: {effective_all_devices_for_convo}")
         conversation_result = run_conversation(dev, 1, debug=True, all_devices=effective_all_devices_for_convo, stop_event=stop_event, status_callback=status_callback, context=context)
-        print(f"[DEBUG] run_conversation completed with result: {conversation_result}")
+        log.debug("run_conversation completed with result: %s", conversation_result)
         if context:
             context.log_info(f"Conversation completed with result: {conversation_result}")
     else:
-        print("❌ Không thể vào chat")
+        log.error("❌ Không thể vào chat")
     
-    print("✅ Hoàn thành flow.")
+    log.info("✅ Hoàn thành flow.")
     update_shared_status(device_ip, 'completed', 'Hoàn thành automation', 100)
     
     # Cleanup barrier file nếu có
@@ -4923,34 +5328,39 @@ def run_automation_from_gui(selected_devices, conversation_text=None, context=No
     Returns:
         dict: Kết quả automation cho từng device
     """
-    print(f"\n🚀 Bắt đầu automation từ GUI với {len(selected_devices)} devices")
-    print(f"📱 Devices: {selected_devices}")
-    print(f"[DEBUG] ===== RUN_AUTOMATION_FROM_GUI DEBUG INFO =====")
-    print(f"[DEBUG] Selected devices received: {selected_devices}")
-    print(f"[DEBUG] Type of selected_devices: {type(selected_devices)}")
+    log.info("🚀 Bắt đầu automation từ GUI với %s devices", len(selected_devices))
+    log.info("📱 Devices: %s", selected_devices)
+    log.debug("===== RUN_AUTOMATION_FROM_GUI DEBUG INFO =====")
+    log.debug("Selected devices received: %s", selected_devices)
+    log.debug("Type of selected_devices: %s", type(selected_devices))
     for i, device in enumerate(selected_devices):
-        print(f"[DEBUG] Device {i+1}: {device} (type: {type(device)})")
-    print(f"[DEBUG] ================================================")
+        log.debug("Device %s: %s (type: %s)", i + 1, device, type(device))
+    log.debug("================================================")
     
     # Log với context nếu có
     if context:
         context.log_info(f"Starting automation with {len(selected_devices)} devices: {selected_devices}")
     
     if conversation_text:
-        print(f"💬 Conversation text: {conversation_text[:50]}...")
+        log.info("💬 Conversation text: %s...", conversation_text[:50])
         if context:
             context.log_info(f"Using conversation text: {conversation_text[:100]}...")
         # Update global conversation nếu có
         global CONVERSATION
         CONVERSATION = conversation_text.strip().split('\n')
     
+    run_log_id = start_run_logs(device_count=len(selected_devices), created_by="gui")
+    start_run(run_log_id, devices=len(selected_devices))
+    start_trace(devices=len(selected_devices))
+    start_capture_run()
+    
     results = {}
     connected_devices = []
     
     # Kết nối tất cả devices
-    print(f"[DEBUG] Starting device connection loop for {len(selected_devices)} devices")
+    log.debug("Starting device connection loop for %s devices", len(selected_devices))
     for i, device_ip in enumerate(selected_devices):
-        print(f"[DEBUG] Processing device {i+1}/{len(selected_devices)}: {device_ip}")
+        log.debug("Processing device %s/%s: %s", i + 1, len(selected_devices), device_ip)
         
         # Check cancel_event trước khi kết nối
         if context and context.is_cancelled():
@@ -4958,51 +5368,52 @@ def run_automation_from_gui(selected_devices, conversation_text=None, context=No
             break
             
         try:
-            print(f"\n🔌 Kết nối device: {device_ip}")
-            print(f"[DEBUG] Creating Device object for: {device_ip}")
+            log.info("🔌 Kết nối device: %s", device_ip)
+            log.debug("Creating Device object for: %s", device_ip)
             if context:
                 context.log_info(f"Connecting to device: {device_ip}")
                 
             dev = Device(device_ip)
-            print(f"[DEBUG] Device object created, attempting connection...")
+            log.debug("Device object created, attempting connection...")
             if dev.connect():
                 connected_devices.append(dev)
                 results[device_ip] = {"status": "connected", "result": None}
-                print(f"✅ Kết nối thành công: {device_ip}")
-                print(f"[DEBUG] Device {device_ip} connected successfully, total connected: {len(connected_devices)}")
+                log.info("✅ Kết nối thành công: %s", device_ip)
+                log.debug("Device %s connected successfully, total connected: %s", device_ip, len(connected_devices))
                 if context:
                     context.log_info(f"Successfully connected to {device_ip}")
             else:
                 results[device_ip] = {"status": "connection_failed", "result": None}
-                print(f"❌ Kết nối thất bại: {device_ip}")
-                print(f"[DEBUG] Device {device_ip} connection failed")
+                log.error("❌ Kết nối thất bại: %s", device_ip)
+                log.debug("Device %s connection failed", device_ip)
                 if context:
                     context.log_error(f"Failed to connect to {device_ip}")
         except Exception as e:
             results[device_ip] = {"status": "error", "result": str(e)}
-            print(f"❌ Lỗi kết nối {device_ip}: {e}")
-            print(f"[DEBUG] Exception during connection to {device_ip}: {e}")
+            log.error("❌ Lỗi kết nối %s: %s", device_ip, e)
+            log.debug("Exception during connection to %s: %s", device_ip, e)
             if context:
                 context.log_error(f"Error connecting to {device_ip}: {str(e)}")
     
-    print(f"[DEBUG] Device connection loop completed. Total connected: {len(connected_devices)}")
+    log.debug("Device connection loop completed. Total connected: %s", len(connected_devices))
     
     if not connected_devices:
-        print("❌ Không có device nào kết nối được")
+        log.error("❌ Không có device nào kết nối được")
         if context:
             context.log_error("No devices could be connected")
+        finish_run_logs(run_log_id, "failed")
         return results
     
     # Chạy automation trên tất cả devices đã kết nối
     device_ips = [dev.device_id for dev in connected_devices]
-    print(f"\n🎯 Bắt đầu automation với {len(connected_devices)} devices")
-    print(f"[DEBUG] Device IPs for automation: {device_ips}")
+    log.info("🎯 Bắt đầu automation với %s devices", len(connected_devices))
+    log.debug("Device IPs for automation: %s", device_ips)
     if context:
         context.log_info(f"Starting automation on {len(connected_devices)} connected devices")
     
     # Chọn execution mode
     if parallel_mode and len(connected_devices) > 1:
-        print(f"[DEBUG] Using PARALLEL execution mode for {len(connected_devices)} devices")
+        log.debug("Using PARALLEL execution mode for %s devices", len(connected_devices))
         # Parallel execution using threading
         import threading
         import queue
@@ -5013,39 +5424,39 @@ def run_automation_from_gui(selected_devices, conversation_text=None, context=No
         def run_device_automation(dev, device_index):
             device_ip = dev.device_id
             try:
-                print(f"[DEBUG] Starting parallel automation for device {device_ip} (thread {device_index})")
+                log.debug("Starting parallel automation for device %s (thread %s)", device_ip, device_index)
                 result = flow(dev, all_devices=device_ips, context=context)
                 result_queue.put((device_ip, "completed", result))
-                print(f"[DEBUG] Completed parallel automation for device {device_ip}")
+                log.debug("Completed parallel automation for device %s", device_ip)
             except Exception as e:
                 result_queue.put((device_ip, "error", str(e)))
-                print(f"[DEBUG] Error in parallel automation for device {device_ip}: {e}")
+                log.debug("Error in parallel automation for device %s: %s", device_ip, e)
         
         # Start threads
         for i, dev in enumerate(connected_devices):
             thread = threading.Thread(target=run_device_automation, args=(dev, i), name=f"Device-{dev.device_id}")
             threads.append(thread)
             thread.start()
-            print(f"[DEBUG] Started thread for device {dev.device_id}")
+            log.debug("Started thread for device %s", dev.device_id)
         
         # Wait for all threads to complete
         for thread in threads:
             thread.join()
-            print(f"[DEBUG] Thread {thread.name} completed")
+            log.debug("Thread %s completed", thread.name)
         
         # Collect results
         while not result_queue.empty():
             device_ip, status, result = result_queue.get()
             results[device_ip]["status"] = status
             results[device_ip]["result"] = result
-            print(f"[DEBUG] Collected result for {device_ip}: {status}")
+            log.debug("Collected result for %s: %s", device_ip, status)
         
-        print(f"[DEBUG] Parallel automation completed for all devices")
+        log.debug("Parallel automation completed for all devices")
     else:
-        print(f"[DEBUG] Using SEQUENTIAL execution mode for {len(connected_devices)} devices")
-        print(f"[DEBUG] Starting automation loop for {len(connected_devices)} devices")
+        log.debug("Using SEQUENTIAL execution mode for %s devices", len(connected_devices))
+        log.debug("Starting automation loop for %s devices", len(connected_devices))
         for i, dev in enumerate(connected_devices):
-            print(f"[DEBUG] Processing automation for device {i+1}/{len(connected_devices)}: {dev.device_id}")
+            log.debug("Processing automation for device %s/%s: %s", i + 1, len(connected_devices), dev.device_id)
             
             # Check cancel_event trước mỗi device
             if context and context.is_cancelled():
@@ -5054,29 +5465,29 @@ def run_automation_from_gui(selected_devices, conversation_text=None, context=No
                 
             device_ip = dev.device_id
             try:
-                print(f"\n📱 Chạy automation trên {device_ip}")
-                print(f"[DEBUG] Launching automation thread for {device_ip}")
+                log.info("📱 Chạy automation trên %s", device_ip)
+                log.debug("Launching automation thread for %s", device_ip)
                 if context:
                     context.log_info(f"Running automation on device: {device_ip}")
                     
                 # Pass context to flow function để check cancel_event trong automation
-                print(f"[DEBUG] Calling flow() for device {device_ip} with all_devices={device_ips}")
+                log.debug("Calling flow() for device %s with all_devices=%s", device_ip, device_ips)
                 result = flow(dev, all_devices=device_ips, context=context)
                 results[device_ip]["result"] = result
                 results[device_ip]["status"] = "completed"
-                print(f"✅ Hoàn thành automation trên {device_ip}: {result}")
-                print(f"[DEBUG] Flow completed for {device_ip} with result: {result}")
+                log.info("✅ Hoàn thành automation trên %s: %s", device_ip, result)
+                log.debug("Flow completed for %s with result: %s", device_ip, result)
                 if context:
                     context.log_info(f"Completed automation on {device_ip}: {result}")
             except Exception as e:
                 results[device_ip]["result"] = str(e)
                 results[device_ip]["status"] = "error"
-                print(f"❌ Lỗi automation trên {device_ip}: {e}")
-                print(f"[DEBUG] Exception in automation for {device_ip}: {e}")
+                log.error("❌ Lỗi automation trên %s: %s", device_ip, e)
+                log.debug("Exception in automation for %s: %s", device_ip, e)
                 if context:
                     context.log_error(f"Error on {device_ip}: {str(e)}")
         
-        print(f"[DEBUG] Sequential automation loop completed for {len(connected_devices)} devices")
+        log.debug("Sequential automation loop completed for %s devices", len(connected_devices))
     
     # Ngắt kết nối tất cả devices
     for dev in connected_devices:
@@ -5085,12 +5496,19 @@ def run_automation_from_gui(selected_devices, conversation_text=None, context=No
         except:
             pass
     
-    print(f"\n🏁 Hoàn thành automation từ GUI")
+    log.info("🏁 Hoàn thành automation từ GUI")
+    report_path = write_run_report()
+    if report_path:
+        log.info("📊 Metrics report: %s", report_path)
+    trace_path = export_chrome_trace()
+    if trace_path:
+        log.info("🧭 Chrome trace: %s", trace_path)
     if context:
         if context.is_cancelled():
             context.log_info("Automation completed (cancelled by user)")
         else:
             context.log_info("Automation completed successfully")
+    finish_run_logs(run_log_id, "stopped" if context and context.is_cancelled() else "completed")
     return results
 
 def get_available_devices_for_gui():
@@ -5109,21 +5527,16 @@ def get_available_devices_for_gui():
                 device_ips.append(ip)
         return sorted(device_ips)
     except Exception as e:
-        print(f"❌ Lỗi lấy danh sách devices: {e}")
+        log.error("❌ Lỗi lấy danh sách devices: %s", e)
         return []
 
 def check_btn_send_friend_request_in_dump(device_serial, debug=False):
     """Kiểm tra sự tồn tại của btn_send_friend_request trong UI dump"""
     import subprocess
     import re
-    import os
     
     try:
-        # Tạo tên file dump duy nhất
-        timestamp = int(time.time() * 1000000)
-        dump_file = f"ui_dump_{device_serial.replace(':', '_').replace('.', '_')}_{timestamp}.xml"
-        
-        # Chạy lệnh adb để dump UI ra file
+        # Chạy lệnh adb để dump UI ra stdout
         cmd = f"adb -s {device_serial} exec-out uiautomator dump /dev/stdout"
         result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=10)
         
@@ -5134,64 +5547,54 @@ def check_btn_send_friend_request_in_dump(device_serial, debug=False):
             if '</hierarchy>' in dump_content:
                 dump_content = dump_content.split('</hierarchy>')[0] + '</hierarchy>'
             
-            # Lưu dump content ra file để debug
-            try:
-                with open(dump_file, 'w', encoding='utf-8') as f:
-                    f.write(dump_content)
-                if debug: print(f"[DEBUG] UI dump saved to: {dump_file}")
-            except Exception as e:
-                if debug: print(f"[DEBUG] Failed to save dump file: {e}")
+            # Dump được phân tích trong bộ nhớ, chỉ lưu vào capture store khi debug
+            if debug:
+                ref = store_capture(device_serial, "friend_check_adb", "hierarchy", dump_content)
+                log.debug("UI dump saved to: %s", ref)
             
             # Kiểm tra sự tồn tại của btn_send_friend_request bằng string search
             has_btn = 'com.zing.zalo:id/btn_send_friend_request' in dump_content
             
             if debug:
                 if has_btn:
-                    print(f"[DEBUG] ✅ btn_send_friend_request found in UI dump")
+                    log.debug("✅ btn_send_friend_request found in UI dump")
                     
                     # Extract thông tin chi tiết từ node
                     pattern = r'<node[^>]*resource-id="com\.zing\.zalo:id/btn_send_friend_request"[^>]*>'
                     match = re.search(pattern, dump_content)
                     if match:
                         node_info = match.group(0)
-                        print(f"[DEBUG] Button node: {node_info}")
+                        log.debug("Button node: %s", node_info)
                         
                         # Extract bounds
                         bounds_pattern = r'bounds="\[([^\]]+)\]\[([^\]]+)\]"'
                         bounds_match = re.search(bounds_pattern, node_info)
                         if bounds_match:
-                            print(f"[DEBUG] Button bounds: [{bounds_match.group(1)}][{bounds_match.group(2)}]")
+                            log.debug("Button bounds: [%s][%s]", bounds_match.group(1), bounds_match.group(2))
                         
                         # Check NAF status
                         naf_pattern = r'NAF="([^"]+)"'
                         naf_match = re.search(naf_pattern, node_info)
                         if naf_match:
-                            print(f"[DEBUG] Button NAF status: {naf_match.group(1)}")
+                            log.debug("Button NAF status: %s", naf_match.group(1))
                         
                         # Check clickable status
                         clickable_pattern = r'clickable="([^"]+)"'
                         clickable_match = re.search(clickable_pattern, node_info)
                         if clickable_match:
-                            print(f"[DEBUG] Button clickable: {clickable_match.group(1)}")
+                            log.debug("Button clickable: %s", clickable_match.group(1))
                 else:
-                    print(f"[DEBUG] ❌ btn_send_friend_request NOT found in UI dump")
+                    log.debug("❌ btn_send_friend_request NOT found in UI dump")
                     # Debug: show what friend-related elements exist
                     friend_elements = re.findall(r'resource-id="[^"]*friend[^"]*"', dump_content)
                     if friend_elements:
-                        print(f"[DEBUG] Found friend-related elements: {friend_elements[:3]}")
-            
-            # Cleanup dump file sau khi xử lý
-            try:
-                if os.path.exists(dump_file):
-                    os.remove(dump_file)
-            except:
-                pass
+                        log.debug("Found friend-related elements: %s", friend_elements[:3])
             
             return has_btn
         else:
-            if debug: print(f"[DEBUG] Failed to get UI dump: {result.stderr}")
+            if debug: log.debug("Failed to get UI dump: %s", result.stderr)
             return False
         
     except Exception as e:
-        if debug: print(f"[DEBUG] Error checking btn_send_friend_request: {e}")
+        if debug: log.debug("Error checking btn_send_friend_request: %s", e)
         return False
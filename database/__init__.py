@@ -2,33 +2,68 @@
 
 Module này cung cấp các repository classes để tương tác với Supabase database:
 - SupabaseManager: Quản lý kết nối và các thao tác cơ bản
+- get_supabase_client: Client dùng chung toàn process (shared connection pool)
 - DeviceRepository: Quản lý devices
 - AutomationRepository: Quản lý automation rules
 - LogRepository: Quản lý system logs
+- RunLogRepository: Đọc/ghi run_logs với keyset pagination
 """
 
-from .supabase_manager import SupabaseManager, get_supabase_manager
-from .device_repository import DeviceRepository
-from .automation_repository import AutomationRepository
-from .log_repository import LogRepository
+import importlib
+
+# Import lười (PEP 562): `import database.xxx` / `from database import X` chỉ kéo
+# supabase client + httpx vào khi thật sự dùng, không phải khi import package
+_EXPORTS = {
+    'get_supabase_client': '.client_registry',
+    'SupabaseManager': '.supabase_manager',
+    'get_supabase_manager': '.supabase_manager',
+    'DeviceRepository': '.device_repository',
+    'AutomationRepository': '.automation_repository',
+    'LogRepository': '.log_repository',
+    'RunLogRepository': '.run_log_repository',
+}
 
 __all__ = [
     'SupabaseManager',
     'get_supabase_manager',
+    'get_supabase_client',
     'DeviceRepository',
     'AutomationRepository',
-    'LogRepository'
+    'LogRepository',
+    'RunLogRepository'
 ]
 
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
+
+
 # Convenience functions để tạo repository instances
-def get_device_repository() -> DeviceRepository:
+def get_device_repository() -> 'DeviceRepository':
     """Lấy instance của DeviceRepository"""
+    from .device_repository import DeviceRepository
     return DeviceRepository()
 
-def get_automation_repository() -> AutomationRepository:
+def get_automation_repository() -> 'AutomationRepository':
     """Lấy instance của AutomationRepository"""
+    from .automation_repository import AutomationRepository
     return AutomationRepository()
 
-def get_log_repository() -> LogRepository:
+def get_log_repository() -> 'LogRepository':
     """Lấy instance của LogRepository"""
-    return LogRepository()
\ No newline at end of file
+    from .log_repository import LogRepository
+    return LogRepository()
+
+def get_run_log_repository() -> 'RunLogRepository':
+    """Lấy instance của RunLogRepository"""
+    from .run_log_repository import RunLogRepository
+    return RunLogRepository()
@@ -1,6 +1,7 @@
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from .supabase_manager import get_supabase_manager
+from .pagination import iter_keyset
 
 class AutomationRepository:
     """Repository để quản lý automation rules trong Supabase"""
@@ -97,9 +98,23 @@ class AutomationRepository:
             raise
     
     def get_rules_statistics(self) -> Dict[str, Any]:
-        """Lấy thống kê automation rules"""
+        """Lấy thống kê automation rules (GROUP BY phía server qua RPC get_rules_statistics)"""
         try:
-            all_rules = self.get_all_rules()
+            result = self.db.rpc('get_rules_statistics')
+            if result.data:
+                return result.data
+        except Exception as e:
+            print(f"[WARNING] RPC get_rules_statistics không khả dụng, đếm phía client: {e}")
+        
+        return self._count_rules_statistics()
+    
+    def _count_rules_statistics(self) -> Dict[str, Any]:
+        """Fallback: đếm thống kê automation rules trong Python (đọc theo trang keyset, không bị cắt ở max-rows)"""
+        try:
+            all_rules = list(iter_keyset(
+                lambda: (self.db.supabase.table(self.table)
+                         .select('id, created_at, is_active, trigger_conditions, last_executed')),
+                'created_at'))
             
             stats = {
                 'total_rules': len(all_rules),
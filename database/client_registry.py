@@ -0,0 +1,180 @@
+"""Process-wide Supabase client registry
+
+Tất cả repositories/managers dùng chung một Supabase client cho mỗi cặp
+(url, key), và tất cả clients dùng chung một httpx connection pool
+keep-alive (HTTP/2 nếu có package `h2`). Nhờ vậy mỗi request API không còn
+phải tạo client mới và bắt tay TLS lại từ đầu.
+
+Chỉ transport (connection pool) được dùng chung: mỗi (url, key) có
+httpx.Client riêng, vì postgrest/storage sửa base_url và headers (auth) trên
+httpx.Client được truyền vào - dùng chung client thì headers của role
+service có thể lọt sang client anon.
+
+Cấu hình qua environment variables:
+- SUPABASE_POOL_SIZE: số connection tối đa trong pool (mặc định 20)
+- SUPABASE_POOL_KEEPALIVE: số keep-alive connection giữ lại (mặc định = pool size)
+- SUPABASE_TIMEOUT: timeout mỗi request, giây (mặc định 10)
+- SUPABASE_CONNECT_TIMEOUT: timeout kết nối, giây (mặc định 5)
+- SUPABASE_HTTP2: bật/tắt HTTP/2 (mặc định 1)
+"""
+
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from supabase import create_client, Client
+from dotenv import load_dotenv
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+try:
+    from supabase import ClientOptions
+except ImportError:
+    try:
+        from supabase.lib.client_options import ClientOptions
+    except ImportError:
+        ClientOptions = None
+
+load_dotenv()
+
+_lock = threading.Lock()
+_clients: Dict[Tuple[str, str], Client] = {}
+_http_clients: Dict[Tuple[str, str], object] = {}
+_transport = None
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def get_pool_settings() -> Dict[str, object]:
+    """Đọc cấu hình connection pool từ environment"""
+    pool_size = _env_int('SUPABASE_POOL_SIZE', 20)
+    return {
+        'pool_size': pool_size,
+        'keepalive': _env_int('SUPABASE_POOL_KEEPALIVE', pool_size),
+        'timeout': _env_float('SUPABASE_TIMEOUT', 10.0),
+        'connect_timeout': _env_float('SUPABASE_CONNECT_TIMEOUT', 5.0),
+        'http2': os.getenv('SUPABASE_HTTP2', '1').lower() not in ('0', 'false', 'no'),
+    }
+
+
+def get_transport():
+    """Lấy httpx transport dùng chung (keep-alive connection pool) cho toàn process"""
+    global _transport
+    if not HTTPX_AVAILABLE:
+        return None
+
+    with _lock:
+        if _transport is None:
+            settings = get_pool_settings()
+            limits = httpx.Limits(
+                max_connections=settings['pool_size'],
+                max_keepalive_connections=settings['keepalive']
+            )
+            try:
+                _transport = httpx.HTTPTransport(http2=settings['http2'], limits=limits)
+            except ImportError:
+                # http2=True cần package `h2`, fallback về HTTP/1.1 keep-alive
+                _transport = httpx.HTTPTransport(limits=limits)
+        return _transport
+
+
+def get_http_client(cache_key: Tuple[str, str]):
+    """Lấy httpx.Client riêng của (url, key), dùng chung connection pool"""
+    if not HTTPX_AVAILABLE:
+        return None
+
+    transport = get_transport()
+    with _lock:
+        http_client = _http_clients.get(cache_key)
+        if http_client is None:
+            settings = get_pool_settings()
+            timeout = httpx.Timeout(settings['timeout'], connect=settings['connect_timeout'])
+            http_client = httpx.Client(transport=transport, timeout=timeout)
+            _http_clients[cache_key] = http_client
+        return http_client
+
+
+def _build_options(cache_key: Tuple[str, str]):
+    """Tạo ClientOptions với httpx.Client riêng của (url, key) và request timeout"""
+    if ClientOptions is None:
+        return None
+
+    settings = get_pool_settings()
+    http_client = get_http_client(cache_key)
+    try:
+        return ClientOptions(
+            httpx_client=http_client,
+            postgrest_client_timeout=settings['timeout']
+        )
+    except TypeError:
+        # supabase-py cũ chưa hỗ trợ inject httpx_client
+        return ClientOptions(postgrest_client_timeout=settings['timeout'])
+
+
+def get_supabase_client(role: str = 'service', url: Optional[str] = None,
+                        key: Optional[str] = None) -> Client:
+    """Lấy Supabase client dùng chung cho (url, key)
+
+    Args:
+        role: 'service' dùng SUPABASE_SERVICE_ROLE_KEY, 'anon' dùng SUPABASE_ANON_KEY
+        url, key: override environment nếu cần
+    """
+    url = url or os.getenv('SUPABASE_URL')
+    if key is None:
+        key_name = 'SUPABASE_ANON_KEY' if role == 'anon' else 'SUPABASE_SERVICE_ROLE_KEY'
+        key = os.getenv(key_name)
+
+    if not url or not key:
+        raise ValueError(f"Missing SUPABASE_URL or Supabase key for role '{role}'")
+
+    cache_key = (url, key)
+    client = _clients.get(cache_key)
+    if client is not None:
+        return client
+
+    options = _build_options(cache_key)
+    with _lock:
+        client = _clients.get(cache_key)
+        if client is None:
+            if options is not None:
+                client = create_client(url, key, options=options)
+            else:
+                client = create_client(url, key)
+            _clients[cache_key] = client
+    return client
+
+
+def reset_clients():
+    """Đóng connection pool và xóa clients (dùng khi đổi cấu hình hoặc trong tests)"""
+    global _transport
+    with _lock:
+        _clients.clear()
+        # Các httpx.Client chung transport: đóng client trước, transport sau cùng
+        for http_client in _http_clients.values():
+            try:
+                http_client.close()
+            except Exception:
+                pass
+        _http_clients.clear()
+        if _transport is not None:
+            try:
+                _transport.close()
+            except Exception:
+                pass
+            _transport = None
@@ -1,6 +1,7 @@
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from .supabase_manager import get_supabase_manager
+from .pagination import iter_keyset
 
 class DeviceRepository:
     """Repository để quản lý devices trong Supabase"""
@@ -80,9 +81,22 @@ class DeviceRepository:
             raise
     
     def get_device_statistics(self) -> Dict[str, Any]:
-        """Lấy thống kê devices"""
+        """Lấy thống kê devices (GROUP BY phía server qua RPC get_device_statistics)"""
         try:
-            all_devices = self.get_all_devices()
+            result = self.db.rpc('get_device_statistics')
+            if result.data:
+                return result.data
+        except Exception as e:
+            print(f"[WARNING] RPC get_device_statistics không khả dụng, đếm phía client: {e}")
+        
+        return self._count_device_statistics()
+    
+    def _count_device_statistics(self) -> Dict[str, Any]:
+        """Fallback: đếm thống kê devices trong Python (đọc theo trang keyset, không bị cắt ở max-rows)"""
+        try:
+            all_devices = list(iter_keyset(
+                lambda: self.db.supabase.table(self.table).select('id, created_at, status, device_type'),
+                'created_at'))
             
             stats = {
                 'total_devices': len(all_devices),
@@ -1,6 +1,7 @@
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 from .supabase_manager import get_supabase_manager
+from .pagination import apply_keyset, clamp_page_size, iter_keyset, next_cursor
 
 class LogRepository:
     """Repository để quản lý system logs trong Supabase"""
@@ -8,6 +9,9 @@ class LogRepository:
     def __init__(self):
         self.db = get_supabase_manager()
         self.table = 'automation_logs'
+        self.ts_column = 'created_at'
+        self.level_column = 'log_level'
+        self.component_column = 'metadata->>component'
     
     def create_log(self, log_data: Dict[str, Any]) -> Dict[str, Any]:
         """Tạo log entry mới"""
@@ -57,7 +61,7 @@ class LogRepository:
     def get_logs_by_level(self, level: str, limit: Optional[int] = 100) -> List[Dict[str, Any]]:
         """Lấy logs theo level"""
         try:
-            query = self.db.supabase.table(self.table).select('*').eq('level', level).order('timestamp', desc=True)
+            query = self.db.supabase.table(self.table).select('*').eq(self.level_column, level).order(self.ts_column, desc=True)
             if limit:
                 query = query.limit(limit)
             result = query.execute()
@@ -69,7 +73,7 @@ class LogRepository:
     def get_logs_by_component(self, component: str, limit: Optional[int] = 100) -> List[Dict[str, Any]]:
         """Lấy logs theo component"""
         try:
-            query = self.db.supabase.table(self.table).select('*').eq('component', component).order('timestamp', desc=True)
+            query = self.db.supabase.table(self.table).select('*').eq(self.component_column, component).order(self.ts_column, desc=True)
             if limit:
                 query = query.limit(limit)
             result = query.execute()
@@ -78,14 +82,15 @@ class LogRepository:
             print(f"Lỗi get logs by component {component}: {e}")
             raise
     
-    def get_logs_by_time_range(self, start_time: datetime, end_time: datetime, limit: Optional[int] = 100) -> List[Dict[str, Any]]:
-        """Lấy logs trong khoảng thời gian"""
+    def get_logs_by_time_range(self, start_time: datetime, end_time: datetime, limit: Optional[int] = 100,
+                               cursor: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Lấy logs trong khoảng thời gian (keyset pagination qua cursor)"""
         try:
             query = (self.db.supabase.table(self.table)
                     .select('*')
-                    .gte('timestamp', start_time.isoformat())
-                    .lte('timestamp', end_time.isoformat())
-                    .order('timestamp', desc=True))
+                    .gte(self.ts_column, start_time.isoformat())
+                    .lte(self.ts_column, end_time.isoformat()))
+            query = apply_keyset(query, self.ts_column, cursor)
             if limit:
                 query = query.limit(limit)
             result = query.execute()
@@ -100,13 +105,14 @@ class LogRepository:
         end_time = datetime.utcnow()
         return self.get_logs_by_time_range(start_time, end_time, limit)
     
-    def search_logs(self, search_term: str, limit: Optional[int] = 100) -> List[Dict[str, Any]]:
-        """Tìm kiếm logs theo message"""
+    def search_logs(self, search_term: str, limit: Optional[int] = 100,
+                    cursor: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Tìm kiếm logs theo message (ilike dùng trigram index idx_automation_logs_message_trgm)"""
         try:
             query = (self.db.supabase.table(self.table)
                     .select('*')
-                    .ilike('message', f'%{search_term}%')
-                    .order('timestamp', desc=True))
+                    .ilike('message', f'%{search_term}%'))
+            query = apply_keyset(query, self.ts_column, cursor)
             if limit:
                 query = query.limit(limit)
             result = query.execute()
@@ -121,9 +127,9 @@ class LogRepository:
         try:
             query = (self.db.supabase.table(self.table)
                     .select('*')
-                    .eq('level', 'error')
-                    .gte('timestamp', start_time.isoformat())
-                    .order('timestamp', desc=True))
+                    .eq(self.level_column, 'ERROR')
+                    .gte(self.ts_column, start_time.isoformat())
+                    .order(self.ts_column, desc=True))
             if limit:
                 query = query.limit(limit)
             result = query.execute()
@@ -133,12 +139,33 @@ class LogRepository:
             raise
     
     def get_logs_statistics(self, hours: int = 24) -> Dict[str, Any]:
-        """Lấy thống kê logs"""
+        """Lấy thống kê logs (aggregate phía server qua RPC get_log_statistics)"""
+        since = datetime.utcnow() - timedelta(hours=hours)
         try:
-            recent_logs = self.get_recent_logs(hours)
+            result = self.db.rpc('get_log_statistics', {'since': since.isoformat() + '+00:00'})
+            if result.data:
+                return result.data
+        except Exception as e:
+            print(f"[WARNING] RPC get_log_statistics không khả dụng, đếm phía client: {e}")
+        
+        return self._count_logs_statistics(hours)
+    
+    def _count_logs_statistics(self, hours: int) -> Dict[str, Any]:
+        """Fallback: đếm thống kê logs trong Python (khi migration chưa được áp dụng)
+
+        Đọc theo từng trang keyset: một request không phân trang bị PostgREST cắt
+        ở max-rows nên số đếm sẽ sai khi có nhiều log.
+        """
+        start_time = datetime.utcnow() - timedelta(hours=hours)
+        try:
+            recent_logs = iter_keyset(
+                lambda: (self.db.supabase.table(self.table)
+                         .select(f'id, {self.ts_column}, {self.level_column}, metadata')
+                         .gte(self.ts_column, start_time.isoformat())),
+                self.ts_column)
             
             stats = {
-                'total_logs': len(recent_logs),
+                'total_logs': 0,
                 'by_level': {},
                 'by_component': {},
                 'error_count': 0,
@@ -146,8 +173,9 @@ class LogRepository:
             }
             
             for log in recent_logs:
-                level = log.get('level', 'unknown')
-                component = log.get('component', 'unknown')
+                stats['total_logs'] += 1
+                level = log.get(self.level_column, 'unknown')
+                component = (log.get('metadata') or {}).get('component', 'unknown')
                 
                 # Count by level
                 stats['by_level'][level] = stats['by_level'].get(level, 0) + 1
@@ -156,9 +184,9 @@ class LogRepository:
                 stats['by_component'][component] = stats['by_component'].get(component, 0) + 1
                 
                 # Count errors and warnings
-                if level == 'error':
+                if level == 'ERROR':
                     stats['error_count'] += 1
-                elif level == 'warning':
+                elif level == 'WARNING':
                     stats['warning_count'] += 1
             
             return stats
@@ -166,15 +194,14 @@ class LogRepository:
             print(f"Lỗi get logs statistics: {e}")
             raise
     
-    def cleanup_old_logs(self, days: int = 30) -> int:
-        """Xóa logs cũ hơn số ngày chỉ định"""
+    def cleanup_old_logs(self, days: int = 30, batch_size: int = 1000) -> int:
+        """Xóa logs cũ hơn số ngày chỉ định (theo batch, xem database/log_retention.py)"""
+        from .log_retention import LogRetentionManager, RetentionPolicy
         try:
-            cutoff_date = datetime.utcnow() - timedelta(days=days)
-            result = (self.db.supabase.table(self.table)
-                     .delete()
-                     .lt('timestamp', cutoff_date.isoformat())
-                     .execute())
-            return len(result.data)
+            policy = RetentionPolicy(automation_logs_days=days, batch_size=batch_size, archive_dir=None)
+            manager = LogRetentionManager(policy)
+            tier = next(t for t in manager.build_tiers() if t.table == self.table)
+            return manager.run_tier(tier)
         except Exception as e:
             print(f"Lỗi cleanup old logs: {e}")
             raise
@@ -184,21 +211,22 @@ class LogRepository:
                              component: Optional[str] = None,
                              start_time: Optional[datetime] = None,
                              end_time: Optional[datetime] = None,
-                             limit: Optional[int] = 100) -> List[Dict[str, Any]]:
-        """Lấy logs với nhiều filters"""
+                             limit: Optional[int] = 100,
+                             cursor: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Lấy logs với nhiều filters (keyset pagination qua cursor)"""
         try:
             query = self.db.supabase.table(self.table).select('*')
             
             if level:
-                query = query.eq('level', level)
+                query = query.eq(self.level_column, level)
             if component:
-                query = query.eq('component', component)
+                query = query.eq(self.component_column, component)
             if start_time:
-                query = query.gte('timestamp', start_time.isoformat())
+                query = query.gte(self.ts_column, start_time.isoformat())
             if end_time:
-                query = query.lte('timestamp', end_time.isoformat())
+                query = query.lte(self.ts_column, end_time.isoformat())
             
-            query = query.order('timestamp', desc=True)
+            query = apply_keyset(query, self.ts_column, cursor)
             if limit:
                 query = query.limit(limit)
                 
@@ -206,4 +234,16 @@ class LogRepository:
             return result.data
         except Exception as e:
             print(f"Lỗi get logs with filters: {e}")
-            raise
\ No newline at end of file
+            raise
+    
+    def get_logs_page(self, page_size: int = 100, cursor: Optional[str] = None, **filters) -> Dict[str, Any]:
+        """Lấy một trang logs kèm cursor cho trang tiếp theo
+        
+        filters: level, component, start_time, end_time (giống get_logs_with_filters)
+        """
+        page_size = clamp_page_size(page_size)
+        rows = self.get_logs_with_filters(limit=page_size, cursor=cursor, **filters)
+        return {
+            'data': rows,
+            'next_cursor': next_cursor(rows, self.ts_column, page_size)
+        }
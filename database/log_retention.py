@@ -0,0 +1,229 @@
+"""Tiered retention cho run_logs và automation_logs
+
+Mỗi tier xử lý các dòng cũ hơn một mốc thời gian, theo từng batch nhỏ:
+1. Đọc batch cũ nhất theo keyset (ts, id)
+2. Ghi batch ra file gzip NDJSON trong archive_dir (append theo ngày)
+3. Gọi RPC purge_*_batch để xóa đúng các dòng đã archive
+   (DEBUG/INFO của run_logs được gộp vào run_log_summaries)
+4. Nghỉ một chút giữa các batch để không tranh lock với automation đang ghi log
+
+Cấu hình qua environment variables (xem RetentionPolicy.from_env).
+"""
+
+import gzip
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from .supabase_manager import get_supabase_manager
+
+
+@dataclass
+class RetentionPolicy:
+    """Các mốc retention (ngày) và tham số batch"""
+    compact_debug_info_days: int = 7     # DEBUG/INFO của run_logs -> summary sau 7 ngày
+    run_logs_days: int = 90              # Mọi run_logs bị xóa sau 90 ngày
+    automation_logs_days: int = 30       # automation_logs bị xóa sau 30 ngày
+    batch_size: int = 1000
+    pause_seconds: float = 0.5
+    max_batches_per_tier: int = 500
+    archive_dir: Optional[str] = 'log_archive'
+
+    @classmethod
+    def from_env(cls) -> 'RetentionPolicy':
+        """Tạo policy từ environment variables LOG_RETENTION_*"""
+        defaults = cls()
+
+        def env_int(name, default):
+            try:
+                return int(os.getenv(name, default))
+            except (TypeError, ValueError):
+                return default
+
+        archive_dir = os.getenv('LOG_RETENTION_ARCHIVE_DIR', defaults.archive_dir)
+        return cls(
+            compact_debug_info_days=env_int('LOG_RETENTION_COMPACT_DAYS', defaults.compact_debug_info_days),
+            run_logs_days=env_int('LOG_RETENTION_RUN_LOGS_DAYS', defaults.run_logs_days),
+            automation_logs_days=env_int('LOG_RETENTION_AUTOMATION_LOGS_DAYS', defaults.automation_logs_days),
+            batch_size=env_int('LOG_RETENTION_BATCH_SIZE', defaults.batch_size),
+            pause_seconds=float(os.getenv('LOG_RETENTION_PAUSE_SECONDS', defaults.pause_seconds)),
+            max_batches_per_tier=env_int('LOG_RETENTION_MAX_BATCHES', defaults.max_batches_per_tier),
+            archive_dir=archive_dir or None
+        )
+
+
+@dataclass
+class _Tier:
+    """Một bước retention trên một bảng"""
+    name: str
+    table: str
+    ts_column: str
+    level_column: str
+    rpc: str
+    cutoff: datetime
+    levels: Optional[List[str]] = None
+    summarize: bool = False
+
+
+class LogRetentionManager:
+    """Chạy các tier retention theo batch (archive -> compact/delete)"""
+
+    def __init__(self, policy: Optional[RetentionPolicy] = None):
+        self.db = get_supabase_manager()
+        self.policy = policy or RetentionPolicy.from_env()
+        self._stop_event = threading.Event()
+
+    def build_tiers(self, now: Optional[datetime] = None) -> List[_Tier]:
+        """Danh sách tier theo policy hiện tại"""
+        now = now or datetime.utcnow()
+        policy = self.policy
+        return [
+            _Tier('compact_run_logs', 'run_logs', 'ts', 'level', 'purge_run_logs_batch',
+                  now - timedelta(days=policy.compact_debug_info_days),
+                  levels=['DEBUG', 'INFO'], summarize=True),
+            _Tier('expire_run_logs', 'run_logs', 'ts', 'level', 'purge_run_logs_batch',
+                  now - timedelta(days=policy.run_logs_days)),
+            _Tier('expire_automation_logs', 'automation_logs', 'created_at', 'log_level',
+                  'purge_automation_logs_batch',
+                  now - timedelta(days=policy.automation_logs_days)),
+        ]
+
+    def run_once(self) -> Dict[str, int]:
+        """Chạy tất cả tier một lần, trả về số dòng đã xóa theo tier"""
+        results = {}
+        for tier in self.build_tiers():
+            if self._stop_event.is_set():
+                break
+            try:
+                results[tier.name] = self.run_tier(tier)
+            except Exception as e:
+                print(f"[ERROR] Log retention tier {tier.name} failed: {e}")
+                results[tier.name] = -1
+        return results
+
+    def run_tier(self, tier: _Tier) -> int:
+        """Xử lý một tier theo từng batch cho tới khi hết dòng cũ hoặc đạt max_batches"""
+        total = 0
+        for _ in range(self.policy.max_batches_per_tier):
+            if self._stop_event.is_set():
+                break
+
+            rows = self._fetch_batch(tier)
+            if not rows:
+                break
+
+            if self.policy.archive_dir:
+                self._archive_rows(tier, rows)
+
+            last = rows[-1]
+            params = {
+                'cutoff': _iso(tier.cutoff),
+                'upto_ts': last[tier.ts_column],
+                'upto_id': last['id'],
+                'levels': tier.levels
+            }
+            if tier.table == 'run_logs':
+                params['summarize'] = tier.summarize
+
+            result = self.db.rpc(tier.rpc, params)
+            deleted = result.data if isinstance(result.data, int) else len(rows)
+            total += deleted
+
+            if len(rows) < self.policy.batch_size:
+                break
+            time.sleep(self.policy.pause_seconds)
+
+        if total:
+            print(f"[INFO] Log retention {tier.name}: removed {total} rows older than {tier.cutoff:%Y-%m-%d}")
+        return total
+
+    def _fetch_batch(self, tier: _Tier) -> List[Dict[str, Any]]:
+        """Batch cũ nhất (ORDER BY ts, id) thuộc tier"""
+        query = (self.db.supabase.table(tier.table)
+                 .select('*')
+                 .lt(tier.ts_column, _iso(tier.cutoff)))
+        if tier.levels:
+            query = query.in_(tier.level_column, tier.levels)
+        result = (query.order(tier.ts_column)
+                  .order('id')
+                  .limit(self.policy.batch_size)
+                  .execute())
+        return result.data or []
+
+    def _archive_rows(self, tier: _Tier, rows: List[Dict[str, Any]]):
+        """Append rows vào <archive_dir>/<table>/<YYYY-MM-DD>.ndjson.gz theo ngày của log"""
+        by_day: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            day = str(row.get(tier.ts_column) or '')[:10] or 'unknown'
+            by_day.setdefault(day, []).append(row)
+
+        table_dir = os.path.join(self.policy.archive_dir, tier.table)
+        os.makedirs(table_dir, exist_ok=True)
+        for day, day_rows in by_day.items():
+            path = os.path.join(table_dir, f"{day}.ndjson.gz")
+            # Mỗi lần append tạo một gzip member mới, gzip.open đọc được nhiều member liên tiếp
+            with gzip.open(path, 'at', encoding='utf-8') as f:
+                for row in day_rows:
+                    f.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+
+    def stop(self):
+        """Yêu cầu dừng sau batch hiện tại"""
+        self._stop_event.set()
+
+
+class LogRetentionScheduler:
+    """Chạy LogRetentionManager định kỳ trong background thread"""
+
+    def __init__(self, interval_hours: float = 6.0, manager: Optional[LogRetentionManager] = None):
+        self.interval_seconds = interval_hours * 3600
+        self.manager = manager or LogRetentionManager()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name='log-retention', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self.manager.stop()
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            try:
+                results = self.manager.run_once()
+                print(f"[INFO] Log retention finished: {results}")
+            except Exception as e:
+                print(f"[ERROR] Log retention run failed: {e}")
+            self._stop_event.wait(self.interval_seconds)
+
+
+def _iso(value: datetime) -> str:
+    """ISO timestamp (UTC) cho PostgREST"""
+    text = value.isoformat()
+    return text if value.tzinfo else text + '+00:00'
+
+
+_scheduler: Optional[LogRetentionScheduler] = None
+
+
+def start_retention_scheduler(interval_hours: Optional[float] = None) -> LogRetentionScheduler:
+    """Khởi động scheduler dùng chung của process (idempotent)"""
+    global _scheduler
+    if _scheduler is None:
+        if interval_hours is None:
+            interval_hours = float(os.getenv('LOG_RETENTION_INTERVAL_HOURS', 6))
+        _scheduler = LogRetentionScheduler(interval_hours)
+    _scheduler.start()
+    return _scheduler
+
+
+if __name__ == '__main__':
+    print(LogRetentionManager().run_once())
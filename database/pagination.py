@@ -0,0 +1,89 @@
+"""Keyset (cursor) pagination helpers cho các bảng log
+
+Thay vì OFFSET, mỗi trang được lấy bằng điều kiện (ts, id) < (last_ts, last_id)
+nên chi phí mỗi trang không phụ thuộc vào vị trí trong bảng.
+Cursor là chuỗi base64 mờ (opaque) để client chỉ cần gửi lại nguyên vẹn.
+
+PostgREST trả tối đa max-rows dòng mỗi request (mặc định 1000, đổi bằng
+SUPABASE_MAX_ROWS nếu server cấu hình khác); page_size lớn hơn bị hạ xuống
+mức đó (clamp_page_size), nếu không trang "thiếu dòng" sẽ bị hiểu nhầm là
+trang cuối.
+"""
+
+import base64
+import json
+import os
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+MAX_PAGE_SIZE = int(os.environ.get('SUPABASE_MAX_ROWS', '1000'))
+
+
+def clamp_page_size(page_size: int, max_page_size: int = MAX_PAGE_SIZE) -> int:
+    """page_size hợp lệ cho một request (1..max-rows của server); <= 0 raise ValueError"""
+    page_size = int(page_size)
+    if page_size <= 0:
+        raise ValueError(f"page_size must be positive: {page_size}")
+    return min(page_size, max_page_size)
+
+
+def encode_cursor(ts: Any, row_id: Any) -> str:
+    """Mã hóa (ts, id) thành cursor string"""
+    raw = json.dumps([ts, row_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[List[Any]]:
+    """Giải mã cursor string thành [ts, id], None nếu cursor rỗng"""
+    if not cursor:
+        return None
+    try:
+        ts, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return [ts, row_id]
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def next_cursor(rows: List[Dict[str, Any]], ts_column: str, page_size: int,
+                id_column: str = 'id') -> Optional[str]:
+    """Cursor cho trang tiếp theo, None nếu đã hết dữ liệu
+
+    page_size phải là giá trị đã clamp_page_size (số dòng thực sự có thể nhận được).
+    """
+    if not rows or len(rows) < page_size:
+        return None
+    last = rows[-1]
+    return encode_cursor(last.get(ts_column), last.get(id_column))
+
+
+def apply_keyset(query, ts_column: str, cursor: Optional[str], desc: bool = True,
+                 id_column: str = 'id'):
+    """Áp dụng điều kiện keyset và ORDER BY (ts, id) cho PostgREST query"""
+    position = decode_cursor(cursor)
+    if position is not None:
+        ts, row_id = position
+        op = 'lt' if desc else 'gt'
+        query = query.or_(
+            f'{ts_column}.{op}."{ts}",'
+            f'and({ts_column}.eq."{ts}",{id_column}.{op}."{row_id}")'
+        )
+    return query.order(ts_column, desc=desc).order(id_column, desc=desc)
+
+
+def iter_keyset(build_query: Callable[[], Any], ts_column: str, page_size: int = MAX_PAGE_SIZE,
+                desc: bool = True, id_column: str = 'id') -> Iterator[Dict[str, Any]]:
+    """Duyệt toàn bộ dòng của query theo từng trang keyset
+
+    build_query trả về query mới (select + filter, chưa order/limit) cho mỗi
+    trang. Dùng khi cần đọc hết bảng: một request không phân trang chỉ nhận
+    tối đa max-rows dòng và phần còn lại bị cắt im lặng.
+    """
+    page_size = clamp_page_size(page_size)
+    cursor = None
+    while True:
+        query = apply_keyset(build_query(), ts_column, cursor, desc=desc, id_column=id_column)
+        rows = query.limit(page_size).execute().data or []
+        yield from rows
+        cursor = next_cursor(rows, ts_column, page_size, id_column)
+        if not cursor:
+            break
@@ -0,0 +1,103 @@
+from typing import List, Optional, Dict, Any, Iterator
+from datetime import datetime, timezone
+from .supabase_manager import get_supabase_manager
+from .pagination import apply_keyset, clamp_page_size, next_cursor
+
+class RunLogRepository:
+    """Repository để đọc/ghi log chi tiết của từng run (bảng run_logs)"""
+
+    def __init__(self):
+        self.db = get_supabase_manager()
+        self.table = 'run_logs'
+        self.ts_column = 'ts'
+
+    def create_run(self, pair_count: int = 0, device_count: int = 0, created_by: Optional[str] = None,
+                   metadata: Optional[Dict[str, Any]] = None) -> str:
+        """Tạo row runs (status running), trả về run id"""
+        try:
+            result = self.db.supabase.table('runs').insert({
+                'pair_count': pair_count,
+                'device_count': device_count,
+                'created_by': created_by,
+                'metadata': metadata or {}
+            }).execute()
+            return result.data[0]['id']
+        except Exception as e:
+            print(f"Lỗi tạo run: {e}")
+            raise
+
+    def finish_run(self, run_id: str, status: str = 'completed') -> bool:
+        """Đóng run: status (completed/stopped/failed) + stopped_at"""
+        try:
+            result = self.db.supabase.table('runs').update({
+                'status': status,
+                'stopped_at': datetime.now(timezone.utc).isoformat()
+            }).eq('id', run_id).execute()
+            return bool(result.data)
+        except Exception as e:
+            print(f"Lỗi cập nhật run {run_id}: {e}")
+            raise
+
+    def insert_logs(self, rows: List[Dict[str, Any]]) -> int:
+        """Insert nhiều log lines trong một request"""
+        if not rows:
+            return 0
+        try:
+            result = self.db.supabase.table(self.table).insert(rows).execute()
+            return len(result.data or [])
+        except Exception as e:
+            print(f"Lỗi insert run logs: {e}")
+            raise
+
+    def get_run_logs(self,
+                     run_id: str,
+                     level: Optional[str] = None,
+                     pair_id: Optional[str] = None,
+                     search_term: Optional[str] = None,
+                     start_time: Optional[datetime] = None,
+                     end_time: Optional[datetime] = None,
+                     cursor: Optional[str] = None,
+                     limit: int = 500,
+                     ascending: bool = True) -> List[Dict[str, Any]]:
+        """Lấy logs của run theo keyset (ts, id), dùng index idx_run_logs_run_id_ts_id"""
+        try:
+            query = self.db.supabase.table(self.table).select('*').eq('run_id', run_id)
+
+            if level:
+                query = query.eq('level', level)
+            if pair_id:
+                query = query.eq('pair_id', pair_id)
+            if search_term:
+                query = query.ilike('message', f'%{search_term}%')
+            if start_time:
+                query = query.gte(self.ts_column, start_time.isoformat())
+            if end_time:
+                query = query.lte(self.ts_column, end_time.isoformat())
+
+            query = apply_keyset(query, self.ts_column, cursor, desc=not ascending)
+            result = query.limit(limit).execute()
+            return result.data
+        except Exception as e:
+            print(f"Lỗi get run logs cho run {run_id}: {e}")
+            raise
+
+    def get_run_logs_page(self, run_id: str, page_size: int = 500, cursor: Optional[str] = None,
+                          **filters) -> Dict[str, Any]:
+        """Lấy một trang logs của run kèm cursor cho trang tiếp theo (page_size tối đa MAX_PAGE_SIZE)"""
+        page_size = clamp_page_size(page_size)
+        rows = self.get_run_logs(run_id, cursor=cursor, limit=page_size, **filters)
+        return {
+            'data': rows,
+            'next_cursor': next_cursor(rows, self.ts_column, page_size)
+        }
+
+    def iter_run_logs(self, run_id: str, page_size: int = 1000, **filters) -> Iterator[Dict[str, Any]]:
+        """Duyệt toàn bộ logs của run theo từng trang (không giữ cả run trong bộ nhớ)"""
+        cursor = None
+        while True:
+            page = self.get_run_logs_page(run_id, page_size=page_size, cursor=cursor, **filters)
+            for row in page['data']:
+                yield row
+            cursor = page['next_cursor']
+            if not cursor or not page['data']:
+                break
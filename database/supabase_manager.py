@@ -1,9 +1,10 @@
 import os
 from typing import Dict, List, Optional, Any
-from supabase import create_client, Client
+from supabase import Client
 from datetime import datetime
 import json
 from dotenv import load_dotenv
+from .client_registry import get_supabase_client
 
 # Load environment variables
 load_dotenv()
@@ -18,7 +19,8 @@ class SupabaseManager:
         if not self.url or not self.key:
             raise ValueError("Thiếu SUPABASE_URL hoặc SUPABASE_SERVICE_ROLE_KEY trong environment variables")
         
-        self.supabase: Client = create_client(self.url, self.key)
+        # Dùng client chung của process (shared connection pool)
+        self.supabase: Client = get_supabase_client(url=self.url, key=self.key)
     
     def test_connection(self) -> bool:
         """Test kết nối đến Supabase"""
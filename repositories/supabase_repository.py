@@ -7,11 +7,15 @@ Thay thế các operations với JSON files bằng Supabase database operations
 
 import json
 import os
+import sys
 from datetime import datetime
 from typing import Dict, List, Optional, Any
-from supabase import create_client, Client
+from supabase import Client
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.client_registry import get_supabase_client
+
 # Load environment variables
 load_dotenv()
 
@@ -33,7 +37,7 @@ class SupabaseConnection:
             if not supabase_url or not supabase_key:
                 raise ValueError("Missing SUPABASE_URL or SUPABASE_ANON_KEY environment variables")
             
-            self._client = create_client(supabase_url, supabase_key)
+            self._client = get_supabase_client(url=supabase_url, key=supabase_key)
         
         return self._client
 
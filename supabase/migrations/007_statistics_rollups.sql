@@ -0,0 +1,174 @@
+-- Server-side statistics for logs, devices and automation rules
+-- Thay thế việc kéo toàn bộ bảng về Python để đếm
+
+-- =============================================
+-- AUTOMATION LOG ROLLUP (hourly buckets)
+-- =============================================
+-- Mỗi dòng = số log theo (giờ, level, component). Được cập nhật incremental
+-- bằng statement-level triggers nên thống kê là O(groups) thay vì O(rows).
+CREATE TABLE IF NOT EXISTS automation_log_rollups (
+    bucket_hour TIMESTAMP WITH TIME ZONE NOT NULL,
+    log_level VARCHAR(10) NOT NULL,
+    component TEXT NOT NULL,
+    log_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket_hour, log_level, component)
+);
+
+CREATE INDEX IF NOT EXISTS idx_automation_log_rollups_bucket ON automation_log_rollups(bucket_hour DESC);
+
+CREATE OR REPLACE FUNCTION automation_log_rollups_on_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO automation_log_rollups (bucket_hour, log_level, component, log_count)
+    SELECT date_trunc('hour', created_at),
+           log_level,
+           COALESCE(metadata->>'component', 'unknown'),
+           COUNT(*)
+    FROM new_rows
+    GROUP BY 1, 2, 3
+    ON CONFLICT (bucket_hour, log_level, component)
+    DO UPDATE SET log_count = automation_log_rollups.log_count + EXCLUDED.log_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION automation_log_rollups_on_delete()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE automation_log_rollups r
+    SET log_count = GREATEST(r.log_count - d.cnt, 0)
+    FROM (
+        SELECT date_trunc('hour', created_at) AS bucket_hour,
+               log_level,
+               COALESCE(metadata->>'component', 'unknown') AS component,
+               COUNT(*) AS cnt
+        FROM old_rows
+        GROUP BY 1, 2, 3
+    ) d
+    WHERE r.bucket_hour = d.bucket_hour
+      AND r.log_level = d.log_level
+      AND r.component = d.component;
+
+    DELETE FROM automation_log_rollups WHERE log_count = 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS automation_logs_rollup_insert ON automation_logs;
+CREATE TRIGGER automation_logs_rollup_insert
+    AFTER INSERT ON automation_logs
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION automation_log_rollups_on_insert();
+
+DROP TRIGGER IF EXISTS automation_logs_rollup_delete ON automation_logs;
+CREATE TRIGGER automation_logs_rollup_delete
+    AFTER DELETE ON automation_logs
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION automation_log_rollups_on_delete();
+
+-- Backfill rollup từ dữ liệu hiện có
+TRUNCATE automation_log_rollups;
+INSERT INTO automation_log_rollups (bucket_hour, log_level, component, log_count)
+SELECT date_trunc('hour', created_at),
+       log_level,
+       COALESCE(metadata->>'component', 'unknown'),
+       COUNT(*)
+FROM automation_logs
+GROUP BY 1, 2, 3;
+
+-- =============================================
+-- STATISTICS RPC FUNCTIONS
+-- =============================================
+
+-- Thống kê logs kể từ `since`. Các giờ đầy đủ lấy từ rollup, phần giờ lẻ
+-- đầu tiên đếm trực tiếp (dùng idx_automation_logs_created_at) để số liệu chính xác.
+CREATE OR REPLACE FUNCTION get_log_statistics(since TIMESTAMP WITH TIME ZONE)
+RETURNS JSONB AS $$
+DECLARE
+    first_full_hour TIMESTAMP WITH TIME ZONE := date_trunc('hour', since) +
+        CASE WHEN date_trunc('hour', since) = since THEN INTERVAL '0' ELSE INTERVAL '1 hour' END;
+    result JSONB;
+BEGIN
+    WITH grouped AS (
+        SELECT log_level, component, SUM(log_count) AS cnt
+        FROM (
+            SELECT log_level, component, log_count
+            FROM automation_log_rollups
+            WHERE bucket_hour >= first_full_hour
+            UNION ALL
+            SELECT log_level, COALESCE(metadata->>'component', 'unknown'), 1
+            FROM automation_logs
+            WHERE created_at >= since AND created_at < first_full_hour
+        ) s
+        GROUP BY log_level, component
+    )
+    SELECT jsonb_build_object(
+        'total_logs', COALESCE((SELECT SUM(cnt) FROM grouped), 0),
+        'by_level', COALESCE((SELECT jsonb_object_agg(log_level, c)
+                              FROM (SELECT log_level, SUM(cnt) AS c FROM grouped GROUP BY log_level) l), '{}'::jsonb),
+        'by_component', COALESCE((SELECT jsonb_object_agg(component, c)
+                                  FROM (SELECT component, SUM(cnt) AS c FROM grouped GROUP BY component) cc), '{}'::jsonb),
+        'error_count', COALESCE((SELECT SUM(cnt) FROM grouped WHERE log_level = 'ERROR'), 0),
+        'warning_count', COALESCE((SELECT SUM(cnt) FROM grouped WHERE log_level = 'WARNING'), 0)
+    ) INTO result;
+
+    RETURN result;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Thống kê devices bằng GROUP BY (device_type đọc qua to_jsonb để không phụ thuộc schema)
+CREATE OR REPLACE FUNCTION get_device_statistics()
+RETURNS JSONB AS $$
+    WITH grouped AS (
+        SELECT status,
+               COALESCE(to_jsonb(d)->>'device_type', 'unknown') AS device_type,
+               COUNT(*) AS cnt
+        FROM devices d
+        GROUP BY 1, 2
+    )
+    SELECT jsonb_build_object(
+        'total_devices', COALESCE((SELECT SUM(cnt) FROM grouped), 0),
+        'online_devices', COALESCE((SELECT SUM(cnt) FROM grouped WHERE status = 'online'), 0),
+        'offline_devices', COALESCE((SELECT SUM(cnt) FROM grouped WHERE status = 'offline'), 0),
+        'by_status', COALESCE((SELECT jsonb_object_agg(COALESCE(status, 'unknown'), c)
+                               FROM (SELECT status, SUM(cnt) AS c FROM grouped GROUP BY status) s), '{}'::jsonb),
+        'by_type', COALESCE((SELECT jsonb_object_agg(device_type, c)
+                             FROM (SELECT device_type, SUM(cnt) AS c FROM grouped GROUP BY device_type) t), '{}'::jsonb)
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Thống kê automation rules (plpgsql để không lỗi khi bảng chưa tồn tại lúc migrate)
+CREATE OR REPLACE FUNCTION get_rules_statistics()
+RETURNS JSONB AS $$
+DECLARE
+    result JSONB;
+BEGIN
+    WITH grouped AS (
+        SELECT COALESCE(is_active, false) AS is_active,
+               COALESCE(trigger_conditions->>'type', 'unknown') AS trigger_type,
+               COUNT(*) AS cnt,
+               COUNT(*) FILTER (WHERE last_executed > NOW() - INTERVAL '1 day') AS recent
+        FROM automation_rules
+        GROUP BY 1, 2
+    )
+    SELECT jsonb_build_object(
+        'total_rules', COALESCE((SELECT SUM(cnt) FROM grouped), 0),
+        'active_rules', COALESCE((SELECT SUM(cnt) FROM grouped WHERE is_active), 0),
+        'inactive_rules', COALESCE((SELECT SUM(cnt) FROM grouped WHERE NOT is_active), 0),
+        'by_trigger_type', COALESCE((SELECT jsonb_object_agg(trigger_type, c)
+                                     FROM (SELECT trigger_type, SUM(cnt) AS c FROM grouped GROUP BY trigger_type) t), '{}'::jsonb),
+        'recently_executed', COALESCE((SELECT SUM(recent) FROM grouped), 0)
+    ) INTO result;
+
+    RETURN result;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Permissions
+ALTER TABLE automation_log_rollups ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Allow all operations on automation_log_rollups" ON automation_log_rollups
+    FOR ALL USING (true) WITH CHECK (true);
+GRANT SELECT ON automation_log_rollups TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_log_statistics(TIMESTAMP WITH TIME ZONE) TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_device_statistics() TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_rules_statistics() TO anon, authenticated;
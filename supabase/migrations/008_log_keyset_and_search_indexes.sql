@@ -0,0 +1,31 @@
+-- Keyset pagination + message search indexes cho automation_logs và run_logs
+-- Cho phép đọc theo (ts, id) không cần OFFSET và ilike '%term%' không full scan
+
+-- Trigram extension cho ilike '%term%'
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- =============================================
+-- AUTOMATION LOGS
+-- =============================================
+CREATE INDEX IF NOT EXISTS idx_automation_logs_created_at_id
+    ON automation_logs(created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_automation_logs_level_created_at_id
+    ON automation_logs(log_level, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_automation_logs_message_trgm
+    ON automation_logs USING GIN (message gin_trgm_ops);
+
+-- =============================================
+-- RUN LOGS
+-- =============================================
+-- Thay index (run_id, ts) bằng (run_id, ts, id) để keyset có tie-breaker ổn định
+DROP INDEX IF EXISTS idx_run_logs_run_id_ts;
+CREATE INDEX IF NOT EXISTS idx_run_logs_run_id_ts_id
+    ON run_logs(run_id, ts, id);
+
+CREATE INDEX IF NOT EXISTS idx_run_logs_ts_id
+    ON run_logs(ts DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_run_logs_message_trgm
+    ON run_logs USING GIN (message gin_trgm_ops);
@@ -0,0 +1,101 @@
+-- Tiered retention cho run_logs và automation_logs
+-- Xóa theo batch nhỏ (giới hạn bởi keyset (ts, id)) thay vì một DELETE lớn,
+-- và gộp các dòng DEBUG/INFO cũ thành summary theo run trước khi xóa.
+
+-- =============================================
+-- RUN LOG SUMMARIES (compacted DEBUG/INFO lines)
+-- =============================================
+CREATE TABLE IF NOT EXISTS run_log_summaries (
+    run_id UUID REFERENCES runs(id) ON DELETE CASCADE,
+    level TEXT NOT NULL,
+    line_count BIGINT NOT NULL DEFAULT 0,
+    first_ts TIMESTAMPTZ,
+    last_ts TIMESTAMPTZ,
+    actions JSONB DEFAULT '{}',
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (run_id, level)
+);
+
+-- Xóa một batch run_logs có ts < cutoff và (ts, id) <= (upto_ts, upto_id).
+-- Nếu summarize = true thì cộng dồn số dòng vào run_log_summaries.
+CREATE OR REPLACE FUNCTION purge_run_logs_batch(
+    cutoff TIMESTAMPTZ,
+    upto_ts TIMESTAMPTZ,
+    upto_id BIGINT,
+    levels TEXT[] DEFAULT NULL,
+    summarize BOOLEAN DEFAULT false
+)
+RETURNS INTEGER AS $$
+DECLARE
+    deleted_count INTEGER;
+BEGIN
+    WITH deleted AS (
+        DELETE FROM run_logs
+        WHERE ts < cutoff
+          AND (ts, id) <= (upto_ts, upto_id)
+          AND (levels IS NULL OR level = ANY(levels))
+        RETURNING run_id, level, ts, action
+    ),
+    summarized AS (
+        INSERT INTO run_log_summaries (run_id, level, line_count, first_ts, last_ts, actions, updated_at)
+        SELECT run_id, level, SUM(action_count), MIN(ts_min), MAX(ts_max),
+               jsonb_object_agg(action_name, action_count), NOW()
+        FROM (
+            SELECT run_id, level, COALESCE(action, 'none') AS action_name,
+                   COUNT(*) AS action_count, MIN(ts) AS ts_min, MAX(ts) AS ts_max
+            FROM deleted
+            WHERE summarize AND run_id IS NOT NULL
+            GROUP BY run_id, level, COALESCE(action, 'none')
+        ) per_action
+        GROUP BY run_id, level
+        ON CONFLICT (run_id, level) DO UPDATE SET
+            line_count = run_log_summaries.line_count + EXCLUDED.line_count,
+            first_ts = LEAST(run_log_summaries.first_ts, EXCLUDED.first_ts),
+            last_ts = GREATEST(run_log_summaries.last_ts, EXCLUDED.last_ts),
+            actions = (
+                SELECT COALESCE(jsonb_object_agg(k, COALESCE((run_log_summaries.actions->>k)::BIGINT, 0)
+                                                  + COALESCE((EXCLUDED.actions->>k)::BIGINT, 0)), '{}'::jsonb)
+                FROM (SELECT jsonb_object_keys(run_log_summaries.actions) AS k
+                      UNION SELECT jsonb_object_keys(EXCLUDED.actions)) keys
+            ),
+            updated_at = NOW()
+        RETURNING 1
+    )
+    SELECT COUNT(*) INTO deleted_count FROM deleted;
+
+    RETURN deleted_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Xóa một batch automation_logs có created_at < cutoff và (created_at, id) <= (upto_ts, upto_id)
+CREATE OR REPLACE FUNCTION purge_automation_logs_batch(
+    cutoff TIMESTAMPTZ,
+    upto_ts TIMESTAMPTZ,
+    upto_id UUID,
+    levels TEXT[] DEFAULT NULL
+)
+RETURNS INTEGER AS $$
+DECLARE
+    deleted_count INTEGER;
+BEGIN
+    DELETE FROM automation_logs
+    WHERE created_at < cutoff
+      AND (created_at, id) <= (upto_ts, upto_id)
+      AND (levels IS NULL OR log_level = ANY(levels));
+
+    GET DIAGNOSTICS deleted_count = ROW_COUNT;
+    RETURN deleted_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Index hỗ trợ chọn batch cũ nhất theo level
+CREATE INDEX IF NOT EXISTS idx_run_logs_level_ts_id ON run_logs(level, ts, id);
+
+-- Permissions
+ALTER TABLE run_log_summaries ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Allow all operations on run_log_summaries" ON run_log_summaries
+    FOR ALL USING (true) WITH CHECK (true);
+GRANT SELECT ON run_log_summaries TO anon;
+GRANT ALL PRIVILEGES ON run_log_summaries TO authenticated;
+
+COMMENT ON TABLE run_log_summaries IS 'Per-run counts of compacted (deleted) DEBUG/INFO run_logs lines';
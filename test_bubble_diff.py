@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test script for utils.bubble_diff
+Xác minh gửi tin nhắn bằng diff bubble không báo nhầm "đã gửi"
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.bubble_diff import Bubble, Snapshot, take_snapshot, new_bubbles, outgoing_bubble_added
+
+
+def snapshot(*items):
+    """items: (text, outgoing)"""
+    return Snapshot(tuple(Bubble(text, outgoing) for text, outgoing in items), "", True)
+
+
+def test_status_row_change_is_not_a_send():
+    """Regression: dòng trạng thái cuối đổi ("Đã nhận" -> "Đã xem") không được tính là gửi lại "ok" """
+    before = snapshot(("hi", True), ("ok", True), ("Đã nhận", True))
+    after = snapshot(("hi", True), ("ok", True), ("Đã xem", True))
+    assert not outgoing_bubble_added(before, after, "ok")
+    assert new_bubbles(before.bubbles, after.bubbles) == []
+
+
+def test_repeated_message_sent():
+    before = snapshot(("hi", True), ("ok", True), ("Đã xem", True))
+    after = snapshot(("hi", True), ("ok", True), ("ok", True), ("Đã gửi", True))
+    assert outgoing_bubble_added(before, after, "ok")
+
+
+def test_scrolled_list():
+    """Bubble cũ cuộn ra khỏi màn hình: chỉ phần còn hiển thị được dùng làm mốc"""
+    before = snapshot(("a", False), ("ok", True), ("b", False), ("10:35", None))
+    after = snapshot(("ok", True), ("b", False), ("ok", True), ("10:36", None))
+    assert outgoing_bubble_added(before, after, "ok")
+
+
+def test_incoming_bubble_is_not_a_send():
+    before = snapshot(("hi", True))
+    after = snapshot(("hi", True), ("ok", False))
+    assert not outgoing_bubble_added(before, after, "ok")
+
+
+def test_unaligned_lists_compare_whole_before():
+    """Không căn được đuôi thì không coi mọi bubble của after là mới"""
+    before = snapshot(("ok", True), ("x", False))
+    after = snapshot(("y", False), ("ok", True))
+    assert not outgoing_bubble_added(before, after, "ok")
+
+
+def test_take_snapshot_outgoing_side():
+    xml = (
+        '<hierarchy><node resource-id="com.zing.zalo:id/message_list" bounds="[0,100][1000,1800]">'
+        '<node text="chào" bounds="[40,200][400,260]" />'
+        '<node text="ok" bounds="[600,300][960,360]" />'
+        '</node><node resource-id="com.zing.zalo:id/chatinput_text" text="" bounds="[0,1800][1000,1900]" />'
+        '</hierarchy>'
+    )
+    result = take_snapshot(xml)
+    assert result.bubbles == (Bubble("chào", False), Bubble("ok", True))
+    assert result.input_text == ""
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✓ {name}")
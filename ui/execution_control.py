@@ -19,6 +19,8 @@ from PyQt6.QtWidgets import (
 from PyQt6.QtCore import Qt, QTimer, pyqtSignal, QThread, pyqtSlot, QMutex
 from PyQt6.QtGui import QFont, QIcon, QPalette, QColor, QTextCursor
 
+from utils.status_hub import get_status_hub
+
 class ExecutionWorker(QThread):
     """Worker thread for flow execution"""
     
@@ -129,18 +131,23 @@ class ExecutionWorker(QThread):
 class ExecutionStatusWidget(QWidget):
     """Widget hiển thị trạng thái execution với bảng 6 cột cho conversation"""
     
+    # Delta từ status hub (emit trên automation thread -> queued về GUI thread)
+    status_delta_received = pyqtSignal(dict)
+    
+    STATUS_COLORS = {'running': '#1e88e5', 'completed': '#107c10', 'error': '#d13438'}
+    
     def __init__(self):
         super().__init__()
-        self.device_progress = {}  # device_id -> progress_bar
-        self.device_status = {}   # device_id -> status_label
         self.conversation_data = []  # Store conversation messages
         self.countdown_timers = {}  # message_id -> QTimer for countdown
+        self.device_rows = {}  # device_id -> row trong device_table
+        self.board_progress = {}  # device_id -> progress (%)
+        self._unsubscribe_status = None
         self.setup_ui()
         
-        # Timer to read shared status
-        self.status_timer = QTimer()
-        self.status_timer.timeout.connect(self.update_from_shared_status)
-        self.status_timer.start(500)  # Update every 500ms
+        # Nhận trạng thái push từ status hub thay vì đọc file mỗi 500ms
+        self.status_delta_received.connect(self.apply_status_delta)
+        self.start_status_monitoring()
         
     def setup_ui(self):
         layout = QVBoxLayout()
@@ -195,6 +202,17 @@ class ExecutionStatusWidget(QWidget):
         
         layout.addWidget(self.status_table)
         
+        # Bảng trạng thái device: mỗi device một row, chỉ row có trong delta được vẽ lại
+        self.device_table = QTableWidget()
+        self.device_table.setColumnCount(4)
+        self.device_table.setHorizontalHeaderLabels(["Device", "Trạng thái", "Tiến độ", "Message"])
+        self.device_table.verticalHeader().setVisible(False)
+        self.device_table.horizontalHeader().setSectionResizeMode(3, QHeaderView.ResizeMode.Stretch)
+        self.device_table.setColumnWidth(0, 160)
+        self.device_table.setColumnWidth(1, 100)
+        self.device_table.setColumnWidth(2, 80)
+        layout.addWidget(self.device_table)
+        
         # Overall progress
         overall_group = QGroupBox("Overall Progress")
         overall_layout = QVBoxLayout()
@@ -397,148 +415,110 @@ class ExecutionStatusWidget(QWidget):
                 QTimer.singleShot(2000 * message_id, lambda mid=message_id, d=delay: self.start_countdown_timer(mid, d))
     
     def start_status_monitoring(self):
-        """Bắt đầu monitor status.json để cập nhật real-time"""
-        self.status_monitor_timer = QTimer()
-        self.status_monitor_timer.timeout.connect(self.update_from_status_file)
-        self.status_monitor_timer.start(1000)  # Check every second
+        """Subscribe status hub để nhận delta real-time (không đọc status.json)"""
+        if self._unsubscribe_status is None:
+            self._unsubscribe_status = get_status_hub().subscribe(self._on_status_delta)
+            self.update_from_status_file()
     
     def stop_status_monitoring(self):
-        """Dừng monitor status.json"""
-        if hasattr(self, 'status_monitor_timer'):
-            self.status_monitor_timer.stop()
+        """Hủy subscribe status hub"""
+        if self._unsubscribe_status is not None:
+            self._unsubscribe_status()
+            self._unsubscribe_status = None
     
-    def update_from_status_file(self):
-        """Cập nhật trạng thái từ status.json"""
-        import json
-        import os
-        
+    def _on_status_delta(self, delta):
+        # Chạy trên thread publish: chỉ emit, signal tự chuyển về GUI thread
         try:
-            file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'status.json')
-            if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    status_data = json.load(f)
-                
-                # Cập nhật trạng thái devices
-                for device_id, device_status in status_data.get('devices', {}).items():
-                    status = device_status.get('status', 'unknown')
-                    message = device_status.get('message', '')
-                    
-                    # Tìm và cập nhật trong bảng
-                    self.update_device_status_in_table(device_id, status, message)
-                
-                # Cập nhật trạng thái tổng thể
-                overall_status = status_data.get('overall', {}).get('status', 'idle')
-                if overall_status == 'running':
-                    self.start_status_monitoring()
-                elif overall_status in ['completed', 'error']:
-                    self.stop_status_monitoring()
-                    
-        except Exception as e:
-            print(f"Lỗi khi đọc status.json: {e}")
+            self.status_delta_received.emit(delta)
+        except RuntimeError:
+            # Widget đã bị xóa
+            self.stop_status_monitoring()
     
-    def update_device_status_in_table(self, device_id, status, message):
-        """Cập nhật trạng thái device trong bảng"""
-        # Tìm row tương ứng với device_id và cập nhật
-        for row in range(self.status_table.rowCount()):
-            # Kiểm tra nếu có thông tin device phù hợp
-            role1_item = self.status_table.item(row, 2)
-            role2_item = self.status_table.item(row, 5)
-            
-            if role1_item and f"device_{device_id}" in role1_item.text():
-                role1_item.setText(f"{status}: {message}")
-            elif role2_item and f"device_{device_id}" in role2_item.text():
-                role2_item.setText(f"{status}: {message}")
-        
-    def update_progress(self, device_id, progress):
-        """Update device progress"""
-        if device_id in self.device_progress:
-            self.device_progress[device_id].setValue(progress)
-            
-        # Update overall progress
-        self.update_overall_progress()
-        
-    def update_status(self, device_id, status, color=None):
-        """Update device status"""
-        if device_id in self.device_status:
-            self.device_status[device_id].setText(status)
-            
-            if color:
-                self.device_status[device_id].setForeground(QColor(color))
-                
-    def update_overall_progress(self):
-        """Update overall progress"""
-        if not self.device_progress:
+    def update_from_status_file(self):
+        """Vẽ lại toàn bộ bảng device từ status hub (tên cũ giữ cho tương thích)"""
+        delta = get_status_hub().changes_since(-1)
+        delta['reset'] = True
+        self.apply_status_delta(delta)
+    
+    @pyqtSlot(dict)
+    def apply_status_delta(self, delta):
+        """Áp dụng delta của status hub: chỉ cập nhật row của các device đã đổi"""
+        if delta.get('reset'):
+            self.device_table.setRowCount(0)
+            self.device_rows.clear()
+            self.board_progress.clear()
+        
+        for device_id, record in delta.get('devices', {}).items():
+            self._set_device_row(device_id, status=record.get('status', 'unknown'),
+                                 progress=record.get('progress') or 0, message=record.get('message', ''))
+        
+        self._refresh_overall(delta.get('overall_status'))
+    
+    def _device_row(self, device_id):
+        """Row của device trong device_table (tạo mới nếu chưa có)"""
+        row = self.device_rows.get(device_id)
+        if row is None:
+            row = self.device_table.rowCount()
+            self.device_table.insertRow(row)
+            self.device_table.setItem(row, 0, QTableWidgetItem(device_id))
+            for col in (1, 2, 3):
+                self.device_table.setItem(row, col, QTableWidgetItem(""))
+            self.device_rows[device_id] = row
+            self.board_progress.setdefault(device_id, 0)
+        return row
+    
+    def _set_device_row(self, device_id, status=None, progress=None, message=None, color=None):
+        """Cập nhật các ô của một device; None = giữ nguyên giá trị cũ"""
+        row = self._device_row(device_id)
+        if status is not None:
+            status_item = self.device_table.item(row, 1)
+            status_item.setText(status)
+            status_item.setForeground(QColor(color or self.STATUS_COLORS.get(status, '#888888')))
+        if progress is not None:
+            self.device_table.item(row, 2).setText(f"{progress}%")
+            self.board_progress[device_id] = progress
+        if message is not None:
+            self.device_table.item(row, 3).setText(message)
+    
+    def _refresh_overall(self, overall_status=None):
+        """Overall progress = trung bình tiến độ các device trong device_table"""
+        if not self.board_progress:
             self.overall_progress.setValue(0)
             self.overall_label.setText("Ready")
             return
-            
-        total_progress = sum(pb.value() for pb in self.device_progress.values())
-        avg_progress = total_progress // len(self.device_progress)
         
+        avg_progress = int(sum(self.board_progress.values()) / len(self.board_progress))
         self.overall_progress.setValue(avg_progress)
-        
-        if avg_progress == 100:
+        if overall_status:
+            self.overall_label.setText(
+                f"{overall_status.title()} - {len(self.board_progress)} devices, {avg_progress}%")
+        elif avg_progress == 100:
             self.overall_label.setText("All executions completed")
         elif avg_progress > 0:
             self.overall_label.setText(f"Executing... {avg_progress}%")
         else:
             self.overall_label.setText("Starting...")
+        
+    def update_progress(self, device_id, progress):
+        """Update device progress (flow execution không qua status hub)"""
+        self._set_device_row(device_id, progress=progress)
+        self._refresh_overall()
+        
+    def update_status(self, device_id, status, color=None):
+        """Update device status (flow execution không qua status hub)"""
+        self._set_device_row(device_id, status=status, color=color)
             
     def clear_status(self):
         """Clear all status"""
         self.status_table.setRowCount(0)
-        self.device_progress.clear()
-        self.device_status.clear()
         
         # Stop all countdown timers
         for timer in self.countdown_timers.values():
             timer.stop()
         self.countdown_timers.clear()
         
-        self.overall_progress.setValue(0)
-        self.overall_label.setText("Ready")
-    
-    def read_shared_status(self):
-        """Read shared status from file"""
-        try:
-            status_file = "shared_status.json"
-            if os.path.exists(status_file):
-                with open(status_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception as e:
-            # Silently ignore errors when reading status file
-            pass
-        return None
-    
-    def update_from_shared_status(self):
-        """Update status from shared status file"""
-        shared_status = self.read_shared_status()
-        if not shared_status:
-            return
-            
-        device_id = shared_status.get('device_id')
-        status_text = shared_status.get('status', 'unknown')
-        progress = shared_status.get('progress', 0)
-        
-        if device_id:
-            # Update progress if device exists in our tracking
-            if device_id in self.device_progress:
-                self.update_progress(device_id, progress)
-                
-                # Update status text
-                status_display = {
-                    'running': 'Running',
-                    'completed': 'Success', 
-                    'error': 'Error'
-                }.get(status_text, status_text.title())
-                
-                status_color = {
-                    'running': 'blue',
-                    'completed': 'green',
-                    'error': 'red'
-                }.get(status_text, None)
-                
-                self.update_status(device_id, status_display, status_color)
+        # Bảng device vẽ lại từ status hub (bỏ row của các lần execution trước)
+        self.update_from_status_file()
 
 class LogsViewerWidget(QWidget):
     """Widget hiển thị logs với filtering"""
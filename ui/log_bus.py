@@ -0,0 +1,65 @@
+import threading
+from collections import deque
+from typing import List, Tuple
+
+# Levels luôn được giữ khi đang sampling
+PRIORITY_LEVELS = {"error", "stderr", "warning", "critical", "system"}
+
+
+class LogBus:
+    """Bounded ring buffer cho log lines (thread-safe, không bao giờ block producer)
+
+    Producer (stdout redirector, log pipeline, logcat reader) gọi publish() từ
+    bất kỳ thread nào; GUI thread gọi drain() theo nhịp timer và nhận cả batch.
+
+    Policies khi buffer đầy / gần đầy:
+        "drop_oldest": bỏ dòng cũ nhất để nhận dòng mới
+        "sample":      khi buffer vượt sample_threshold, chỉ giữ 1/sample_every
+                       dòng thường (error/warning/system vẫn giữ hết)
+    """
+
+    def __init__(self, capacity: int = 20000, policy: str = "drop_oldest",
+                 sample_threshold: float = 0.5, sample_every: int = 10):
+        if policy not in ("drop_oldest", "sample"):
+            raise ValueError(f"Unknown log bus policy: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.sample_threshold = int(capacity * sample_threshold)
+        self.sample_every = max(1, sample_every)
+        self._buffer: deque = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._sample_counter = 0
+        self.dropped = 0
+
+    def publish(self, message: str, level: str = "info"):
+        """Đưa một dòng vào bus"""
+        with self._lock:
+            if self.policy == "sample" and len(self._buffer) >= self.sample_threshold \
+                    and level not in PRIORITY_LEVELS:
+                self._sample_counter += 1
+                if self._sample_counter % self.sample_every:
+                    self.dropped += 1
+                    return
+            if len(self._buffer) == self.capacity:
+                self.dropped += 1
+            self._buffer.append((message, level))
+
+    def publish_many(self, lines: List[Tuple[str, str]]):
+        """Đưa nhiều dòng (message, level) vào bus"""
+        for message, level in lines:
+            self.publish(message, level)
+
+    def drain(self, max_items: int = 2000) -> List[Tuple[str, str]]:
+        """Lấy tối đa max_items dòng cũ nhất ra khỏi bus"""
+        with self._lock:
+            count = min(max_items, len(self._buffer))
+            return [self._buffer.popleft() for _ in range(count)]
+
+    def take_dropped(self) -> int:
+        """Số dòng bị bỏ từ lần gọi trước (reset về 0)"""
+        with self._lock:
+            dropped, self.dropped = self.dropped, 0
+            return dropped
+
+    def __len__(self):
+        return len(self._buffer)
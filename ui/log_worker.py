@@ -2,16 +2,25 @@ from PyQt6.QtCore import QThread, pyqtSignal, QProcess
 import subprocess
 import sys
 import os
+import threading
 from typing import Optional
 
+from ui.log_bus import LogBus
+
 class LogWorker(QThread):
     """Worker thread for streaming logs from ADB and internal tool operations"""
     
     log_received = pyqtSignal(str)  # Signal emitted when new log line is received
+    logs_received = pyqtSignal(list)  # Batch of (line, level) emitted once per frame
     error_occurred = pyqtSignal(str)  # Signal emitted when error occurs
     
+    FRAME_INTERVAL_MS = 50
+    MAX_BATCH_LINES = 2000
+    
     def __init__(self, parent=None):
         super().__init__(parent)
+        # logcat ở debug verbosity rất nhiều dòng: sampling khi GUI không theo kịp
+        self.log_bus = LogBus(capacity=20000, policy="sample")
         self.adb_process: Optional[subprocess.Popen] = None
         self.internal_process: Optional[QProcess] = None
         self.is_running = False
@@ -107,31 +116,47 @@ class LogWorker(QThread):
                 if line.strip():
                     self.log_received.emit(f"[INTERNAL ERROR] {line}")
                     
+    def _pump_adb_output(self, process: subprocess.Popen):
+        """Đọc logcat (blocking readline) và đẩy vào log bus"""
+        try:
+            for line in process.stdout:
+                if not self.is_running:
+                    break
+                line = line.strip()
+                if line:
+                    self.log_bus.publish(f"[ADB] {line}", "adb")
+        except Exception as e:
+            self.error_occurred.emit(f"Error reading ADB output: {str(e)}")
+            
+    def _emit_batch(self):
+        """Emit tất cả dòng đang chờ trong bus thành một signal"""
+        batch = self.log_bus.drain(self.MAX_BATCH_LINES)
+        dropped = self.log_bus.take_dropped()
+        if dropped:
+            batch.append((f"[ADB] Sampled out {dropped} lines (GUI behind)", "warning"))
+        if batch:
+            self.logs_received.emit(batch)
+            
     def run(self):
         """Main thread execution"""
         self.is_running = True
+        reader = None
         
         try:
-            # Read ADB logcat output if process is running
-            while self.is_running and self.adb_process:
-                if self.adb_process.poll() is None:  # Process is still running
-                    try:
-                        line = self.adb_process.stdout.readline()
-                        if line:
-                            self.log_received.emit(f"[ADB] {line.strip()}")
-                        else:
-                            # No more output, small delay to prevent busy waiting
-                            self.msleep(100)
-                    except Exception as e:
-                        self.error_occurred.emit(f"Error reading ADB output: {str(e)}")
-                        break
-                else:
-                    # Process has terminated
-                    break
+            # Read ADB logcat output in a reader thread, emit batches per frame here
+            if self.adb_process:
+                reader = threading.Thread(target=self._pump_adb_output, args=(self.adb_process,),
+                                          name="adb-logcat-reader", daemon=True)
+                reader.start()
+            
+            while self.is_running and reader and (reader.is_alive() or len(self.log_bus)):
+                self.msleep(self.FRAME_INTERVAL_MS)
+                self._emit_batch()
                     
         except Exception as e:
             self.error_occurred.emit(f"LogWorker error: {str(e)}")
         finally:
+            self._emit_batch()
             self.is_running = False
             
     def stop(self):
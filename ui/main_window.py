@@ -30,6 +30,7 @@ from ui.phone_mapping_widget import PhoneMappingWidget
 from ui.theme_manager import ThemeManager
 from ui.terminal_log_tab import TerminalLogTab
 from ui.qt_log_redirector import QtLogRedirector
+from utils.status_hub import get_status_hub
 
 # Import ZaloAutomationWidget using importlib to handle module name starting with number
 zalo_module = importlib.import_module('ui.1zalo_automation')
@@ -330,6 +331,7 @@ class MainWindow(QMainWindow):
         
         # Connect log redirector to terminal log tab
         self.log_redirector.log_received.connect(self.terminal_log_tab.append_log)
+        self.log_redirector.log_batch_received.connect(self.terminal_log_tab.append_logs)
         
         # Device manager connections removed - terminal log tab no longer needs device list updates
         
@@ -345,7 +347,7 @@ class MainWindow(QMainWindow):
         device_count = len(self.device_manager.get_connected_devices())
         self.device_status_label.setText(f"Devices: {device_count}")
         
-        # Read shared status from file
+        # Trạng thái mới nhất từ status hub (in-memory, không đọc file)
         shared_status = self.read_shared_status()
         
         # Update execution status based on shared status
@@ -385,16 +387,8 @@ class MainWindow(QMainWindow):
         self.flow_status_label.setText("Flows: 0")
     
     def read_shared_status(self):
-        """Read shared status from file"""
-        try:
-            status_file = "shared_status.json"
-            if os.path.exists(status_file):
-                with open(status_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception as e:
-            # Silently ignore errors when reading status file
-            pass
-        return None
+        """Trạng thái của device cập nhật gần nhất từ status hub (device_id, status, progress...)"""
+        return get_status_hub().latest()
         
     def on_device_connected(self, device_id):
         """Handle device connection"""
@@ -2,27 +2,34 @@ from PyQt6.QtCore import QObject, QThread, pyqtSignal, QTimer
 from PyQt6.QtWidgets import QApplication
 import sys
 import io
-import queue
 import threading
 from datetime import datetime
 
+from ui.log_bus import LogBus
+from utils.log_pipeline import add_sink_callback, remove_sink_callback
+
 class QtLogRedirector(QObject):
     """Redirects stdout/stderr to Qt signals for display in Terminal Log tab"""
     
     # Signal emitted when log is received
     log_received = pyqtSignal(str, str)  # message, level
+    # Signal emitted once per frame with all lines drained from the bus
+    log_batch_received = pyqtSignal(list)  # [(message, level), ...]
+    
+    FRAME_INTERVAL_MS = 50
+    MAX_BATCH_LINES = 2000
     
-    def __init__(self):
+    def __init__(self, capacity: int = 20000, policy: str = "drop_oldest"):
         super().__init__()
         self.original_stdout = sys.stdout
         self.original_stderr = sys.stderr
-        self.log_queue = queue.Queue()
+        self.log_bus = LogBus(capacity=capacity, policy=policy)
         self.is_redirecting = False
         
         # Timer to process log queue
         self.timer = QTimer()
         self.timer.timeout.connect(self.process_log_queue)
-        self.timer.start(100)  # Process every 100ms
+        self.timer.start(self.FRAME_INTERVAL_MS)
         
     def start_redirection(self):
         """Start redirecting stdout and stderr"""
@@ -35,15 +42,18 @@ class QtLogRedirector(QObject):
             self.original_stderr = sys.stderr
             
             # Create redirectors with original streams
-            self.stdout_redirector = StreamRedirector(self.log_queue, "stdout", self.original_stdout)
-            self.stderr_redirector = StreamRedirector(self.log_queue, "stderr", self.original_stderr)
+            self.stdout_redirector = StreamRedirector(self.log_bus, "stdout", self.original_stdout)
+            self.stderr_redirector = StreamRedirector(self.log_bus, "stderr", self.original_stderr)
             
             # Replace system streams
             sys.stdout = self.stdout_redirector
             sys.stderr = self.stderr_redirector
             
+            # Structured logs từ utils.log_pipeline (không đi qua stdout)
+            add_sink_callback(self._enqueue_pipeline_log)
+            
             # Start processing timer
-            self.timer.start(100)  # Process queue every 100ms
+            self.timer.start(self.FRAME_INTERVAL_MS)
             
             self.is_redirecting = True
             self.log_received.emit("[REDIRECTOR] Started capturing stdout/stderr", "system")
@@ -60,6 +70,8 @@ class QtLogRedirector(QObject):
             # Stop timer
             self.timer.stop()
             
+            remove_sink_callback(self._enqueue_pipeline_log)
+            
             # Restore original streams
             if self.original_stdout:
                 sys.stdout = self.original_stdout
@@ -84,15 +96,24 @@ class QtLogRedirector(QObject):
             else:
                 print(error_msg)
                 
+    def _enqueue_pipeline_log(self, message: str, level: str):
+        """Sink callback của log pipeline (gọi từ listener thread)"""
+        self.log_bus.publish(message, level)
+        
+    def _drain_batch(self) -> list:
+        """Lấy một batch từ bus, kèm dòng thông báo nếu có log bị bỏ"""
+        batch = self.log_bus.drain(self.MAX_BATCH_LINES)
+        dropped = self.log_bus.take_dropped()
+        if dropped:
+            batch.append((f"[LOG BUS] Dropped {dropped} lines (buffer full)", "warning"))
+        return batch
+        
     def process_log_queue(self):
-        """Process logs from queue and emit signals"""
-        try:
-            while not self.log_queue.empty():
-                message, level = self.log_queue.get_nowait()
-                # Emit signal to Terminal Log tab
-                self.log_received.emit(message, level)
-        except queue.Empty:
-            pass
+        """Drain the log bus and emit one batch signal per frame"""
+        batch = self._drain_batch()
+        if batch:
+            # Emit signal to Terminal Log tab
+            self.log_batch_received.emit(batch)
                 
     def write_log(self, message: str, level: str = "info"):
         """Manually write a log message"""
@@ -108,9 +129,9 @@ class QtLogRedirector(QObject):
 class StreamRedirector(io.TextIOBase):
     """Custom stream redirector that captures output and puts it in a queue while preserving original output"""
     
-    def __init__(self, log_queue: queue.Queue, stream_type: str, original_stream):
+    def __init__(self, log_bus: LogBus, stream_type: str, original_stream):
         super().__init__()
-        self.log_queue = log_queue
+        self.log_bus = log_bus
         self.stream_type = stream_type
         self.original_stream = original_stream
         self.buffer = ""
@@ -139,11 +160,8 @@ class StreamRedirector(io.TextIOBase):
                 while '\n' in self.buffer:
                     line, self.buffer = self.buffer.split('\n', 1)
                     if line.strip():  # Only queue non-empty lines
-                        try:
-                            self.log_queue.put_nowait((line, self.stream_type))
-                        except queue.Full:
-                            # If queue is full, skip this message to prevent blocking
-                            pass
+                        # Bus never blocks; when full it drops/samples per its policy
+                        self.log_bus.publish(line, self.stream_type)
                             
         except Exception:
             # Silently ignore errors to prevent infinite recursion
@@ -164,10 +182,7 @@ class StreamRedirector(io.TextIOBase):
         try:
             with self.lock:
                 if self.buffer.strip():
-                    try:
-                        self.log_queue.put_nowait((self.buffer, self.stream_type))
-                    except queue.Full:
-                        pass
+                    self.log_bus.publish(self.buffer, self.stream_type)
                     self.buffer = ""
         except Exception:
             pass
@@ -203,8 +218,8 @@ class LogCapture:
 class FilteredLogRedirector(QtLogRedirector):
     """Extended log redirector with filtering capabilities"""
     
-    def __init__(self, parent=None):
-        super().__init__(parent)
+    def __init__(self, capacity: int = 20000, policy: str = "drop_oldest"):
+        super().__init__(capacity, policy)
         self.filters = []
         self.log_levels = {"DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"}
         
@@ -221,28 +236,27 @@ class FilteredLogRedirector(QtLogRedirector):
         """Clear all filters"""
         self.filters.clear()
         
-    def _process_log_queue(self):
-        """Process messages from the log queue with filtering"""
+    def process_log_queue(self):
+        """Drain the log bus, apply filters and emit one batch signal"""
         try:
-            while not self.log_queue.empty():
-                try:
-                    message, level = self.log_queue.get_nowait()
-                    if message.strip():
-                        # Apply filters
-                        should_log = True
-                        for filter_func in self.filters:
-                            try:
-                                if not filter_func(message, level):
-                                    should_log = False
-                                    break
-                            except Exception:
-                                # If filter fails, log the message anyway
-                                continue
-                                
-                        if should_log:
-                            self.log_captured.emit(message.strip(), level)
-                except queue.Empty:
-                    break
+            batch = []
+            for message, level in self._drain_batch():
+                if message.strip():
+                    # Apply filters
+                    should_log = True
+                    for filter_func in self.filters:
+                        try:
+                            if not filter_func(message, level):
+                                should_log = False
+                                break
+                        except Exception:
+                            # If filter fails, log the message anyway
+                            continue
+                            
+                    if should_log:
+                        batch.append((message.strip(), level))
+            if batch:
+                self.log_batch_received.emit(batch)
         except Exception as e:
             if self.original_stderr:
                 self.original_stderr.write(f"Error processing filtered log queue: {str(e)}\n")
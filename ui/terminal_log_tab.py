@@ -1,13 +1,80 @@
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QTextEdit, 
     QPushButton, QLabel, QGroupBox, QCheckBox, QComboBox,
-    QPlainTextEdit, QSplitter
+    QListView, QAbstractItemView, QSplitter
 )
-from PyQt6.QtCore import Qt, pyqtSignal, QTimer
-from PyQt6.QtGui import QFont, QTextCursor, QColor, QPalette
+from PyQt6.QtCore import Qt, pyqtSignal, QTimer, QAbstractListModel, QModelIndex
+from PyQt6.QtGui import QFont, QColor, QPalette
+from collections import deque
 from datetime import datetime
 from ui.log_worker import LogWorker
 
+# Color coding based on level
+LEVEL_COLORS = {
+    "error": "#ff6b6b",
+    "critical": "#ff6b6b",
+    "stderr": "#ff6b6b",
+    "warning": "#ffa726",
+    "info": "#66bb6a",
+    "stdout": "#e0e0e0",
+    "adb": "#e0e0e0",
+    "debug": "#90a4ae",
+    "system": "#42a5f5"
+}
+
+
+class LogListModel(QAbstractListModel):
+    """Ring buffer model cho log view: chỉ các dòng đang hiển thị mới được render"""
+    
+    def __init__(self, max_lines: int = 20000, parent=None):
+        super().__init__(parent)
+        self.max_lines = max_lines
+        self._rows = deque(maxlen=max_lines)
+        self._brushes = {level: QColor(color) for level, color in LEVEL_COLORS.items()}
+        self._default_brush = QColor("#e0e0e0")
+        
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+        
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._rows):
+            return None
+        text, level = self._rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return text
+        if role == Qt.ItemDataRole.ForegroundRole:
+            return self._brushes.get(level, self._default_brush)
+        return None
+        
+    def append_rows(self, rows):
+        """Thêm một batch (text, level), bỏ các dòng cũ nhất khi vượt max_lines"""
+        if not rows:
+            return
+        if len(rows) >= self.max_lines:
+            self.beginResetModel()
+            self._rows.clear()
+            self._rows.extend(rows[-self.max_lines:])
+            self.endResetModel()
+            return
+            
+        overflow = len(self._rows) + len(rows) - self.max_lines
+        if overflow > 0:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            for _ in range(overflow):
+                self._rows.popleft()
+            self.endRemoveRows()
+            
+        start = len(self._rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
+        
+    def clear(self):
+        self.beginResetModel()
+        self._rows.clear()
+        self.endResetModel()
+
+
 class TerminalLogTab(QWidget):
     """Terminal Log tab widget for displaying real-time logs"""
     
@@ -15,7 +82,7 @@ class TerminalLogTab(QWidget):
         super().__init__(parent)
         self.log_worker = None
         self.auto_scroll_enabled = True
-        self.max_lines = 1000  # Maximum number of lines to keep
+        self.max_lines = 20000  # Maximum number of lines to keep (view is virtualized)
         self.setup_ui()
         self.setup_connections()
         
@@ -42,10 +109,15 @@ class TerminalLogTab(QWidget):
             }
         """)
         
-        # Log text area
-        self.log_text = QPlainTextEdit()
-        self.log_text.setReadOnly(True)
-        self.log_text.setMaximumBlockCount(self.max_lines)
+        # Log view: virtualized list, rows có cùng chiều cao nên chỉ vẽ phần đang thấy
+        self.log_model = LogListModel(self.max_lines, self)
+        self.log_text = QListView()
+        self.log_text.setModel(self.log_model)
+        self.log_text.setUniformItemSizes(True)
+        self.log_text.setWordWrap(False)
+        self.log_text.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.log_text.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.log_text.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
         
         # Set monospace font for better log readability
         font = QFont("Consolas", 9)
@@ -55,7 +127,7 @@ class TerminalLogTab(QWidget):
         
         # Set dark theme for log area
         self.log_text.setStyleSheet("""
-            QPlainTextEdit {
+            QListView {
                 background-color: #1e1e1e;
                 color: #ffffff;
                 border: 1px solid #555555;
@@ -77,55 +149,31 @@ class TerminalLogTab(QWidget):
         # Log worker connections
         if self.log_worker:
             self.log_worker.log_received.connect(self.append_log)
+            self.log_worker.logs_received.connect(self.append_logs)
             self.log_worker.error_occurred.connect(self.handle_error)
             
 
         
     def append_log(self, message: str, level: str = "info"):
         """Append log message to display"""
-        if not message.strip():
+        self.append_logs([(message, level)])
+        
+    def append_logs(self, batch):
+        """Append a batch of (message, level) in one model update"""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        rows = [(f"[{timestamp}] {message}", level.lower())
+                for message, level in batch if message.strip()]
+        if not rows:
             return
             
-        # Format timestamp
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        
-        # Color coding based on level
-        color_map = {
-            "error": "#ff6b6b",
-            "stderr": "#ff6b6b", 
-            "warning": "#ffa726",
-            "info": "#66bb6a",
-            "stdout": "#e0e0e0",
-            "debug": "#90a4ae",
-            "system": "#42a5f5"
-        }
-        
-        color = color_map.get(level.lower(), "#e0e0e0")
-        
-        # Format message with timestamp and color
-        formatted_message = f'<span style="color: #90a4ae;">[{timestamp}]</span> <span style="color: {color};">{message}</span>'
-        
         # Check if we're at the bottom before adding new content
         scrollbar = self.log_text.verticalScrollBar()
         was_at_bottom = scrollbar.value() >= scrollbar.maximum() - 10
         
-        # Append to log area
-        self.log_text.appendHtml(formatted_message)
-        
-        # Auto-scroll if enabled and was at bottom, or force scroll if auto-scroll is enabled
-        if self.auto_scroll_enabled and (was_at_bottom or scrollbar.value() == 0):
-            # Use QTimer to ensure scroll happens after text is rendered
-            QTimer.singleShot(10, lambda: scrollbar.setValue(scrollbar.maximum()))
-        
-        # Limit log lines to prevent memory issues
-        document = self.log_text.document()
-        if document.blockCount() > 1000:  # Keep last 1000 lines
-            cursor = self.log_text.textCursor()
-            cursor.movePosition(cursor.MoveOperation.Start)
-            for _ in range(100):  # Remove first 100 lines
-                cursor.select(cursor.SelectionType.BlockUnderCursor)
-                cursor.removeSelectedText()
-                cursor.deleteChar()  # Remove the newline
+        self.log_model.append_rows(rows)
+        
+        if self.auto_scroll_enabled and was_at_bottom:
+            self.log_text.scrollToBottom()
             
     def handle_error(self, error_message):
         """Handle error messages"""
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+App Reset
+Đưa máy về trạng thái sạch trước khi mở Zalo bằng một lệnh shell gộp thay
+cho việc bấm Recent apps -> Clear all trên UI (phụ thuộc launcher, ~10s/máy).
+
+Một lần d.shell() chạy cả batch trong một phiên shell:
+    am kill-all; am force-stop com.zing.zalo; ...; echo __app_reset_ok__
+(kill-all dừng mọi process nền, force-stop dừng hẳn app đích). Marker ở cuối
+xác nhận batch đã chạy; không có marker thì flow fallback về cách UI.
+
+Profile theo máy trong config/app_reset.json (AUTOMATION_APP_RESET_CONFIG),
+device_id ghi đè model, model ghi đè default:
+    {
+      "default": {"method": "shell", "packages": ["com.zing.zalo"], "kill_background": true},
+      "models": {"SM-A105F": {"method": "ui"}},
+      "devices": {"192.168.5.74:5555": {"packages": ["com.zing.zalo", "com.facebook.katana"]}}
+    }
+AUTOMATION_APP_RESET=shell|ui ép method cho mọi máy.
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+CONFIG_FILE = os.environ.get("AUTOMATION_APP_RESET_CONFIG", os.path.join("config", "app_reset.json"))
+METHOD_OVERRIDE = os.environ.get("AUTOMATION_APP_RESET", "").lower()
+METHODS = ("shell", "ui")
+DONE_MARKER = "__app_reset_ok__"
+
+DEFAULT_PROFILE = {
+    "method": "shell",
+    "packages": ["com.zing.zalo"],
+    "kill_background": True,
+}
+
+_config: Optional[Dict[str, Any]] = None
+_config_lock = threading.Lock()
+_models: Dict[str, str] = {}
+
+
+def load_config(path: str = CONFIG_FILE) -> Dict[str, Any]:
+    """Đọc file profile (một lần mỗi process); thiếu file -> chỉ dùng DEFAULT_PROFILE"""
+    global _config
+    with _config_lock:
+        if _config is None:
+            _config = {}
+            if os.path.exists(path):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        _config = json.load(f)
+                except Exception as e:
+                    print(f"⚠️ Không đọc được app reset config {path}: {e}")
+        return _config
+
+
+def device_model(dev) -> str:
+    """Model của device (cache theo device_id)"""
+    device_id = getattr(dev, "device_id", None) or "default"
+    model = _models.get(device_id)
+    if model is None:
+        model = "unknown"
+        try:
+            model = dev.d.device_info.get("model") or model
+        except Exception:
+            pass
+        _models[device_id] = model
+    return model
+
+
+def get_reset_profile(dev) -> Dict[str, Any]:
+    """Profile app reset của device: default <- models[model] <- devices[device_id] <- env"""
+    config = load_config()
+    profile = dict(DEFAULT_PROFILE)
+    profile.update(config.get("default", {}))
+    models = config.get("models", {})
+    if models:
+        profile.update(models.get(device_model(dev), {}))
+    profile.update(config.get("devices", {}).get(getattr(dev, "device_id", ""), {}))
+    if METHOD_OVERRIDE in METHODS:
+        profile["method"] = METHOD_OVERRIDE
+    return profile
+
+
+def build_reset_command(profile: Dict[str, Any]) -> str:
+    """Batch lệnh shell của profile, kết thúc bằng DONE_MARKER"""
+    commands = ["am kill-all"] if profile.get("kill_background", True) else []
+    commands += [f"am force-stop {package}" for package in profile.get("packages", [])]
+    commands.append(f"echo {DONE_MARKER}")
+    return "; ".join(commands)
+
+
+def shell_reset(dev, profile: Dict[str, Any], timeout: float = 15) -> bool:
+    """Chạy batch reset qua một lần d.shell(); True nếu batch chạy hết (thấy marker)"""
+    try:
+        response = dev.d.shell(build_reset_command(profile), timeout=timeout)
+    except Exception as e:
+        print(f"⚠️ Shell app reset lỗi trên {dev.device_id}: {e}")
+        return False
+    output = getattr(response, "output", response)
+    return DONE_MARKER in (output or "")
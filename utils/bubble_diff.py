@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Bubble Diff
+Xác minh tin nhắn đã gửi bằng cách so sánh hai snapshot hierarchy của danh
+sách tin nhắn (trước khi gửi / sau khi gửi) thay vì poll nhiều selector.
+
+Mỗi snapshot chỉ tốn một lần dump_hierarchy() (thay cho 3 selector exists +
+1 get_text mỗi vòng). Snapshot gồm các bubble có text trong message list
+theo thứ tự hiển thị, kèm bên gửi (outgoing = bubble lệch phải), và text
+đang nằm trong ô nhập.
+
+Diff căn theo đuôi: danh sách sau khi gửi bắt đầu bằng một đoạn đuôi của
+danh sách trước (bubble cũ có thể bị cuộn ra khỏi màn hình). Dòng trạng thái
+/ thời gian ("Đã nhận" -> "Đã xem", "10:35") đổi liên tục nên bị bỏ qua khi
+căn. Tin nhắn được coi là đã gửi khi số bubble gửi đi mang đúng nội dung
+tăng so với phần danh sách trước còn hiển thị - tin nhắn lặp lại ("ok",
+"ok") không bị nhận nhầm là bubble cũ.
+
+    before = take_snapshot(d.dump_hierarchy())
+    ... gửi ...
+    after = take_snapshot(d.dump_hierarchy())
+    if outgoing_bubble_added(before, after, message):
+        ...
+"""
+
+import re
+import xml.etree.ElementTree as ET
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+# Danh sách tin nhắn trong màn hình chat (id khác nhau theo version Zalo)
+MESSAGE_LIST_IDS = (
+    "com.zing.zalo:id/message_list",
+    "com.zing.zalo:id/chat_message_list",
+    "com.zing.zalo:id/recycler_view",
+)
+CHAT_INPUT_ID = "com.zing.zalo:id/chatinput_text"
+
+_BOUNDS = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+
+
+class Bubble(NamedTuple):
+    text: str
+    outgoing: Optional[bool]  # None nếu không đọc được bounds
+
+
+class Snapshot(NamedTuple):
+    bubbles: Tuple[Bubble, ...]
+    input_text: Optional[str]  # None nếu không thấy ô nhập
+    has_list: bool
+
+
+def normalize_text(text: Optional[str]) -> str:
+    return " ".join((text or "").split())
+
+
+# Dòng trạng thái / thời gian trong message list (không phải nội dung tin nhắn)
+STATUS_TEXTS = frozenset({
+    "đã gửi", "đang gửi", "đã nhận", "đã xem", "gửi lỗi", "gửi không thành công",
+    "vừa xong", "hôm nay", "hôm qua", "sent", "received", "seen", "delivered",
+})
+_TIMESTAMP = re.compile(r"^(\d{1,2}:\d{2}(\s*[ap]m)?|\d{1,2}/\d{1,2}(/\d{2,4})?)(\s+\d{1,2}:\d{2})?$", re.I)
+
+
+def is_status_row(text: str) -> bool:
+    """True nếu text là dòng trạng thái gửi / timestamp thay vì bubble tin nhắn"""
+    text = normalize_text(text).lower()
+    return text in STATUS_TEXTS or bool(_TIMESTAMP.match(text))
+
+
+def _bounds(node) -> Optional[Tuple[int, int, int, int]]:
+    match = _BOUNDS.match(node.get("bounds", ""))
+    return tuple(int(v) for v in match.groups()) if match else None
+
+
+def take_snapshot(xml: Optional[str], list_ids: Sequence[str] = MESSAGE_LIST_IDS) -> Optional[Snapshot]:
+    """Snapshot bubble của message list từ XML dump_hierarchy (None nếu XML lỗi)"""
+    if not xml:
+        return None
+    if "</hierarchy>" in xml:
+        xml = xml.split("</hierarchy>")[0] + "</hierarchy>"
+    try:
+        root = ET.fromstring(xml.encode("utf-8"))
+    except ET.ParseError:
+        return None
+
+    input_text = None
+    container = None
+    for node in root.iter("node"):
+        rid = node.get("resource-id", "")
+        if rid == CHAT_INPUT_ID and input_text is None:
+            input_text = normalize_text(node.get("text"))
+        elif container is None and rid in list_ids:
+            container = node
+    if container is None:
+        return Snapshot((), input_text, False)
+
+    list_bounds = _bounds(container)
+    center = (list_bounds[0] + list_bounds[2]) / 2 if list_bounds else None
+    bubbles: List[Bubble] = []
+    for node in container.iter("node"):
+        text = normalize_text(node.get("text"))
+        if node is container or not text:
+            continue
+        bounds = _bounds(node)
+        outgoing = None
+        if bounds and center is not None:
+            # Bubble của mình nằm lệch phải trong message list
+            outgoing = (bounds[0] + bounds[2]) / 2 > center
+        bubbles.append(Bubble(text, outgoing))
+    return Snapshot(tuple(bubbles), input_text, True)
+
+
+def content_bubbles(bubbles: Sequence[Bubble]) -> List[Bubble]:
+    """Bỏ dòng trạng thái / timestamp, chỉ giữ bubble nội dung"""
+    return [b for b in bubbles if not is_status_row(b.text)]
+
+
+def aligned_overlap(before: Sequence[Bubble], after: Sequence[Bubble]) -> Optional[int]:
+    """Số bubble đầu của after khớp với đuôi của before (None nếu không căn được)"""
+    before_texts = [b.text for b in before]
+    after_texts = [b.text for b in after]
+    for overlap in range(min(len(before_texts), len(after_texts)), 0, -1):
+        if after_texts[:overlap] == before_texts[len(before_texts) - overlap:]:
+            return overlap
+    return None
+
+
+def new_bubbles(before: Sequence[Bubble], after: Sequence[Bubble]) -> List[Bubble]:
+    """Bubble nội dung mới trong after (bỏ qua dòng trạng thái khi căn)"""
+    before, after = content_bubbles(before), content_bubbles(after)
+    overlap = aligned_overlap(before, after)
+    return list(after[overlap or 0:])
+
+
+def _count_outgoing(bubbles: Sequence[Bubble], expected: str) -> int:
+    return sum(1 for b in bubbles if b.text == expected and b.outgoing is not False)
+
+
+def outgoing_bubble_added(before: Optional[Snapshot], after: Optional[Snapshot], message: str) -> bool:
+    """True nếu số bubble gửi đi mang đúng nội dung message tăng lên
+
+    So với phần danh sách trước còn hiển thị trong after (đuôi đã căn); không căn
+    được thì so với toàn bộ before - thà báo chưa gửi (còn fallback input_cleared)
+    hơn là báo đã gửi khi chưa gửi.
+    """
+    if after is None or not after.has_list:
+        return False
+    expected = normalize_text(message)
+    baseline = content_bubbles(before.bubbles) if before is not None and before.has_list else []
+    current = content_bubbles(after.bubbles)
+    overlap = aligned_overlap(baseline, current)
+    retained = baseline[len(baseline) - overlap:] if overlap else baseline
+    return _count_outgoing(current, expected) > _count_outgoing(retained, expected)
+
+
+def input_cleared(snapshot: Optional[Snapshot], message: str) -> bool:
+    """Ô nhập không còn chứa message (dấu hiệu yếu: Zalo xóa ô nhập khi gửi)"""
+    if snapshot is None or snapshot.input_text is None:
+        return False
+    return normalize_text(message) not in snapshot.input_text
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+Capture Store
+Lưu UI dump, screenshot và device info khi debug / lỗi vào một kho nén,
+thay cho hàng nghìn file rời trong error_logs/ và debug_dumps/.
+
+Mỗi run automation (start_capture_run, gọi lúc bắt đầu run) ghi một archive
+append-only và một index:
+    captures/run_20240101_120000_1234_001.pack        các blob nén nối tiếp nhau
+    captures/run_20240101_120000_1234_001.idx.jsonl   mỗi capture một dòng
+        {"ts": 1704110400.123, "device": "...", "step": "friend_check", "kind": "hierarchy",
+         "hash": "3f2a...", "offset": 0, "length": 1834, "size": 20480, "codec": "zstd"}
+
+Blob được định danh theo nội dung (sha1): hierarchy giống hệt nhau trong
+cùng run chỉ ghi một lần, các capture sau chỉ thêm dòng index. Mỗi blob nén
+riêng (zstd nếu có package zstandard, không thì gzip) nên đọc lại được bằng
+offset. Khi tổng dung lượng vượt AUTOMATION_CAPTURE_MAX_MB, các run cũ nhất
+bị xóa (cả archive lẫn index). Archive hiện tại lớn hơn 1/4 giới hạn thì được
+cắt sang archive mới, nên process sống lâu (GUI, API) cũng không vượt giới hạn.
+
+Usage:
+    python -m utils.capture_store list --device 192.168.5.74:5555 --step friend_check
+    python -m utils.capture_store extract run_20240101_120000_1234_001.pack:3f2a... -o dump.xml
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+try:
+    import zstandard
+except ImportError:  # zstandard là optional, fallback gzip
+    zstandard = None
+
+CAPTURE_DIR = os.environ.get("AUTOMATION_CAPTURE_DIR", "captures")
+MAX_BYTES = int(float(os.environ.get("AUTOMATION_CAPTURE_MAX_MB", "500")) * 1024 * 1024)
+EVICT_EVERY = 100  # số capture giữa hai lần kiểm tra dung lượng
+PACK_FRACTION = 4  # archive hiện tại tối đa max_bytes / PACK_FRACTION
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Capture nén bằng zstd, cần cài package zstandard để đọc")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class CaptureStore:
+    """Archive append-only + index cho capture của một run, thread-safe"""
+
+    def __init__(self, root: str = CAPTURE_DIR, max_bytes: int = MAX_BYTES, codec: Optional[str] = None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.codec = codec or ("zstd" if zstandard is not None else "gzip")
+        self._seq = 0
+        self.run_id = self._next_run_id()
+        self._lock = threading.Lock()
+        self._blobs: Dict[str, Dict[str, Any]] = {}
+        self._pack = None
+        self._index = None
+        self._offset = 0
+        self._puts = 0
+
+    def _next_run_id(self) -> str:
+        self._seq += 1
+        return f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{self._seq:03d}"
+
+    def _close_files(self):
+        for handle in (self._pack, self._index):
+            if handle is not None:
+                handle.close()
+        self._pack = self._index = None
+
+    def _rotate(self):
+        """Đóng archive hiện tại, capture sau ghi vào archive mới (dedup bắt đầu lại)"""
+        self._close_files()
+        self.run_id = self._next_run_id()
+        self._blobs.clear()
+        self._offset = 0
+
+    def new_run(self):
+        """Bắt đầu archive cho một run automation mới (run trước thành run cũ, có thể bị evict)"""
+        with self._lock:
+            if self._pack is not None or self._blobs:
+                self._rotate()
+
+    @property
+    def pack_path(self) -> str:
+        return os.path.join(self.root, f"{self.run_id}.pack")
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.root, f"{self.run_id}.idx.jsonl")
+
+    def _open(self):
+        # Chỉ tạo file khi có capture đầu tiên
+        os.makedirs(self.root, exist_ok=True)
+        self.evict()
+        self._pack = open(self.pack_path, "ab")
+        self._index = open(self.index_path, "a", encoding="utf-8")
+        self._offset = self._pack.tell()
+
+    def put(self, device: str, step: str, kind: str, data: Union[bytes, str],
+            **meta) -> Dict[str, Any]:
+        """Lưu một capture (hierarchy, screenshot, info...) và trả về entry index"""
+        raw = data.encode("utf-8") if isinstance(data, str) else bytes(data)
+        digest = hashlib.sha1(raw).hexdigest()
+        with self._lock:
+            if self._pack is not None and self.max_bytes and self._offset >= self.max_bytes // PACK_FRACTION:
+                self._rotate()
+            if self._pack is None:
+                self._open()
+            blob = self._blobs.get(digest)
+            if blob is None:
+                compressed = _compress(raw, self.codec)
+                self._pack.write(compressed)
+                self._pack.flush()
+                blob = {"offset": self._offset, "length": len(compressed), "size": len(raw), "codec": self.codec}
+                self._offset += len(compressed)
+                self._blobs[digest] = blob
+            entry = {"ts": round(time.time(), 3), "device": device, "step": step, "kind": kind,
+                     "hash": digest, **blob, **meta}
+            self._index.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._index.flush()
+            self._puts += 1
+            if self._puts % EVICT_EVERY == 0:
+                self.evict()
+        entry["archive"] = os.path.basename(self.pack_path)
+        return entry
+
+    def evict(self) -> List[str]:
+        """Xóa các run cũ nhất cho tới khi tổng dung lượng <= max_bytes (không xóa run hiện tại)"""
+        if not self.max_bytes or not os.path.isdir(self.root):
+            return []
+        runs = {}
+        for item in os.scandir(self.root):
+            if item.name.endswith((".pack", ".idx.jsonl")):
+                run_id = item.name.split(".", 1)[0]
+                runs[run_id] = runs.get(run_id, 0) + item.stat().st_size
+        total = sum(runs.values())
+        removed = []
+        for run_id in sorted(runs):
+            if total <= self.max_bytes:
+                break
+            if run_id == self.run_id:
+                continue
+            for suffix in (".pack", ".idx.jsonl"):
+                try:
+                    os.remove(os.path.join(self.root, run_id + suffix))
+                except OSError:
+                    pass
+            total -= runs[run_id]
+            removed.append(run_id)
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._close_files()
+
+
+def iter_captures(root: str = CAPTURE_DIR, device: Optional[str] = None, step: Optional[str] = None,
+                  kind: Optional[str] = None, since: Optional[float] = None,
+                  until: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+    """Các entry index khớp bộ lọc (device, step chứa chuỗi, kind, khoảng thời gian), cũ -> mới"""
+    if not os.path.isdir(root):
+        return
+    for name in sorted(os.listdir(root)):
+        if not name.endswith(".idx.jsonl"):
+            continue
+        archive = name[:-len(".idx.jsonl")] + ".pack"
+        with open(os.path.join(root, name), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # dòng cuối bị cắt dở (process bị kill)
+                if device and entry.get("device") != device:
+                    continue
+                if step and step not in entry.get("step", ""):
+                    continue
+                if kind and entry.get("kind") != kind:
+                    continue
+                if since is not None and entry["ts"] < since:
+                    continue
+                if until is not None and entry["ts"] > until:
+                    continue
+                entry["archive"] = archive
+                yield entry
+
+
+def read_capture(entry: Dict[str, Any], root: str = CAPTURE_DIR) -> bytes:
+    """Nội dung gốc của một capture từ entry index"""
+    with open(os.path.join(root, entry["archive"]), "rb") as f:
+        f.seek(entry["offset"])
+        return _decompress(f.read(entry["length"]), entry.get("codec", "gzip"))
+
+
+def capture_ref(entry: Dict[str, Any]) -> str:
+    """Định danh ngắn của capture: <archive>:<hash>"""
+    return f"{entry['archive']}:{entry['hash']}"
+
+
+_store: Optional[CaptureStore] = None
+_store_lock = threading.Lock()
+
+
+def get_capture_store() -> CaptureStore:
+    """CaptureStore dùng chung của process (tạo khi cần)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CaptureStore()
+        return _store
+
+
+def start_capture_run():
+    """Capture của run automation mới ghi vào archive riêng (gọi lúc bắt đầu run)"""
+    get_capture_store().new_run()
+
+
+def store_capture(device: str, step: str, kind: str, data: Union[bytes, str], **meta) -> Optional[str]:
+    """Lưu capture vào store dùng chung, trả về ref (None nếu lỗi - capture không được làm hỏng flow)"""
+    try:
+        return capture_ref(get_capture_store().put(device, step, kind, data, **meta))
+    except Exception as e:
+        print(f"⚠️ Không lưu được capture {kind} ({step}): {e}")
+        return None
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Tra cứu / trích capture trong capture store")
+    parser.add_argument("--root", default=CAPTURE_DIR, help=f"Thư mục store (mặc định: {CAPTURE_DIR})")
+    sub = parser.add_subparsers(dest="command", required=True)
+    list_parser = sub.add_parser("list", help="Liệt kê capture")
+    list_parser.add_argument("--device")
+    list_parser.add_argument("--step", help="Lọc step chứa chuỗi này")
+    list_parser.add_argument("--kind", choices=["hierarchy", "screenshot", "info"])
+    list_parser.add_argument("--since", help="ISO time, vd. 2024-01-01T08:00")
+    list_parser.add_argument("--until", help="ISO time")
+    extract_parser = sub.add_parser("extract", help="Trích một capture ra file")
+    extract_parser.add_argument("ref", help="<archive>:<hash> (hash có thể viết tắt)")
+    extract_parser.add_argument("-o", "--output", help="File output (mặc định: stdout)")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for entry in iter_captures(args.root, args.device, args.step, args.kind,
+                                   _parse_time(args.since), _parse_time(args.until)):
+            stamp = datetime.fromtimestamp(entry["ts"]).isoformat(timespec="seconds")
+            print(f"{stamp}  {entry['device']:<22} {entry['kind']:<10} {entry['size']:>8}B  "
+                  f"{entry['step']}  {capture_ref(entry)}")
+        return 0
+
+    archive, _, prefix = args.ref.partition(":")
+    for entry in iter_captures(args.root):
+        if entry["archive"] == archive and entry["hash"].startswith(prefix):
+            data = read_capture(entry, args.root)
+            if args.output:
+                with open(args.output, "wb") as f:
+                    f.write(data)
+            else:
+                sys.stdout.buffer.write(data)
+            return 0
+    print(f"❌ Không tìm thấy capture {args.ref}", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,6 +6,7 @@ with automatic cleanup and validation functionality.
 
 import json
 import hashlib
+import threading
 import time
 import random
 import string
@@ -15,7 +16,7 @@ from datetime import datetime
 import logging
 
 from database.supabase_manager import SupabaseManager, get_supabase_manager
-from supabase import create_client
+from database.client_registry import get_supabase_client
 import os
 from dotenv import load_dotenv
 
@@ -23,6 +24,11 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Pair index: snapshot lifetime, retry delay after a failed load, rows per page
+PAIR_INDEX_TTL = float(os.getenv('PAIR_INDEX_TTL', '600'))
+PAIR_INDEX_RETRY_DELAY = float(os.getenv('PAIR_INDEX_RETRY_DELAY', '30'))
+PAIR_INDEX_PAGE_SIZE = int(os.getenv('PAIR_INDEX_PAGE_SIZE', '1000'))
+
 
 @dataclass
 class SummaryData:
@@ -140,21 +146,198 @@ class ConversationValidator:
         return ConversationInput(content=content, summary=summary)
 
 
+class PairIndex:
+    """Thread-safe in-memory index of device_pairs rows
+    
+    Pair IDs are deterministic (generate_pair_id), so after one bulk load at
+    start-up the hot path of find_or_create_pair is a dictionary lookup.
+    Rows are indexed by id, temp_pair_id and legacy pair_hash.
+    
+    The snapshot expires after `ttl` seconds (rows changed by other processes,
+    e.g. cleanup_database.py / migrate_pair_ids.py, are picked up on the next
+    reload) and can be dropped explicitly with invalidate(). A failed load is
+    not retried before `retry_delay` seconds (doubling up to `ttl`), so an
+    unreachable database does not cost a full-table query on every lookup.
+    """
+    
+    def __init__(self, ttl: float = PAIR_INDEX_TTL, retry_delay: float = PAIR_INDEX_RETRY_DELAY):
+        self.ttl = ttl
+        self.retry_delay = retry_delay
+        self._lock = threading.RLock()
+        self._by_id: Dict[str, DevicePair] = {}
+        self._by_temp_id: Dict[str, DevicePair] = {}
+        self._by_hash: Dict[str, DevicePair] = {}
+        self._loaded_at: Optional[float] = None
+        self._failures = 0
+        self._retry_at = 0.0
+    
+    def __len__(self) -> int:
+        return len(self._by_id)
+    
+    @property
+    def warmed(self) -> bool:
+        """True while the last full snapshot is younger than ttl"""
+        loaded_at = self._loaded_at
+        return loaded_at is not None and time.monotonic() - loaded_at < self.ttl
+    
+    def needs_warm(self) -> bool:
+        """Snapshot missing/expired and not backing off after a failed load"""
+        return not self.warmed and time.monotonic() >= self._retry_at
+    
+    def add(self, pair: DevicePair):
+        with self._lock:
+            self._by_id[pair.id] = pair
+            if pair.temp_pair_id:
+                self._by_temp_id[pair.temp_pair_id] = pair
+            if pair.pair_hash:
+                self._by_hash[pair.pair_hash] = pair
+    
+    def discard(self, pair_id: str):
+        """Drop one row (deleted or re-keyed pair)"""
+        with self._lock:
+            pair = self._by_id.pop(pair_id, None)
+            if pair is None:
+                return
+            if pair.temp_pair_id and self._by_temp_id.get(pair.temp_pair_id) is pair:
+                del self._by_temp_id[pair.temp_pair_id]
+            if pair.pair_hash and self._by_hash.get(pair.pair_hash) is pair:
+                del self._by_hash[pair.pair_hash]
+    
+    def get(self, pair_id: str) -> Optional[DevicePair]:
+        return self._by_id.get(pair_id)
+    
+    def get_by_temp_id(self, temp_pair_id: str) -> Optional[DevicePair]:
+        return self._by_temp_id.get(temp_pair_id)
+    
+    def get_by_hash(self, pair_hash: str) -> Optional[DevicePair]:
+        return self._by_hash.get(pair_hash)
+    
+    def load(self, pairs: List[DevicePair]):
+        """Replace index content with a full table snapshot"""
+        with self._lock:
+            self._by_id.clear()
+            self._by_temp_id.clear()
+            self._by_hash.clear()
+            for pair in pairs:
+                self.add(pair)
+            self._loaded_at = time.monotonic()
+            self._failures = 0
+            self._retry_at = 0.0
+    
+    def load_failed(self):
+        """Record a failed load: back off before the next attempt"""
+        with self._lock:
+            delay = min(self.retry_delay * (2 ** self._failures), max(self.ttl, self.retry_delay))
+            self._failures += 1
+            self._retry_at = time.monotonic() + delay
+    
+    def invalidate(self):
+        """Mark the snapshot stale; rows stay usable until the next reload replaces them"""
+        with self._lock:
+            self._loaded_at = None
+            self._failures = 0
+            self._retry_at = 0.0
+    
+    def clear(self):
+        with self._lock:
+            self._by_id.clear()
+            self._by_temp_id.clear()
+            self._by_hash.clear()
+            self._loaded_at = None
+            self._failures = 0
+            self._retry_at = 0.0
+
+
+# Shared by every DevicePairManager in the process
+_pair_index = PairIndex()
+
+
+def _row_to_pair(pair_data: Dict[str, Any]) -> DevicePair:
+    """Build DevicePair from a device_pairs row"""
+    return DevicePair(
+        id=pair_data['id'],
+        device_a=pair_data['device_a'],
+        device_b=pair_data['device_b'],
+        pair_hash=pair_data['pair_hash'],
+        temp_pair_id=pair_data['temp_pair_id'],
+        created_at=pair_data['created_at']
+    )
+
+
 class DevicePairManager:
     """Manages device pairs and temporary ID mapping"""
     
     def __init__(self, supabase_manager: SupabaseManager = None):
-        # Initialize supabase client directly
-        url = os.getenv('SUPABASE_URL')
-        key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
-        self.supabase = create_client(url, key)
+        # Shared process-wide client (one connection pool for all managers)
+        self.supabase = supabase_manager.get_client() if supabase_manager else get_supabase_client()
         self._temp_mapping: Dict[str, str] = {}  # temp_pair_id -> pair_id
         self._conversation_mapping: Dict[str, str] = {}  # temp_conversation_id -> conversation_id
+        self.pair_index = _pair_index
         
     def _get_client(self):
         """Get Supabase client"""
         return self.supabase
     
+    def warm_pair_index(self, force: bool = False) -> int:
+        """Load all device_pairs into the shared index (paged bulk query)
+        
+        No-op while the snapshot is fresh or a previous failure is backing off,
+        unless force=True.
+        """
+        if not force and not self.pair_index.needs_warm():
+            return len(self.pair_index)
+        try:
+            pairs = [_row_to_pair(row) for row in self._fetch_all_pair_rows()]
+            self.pair_index.load(pairs)
+            logger.info(f"Pair index warmed with {len(pairs)} pairs")
+            return len(pairs)
+        except Exception as e:
+            self.pair_index.load_failed()
+            logger.warning(f"Could not warm pair index: {e}")
+            return 0
+    
+    def _fetch_all_pair_rows(self) -> List[Dict[str, Any]]:
+        """Every device_pairs row, PAIR_INDEX_PAGE_SIZE rows per request
+        
+        PostgREST caps an unpaged select (1000 rows by default), so a single
+        select('*') silently returns a truncated table.
+        """
+        rows: List[Dict[str, Any]] = []
+        start = 0
+        while True:
+            result = self._get_client().table('device_pairs')\
+                .select('*')\
+                .order('id')\
+                .range(start, start + PAIR_INDEX_PAGE_SIZE - 1)\
+                .execute()
+            page = result.data or []
+            rows.extend(page)
+            if len(page) < PAIR_INDEX_PAGE_SIZE:
+                return rows
+            start += PAIR_INDEX_PAGE_SIZE
+    
+    def invalidate_pair_index(self, pair_id: Optional[str] = None):
+        """Drop one cached pair, or mark the whole index stale (reloaded on next lookup)"""
+        if pair_id is None:
+            self.pair_index.invalidate()
+        else:
+            self.pair_index.discard(pair_id)
+    
+    def _lookup_cached_pair(self, pair_id: str, pair_hash: str) -> Optional[DevicePair]:
+        """Resolve pair from the in-memory index (by id, then legacy pair_hash)"""
+        self.warm_pair_index()
+        return self.pair_index.get(pair_id) or self.pair_index.get_by_hash(pair_hash)
+    
+    def _new_pair_row(self, device_a: str, device_b: str) -> Dict[str, Any]:
+        """Row for a new device_pairs record with standardized ID"""
+        return {
+            'id': self.create_pair_id(device_a, device_b),  # Use standardized pair_id as primary key
+            'device_a': device_a,
+            'device_b': device_b,
+            'pair_hash': self.create_pair_hash(device_a, device_b),
+            'temp_pair_id': self.generate_temp_pair_id()
+        }
+    
     def generate_temp_pair_id(self) -> str:
         """Generate temporary pair ID"""
         timestamp = int(time.time())
@@ -179,7 +362,6 @@ class DevicePairManager:
     
     def _find_or_create_pair_sync(self, device_a: str, device_b: str) -> DevicePair:
         """Sync version of find_or_create_pair"""
-        supabase = self._get_client()
         try:
             # Ensure device_a and device_b are strings
             device_a_str = str(device_a)
@@ -188,92 +370,112 @@ class DevicePairManager:
             pair_id = self.create_pair_id(device_a_str, device_b_str)
             pair_hash = self.create_pair_hash(device_a_str, device_b_str)  # Keep for backward compatibility
             
-            # Try to find existing pair by pair_id first, then by pair_hash
-            try:
-                # First try to find by standardized pair_id
-                result = supabase.table('device_pairs').select('*').eq('id', pair_id).execute()
-                
-                if result.data:
-                    pair_data = result.data[0]
-                    return DevicePair(
-                        id=pair_data['id'],
-                        device_a=pair_data['device_a'],
-                        device_b=pair_data['device_b'],
-                        pair_hash=pair_data['pair_hash'],
-                        temp_pair_id=pair_data['temp_pair_id'],
-                        created_at=pair_data['created_at']
-                    )
-                
-                # Fallback: try to find by pair_hash for backward compatibility
-                result = supabase.table('device_pairs').select('*').eq('pair_hash', pair_hash).execute()
-                
-                if result.data:
-                    pair_data = result.data[0]
-                    return DevicePair(
-                        id=pair_data['id'],
-                        device_a=pair_data['device_a'],
-                        device_b=pair_data['device_b'],
-                        pair_hash=pair_data['pair_hash'],
-                        temp_pair_id=pair_data['temp_pair_id'],
-                        created_at=pair_data['created_at']
-                    )
-            except Exception as find_error:
-                logger.warning(f"Error finding existing pair: {find_error}")
-            
-            # Create new pair with standardized ID
-            temp_pair_id = self.generate_temp_pair_id()
-            new_pair = {
-                'id': pair_id,  # Use standardized pair_id as primary key
-                'device_a': device_a_str,
-                'device_b': device_b_str,
-                'pair_hash': pair_hash,
-                'temp_pair_id': temp_pair_id
-            }
+            # Hot path: deterministic pair_id resolved from the in-memory index
+            cached = self._lookup_cached_pair(pair_id, pair_hash)
+            if cached:
+                return cached
             
             try:
-                result = supabase.table('device_pairs').upsert(new_pair).execute()
-                
-                if result.data:
-                    pair_data = result.data[0]
-                    return DevicePair(
-                        id=pair_data['id'],
-                        device_a=pair_data['device_a'],
-                        device_b=pair_data['device_b'],
-                        pair_hash=pair_data['pair_hash'],
-                        temp_pair_id=pair_data['temp_pair_id'],
-                        created_at=pair_data['created_at']
-                    )
-                
-                raise Exception("Failed to create device pair - no data returned")
-                
-            except Exception as create_error:
-                logger.error(f"Error creating new pair: {create_error}")
-                raise Exception(f"Failed to create device pair: {create_error}")
+                pairs = self._create_pairs([self._new_pair_row(device_a_str, device_b_str)])
+            except Exception:
+                # Legacy row with the same pair_hash but a non-standard id (created after warm-up)
+                result = self._get_client().table('device_pairs').select('*').eq('pair_hash', pair_hash).execute()
+                if not result.data:
+                    raise
+                pairs = [_row_to_pair(result.data[0])]
+                self.pair_index.add(pairs[0])
+            
+            if pairs:
+                return pairs[0]
+            
+            raise Exception("Failed to create device pair - no data returned")
             
         except Exception as e:
             logger.error(f"Error finding/creating device pair: {str(e)}")
             raise
     
+    def _create_pairs(self, rows: List[Dict[str, Any]]) -> List[DevicePair]:
+        """Create-if-absent for many pairs: one upsert, plus one select for rows that already existed"""
+        supabase = self._get_client()
+        try:
+            # ignore_duplicates keeps the existing temp_pair_id of pairs created concurrently
+            result = supabase.table('device_pairs')\
+                .upsert(rows, on_conflict='id', ignore_duplicates=True)\
+                .execute()
+            for row in (result.data or []):
+                self.pair_index.add(_row_to_pair(row))
+            
+            missing = [row['id'] for row in rows if not self.pair_index.get(row['id'])]
+            if missing:
+                result = supabase.table('device_pairs').select('*').in_('id', missing).execute()
+                for row in (result.data or []):
+                    self.pair_index.add(_row_to_pair(row))
+            
+            return [self.pair_index.get(row['id']) for row in rows if self.pair_index.get(row['id'])]
+            
+        except Exception as create_error:
+            logger.error(f"Error creating new pair: {create_error}")
+            raise Exception(f"Failed to create device pair: {create_error}")
+    
+    def find_or_create_pairs(self, device_pairs: List[Tuple[str, str]]) -> List[Optional[DevicePair]]:
+        """Bulk find_or_create_pair for a whole fleet (result order matches input)
+        
+        If the bulk upsert fails (e.g. a legacy row holds the same UNIQUE pair_hash
+        under a non-standard id), the unresolved pairs are retried one by one through
+        find_or_create_pair; a pair that still fails is returned as None instead of
+        failing the whole batch.
+        """
+        resolved: Dict[str, DevicePair] = {}
+        to_create: Dict[str, Dict[str, Any]] = {}
+        pair_ids = []
+        
+        for device_a, device_b in device_pairs:
+            device_a_str, device_b_str = str(device_a), str(device_b)
+            pair_id = self.create_pair_id(device_a_str, device_b_str)
+            pair_ids.append(pair_id)
+            
+            cached = self._lookup_cached_pair(pair_id, self.create_pair_hash(device_a_str, device_b_str))
+            if cached:
+                resolved[pair_id] = cached
+            elif pair_id not in to_create:
+                to_create[pair_id] = self._new_pair_row(device_a_str, device_b_str)
+        
+        if to_create:
+            try:
+                for pair in self._create_pairs(list(to_create.values())):
+                    resolved[pair.id] = pair
+            except Exception as batch_error:
+                logger.warning(f"Bulk pair upsert failed, retrying {len(to_create)} pairs one by one: {batch_error}")
+        
+        for pair_id, row in to_create.items():
+            if pair_id in resolved:
+                continue
+            try:
+                resolved[pair_id] = self._find_or_create_pair_sync(row['device_a'], row['device_b'])
+            except Exception as e:
+                logger.error(f"Failed to create device pair {pair_id}: {e}")
+        
+        return [resolved.get(pair_id) for pair_id in pair_ids]
+    
     def find_or_create_pair(self, device_a: str, device_b: str) -> DevicePair:
         """Find existing pair or create new one"""
         return self._find_or_create_pair_sync(device_a, device_b)
     
     def _get_pair_by_temp_id_sync(self, temp_pair_id: str) -> Optional[DevicePair]:
         """Sync version of get_pair_by_temp_id"""
+        self.warm_pair_index()
+        cached = self.pair_index.get_by_temp_id(temp_pair_id)
+        if cached:
+            return cached
+        
         supabase = self._get_client()
         try:
             result = supabase.table('device_pairs').select('*').eq('temp_pair_id', temp_pair_id).execute()
             
             if result.data:
-                pair_data = result.data[0]
-                return DevicePair(
-                    id=pair_data['id'],
-                    device_a=pair_data['device_a'],
-                    device_b=pair_data['device_b'],
-                    pair_hash=pair_data['pair_hash'],
-                    temp_pair_id=pair_data['temp_pair_id'],
-                    created_at=pair_data['created_at']
-                )
+                pair = _row_to_pair(result.data[0])
+                self.pair_index.add(pair)
+                return pair
             
             return None
             
@@ -287,20 +489,19 @@ class DevicePairManager:
     
     def _get_pair_by_id_sync(self, pair_id: str) -> Optional[DevicePair]:
         """Sync version of get_pair_by_id"""
+        self.warm_pair_index()
+        cached = self.pair_index.get(pair_id)
+        if cached:
+            return cached
+        
         supabase = self._get_client()
         try:
             result = supabase.table('device_pairs').select('*').eq('id', pair_id).execute()
             
             if result.data:
-                pair_data = result.data[0]
-                return DevicePair(
-                    id=pair_data['id'],
-                    device_a=pair_data['device_a'],
-                    device_b=pair_data['device_b'],
-                    pair_hash=pair_data['pair_hash'],
-                    temp_pair_id=pair_data['temp_pair_id'],
-                    created_at=pair_data['created_at']
-                )
+                pair = _row_to_pair(result.data[0])
+                self.pair_index.add(pair)
+                return pair
             
             return None
             
@@ -347,10 +548,8 @@ class SummaryManager:
     MAX_SUMMARIES_PER_PAIR = 3
     
     def __init__(self, supabase_manager: SupabaseManager = None):
-        # Initialize supabase client directly
-        url = os.getenv('SUPABASE_URL')
-        key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
-        self.supabase = create_client(url, key)
+        # Shared process-wide client (one connection pool for all managers)
+        self.supabase = supabase_manager.get_client() if supabase_manager else get_supabase_client()
         
     def _get_client(self):
         """Get Supabase client"""
@@ -470,12 +669,10 @@ class ConversationManager:
     """Main conversation management class"""
     
     def __init__(self, supabase_manager: SupabaseManager = None):
-        # Initialize supabase client directly
-        url = os.getenv('SUPABASE_URL')
-        key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
-        self.supabase = create_client(url, key)
-        self.pair_manager = DevicePairManager()
-        self.summary_manager = SummaryManager()
+        # Shared process-wide client (one connection pool for all managers)
+        self.supabase = supabase_manager.get_client() if supabase_manager else get_supabase_client()
+        self.pair_manager = DevicePairManager(supabase_manager)
+        self.summary_manager = SummaryManager(supabase_manager)
         self.validator = ConversationValidator()
         self._temporary_content: Dict[str, ConversationContent] = {}  # temp_conversation_id -> content
         
@@ -598,14 +795,9 @@ class ConversationManager:
             pairs = []
             if result.data:
                 for pair_data in result.data:
-                    pairs.append(DevicePair(
-                        id=pair_data['id'],
-                        device_a=pair_data['device_a'],
-                        device_b=pair_data['device_b'],
-                        pair_hash=pair_data['pair_hash'],
-                        temp_pair_id=pair_data['temp_pair_id'],
-                        created_at=pair_data['created_at']
-                    ))
+                    pair = _row_to_pair(pair_data)
+                    self.pair_manager.pair_index.add(pair)
+                    pairs.append(pair)
             
             return pairs
             
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Conversation Plan
+Compile hội thoại của một cặp máy một lần thành plan bất biến dùng chung cho
+cả hai device worker, thay cho việc mỗi máy tự load_conversation_from_file
+(Supabase + tối đa 2 file JSON fallback) rồi chuẩn hóa lại từ đầu.
+
+Plan là tuple các PlanMessage(message_id, sender, text, delay):
+    - 3 format tin nhắn được chuẩn hóa một lần:
+        {"message_id", "device_number", "content"}
+        {"device_number", "content"}          (message_id tự đánh số)
+        {"sender", "message"}                 (format cũ)
+    - delay (smart delay trước khi gửi) tính sẵn, tin nhắn đầu không delay
+    - kiểm tra trước khi chạy: sender là 1/2, text không rỗng, message_id
+      liên tục 1..n (sync current_message_id chờ đúng id kế tiếp, id lệch
+      thì máy kia đợi tới timeout) -> ConversationPlanError
+
+    plan = get_plan_registry().get_or_compile(group_id, load_conversation_from_file, refresh=True)
+    dev.conversation_plan = plan          # scheduler gắn cho cả hai máy trong cặp
+    for msg in plan.messages_for(role):   # run_conversation
+        ...
+
+Máy chạy không qua scheduler (main_multi_device, hot reload) lấy plan qua
+get_or_compile(): máy đầu của nhóm load + compile, máy còn lại chờ và dùng
+chung; plan quá AUTOMATION_PLAN_MAX_AGE giây (mặc định 300) thì compile lại.
+
+AUTOMATION_PLAN_SEED cố định seed random của delay (benchmark lặp lại được).
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from utils import metrics
+
+PLAN_MAX_AGE = float(os.environ.get("AUTOMATION_PLAN_MAX_AGE", "300"))
+PLAN_SEED = os.environ.get("AUTOMATION_PLAN_SEED")
+SENDER_ROLES = (1, 2)
+CONVERSATION_PLAN_TOTAL = "automation_conversation_plan_total"
+
+
+class ConversationPlanError(ValueError):
+    """Dữ liệu hội thoại không hợp lệ (phát hiện lúc compile, trước khi chạy)"""
+
+
+class PlanMessage(NamedTuple):
+    message_id: int
+    sender: int  # role_in_group của máy gửi
+    text: str
+    delay: float  # smart delay (giây) trước khi gửi
+
+
+class ConversationPlan(NamedTuple):
+    group_id: Any
+    messages: Tuple[PlanMessage, ...]
+    digest: str
+    compiled_at: float
+
+    def messages_for(self, role: int) -> Tuple[PlanMessage, ...]:
+        return tuple(msg for msg in self.messages if msg.sender == role)
+
+    def as_records(self) -> List[Dict[str, Any]]:
+        """Dạng {"message_id", "device_number", "content"} (ghi session / conversation_data.json)"""
+        return [{"message_id": msg.message_id, "device_number": msg.sender, "content": msg.text}
+                for msg in self.messages]
+
+
+def smart_delay(is_first_message: bool = False, rng: Optional[random.Random] = None) -> float:
+    """Delay trước khi gửi: 70% tin nhắn nhanh (5-15s), 30% chậm (30-60s), tin nhắn đầu 1-3s"""
+    rng = rng or random
+    if is_first_message:
+        return rng.uniform(1, 3)
+    if rng.random() < 0.7:
+        return rng.uniform(5, 15)
+    return rng.uniform(30, 60)
+
+
+def normalize_messages(raw_messages: Optional[Iterable[Any]]) -> List[Tuple[Any, Any, Any]]:
+    """3 format tin nhắn -> [(message_id, sender, text)] theo thứ tự; entry lạ raise ConversationPlanError"""
+    normalized = []
+    for index, msg in enumerate(raw_messages or [], 1):
+        if not isinstance(msg, dict):
+            raise ConversationPlanError(f"Tin nhắn #{index} không phải dict: {msg!r}")
+        if 'device_number' in msg and 'content' in msg:
+            message_id = msg.get('message_id', len(normalized) + 1)
+            normalized.append((message_id, msg['device_number'], msg['content']))
+        elif 'sender' in msg and 'message' in msg:
+            normalized.append((len(normalized) + 1, msg['sender'], msg['message']))
+        else:
+            raise ConversationPlanError(f"Tin nhắn #{index} sai format: {msg!r}")
+    return normalized
+
+
+def compile_plan(group_id: Any, raw_messages: Optional[Iterable[Any]], seed: Any = PLAN_SEED) -> ConversationPlan:
+    """Chuẩn hóa + kiểm tra + tính sẵn delay; lỗi dữ liệu raise ConversationPlanError"""
+    normalized = normalize_messages(raw_messages)
+    if not normalized:
+        raise ConversationPlanError(f"Nhóm {group_id} không có tin nhắn nào")
+
+    rng = random.Random(f"{seed}:{group_id}") if seed is not None else random.Random()
+    messages = []
+    for expected_id, (message_id, sender, text) in enumerate(normalized, 1):
+        try:
+            message_id, sender = int(message_id), int(sender)
+        except (TypeError, ValueError):
+            raise ConversationPlanError(f"message_id/sender không phải số ở tin nhắn #{expected_id}: "
+                                        f"{message_id!r}/{sender!r}") from None
+        if message_id != expected_id:
+            raise ConversationPlanError(f"message_id phải liên tục 1..{len(normalized)}, "
+                                        f"tin nhắn #{expected_id} có message_id {message_id}")
+        if sender not in SENDER_ROLES:
+            raise ConversationPlanError(f"message_id {message_id}: sender {sender} không phải máy 1/2")
+        text = str(text or "").strip()
+        if not text:
+            raise ConversationPlanError(f"message_id {message_id}: nội dung rỗng")
+        # Tin nhắn đầu gửi ngay (trước đây vẫn random 1-3s nhưng không dùng)
+        delay = 0.0 if message_id == 1 else round(smart_delay(False, rng), 3)
+        messages.append(PlanMessage(message_id, sender, text, delay))
+
+    digest = hashlib.sha256(json.dumps([m[:3] for m in messages], ensure_ascii=False).encode("utf-8")).hexdigest()
+    return ConversationPlan(group_id, tuple(messages), digest[:16], time.time())
+
+
+class PlanRegistry:
+    """Plan theo group_id dùng chung giữa các device thread; mỗi nhóm chỉ load/compile một lần"""
+
+    def __init__(self, max_age: float = PLAN_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._plans: Dict[Any, ConversationPlan] = {}
+        self._group_locks: Dict[Any, threading.Lock] = {}
+
+    def _group_lock(self, group_id: Any) -> threading.Lock:
+        with self._lock:
+            return self._group_locks.setdefault(group_id, threading.Lock())
+
+    def get(self, group_id: Any) -> Optional[ConversationPlan]:
+        """Plan còn hạn của nhóm (None nếu chưa có / quá max_age)"""
+        with self._lock:
+            plan = self._plans.get(group_id)
+        if plan is None or time.time() - plan.compiled_at > self.max_age:
+            return None
+        return plan
+
+    def publish(self, plan: ConversationPlan):
+        with self._lock:
+            self._plans[plan.group_id] = plan
+
+    def discard(self, group_id: Any):
+        with self._lock:
+            self._plans.pop(group_id, None)
+
+    def get_or_compile(self, group_id: Any, loader: Callable[[Any], Any], refresh: bool = False,
+                       seed: Any = PLAN_SEED) -> ConversationPlan:
+        """Plan của nhóm; chưa có (hoặc refresh) thì loader(group_id) + compile, thread khác chờ kết quả"""
+        with self._group_lock(group_id):
+            plan = None if refresh else self.get(group_id)
+            if plan is not None:
+                metrics.inc(CONVERSATION_PLAN_TOTAL, result="shared")
+                return plan
+            try:
+                plan = compile_plan(group_id, loader(group_id), seed)
+            except ConversationPlanError:
+                metrics.inc(CONVERSATION_PLAN_TOTAL, result="invalid")
+                raise
+            self.publish(plan)
+            metrics.inc(CONVERSATION_PLAN_TOTAL, result="compiled")
+            return plan
+
+
+_registry: Optional[PlanRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_plan_registry() -> PlanRegistry:
+    """PlanRegistry dùng chung của process"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PlanRegistry()
+        return _registry
@@ -6,19 +6,24 @@ Quản lý tập trung dữ liệu devices và phone mapping với Supabase và
 
 import json
 import os
+import threading
 import time
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 
-# Import Supabase repositories
-try:
-    from database.device_repository import DeviceRepository
-    from database.log_repository import LogRepository
-    from database.supabase_manager import SupabaseManager
-    SUPABASE_AVAILABLE = True
-except ImportError as e:
-    print(f"[WARNING] Supabase repositories not available: {e}")
-    SUPABASE_AVAILABLE = False
+from utils.lazy import LazyObject
+
+
+def _import_supabase_repositories():
+    """Import Supabase repositories (supabase client, httpx...) khi DataManager khởi tạo; None nếu thiếu package"""
+    try:
+        from database.device_repository import DeviceRepository
+        from database.log_repository import LogRepository
+        from database.supabase_manager import get_supabase_manager
+        return DeviceRepository, LogRepository, get_supabase_manager
+    except ImportError as e:
+        print(f"[WARNING] Supabase repositories not available: {e}")
+        return None
 
 class DataManager:
     """Singleton class quản lý tập trung dữ liệu với Supabase và JSON fallback"""
@@ -57,9 +62,11 @@ class DataManager:
     def _initialize_data_sources(self):
         """Initialize Supabase repositories or fallback to JSON"""
         try:
-            if SUPABASE_AVAILABLE:
+            repositories = _import_supabase_repositories()
+            if repositories:
+                DeviceRepository, LogRepository, get_supabase_manager = repositories
                 # Try to initialize Supabase
-                supabase_manager = SupabaseManager()
+                supabase_manager = get_supabase_manager()
                 if supabase_manager.test_connection():
                     self.device_repo = DeviceRepository()
                     self.log_repo = LogRepository()
@@ -865,5 +872,12 @@ class DataManager:
             print(f"[ERROR] Error logging action: {e}")
             return False
 
-# Singleton instance
-data_manager = DataManager()
\ No newline at end of file
+_data_manager_lock = threading.Lock()
+
+def get_data_manager() -> DataManager:
+    """DataManager dùng chung của process (kết nối Supabase ở lần gọi đầu)"""
+    with _data_manager_lock:
+        return DataManager()
+
+# Singleton instance - khởi tạo (test_connection Supabase) ở lần dùng đầu, không phải lúc import
+data_manager = LazyObject(get_data_manager, "data_manager")
\ No newline at end of file
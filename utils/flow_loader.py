@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Flow Loader
+Compile vùng "=== FLOW START/END ===" một lần cho mỗi nội dung file và dùng
+chung code object cho mọi worker, thay cho việc mỗi device thread đọc lại
+file ~5000 dòng, regex tìm markers rồi compile lại (~50ms CPU giữ GIL mỗi
+lần, x40 device khi launch).
+
+Cache theo (path, mtime, size) -> sha256 vùng FLOW -> code object:
+    - stat không đổi: trả code object ngay, không đọc file
+    - stat đổi nhưng vùng FLOW không đổi (touch, editor lưu lại, sửa phần
+      khác của file mà không lệch dòng): chỉ hash lại
+    - nội dung đổi: compile lại một lần (thread khác chờ kết quả chứ không
+      compile song song)
+Nội dung mới bị lỗi cú pháp thì giữ bản compile tốt gần nhất (cảnh báo),
+để một lần lưu dở không làm hỏng cả đợt launch.
+
+Mỗi lần load vẫn exec code object vào namespace riêng (globals của flow như
+PHONE_MAP không bị chia sẻ giữa các worker); exec chỉ định nghĩa hàm nên rẻ.
+
+Hot reload: revalidate_async() compile ở thread nền và chỉ báo về khi xong,
+nên watchdog event không chặn thread đang launch device.
+
+Code được compile với filename thật và giữ nguyên số dòng của vùng FLOW
+trong file, traceback trỏ đúng dòng trong core1.py.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from utils import metrics
+
+FLOW_PATTERN = re.compile(r"#\s*===\s*FLOW START\s*===\s*(.*?)#\s*===\s*FLOW END\s*===", re.S)
+FLOW_COMPILE_TOTAL = "automation_flow_compile_total"
+FLOW_COMPILE_SECONDS = "automation_flow_compile_seconds"
+MAX_COMPILED = int(os.environ.get("AUTOMATION_FLOW_CACHE_SIZE", "16"))
+
+
+class FlowRegionMissing(RuntimeError):
+    """File không có vùng FLOW START/END (khi bắt buộc có markers)"""
+
+
+class CompiledFlow(NamedTuple):
+    path: str
+    digest: str
+    code: Any  # code object
+    seconds: float
+
+
+def content_digest(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def source_digest(content: str, require_markers: bool = True) -> str:
+    """Digest của source thực sự được compile (sửa ngoài vùng FLOW mà không lệch dòng thì không đổi)"""
+    return content_digest(flow_region(content, require_markers))
+
+
+def flow_region(content: str, require_markers: bool = True) -> str:
+    """Source của vùng FLOW, đệm dòng trống để số dòng khớp với file gốc
+
+    Không có markers: lỗi nếu require_markers, ngược lại dùng cả file.
+    """
+    match = FLOW_PATTERN.search(content)
+    if not match:
+        if require_markers:
+            raise FlowRegionMissing("Không tìm thấy vùng FLOW trong file (markers).")
+        return content
+    return "\n" * content.count("\n", 0, match.start(1)) + match.group(1)
+
+
+class FlowCodeCache:
+    """Cache code object của vùng FLOW theo path + nội dung, dùng chung giữa các thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # path -> (mtime_ns, size) của lần đọc gần nhất
+        self._stats: Dict[str, Tuple[int, int]] = {}
+        # path -> ((mtime_ns, size), SyntaxError) khi nội dung hiện tại lỗi cú pháp
+        self._failed: Dict[str, Tuple[Tuple[int, int], SyntaxError]] = {}
+        # path -> CompiledFlow tốt gần nhất
+        self._current: Dict[str, CompiledFlow] = {}
+        # (digest, require_markers) -> CompiledFlow (nội dung giống nhau ở path khác cũng dùng lại)
+        self._by_digest: "OrderedDict[Tuple[str, bool], CompiledFlow]" = OrderedDict()
+        self._compile_locks: Dict[str, threading.Lock] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _path_lock(self, path: str) -> threading.Lock:
+        with self._lock:
+            return self._compile_locks.setdefault(path, threading.Lock())
+
+    def compile_source(self, content: str, filename: str = "<flow>", require_markers: bool = True) -> CompiledFlow:
+        """Code object của content (compile lại chỉ khi nội dung chưa gặp); lỗi cú pháp raise"""
+        source = flow_region(content, require_markers)
+        digest = content_digest(source)
+        key = (digest, require_markers)
+        with self._lock:
+            cached = self._by_digest.get(key)
+            if cached is not None:
+                self._by_digest.move_to_end(key)
+        if cached is not None:
+            metrics.inc(FLOW_COMPILE_TOTAL, result="hit")
+            return cached
+        started = time.perf_counter()
+        code = compile(source, filename, "exec")
+        elapsed = time.perf_counter() - started
+        metrics.observe(FLOW_COMPILE_SECONDS, elapsed)
+        compiled = CompiledFlow(filename, digest, code, round(elapsed, 4))
+        with self._lock:
+            self._by_digest[key] = compiled
+            # Mỗi lần lưu file khi hot reload thêm một bản: chỉ giữ các bản gần nhất
+            while len(self._by_digest) > MAX_COMPILED:
+                self._by_digest.popitem(last=False)
+        metrics.inc(FLOW_COMPILE_TOTAL, result="compiled")
+        return compiled
+
+    def get(self, path: str, require_markers: bool = True, keep_last_good: bool = True) -> CompiledFlow:
+        """CompiledFlow của file (xem docstring module về các mức cache)
+
+        keep_last_good=False: nội dung mới lỗi cú pháp thì raise thay vì trả bản cũ.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        with self._path_lock(path):
+            with self._lock:
+                current = self._current.get(path)
+                if current is not None and self._stats.get(path) == stat_key:
+                    failed = self._failed.get(path)
+                    if failed is not None and failed[0] == stat_key and not keep_last_good:
+                        raise failed[1]
+                    return current
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+            try:
+                compiled = self.compile_source(content, path, require_markers)
+            except SyntaxError as e:
+                if current is None or not keep_last_good:
+                    raise
+                print(f"⚠️ Flow {path} lỗi cú pháp ({e}), giữ bản compile trước")
+                metrics.inc(FLOW_COMPILE_TOTAL, result="syntax_error")
+                with self._lock:
+                    self._stats[path] = stat_key
+                    self._failed[path] = (stat_key, e)
+                return current
+            with self._lock:
+                self._stats[path] = stat_key
+                self._current[path] = compiled
+                self._failed.pop(path, None)
+            return compiled
+
+    def load(self, path: str, namespace: Dict[str, Any], require_markers: bool = True) -> Dict[str, Any]:
+        """Exec code object của file vào namespace (riêng của caller), trả namespace"""
+        exec(self.get(path, require_markers).code, namespace, namespace)
+        return namespace
+
+    def revalidate_async(self, path: str, require_markers: bool = True, keep_last_good: bool = True,
+                         callback: Optional[Callable[[Optional[CompiledFlow], Optional[BaseException]], None]] = None) -> Future:
+        """Compile lại file ở thread nền (hot reload / prewarm); callback(compiled, error) khi xong"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="flow-compile")
+            executor = self._executor
+
+        def task():
+            try:
+                compiled = self.get(path, require_markers, keep_last_good)
+            except BaseException as e:
+                if callback:
+                    callback(None, e)
+                raise
+            if callback:
+                callback(compiled, None)
+            return compiled
+
+        return executor.submit(task)
+
+    def invalidate(self, path: Optional[str] = None):
+        with self._lock:
+            if path is None:
+                self._stats.clear()
+            else:
+                self._stats.pop(os.path.abspath(path), None)
+
+
+_cache: Optional[FlowCodeCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_flow_cache() -> FlowCodeCache:
+    """FlowCodeCache dùng chung của process"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = FlowCodeCache()
+        return _cache
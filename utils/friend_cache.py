@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Friend Cache
+Nhớ các cặp tài khoản đã là bạn bè để lần chạy sau bỏ qua bước phát hiện
+trạng thái kết bạn (adb UI dump + check_btn_send_friend_request_in_dump,
+~1-3s mỗi máy mỗi run).
+
+Key là cặp số điện thoại đã sắp xếp ("0569924311|0583563439") nên hai máy
+trong cặp dùng chung một entry. Khi hai tài khoản đã là bạn thì trạng thái
+này không đổi giữa các run, nên cache không có TTL:
+
+    cache = get_friend_cache()
+    if cache.is_friends(own, partner) and <thấy ô nhập chat>:
+        ...  # bỏ qua dump
+    else:
+        ...  # phát hiện đầy đủ, xong thì cache.mark_friends(own, partner)
+
+Kiểm tra lại lười: entry chỉ bị xóa (cache.forget) khi đã biết là bạn mà
+mở chat lại không thấy ô nhập tin nhắn (bị hủy kết bạn, đổi tài khoản...).
+
+Lưu ở config/friend_cache.json (AUTOMATION_FRIEND_CACHE), AUTOMATION_FRIEND_CACHE_ENABLED=0 để tắt.
+
+Usage:
+    python -m utils.friend_cache            # liệt kê các cặp đã biết
+    python -m utils.friend_cache --clear    # xóa toàn bộ cache
+"""
+
+import atexit
+import json
+import os
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from utils import metrics
+
+CACHE_FILE = os.environ.get("AUTOMATION_FRIEND_CACHE", os.path.join("config", "friend_cache.json"))
+ENABLED = os.environ.get("AUTOMATION_FRIEND_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+FRIEND_CACHE_TOTAL = "automation_friend_cache_total"
+
+
+def normalize_account(account: Any) -> str:
+    """Số điện thoại chuẩn hóa (bỏ ký tự thừa, 84xxx -> 0xxx, bổ sung 0 đầu); giữ nguyên nếu không phải số"""
+    text = str(account or "").strip()
+    digits = re.sub(r"\D", "", text)
+    if not digits:
+        return text
+    if digits.startswith("84") and len(digits) > 10:
+        digits = "0" + digits[2:]
+    elif not digits.startswith("0"):
+        digits = "0" + digits
+    return digits
+
+
+def pair_key(account_a: Any, account_b: Any) -> Optional[str]:
+    """Key của cặp tài khoản (không phụ thuộc thứ tự), None nếu thiếu một bên"""
+    a, b = normalize_account(account_a), normalize_account(account_b)
+    if not a or not b or a == b:
+        return None
+    return "|".join(sorted((a, b)))
+
+
+class FriendCache:
+    """Tập các cặp tài khoản đã là bạn bè, persist ra JSON"""
+
+    def __init__(self, path: Optional[str] = CACHE_FILE):
+        # Đường dẫn tuyệt đối: lần save lúc thoát không phụ thuộc cwd khi đó
+        self.path = os.path.abspath(path) if path else None
+        self._lock = threading.Lock()
+        # pair_key -> {"since", "verified", "hits", "source"}
+        self._pairs: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._pairs = json.load(f).get("pairs", {})
+        except Exception as e:
+            print(f"⚠️ Không đọc được friend cache {self.path}: {e}")
+
+    def save(self):
+        """Ghi cache (atomic) nếu có thay đổi"""
+        with self._lock:
+            if not self._dirty or not self.path:
+                return
+            # Serialize trong lock: thread của máy kia trong cặp có thể đang ghi
+            payload = json.dumps({"pairs": self._pairs}, ensure_ascii=False, indent=2)
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"⚠️ Không lưu được friend cache {self.path}: {e}")
+
+    def is_friends(self, account_a: Any, account_b: Any) -> bool:
+        """True nếu cặp đã được ghi nhận là bạn bè"""
+        key = pair_key(account_a, account_b)
+        if not ENABLED or key is None:
+            return False
+        with self._lock:
+            entry = self._pairs.get(key)
+            if entry is not None:
+                entry["hits"] = entry.get("hits", 0) + 1
+                self._dirty = True
+        metrics.inc(FRIEND_CACHE_TOTAL, result="hit" if entry else "miss")
+        return entry is not None
+
+    def mark_friends(self, account_a: Any, account_b: Any, source: str = "detected"):
+        """Ghi nhận cặp là bạn bè (sau khi phát hiện / kết bạn xong)"""
+        key = pair_key(account_a, account_b)
+        if not ENABLED or key is None:
+            return
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            entry = self._pairs.get(key)
+            if entry is None:
+                self._pairs[key] = {"since": now, "verified": now, "hits": 0, "source": source}
+                changed = True
+            else:
+                entry["verified"] = now
+                changed = False
+            self._dirty = True
+        if changed:
+            # Cặp mới hiếm -> ghi ngay để máy/process khác thấy; verified/hits ghi lúc thoát
+            self.save()
+
+    def forget(self, account_a: Any, account_b: Any) -> bool:
+        """Xóa cặp khỏi cache (đã biết là bạn nhưng không còn thấy ô chat); True nếu có entry"""
+        key = pair_key(account_a, account_b)
+        if key is None:
+            return False
+        with self._lock:
+            removed = self._pairs.pop(key, None) is not None
+            if removed:
+                self._dirty = True
+        if removed:
+            metrics.inc(FRIEND_CACHE_TOTAL, result="invalidated")
+            self.save()
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._pairs.clear()
+            self._dirty = True
+        self.save()
+
+    def pairs(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return json.loads(json.dumps(self._pairs))
+
+
+_cache: Optional[FriendCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_friend_cache() -> FriendCache:
+    """FriendCache dùng chung của process (load file lần đầu dùng)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = FriendCache()
+            atexit.register(_cache.save)
+        return _cache
+
+
+def main(argv=None) -> int:
+    argv = list(argv or [])
+    cache = FriendCache(CACHE_FILE)
+    if "--clear" in argv:
+        cache.clear()
+        print(f"🧹 Đã xóa friend cache {cache.path}")
+        return 0
+    pairs = cache.pairs()
+    if not pairs:
+        print(f"Chưa có cặp nào trong {cache.path}")
+        return 0
+    print(f"{'cặp tài khoản':<26} {'từ':<20} {'xác nhận':<20} {'hits':>5}")
+    for key in sorted(pairs):
+        entry = pairs[key]
+        print(f"{key:<26} {entry.get('since', ''):<20} {entry.get('verified', ''):<20} {entry.get('hits', 0):>5}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
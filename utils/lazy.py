@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Lazy
+Khởi tạo backend / import module nặng ở lần dùng đầu thay vì lúc import,
+để `python core1.py --help`, GUI và API worker không phải chờ kết nối
+Supabase hay import uiautomator2 trước khi làm gì.
+
+    supabase_data_manager = LazyObject(_create_supabase_data_manager, "supabase_data_manager")
+    u2 = lazy_import("uiautomator2")
+
+    supabase_data_manager.load_phone_mapping()   # khởi tạo ở đây (một lần, thread-safe)
+
+Proxy chuyển mọi attribute sang object thật. Factory trả None (backend
+không khả dụng) thì truy cập attribute raise AttributeError như khi biến
+module là None trước đây, và bool(proxy) là False.
+
+initialized_objects() liệt kê các proxy đã khởi tạo (benchmarks.bench_startup
+dùng để kiểm tra không có backend nào bị khởi tạo lúc import).
+"""
+
+import importlib
+import threading
+from typing import Any, Callable, List, Optional
+
+_UNSET = object()
+_initialized: List[str] = []
+_initialized_lock = threading.Lock()
+
+
+class LazyObject:
+    """Proxy tạo object thật bằng factory ở lần truy cập attribute đầu tiên"""
+
+    __slots__ = ("_lazy_factory", "_lazy_name", "_lazy_target", "_lazy_lock")
+
+    def __init__(self, factory: Callable[[], Any], name: Optional[str] = None):
+        object.__setattr__(self, "_lazy_factory", factory)
+        object.__setattr__(self, "_lazy_name", name or getattr(factory, "__name__", "lazy"))
+        object.__setattr__(self, "_lazy_target", _UNSET)
+        object.__setattr__(self, "_lazy_lock", threading.Lock())
+
+    def _lazy_resolve(self) -> Any:
+        target = object.__getattribute__(self, "_lazy_target")
+        if target is _UNSET:
+            with object.__getattribute__(self, "_lazy_lock"):
+                target = object.__getattribute__(self, "_lazy_target")
+                if target is _UNSET:
+                    target = object.__getattribute__(self, "_lazy_factory")()
+                    object.__setattr__(self, "_lazy_target", target)
+                    with _initialized_lock:
+                        _initialized.append(object.__getattribute__(self, "_lazy_name"))
+        return target
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._lazy_resolve(), name)
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(self._lazy_resolve(), name, value)
+
+    def __bool__(self) -> bool:
+        return bool(self._lazy_resolve())
+
+    def __repr__(self) -> str:
+        target = object.__getattribute__(self, "_lazy_target")
+        name = object.__getattribute__(self, "_lazy_name")
+        if target is _UNSET:
+            return f"<LazyObject {name} (chưa khởi tạo)>"
+        return repr(target)
+
+
+def lazy_import(module_name: str) -> LazyObject:
+    """Module import ở lần truy cập attribute đầu tiên"""
+    return LazyObject(lambda: importlib.import_module(module_name), module_name)
+
+
+def is_initialized(obj: Any) -> bool:
+    """True nếu obj không phải LazyObject hoặc đã được khởi tạo"""
+    if not isinstance(obj, LazyObject):
+        return True
+    return object.__getattribute__(obj, "_lazy_target") is not _UNSET
+
+
+def initialized_objects() -> List[str]:
+    """Tên các LazyObject đã khởi tạo trong process (theo thứ tự)"""
+    with _initialized_lock:
+        return list(_initialized)
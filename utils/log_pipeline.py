@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+"""
+Structured Logging Pipeline
+Logger có context theo device, format lazy và ghi log qua queue không chặn.
+
+Luồng xử lý:
+    automation thread --(QueueHandler, không format)--> queue --> listener thread
+        --> console (sys.__stdout__, bỏ qua StreamRedirector)
+        --> Qt panel (callbacks đăng ký bởi GUI)
+        --> rotating file (logs/automation.log)
+        --> Supabase run_logs (gom batch, insert ở thread riêng, khi đã set run_id)
+
+Mỗi lần chạy automation gọi start_run_logs() (tạo row runs + set_run_id) và
+finish_run_logs() (flush + đóng row runs). run_id được gắn vào record ngay
+lúc log, nên log cuối của run vẫn vào đúng run dù listener xử lý sau.
+Tắt sink run_logs bằng AUTOMATION_RUN_LOGS=0.
+
+Level được kiểm tra trước khi format, nên log.debug("...%s", x) gần như không
+tốn gì khi DEBUG bị tắt. Cấu hình qua AUTOMATION_LOG_LEVEL (mặc định INFO).
+
+Usage:
+    from utils.log_pipeline import get_logger
+    log = get_logger(device="192.168.5.74:5555", pair=1)
+    log.debug("Status %s -> %s", old, new)
+
+Hàm không nhận dev (barrier, turn wait...) dùng logger chung; device/pair lấy
+từ context của thread (bind_context, metrics.bind_device gọi khi flow bắt đầu).
+"""
+
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+import atexit
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+LOGGER_NAME = "automation"
+DEFAULT_FORMAT = "%(asctime)s [%(levelname)s] %(device_prefix)s%(message)s"
+DEFAULT_LOG_FILE = os.path.join("logs", "automation.log")
+QUEUE_SIZE = 10000
+RUN_LOGS_ENABLED = os.environ.get("AUTOMATION_RUN_LOGS", "1").lower() not in ("0", "false", "no")
+
+_config_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["DeferredQueueHandler"] = None
+_sink_callbacks: List[Callable[[str, str], None]] = []
+_run_log_handler: Optional["RunLogBatchHandler"] = None
+_run_id: Optional[str] = None
+_thread_context = threading.local()
+
+
+def bind_context(**context):
+    """Gắn context (device, pair...) cho mọi log của thread hiện tại; value None để bỏ key"""
+    values = dict(getattr(_thread_context, "values", None) or {})
+    for key, value in context.items():
+        if value is None:
+            values.pop(key, None)
+        else:
+            values[key] = value
+    _thread_context.values = values
+
+
+def thread_context() -> Dict[str, Any]:
+    return dict(getattr(_thread_context, "values", None) or {})
+
+
+class DeviceLogger(logging.LoggerAdapter):
+    """LoggerAdapter gắn context (device, pair, step...) vào mỗi record"""
+
+    def process(self, msg, kwargs):
+        # Chạy ở thread gọi log: context của thread < context của logger < extra
+        extra = thread_context()
+        extra.update(self.extra)
+        extra.update(kwargs.pop("extra", None) or {})
+        kwargs["extra"] = {"context": extra}
+        return msg, kwargs
+
+    def bind(self, **context) -> "DeviceLogger":
+        """Tạo logger mới với thêm context"""
+        merged = dict(self.extra)
+        merged.update(context)
+        return DeviceLogger(self.logger, merged)
+
+
+class ContextFilter(logging.Filter):
+    """Đảm bảo record luôn có context/device_prefix cho formatter"""
+
+    def filter(self, record):
+        context = getattr(record, "context", None) or {}
+        record.context = context
+        device = context.get("device")
+        record.device_prefix = f"[{device}] " if device else ""
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler không format ở thread gọi log và không bao giờ block
+
+    QueueHandler mặc định format message ngay trong prepare(); ở đây việc
+    format được dời sang listener thread. Khi queue đầy, record bị bỏ và đếm lại.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        if record.exc_info and not record.exc_text:
+            # Traceback phải được render trước khi frame bị giải phóng
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        record.run_id = _run_id
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class CallbackSinkHandler(logging.Handler):
+    """Gửi log đã format tới các callback (ví dụ Qt terminal panel)"""
+
+    def emit(self, record):
+        if not _sink_callbacks:
+            return
+        try:
+            message = self.format(record)
+            level = record.levelname.lower()
+            for callback in list(_sink_callbacks):
+                try:
+                    callback(message, level)
+                except Exception:
+                    pass
+        except Exception:
+            self.handleError(record)
+
+
+class RunLogBatchHandler(logging.Handler):
+    """Gom log thành batch cho bảng run_logs (emit chạy trong listener thread)
+
+    Insert Supabase chạy ở thread "run-log-writer" riêng qua queue có giới hạn,
+    để một lần gọi chậm/lỗi không làm trễ các sink khác (console, file, Qt).
+    Insert lỗi thì bỏ batch đó và tạm ngừng ghi (backoff tăng dần tới
+    max_backoff giây); queue đầy hoặc đang backoff thì batch mới bị bỏ và đếm
+    vào dropped_rows.
+    """
+
+    LEVEL_MAP = {"WARNING": "WARN", "CRITICAL": "ERROR"}
+
+    def __init__(self, batch_size: int = 200, flush_interval: float = 2.0,
+                 max_pending_batches: int = 20, max_backoff: float = 60.0):
+        super().__init__()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.dropped_rows = 0
+        self._rows: List[Dict[str, Any]] = []
+        self._last_flush = time.time()
+        self._repository = None
+        self._batches: "queue.Queue[Optional[List[Dict[str, Any]]]]" = queue.Queue(maxsize=max_pending_batches)
+        self._worker: Optional[threading.Thread] = None
+        self._backoff = 0.0
+        self._retry_at = 0.0
+
+    def emit(self, record):
+        run_id = getattr(record, "run_id", None)
+        if not run_id:
+            return
+        context = getattr(record, "context", {}) or {}
+        self._rows.append({
+            "run_id": run_id,
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": self.LEVEL_MAP.get(record.levelname, record.levelname),
+            "pair_id": str(context["pair"]) if context.get("pair") is not None else None,
+            "device_a": context.get("device"),
+            "action": context.get("step"),
+            "message": record.getMessage(),
+            "meta": {k: str(v) for k, v in context.items() if k not in ("device", "pair", "step")}
+        })
+        if len(self._rows) >= self.batch_size or time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Chuyển batch hiện tại cho writer thread (không chờ insert)"""
+        # Lock của handler: flush cũng được gọi từ thread kết thúc run
+        self.acquire()
+        try:
+            rows, self._rows = self._rows, []
+            self._last_flush = time.time()
+        finally:
+            self.release()
+        if not rows:
+            return
+        if time.time() < self._retry_at:
+            self.dropped_rows += len(rows)
+            return
+        self._ensure_worker()
+        try:
+            self._batches.put_nowait(rows)
+        except queue.Full:
+            self.dropped_rows += len(rows)
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="run-log-writer", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            rows = self._batches.get()
+            if rows is None:
+                return
+            if time.time() < self._retry_at:
+                self.dropped_rows += len(rows)
+                continue
+            self._write(rows)
+
+    def _write(self, rows: List[Dict[str, Any]]):
+        try:
+            if self._repository is None:
+                from database.run_log_repository import RunLogRepository
+                self._repository = RunLogRepository()
+            self._repository.insert_logs(rows)
+            self._backoff = 0.0
+        except Exception as e:
+            self.dropped_rows += len(rows)
+            self._backoff = min(self.max_backoff, self._backoff * 2 or 1.0)
+            self._retry_at = time.time() + self._backoff
+            if sys.__stderr__:
+                sys.__stderr__.write(f"[LOG PIPELINE] Failed to write run_logs batch ({len(rows)} rows), "
+                                     f"pause {self._backoff:.0f}s: {e}\n")
+
+    def drain(self, timeout: float = 5.0):
+        """Đợi writer thread ghi xong các batch đang chờ rồi dừng (lúc shutdown)"""
+        worker = self._worker
+        if worker is None or not worker.is_alive():
+            return
+        try:
+            self._batches.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        worker.join(timeout)
+
+
+def _resolve_level(level) -> int:
+    if level is None:
+        level = os.environ.get("AUTOMATION_LOG_LEVEL", "INFO")
+    if isinstance(level, str):
+        value = logging.getLevelName(level.upper())
+        return value if isinstance(value, int) else logging.INFO
+    return level
+
+
+def configure_logging(level=None, console: bool = True, log_file: Optional[str] = DEFAULT_LOG_FILE,
+                      run_logs: Optional[bool] = None, force: bool = False) -> logging.Logger:
+    """Cấu hình pipeline (idempotent). Gọi lại với force=True để áp dụng cấu hình mới.
+
+    run_logs=None dùng AUTOMATION_RUN_LOGS; sink chỉ ghi khi đã set run_id.
+    """
+    global _listener, _queue_handler, _run_log_handler
+
+    with _config_lock:
+        logger = logging.getLogger(LOGGER_NAME)
+        if _listener is not None and not force:
+            if level is not None:
+                logger.setLevel(_resolve_level(level))
+            return logger
+
+        if _listener is not None:
+            _listener.stop()
+        if _queue_handler is not None:
+            logger.removeHandler(_queue_handler)
+
+        formatter = logging.Formatter(DEFAULT_FORMAT, datefmt="%H:%M:%S")
+        context_filter = ContextFilter()
+        handlers: List[logging.Handler] = []
+
+        if console and sys.__stdout__ is not None:
+            handlers.append(logging.StreamHandler(sys.__stdout__))
+
+        handlers.append(CallbackSinkHandler())
+
+        if log_file:
+            try:
+                os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+                handlers.append(logging.handlers.RotatingFileHandler(
+                    log_file, maxBytes=10 * 1024 * 1024, backupCount=5, encoding="utf-8"))
+            except OSError as e:
+                if sys.__stderr__:
+                    sys.__stderr__.write(f"[LOG PIPELINE] File sink disabled: {e}\n")
+
+        if run_logs is None:
+            run_logs = RUN_LOGS_ENABLED
+        _run_log_handler = RunLogBatchHandler() if run_logs else None
+        if _run_log_handler:
+            handlers.append(_run_log_handler)
+
+        for handler in handlers:
+            handler.setFormatter(formatter)
+            handler.addFilter(context_filter)
+
+        log_queue = queue.Queue(maxsize=QUEUE_SIZE)
+        _queue_handler = DeferredQueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+
+        logger.addHandler(_queue_handler)
+        logger.setLevel(_resolve_level(level))
+        logger.propagate = False
+        return logger
+
+
+def get_logger(device: Optional[str] = None, **context) -> DeviceLogger:
+    """Lấy logger của automation với context (device, pair, step, ...)"""
+    logger = configure_logging()
+    if device is not None:
+        context["device"] = device
+    return DeviceLogger(logger, context)
+
+
+def set_level(level):
+    """Đổi level của pipeline lúc runtime"""
+    logging.getLogger(LOGGER_NAME).setLevel(_resolve_level(level))
+
+
+def add_sink_callback(callback: Callable[[str, str], None]):
+    """Đăng ký callback(message, level) nhận log đã format (ví dụ Qt panel)"""
+    if callback not in _sink_callbacks:
+        _sink_callbacks.append(callback)
+
+
+def remove_sink_callback(callback: Callable[[str, str], None]):
+    if callback in _sink_callbacks:
+        _sink_callbacks.remove(callback)
+
+
+def set_run_id(run_id: Optional[str]):
+    """Bật/tắt ghi log vào run_logs cho run hiện tại (cần configure_logging(run_logs=True))"""
+    global _run_id
+    _run_id = run_id
+
+
+def current_run_id() -> Optional[str]:
+    return _run_id
+
+
+def start_run_logs(**info) -> Optional[str]:
+    """Tạo row runs cho lần chạy automation và bật sink run_logs; trả về run_id (None nếu sink tắt/lỗi)"""
+    configure_logging()
+    if _run_log_handler is None:
+        return None
+    try:
+        from database.run_log_repository import RunLogRepository
+        run_id = RunLogRepository().create_run(**info)
+    except Exception as e:
+        get_logger().warning("⚠️ Không tạo được run cho run_logs: %s", e)
+        return None
+    set_run_id(run_id)
+    return run_id
+
+
+def flush_run_logs(timeout: float = 2.0):
+    """Đợi listener xử lý hết log đang xếp hàng rồi đẩy batch run_logs cho writer"""
+    if _run_log_handler is None:
+        return
+    log_queue = _queue_handler.queue if _queue_handler else None
+    deadline = time.time() + timeout
+    while log_queue is not None and getattr(log_queue, "unfinished_tasks", 0) and time.time() < deadline:
+        time.sleep(0.02)
+    _run_log_handler.flush()
+
+
+def finish_run_logs(run_id: Optional[str], status: str = "completed"):
+    """Kết thúc run: tắt sink run_logs, flush log còn lại và cập nhật status/stopped_at của row runs"""
+    if _run_id == run_id:
+        set_run_id(None)
+    if not run_id:
+        return
+    flush_run_logs()
+    try:
+        from database.run_log_repository import RunLogRepository
+        RunLogRepository().finish_run(run_id, status)
+    except Exception as e:
+        get_logger().warning("⚠️ Không cập nhật được run %s: %s", run_id, e)
+
+
+def dropped_count() -> int:
+    """Số record bị bỏ vì queue đầy"""
+    return _queue_handler.dropped if _queue_handler else 0
+
+
+def shutdown():
+    """Flush tất cả sinks và dừng listener thread"""
+    global _listener
+    with _config_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        if _run_log_handler is not None:
+            _run_log_handler.flush()
+            _run_log_handler.drain()
+
+
+atexit.register(shutdown)
@@ -0,0 +1,504 @@
+# -*- coding: utf-8 -*-
+"""
+Automation Metrics
+Counters và histograms theo device / step / selector cho automation runs.
+
+- step_timer / timed_step: đo thời gian từng bước của flow (connect, clear
+  recents, mở app, search, kiểm tra bạn bè, gõ tin nhắn, verify, đợi lượt...)
+- instrument_device: bọc uiautomator2 device để đo mọi RPC (click, exists,
+  dump_hierarchy, send_keys...) kèm selector
+- render_prometheus: text format cho endpoint /metrics của API server
+- mỗi bước cũng được ghi thành span trong utils.tracing (Chrome trace)
+- start_run / build_run_report / write_run_report: báo cáo JSON theo từng run,
+  xếp hạng các bước và thiết bị chậm nhất
+
+Tắt hoàn toàn bằng AUTOMATION_METRICS=0.
+"""
+
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils import log_pipeline, tracing
+
+ENABLED = os.environ.get("AUTOMATION_METRICS", "1").lower() not in ("0", "false", "no")
+REPORT_DIR = os.environ.get("AUTOMATION_METRICS_DIR", "metrics_reports")
+
+# Bucket (giây) cho RPC uiautomator (ms -> vài giây) và các bước flow (giây -> phút)
+RPC_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STEP_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+STEP_SECONDS = "automation_step_seconds"
+STEP_TOTAL = "automation_step_total"
+RPC_SECONDS = "device_rpc_seconds"
+RPC_ERRORS = "device_rpc_errors_total"
+
+_BUCKETS_BY_METRIC = {STEP_SECONDS: STEP_BUCKETS, RPC_SECONDS: RPC_BUCKETS}
+_HELP = {
+    STEP_SECONDS: "Duration of automation flow steps",
+    STEP_TOTAL: "Automation flow steps by outcome",
+    RPC_SECONDS: "Duration of uiautomator2 RPC calls",
+    RPC_ERRORS: "uiautomator2 RPC calls that raised",
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, "" if v is None else str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    """Histogram với bucket cố định (cumulative khi export, như Prometheus)"""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "max")
+
+    def __init__(self, buckets: Iterable[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Ước lượng quantile bằng nội suy tuyến tính trong bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, bucket_count in enumerate(self.counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.max
+            if bucket_count and seen + bucket_count >= rank:
+                fraction = (rank - seen) / bucket_count
+                return min(lower + (upper - lower) * fraction, self.max)
+            seen += bucket_count
+            lower = upper
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 4),
+            "avg": round(self.sum / self.count, 4) if self.count else 0.0,
+            "p50": round(self.quantile(0.5), 4),
+            "p95": round(self.quantile(0.95), 4),
+            "max": round(self.max, 4),
+        }
+
+
+class MetricsRegistry:
+    """Lưu counters và histograms theo (metric name, labels), thread-safe"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(_BUCKETS_BY_METRIC.get(name, STEP_BUCKETS))
+            histogram.observe(value)
+
+    def histograms(self, name: str) -> List[Tuple[Dict[str, str], Histogram]]:
+        with self._lock:
+            return [(dict(key), h) for key, h in self._histograms.get(name, {}).items()]
+
+    def counters(self, name: str) -> List[Tuple[Dict[str, str], float]]:
+        with self._lock:
+            return [(dict(key), v) for key, v in self._counters.get(name, {}).items()]
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render_prometheus(self) -> str:
+        """Export theo Prometheus text exposition format 0.0.4"""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, h in series.items():
+                    cumulative = 0
+                    for bound, bucket_count in zip(h.buckets, h.counts):
+                        cumulative += bucket_count
+                        lines.append(f"{name}_bucket{_format_labels(key, le=repr(bound))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, le='+Inf')} {h.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {h.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key: LabelKey, **extra) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in pairs) + "}"
+
+
+# ---------------- Global registries ----------------
+
+_registry = MetricsRegistry()        # cumulative, cho /metrics
+_run_registry = MetricsRegistry()    # chỉ run hiện tại, cho JSON report
+_run_info: Dict[str, Any] = {}
+_thread_context = threading.local()
+
+
+def get_registry() -> MetricsRegistry:
+    return _registry
+
+
+def inc(name: str, value: float = 1, **labels):
+    if not ENABLED:
+        return
+    _registry.inc(name, value, **labels)
+    _run_registry.inc(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels):
+    if not ENABLED:
+        return
+    _registry.observe(name, value, **labels)
+    _run_registry.observe(name, value, **labels)
+
+
+def bind_device(device_id: Optional[str], group: Any = None):
+    """Gắn device (và nhóm) cho thread hiện tại (dùng khi hàm được đo không nhận dev)"""
+    _thread_context.device = device_id
+    tracing.bind_context(device=device_id, group=group)
+    log_pipeline.bind_context(device=device_id, pair=group)
+
+
+def current_device() -> Optional[str]:
+    return getattr(_thread_context, "device", None)
+
+
+def _device_label(dev) -> str:
+    if dev is None:
+        return current_device() or "unknown"
+    if isinstance(dev, str):
+        return dev
+    return getattr(dev, "device_id", None) or current_device() or "unknown"
+
+
+@contextmanager
+def step_timer(dev, step: str, **trace_args):
+    """Đo thời gian một bước flow: with step_timer(dev, "clear_recents"): ...
+
+    Bước cũng được ghi thành span (trace_args như group_id, message_id đi kèm span).
+    """
+    if not ENABLED and not tracing.ENABLED:
+        yield
+        return
+    device = _device_label(dev)
+    status = "ok"
+    start_ns = time.perf_counter_ns()
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        end_ns = time.perf_counter_ns()
+        observe(STEP_SECONDS, (end_ns - start_ns) / 1e9, device=device, step=step)
+        inc(STEP_TOTAL, device=device, step=step, status=status)
+        group = getattr(dev, "group_id", None)
+        if isinstance(trace_args.get("group_id"), int):
+            group = trace_args.pop("group_id")
+        # group_id dạng tên barrier (pre_clear_apps...) giữ làm arg, span thuộc nhóm của thread
+        tracing.record_span(step, tracing.category_for(step), start_ns, end_ns,
+                            device=None if device == "unknown" else device,
+                            group=group, status=status, **trace_args)
+
+
+def timed_step(step: str, trace_args: Tuple[str, ...] = ()):
+    """Decorator đo một hàm flow; device lấy từ tham số đầu (dev) hoặc bind_device.
+
+    trace_args: tên các tham số của hàm được ghi kèm vào span (vd group_id, message_id).
+    """
+    def decorator(func):
+        signature = inspect.signature(func) if trace_args else None
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            dev = args[0] if args and hasattr(args[0], "device_id") else None
+            span_args = {}
+            if signature is not None:
+                try:
+                    bound = signature.bind_partial(*args, **kwargs).arguments
+                    span_args = {name: bound[name] for name in trace_args if name in bound}
+                except TypeError:
+                    pass
+            with step_timer(dev, step, **span_args):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ---------------- uiautomator2 RPC instrumentation ----------------
+
+# Thuộc tính (property) mà việc đọc là một RPC
+_DEVICE_RPC_PROPERTIES = {"info", "device_info", "window_size", "wlan_ip", "orientation", "clipboard"}
+_SELECTOR_RPC_PROPERTIES = {"info", "count"}
+_SELECTOR_LABEL_MAX = 80
+
+
+def _selector_label(kwargs: Dict[str, Any]) -> str:
+    label = ",".join(f"{k}={v}" for k, v in sorted(kwargs.items()))
+    return label[:_SELECTOR_LABEL_MAX]
+
+
+def _is_rpc_method(name: str, attr) -> bool:
+    """Chỉ đo method thật (bound method / function); object callable như
+    UiObject.scroll / .fling hay d.watcher còn được gọi tiếp .to()/.toEnd()/...
+    nên phải trả nguyên object cho caller"""
+    if name.startswith("_"):
+        return False
+    return inspect.ismethod(attr) or inspect.isfunction(attr) or inspect.isbuiltin(attr)
+
+
+def _timed_call(func, device: str, method: str, selector: str = ""):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            inc(RPC_ERRORS, device=device, method=method)
+            raise
+        finally:
+            observe(RPC_SECONDS, time.perf_counter() - start, device=device, method=method, selector=selector)
+        if hasattr(result, "exists") and not isinstance(result, (bool, int, str)):
+            # child()/sibling()/[i] trả về selector mới
+            return _SelectorProxy(result, device, selector)
+        return result
+    return wrapper
+
+
+def _timed_read(target, name: str, device: str, method: str, selector: str = ""):
+    start = time.perf_counter()
+    try:
+        return getattr(target, name)
+    except Exception:
+        inc(RPC_ERRORS, device=device, method=method)
+        raise
+    finally:
+        observe(RPC_SECONDS, time.perf_counter() - start, device=device, method=method, selector=selector)
+
+
+class _TimedExists:
+    """Bọc UiObject.exists: vừa dùng như bool vừa gọi được exists(timeout=...)"""
+
+    __slots__ = ("_exists", "_device", "_selector")
+
+    def __init__(self, exists, device: str, selector: str):
+        self._exists = exists
+        self._device = device
+        self._selector = selector
+
+    def __bool__(self):
+        return _timed_call(lambda: bool(self._exists), self._device, "selector.exists", self._selector)()
+
+    def __call__(self, *args, **kwargs):
+        return _timed_call(self._exists, self._device, "selector.exists", self._selector)(*args, **kwargs)
+
+
+class _SelectorProxy:
+    """Proxy cho UiObject / XPathSelector, đo các RPC kèm selector"""
+
+    __slots__ = ("_target", "_device", "_selector")
+
+    def __init__(self, target, device: str, selector: str):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_device", device)
+        object.__setattr__(self, "_selector", selector)
+
+    def __getattr__(self, name):
+        if name == "exists":
+            return _TimedExists(self._target.exists, self._device, self._selector)
+        if name in _SELECTOR_RPC_PROPERTIES:
+            return _timed_read(self._target, name, self._device, f"selector.{name}", self._selector)
+        attr = getattr(self._target, name)
+        if _is_rpc_method(name, attr):
+            return _timed_call(attr, self._device, f"selector.{name}", self._selector)
+        return attr
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+    def __getitem__(self, index):
+        return _SelectorProxy(self._target[index], self._device, self._selector)
+
+    def __len__(self):
+        return _timed_call(lambda: len(self._target), self._device, "selector.count", self._selector)()
+
+    def __iter__(self):
+        for item in self._target:
+            yield _SelectorProxy(item, self._device, self._selector)
+
+    def __bool__(self):
+        return bool(self._target)
+
+
+class _XPathProxy:
+    """Proxy cho d.xpath: d.xpath(expr) trả về selector đã được đo"""
+
+    __slots__ = ("_target", "_device")
+
+    def __init__(self, target, device: str):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_device", device)
+
+    def __call__(self, xpath, *args, **kwargs):
+        label = f"xpath={xpath}"[:_SELECTOR_LABEL_MAX]
+        return _SelectorProxy(self._target(xpath, *args, **kwargs), self._device, label)
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+class InstrumentedDevice:
+    """Proxy cho uiautomator2.Device: mọi method public (không tính object callable) được đo vào device_rpc_seconds"""
+
+    __slots__ = ("_target", "_device")
+
+    def __init__(self, target, device_id: str):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_device", device_id)
+
+    @property
+    def raw(self):
+        """uiautomator2 device gốc (không đo)"""
+        return self._target
+
+    def __call__(self, **kwargs):
+        return _SelectorProxy(self._target(**kwargs), self._device, _selector_label(kwargs))
+
+    def __getattr__(self, name):
+        if name == "xpath":
+            return _XPathProxy(self._target.xpath, self._device)
+        if name in _DEVICE_RPC_PROPERTIES:
+            return _timed_read(self._target, name, self._device, name)
+        attr = getattr(self._target, name)
+        if _is_rpc_method(name, attr):
+            return _timed_call(attr, self._device, name)
+        return attr
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+
+def instrument_device(d, device_id: str):
+    """Bọc uiautomator2 device nếu metrics đang bật"""
+    if not ENABLED or d is None or isinstance(d, InstrumentedDevice):
+        return d
+    return InstrumentedDevice(d, device_id)
+
+
+# ---------------- Export / reports ----------------
+
+def render_prometheus() -> str:
+    return _registry.render_prometheus()
+
+
+def start_run(run_id: Optional[str] = None, **info):
+    """Bắt đầu thu metrics cho một run mới (xóa dữ liệu run trước)"""
+    _run_registry.reset()
+    _run_info.clear()
+    _run_info.update(info)
+    _run_info["run_id"] = run_id or datetime.now().strftime("%Y%m%d_%H%M%S")
+    _run_info["started_at"] = datetime.now().isoformat()
+
+
+def _group_by(series: List[Tuple[Dict[str, str], Histogram]], field: str) -> List[Dict[str, Any]]:
+    """Gộp các histogram theo một label, xếp theo tổng thời gian giảm dần"""
+    totals: Dict[str, Dict[str, float]] = {}
+    for labels, h in series:
+        entry = totals.setdefault(labels.get(field, ""), {"count": 0, "sum": 0.0, "max": 0.0})
+        entry["count"] += h.count
+        entry["sum"] += h.sum
+        entry["max"] = max(entry["max"], h.max)
+    ranked = [
+        {field: name, "count": v["count"], "total_seconds": round(v["sum"], 3),
+         "avg_seconds": round(v["sum"] / v["count"], 3) if v["count"] else 0.0,
+         "max_seconds": round(v["max"], 3)}
+        for name, v in totals.items()
+    ]
+    return sorted(ranked, key=lambda item: item["total_seconds"], reverse=True)
+
+
+def build_run_report(top: int = 20) -> Dict[str, Any]:
+    """Báo cáo JSON của run hiện tại: chi tiết + xếp hạng bước/thiết bị/selector chậm nhất"""
+    steps = _run_registry.histograms(STEP_SECONDS)
+    rpcs = _run_registry.histograms(RPC_SECONDS)
+    outcomes = _run_registry.counters(STEP_TOTAL)
+    rpc_errors = _run_registry.counters(RPC_ERRORS)
+
+    return {
+        **_run_info,
+        "generated_at": datetime.now().isoformat(),
+        "steps": sorted(({**labels, **h.summary()} for labels, h in steps),
+                        key=lambda item: item["sum"], reverse=True),
+        "step_outcomes": [{**labels, "count": value} for labels, value in outcomes],
+        "slowest_steps": _group_by(steps, "step")[:top],
+        "slowest_devices": _group_by(steps, "device")[:top],
+        "rpc_by_method": _group_by(rpcs, "method")[:top],
+        "slowest_selectors": _group_by([(l, h) for l, h in rpcs if l.get("selector")], "selector")[:top],
+        "rpc_errors": [{**labels, "count": value} for labels, value in rpc_errors],
+    }
+
+
+def write_run_report(directory: Optional[str] = None) -> Optional[str]:
+    """Ghi report của run hiện tại ra <directory>/run_<run_id>.json, trả về đường dẫn"""
+    if not ENABLED:
+        return None
+    report = build_run_report()
+    directory = directory or REPORT_DIR
+    try:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"run_{report['run_id']}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return path
+    except OSError as e:
+        print(f"⚠️ Không thể ghi metrics report: {e}")
+        return None
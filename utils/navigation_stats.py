@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Navigation Stats
+Thống kê các cách mở chat với đối tác theo từng device và chọn cách nhanh
+nhất làm mặc định:
+
+- "intent": am start deep link https://zalo.me/<sđt> -> Zalo mở thẳng chat
+  hoặc profile của đối tác, bỏ qua tab tin nhắn + ô tìm kiếm + kết quả
+- "search": đường cũ (tab Tin nhắn -> mở search -> nhập số -> chọn kết quả)
+
+Mỗi lần thử ghi số lần thử, số lần thành công và tổng thời gian vào
+config/navigation_stats.json (AUTOMATION_NAV_STATS). Ở chế độ "auto" các
+strategy được xếp theo thời gian kỳ vọng tới khi vào được chat
+(thời gian trung bình mỗi lần thử / tỉ lệ thành công); strategy chưa có dữ
+liệu được thử trước để học. AUTOMATION_CHAT_NAV=intent|search ép thứ tự.
+
+Usage:
+    python -m utils.navigation_stats
+"""
+
+import atexit
+import json
+import os
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from utils import metrics
+
+STATS_FILE = os.environ.get("AUTOMATION_NAV_STATS", os.path.join("config", "navigation_stats.json"))
+NAV_MODE = os.environ.get("AUTOMATION_CHAT_NAV", "auto").lower()
+STRATEGIES = ("intent", "search")
+NAV_TOTAL = "automation_chat_navigation_total"
+ZALO_LINK = "https://zalo.me/{phone}"
+
+
+def zalo_chat_link(phone: Any) -> Optional[str]:
+    """Deep link zalo.me của số điện thoại (số VN thiếu 0 đầu được bổ sung), None nếu không có số"""
+    digits = re.sub(r"\D", "", str(phone or ""))
+    if not digits:
+        return None
+    if not digits.startswith(("0", "84")):
+        digits = "0" + digits
+    return ZALO_LINK.format(phone=digits)
+
+
+def expected_seconds(entry: Optional[Dict[str, Any]]) -> float:
+    """Thời gian kỳ vọng tới khi vào chat bằng strategy (0 nếu chưa có dữ liệu)"""
+    if not entry or not entry.get("attempts"):
+        return 0.0
+    if not entry.get("successes"):
+        return float("inf")
+    # (tổng thời gian / số lần thử) / tỉ lệ thành công
+    return entry["seconds"] / entry["successes"]
+
+
+class NavigationStats:
+    """Số lần thử / thành công / thời gian của từng strategy theo device, persist ra JSON"""
+
+    def __init__(self, path: Optional[str] = STATS_FILE):
+        # Đường dẫn tuyệt đối: lần save lúc thoát không phụ thuộc cwd khi đó
+        self.path = os.path.abspath(path) if path else None
+        self._lock = threading.Lock()
+        # device_id -> strategy -> {"attempts", "successes", "seconds", "last_seconds", "updated"}
+        self._devices: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._devices = json.load(f).get("devices", {})
+        except Exception as e:
+            print(f"⚠️ Không đọc được navigation stats {self.path}: {e}")
+
+    def save(self):
+        """Ghi stats (atomic) nếu có thay đổi"""
+        with self._lock:
+            if not self._dirty or not self.path:
+                return
+            payload = json.dumps({"devices": self._devices}, ensure_ascii=False, indent=2)
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"⚠️ Không lưu được navigation stats {self.path}: {e}")
+
+    def record(self, device_id: str, strategy: str, success: bool, seconds: float):
+        """Ghi nhận một lần thử strategy trên device"""
+        with self._lock:
+            entry = self._devices.setdefault(device_id, {}).setdefault(
+                strategy, {"attempts": 0, "successes": 0, "seconds": 0.0})
+            entry["attempts"] += 1
+            entry["successes"] += 1 if success else 0
+            entry["seconds"] = round(entry["seconds"] + seconds, 3)
+            entry["last_seconds"] = round(seconds, 3)
+            entry["updated"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            self._dirty = True
+        metrics.inc(NAV_TOTAL, device=device_id, strategy=strategy, status="ok" if success else "failed")
+
+    def order(self, device_id: str, mode: str = NAV_MODE) -> List[str]:
+        """Thứ tự thử strategy cho device (strategy đầu là mặc định, các strategy sau là fallback)"""
+        if mode in STRATEGIES:
+            return [mode] + [s for s in STRATEGIES if s != mode]
+        with self._lock:
+            entries = dict(self._devices.get(device_id, {}))
+        # sorted ổn định: hòa nhau thì giữ thứ tự STRATEGIES (intent trước)
+        return sorted(STRATEGIES, key=lambda strategy: expected_seconds(entries.get(strategy)))
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Tỉ lệ thành công và thời gian trung bình theo device / strategy"""
+        with self._lock:
+            devices = json.loads(json.dumps(self._devices))
+        for strategies in devices.values():
+            for entry in strategies.values():
+                entry["success_rate"] = round(entry["successes"] / entry["attempts"], 3) if entry["attempts"] else 0.0
+                entry["avg_seconds"] = round(entry["seconds"] / entry["attempts"], 3) if entry["attempts"] else 0.0
+        return devices
+
+
+_stats: Optional[NavigationStats] = None
+_stats_lock = threading.Lock()
+
+
+def get_navigation_stats() -> NavigationStats:
+    """NavigationStats dùng chung của process (load file lần đầu dùng)"""
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = NavigationStats()
+            atexit.register(_stats.save)
+        return _stats
+
+
+def main(argv=None) -> int:
+    stats = NavigationStats(argv[0] if argv else STATS_FILE)
+    summary = stats.summary()
+    if not summary:
+        print(f"Chưa có dữ liệu trong {stats.path}")
+        return 0
+    print(f"{'device':<22} {'strategy':<8} {'thử':>5} {'ok':>5} {'tỉ lệ':>6} {'tb (s)':>7}  mặc định")
+    for device_id in sorted(summary):
+        default = stats.order(device_id, "auto")[0]
+        for strategy, entry in sorted(summary[device_id].items()):
+            print(f"{device_id:<22} {strategy:<8} {entry['attempts']:>5} {entry['successes']:>5} "
+                  f"{entry['success_rate']:>6.0%} {entry['avg_seconds']:>7.2f}  {'*' if strategy == default else ''}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Device Preflight
+Kiểm tra sức khỏe tất cả device song song TRƯỚC khi ghép cặp, để một máy
+hỏng (màn hình khóa, Zalo bị đăng xuất, atx-agent chết, pin yếu...) không
+bắt máy cùng cặp đợi barrier 90-150s rồi mới phát hiện trong flow().
+
+Các check (dừng ở check bắt buộc đầu tiên thất bại):
+    adb         adb -s <serial> get-state == device (bỏ qua với device giả lập)
+    rpc         connect uiautomator2 + d.info trả lời
+    screen      màn hình sáng và không khóa (thử screen_on / unlock một lần)
+    app         app đang foreground (chỉ thông tin)
+    login       mở Zalo, thấy màn hình chính chứ không phải nút đăng nhập
+    battery     pin >= AUTOMATION_PREFLIGHT_MIN_BATTERY% hoặc đang sạc
+
+Kết quả pass được cache theo device trong AUTOMATION_PREFLIGHT_TTL giây;
+kết quả fail luôn được kiểm tra lại ở lần sau. Device vừa được probe giữ
+nguyên kết nối để cặp dùng lại (không connect hai lần).
+
+Cặp có máy fail bị bỏ cả cặp (preflight_failed). AUTOMATION_PREFLIGHT_REPAIR=1
+cho phép ghép lại các máy còn tốt của những cặp hỏng với nhau (tài khoản
+operator chưa từng ghép cặp -> có thể phát sinh kết bạn / nhắn tin lạ).
+
+Tắt bằng AUTOMATION_PREFLIGHT=0.
+"""
+
+import os
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.metrics import step_timer
+
+ENABLED = os.environ.get("AUTOMATION_PREFLIGHT", "1").lower() not in ("0", "false", "no")
+TTL = float(os.environ.get("AUTOMATION_PREFLIGHT_TTL", "300"))
+MIN_BATTERY = int(os.environ.get("AUTOMATION_PREFLIGHT_MIN_BATTERY", "15"))
+WORKERS = int(os.environ.get("AUTOMATION_PREFLIGHT_WORKERS", "8"))
+CHECK_LOGIN = os.environ.get("AUTOMATION_PREFLIGHT_LOGIN", "1").lower() not in ("0", "false", "no")
+REPAIR_PAIRS = os.environ.get("AUTOMATION_PREFLIGHT_REPAIR", "0").lower() not in ("0", "false", "no")
+
+ZALO_PACKAGE = "com.zing.zalo"
+RID_LOGIN = "com.zing.zalo:id/btnLogin"
+RID_LOGGED_IN = ("com.zing.zalo:id/maintab_root_layout", "com.zing.zalo:id/recycler_view_msgList")
+LOGIN_TIMEOUT = 10.0
+
+# Android khác nhau in trạng thái keyguard khác nhau trong dumpsys window policy
+_LOCKED_PATTERN = re.compile(r"(mShowingLockscreen|mDreamingLockscreen|isStatusBarKeyguard|showing)=true")
+
+
+class PreflightFailed(Exception):
+    """Check bắt buộc thất bại - device không được ghép cặp"""
+
+
+def _shell_output(d, command: str) -> str:
+    response = d.shell(command, timeout=10)
+    return getattr(response, "output", response) or ""
+
+
+def check_adb(serial: str) -> str:
+    try:
+        result = subprocess.run(["adb", "-s", serial, "get-state"], capture_output=True, text=True, timeout=10)
+    except Exception as e:
+        raise PreflightFailed(f"adb lỗi: {e}")
+    state = (result.stdout or result.stderr or "").strip()
+    if state != "device":
+        raise PreflightFailed(f"adb state: {state or 'unknown'}")
+    return state
+
+
+def check_screen(d) -> str:
+    if not d.info.get("screenOn", True):
+        d.screen_on()
+        time.sleep(0.5)
+        if not d.info.get("screenOn", True):
+            raise PreflightFailed("màn hình tắt")
+    if _LOCKED_PATTERN.search(_shell_output(d, "dumpsys window policy")):
+        try:
+            d.unlock()  # chỉ mở được khóa vuốt, không có mật khẩu
+            time.sleep(0.5)
+        except Exception:
+            pass
+        if _LOCKED_PATTERN.search(_shell_output(d, "dumpsys window policy")):
+            raise PreflightFailed("màn hình đang khóa")
+        return "đã mở khóa"
+    return "sáng, không khóa"
+
+
+def check_login(d) -> str:
+    d.app_start(ZALO_PACKAGE)
+    deadline = time.time() + LOGIN_TIMEOUT
+    while time.time() < deadline:
+        if d(resourceId=RID_LOGIN).exists:
+            raise PreflightFailed("Zalo chưa đăng nhập")
+        if any(d(resourceId=rid).exists for rid in RID_LOGGED_IN):
+            return "đã đăng nhập"
+        time.sleep(0.5)
+    return "không xác định"  # không chặn: flow() sẽ kiểm tra lại
+
+
+def check_battery(d) -> str:
+    output = _shell_output(d, "dumpsys battery")
+    match = re.search(r"level:\s*(\d+)", output)
+    if not match:
+        return "không xác định"
+    level = int(match.group(1))
+    charging = re.search(r"(AC|USB|Wireless) powered:\s*true", output) is not None
+    if level < MIN_BATTERY and not charging:
+        raise PreflightFailed(f"pin yếu {level}%")
+    return f"{level}%{' (đang sạc)' if charging else ''}"
+
+
+class PreflightService:
+    """Chạy preflight song song cho nhiều device, cache kết quả pass theo TTL"""
+
+    def __init__(self, ttl: float = TTL, max_workers: int = WORKERS):
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Dict[str, Any]] = {}
+
+    def cached(self, device_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            result = self._cache.get(device_id)
+        if result and result["ok"] and time.time() - result["checked_at"] < self.ttl:
+            return dict(result, cached=True)
+        return None
+
+    def invalidate(self, device_id: Optional[str] = None):
+        with self._lock:
+            if device_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(device_id, None)
+
+    def probe(self, device_id: str, connect: Callable[[str], Any], adb_check: bool = True) -> Tuple[Dict[str, Any], Any]:
+        """Chạy các check cho một device, trả về (result, device đã connect hoặc None)"""
+        checks: Dict[str, Dict[str, Any]] = {}
+        dev = None
+        reason = None
+
+        def run(name: str, func, *args):
+            started = time.perf_counter()
+            try:
+                detail = func(*args)
+                checks[name] = {"ok": True, "detail": detail}
+            except PreflightFailed as e:
+                checks[name] = {"ok": False, "detail": str(e)}
+                raise
+            except Exception as e:
+                checks[name] = {"ok": False, "detail": f"{type(e).__name__}: {e}"}
+                raise PreflightFailed(f"{name}: {e}")
+            finally:
+                checks[name]["seconds"] = round(time.perf_counter() - started, 3)
+
+        def connect_device():
+            nonlocal dev
+            dev = connect(device_id)
+            if not dev.connect():
+                raise PreflightFailed("không kết nối được uiautomator2")
+            return dev.d.info.get("productName", "ok")
+
+        with step_timer(device_id, "preflight"):
+            try:
+                if adb_check:
+                    run("adb", check_adb, device_id)
+                run("rpc", connect_device)
+                run("screen", check_screen, dev.d)
+                run("app", lambda: dev.d.app_current().get("package", ""))
+                if CHECK_LOGIN:
+                    run("login", check_login, dev.d)
+                run("battery", check_battery, dev.d)
+            except PreflightFailed as e:
+                reason = str(e)
+
+        ok = reason is None
+        result = {"device": device_id, "ok": ok, "reason": reason, "checks": checks,
+                  "checked_at": time.time(), "cached": False}
+        with self._lock:
+            self._cache[device_id] = result
+        if not ok and dev is not None:
+            try:
+                dev.disconnect()
+            except Exception:
+                pass
+            dev = None
+        return result, dev
+
+    def check_devices(self, device_ids: Iterable[str], connect: Callable[[str], Any], adb_check: bool = True,
+                      force: bool = False) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Any]]:
+        """Preflight song song cho các device (device pass còn trong TTL thì dùng cache)
+
+        Returns (results theo device_id, device đã connect theo device_id để dùng lại).
+        """
+        device_ids = list(dict.fromkeys(device_ids))
+        results: Dict[str, Dict[str, Any]] = {}
+        pending: List[str] = []
+        for device_id in device_ids:
+            cached = None if force else self.cached(device_id)
+            if cached:
+                results[device_id] = cached
+            else:
+                pending.append(device_id)
+
+        connected: Dict[str, Any] = {}
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending)),
+                                    thread_name_prefix="preflight") as executor:
+                futures = {device_id: executor.submit(self.probe, device_id, connect, adb_check)
+                           for device_id in pending}
+                for device_id, future in futures.items():
+                    try:
+                        result, dev = future.result()
+                    except Exception as e:
+                        result, dev = {"device": device_id, "ok": False, "reason": str(e), "checks": {},
+                                       "checked_at": time.time(), "cached": False}, None
+                    results[device_id] = result
+                    if dev is not None:
+                        connected[device_id] = dev
+        return results, connected
+
+
+def schedule_healthy_pairs(device_pairs: List[Tuple[Dict[str, Any], Dict[str, Any]]],
+                           healthy: Callable[[Dict[str, Any]], bool], repair: bool = REPAIR_PAIRS):
+    """Chỉ chạy các cặp mà cả hai device đã pass preflight
+
+    Cặp mà cả hai pass giữ nguyên index (conversation pair_<index>); cặp có máy
+    hỏng bị bỏ cả cặp. repair=True (opt-in) thì máy pass trong các cặp hỏng được
+    ghép lại với nhau, dùng lại index của các cặp hỏng theo thứ tự.
+    Returns (list (index, device1, device2), list (index, device) không có cặp).
+    """
+    scheduled = []
+    free_indexes = []
+    orphans = []
+    for pair_index, (device1, device2) in enumerate(device_pairs, 1):
+        ok1, ok2 = healthy(device1), healthy(device2)
+        if ok1 and ok2:
+            scheduled.append((pair_index, device1, device2))
+            continue
+        free_indexes.append(pair_index)
+        orphans.extend((pair_index, device) for device, ok in ((device1, ok1), (device2, ok2)) if ok)
+    if not repair:
+        return scheduled, orphans
+    while len(orphans) >= 2:
+        scheduled.append((free_indexes.pop(0), orphans.pop(0)[1], orphans.pop(0)[1]))
+    unpaired = [(free_indexes[0], device) for _, device in orphans]
+    scheduled.sort(key=lambda item: item[0])
+    return scheduled, unpaired
+
+
+_service: Optional[PreflightService] = None
+_service_lock = threading.Lock()
+
+
+def get_preflight_service() -> PreflightService:
+    """PreflightService dùng chung của process (cache giữ qua các run)"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = PreflightService()
+        return _service
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Sampling Profiler
+Profiler lấy mẫu (không instrument) cho tất cả thread của automation.
+
+Một daemon thread định kỳ đọc sys._current_frames(), gom stack theo vai trò
+của thread (pair, device, writer, gui, api...) và đếm số lần xuất hiện.
+Khi dừng, kết quả được ghi ra file "collapsed stacks" tương thích
+flamegraph.pl / speedscope / inferno:
+
+    device;flow (core1.py:4360);run_conversation (core1.py:3084);... 42
+
+Mode "cpu" (mặc định khi có psutil) chỉ tính mẫu của thread có CPU time tăng
+kể từ lần lấy mẫu trước, nên thread đang sleep/đợi barrier không làm nhiễu
+kết quả. Mode "wall" tính mọi mẫu.
+
+Usage:
+    python core1.py --profile
+    POST /api/profiler {"action": "start"} ... {"action": "stop"}
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import psutil
+except ImportError:  # psutil là optional, chỉ cần cho mode "cpu"
+    psutil = None
+
+PROFILE_DIR = os.environ.get("AUTOMATION_PROFILE_DIR", "profiles")
+MAX_DEPTH = 64
+
+# (role, regex trên thread name) - khớp theo thứ tự
+ROLE_PATTERNS: List[Tuple[str, "re.Pattern"]] = [
+    ("pair", re.compile(r"^PairThread-")),
+    ("device", re.compile(r"^Device-|^DeviceWorker|adb-logcat")),
+    ("writer", re.compile(r"_monitor|log-retention|writer|RunLog", re.IGNORECASE)),
+    ("api", re.compile(r"process_request_thread|werkzeug", re.IGNORECASE)),
+]
+
+
+def classify_thread(name: str) -> str:
+    """Vai trò của thread dựa trên tên"""
+    if name == "MainThread":
+        return "gui" if "PyQt6.QtWidgets" in sys.modules else "main"
+    for role, pattern in ROLE_PATTERNS:
+        if pattern.search(name):
+            return role
+    return "other"
+
+
+class SamplingProfiler:
+    """Lấy mẫu stack của mọi thread theo chu kỳ, gom theo vai trò"""
+
+    def __init__(self, interval: float = 0.01, mode: str = "cpu"):
+        if mode == "cpu" and psutil is None:
+            mode = "wall"
+        self.interval = interval
+        self.mode = mode
+        self.samples: Counter = Counter()
+        self.samples_by_role: Counter = Counter()
+        self.started_at: Optional[datetime] = None
+        self.elapsed = 0.0
+        self._labels: Dict[object, str] = {}
+        self._last_cpu: Dict[int, float] = {}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop_event.clear()
+        self.started_at = datetime.now()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        start = time.perf_counter()
+        own_ident = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            try:
+                self._sample(own_ident)
+            except Exception:
+                # Profiler không bao giờ được làm hỏng run
+                pass
+        self.elapsed = time.perf_counter() - start
+
+    def _busy_threads(self) -> Optional[set]:
+        """native_id của các thread có CPU time tăng kể từ lần trước (mode cpu)"""
+        if self.mode != "cpu":
+            return None
+        busy = set()
+        current = {}
+        for t in psutil.Process().threads():
+            cpu = t.user_time + t.system_time
+            current[t.id] = cpu
+            if cpu > self._last_cpu.get(t.id, 0.0):
+                busy.add(t.id)
+        self._last_cpu = current
+        return busy
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            label = label.replace(";", ":")
+            self._labels[code] = label
+        return label
+
+    def _sample(self, own_ident: int):
+        busy = self._busy_threads()
+        threads = {t.ident: t for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            thread = threads.get(ident)
+            if busy is not None and (thread is None or thread.native_id not in busy):
+                continue
+            role = classify_thread(thread.name if thread else "")
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(role)
+            self.samples[";".join(reversed(stack))] += 1
+            self.samples_by_role[role] += 1
+
+    def write_collapsed(self, path: Optional[str] = None) -> str:
+        """Ghi collapsed stacks (mỗi dòng: frames;... count) và trả về đường dẫn"""
+        if path is None:
+            stamp = (self.started_at or datetime.now()).strftime("%Y%m%d_%H%M%S")
+            path = os.path.join(PROFILE_DIR, f"profile_{stamp}.collapsed")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def summary(self) -> Dict[str, object]:
+        return {
+            "running": self.running,
+            "mode": self.mode,
+            "interval": self.interval,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "samples_by_role": dict(self.samples_by_role),
+            "unique_stacks": len(self.samples),
+        }
+
+
+_profiler: Optional[SamplingProfiler] = None
+_profiler_lock = threading.Lock()
+
+
+def start_profiling(interval: float = 0.01, mode: str = "cpu") -> SamplingProfiler:
+    """Bật profiler dùng chung của process (nếu đang chạy thì giữ nguyên)"""
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None or not _profiler.running:
+            _profiler = SamplingProfiler(interval=interval, mode=mode)
+            _profiler.start()
+            print(f"🔬 Sampling profiler started ({_profiler.mode}, {interval * 1000:.0f}ms)")
+        return _profiler
+
+
+def stop_profiling(path: Optional[str] = None) -> Optional[str]:
+    """Dừng profiler và ghi collapsed stacks, trả về đường dẫn file"""
+    with _profiler_lock:
+        if _profiler is None or not _profiler.running:
+            return None
+        _profiler.stop()
+        output = _profiler.write_collapsed(path)
+        print(f"🔬 Profile written: {output} (samples by role: {dict(_profiler.samples_by_role)})")
+        return output
+
+
+def get_profiler() -> Optional[SamplingProfiler]:
+    return _profiler
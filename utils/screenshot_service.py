@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Screenshot Service
+Chụp screenshot ngoài automation thread: flow chỉ xếp yêu cầu vào hàng đợi,
+worker thread lấy frame từ device, encode và lưu (capture store hoặc file).
+
+- Frame được lấy ở độ phân giải giảm (scale, mặc định 0.5) dạng JPEG qua
+  jsonrpc takeScreenshot của uiautomator2: device tự resize + nén nên số byte
+  qua Wi-Fi ADB ít hơn nhiều so với PNG full-res. Nếu không có jsonrpc thì
+  fallback d.screenshot() (Pillow) rồi resize/encode trong worker.
+- Mỗi device tối đa một screenshot đang chờ và cách nhau ít nhất
+  AUTOMATION_SCREENSHOT_INTERVAL giây; yêu cầu vượt giới hạn bị bỏ qua.
+- request_diagnostics() chạy job chẩn đoán khác (UI dump, app_current, info
+  element lúc lỗi) trên cùng worker, rate limit riêng theo device.
+
+Cấu hình: AUTOMATION_SCREENSHOT_SCALE, AUTOMATION_SCREENSHOT_QUALITY,
+AUTOMATION_SCREENSHOT_INTERVAL, AUTOMATION_SCREENSHOT_WORKERS.
+"""
+
+import base64
+import io
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from utils.capture_store import store_capture
+
+SCALE = float(os.environ.get("AUTOMATION_SCREENSHOT_SCALE", "0.5"))
+QUALITY = int(os.environ.get("AUTOMATION_SCREENSHOT_QUALITY", "60"))
+MIN_INTERVAL = float(os.environ.get("AUTOMATION_SCREENSHOT_INTERVAL", "10"))
+WORKERS = int(os.environ.get("AUTOMATION_SCREENSHOT_WORKERS", "2"))
+
+
+def _encode_image(image, scale: float, quality: int, image_format: str) -> bytes:
+    """Resize + encode ảnh Pillow (chạy trong worker)"""
+    if scale < 1.0:
+        width, height = image.size
+        image = image.resize((max(1, int(width * scale)), max(1, int(height * scale))))
+    buffer = io.BytesIO()
+    if image_format == "PNG":
+        image.save(buffer, format="PNG", optimize=False)
+    else:
+        image.convert("RGB").save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def grab_frame(d, scale: float = SCALE, quality: int = QUALITY, image_format: str = "JPEG") -> Optional[bytes]:
+    """Lấy một frame đã encode từ uiautomator2 device (JPEG giảm độ phân giải hoặc PNG)"""
+    if image_format == "JPEG":
+        jsonrpc = getattr(d, "jsonrpc", None)
+        if jsonrpc is not None:
+            try:
+                # Device tự scale + nén JPEG -> ít byte qua ADB
+                encoded = jsonrpc.takeScreenshot(scale, quality)
+                if encoded:
+                    return base64.b64decode(encoded)
+            except Exception:
+                pass
+    image = d.screenshot()
+    if image is None:
+        return None
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    return _encode_image(image, scale, quality, image_format)
+
+
+class ScreenshotService:
+    """Hàng đợi screenshot dùng chung, rate limit theo device"""
+
+    def __init__(self, scale: float = SCALE, quality: int = QUALITY, min_interval: float = MIN_INTERVAL,
+                 max_workers: int = WORKERS):
+        self.scale = scale
+        self.quality = quality
+        self.min_interval = min_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="screenshot-writer")
+        self._lock = threading.Lock()
+        self._last_request: Dict[str, float] = {}
+        self._pending: Dict[str, Future] = {}
+        self.stats = {"requested": 0, "captured": 0, "rate_limited": 0, "failed": 0}
+
+    def request(self, d, device_id: str, step: str, out_path: Optional[str] = None,
+                scale: Optional[float] = None, force: bool = False) -> Optional[Future]:
+        """Xếp một screenshot vào hàng đợi, trả về Future (kết quả: capture ref hoặc out_path)
+
+        Trả về None nếu bị rate limit (force=True bỏ qua rate limit, dùng cho
+        yêu cầu chụp rõ ràng như Device.screencap).
+        """
+        return self._submit(device_id, force, self._capture, d, device_id, step, out_path,
+                            self.scale if scale is None else scale)
+
+    def request_job(self, device_id: str, job: Callable[[], Any], force: bool = False) -> Optional[Future]:
+        """Chạy job() trên worker (chẩn đoán lúc lỗi), rate limit riêng với screenshot của device"""
+        return self._submit(f"{device_id}#job", force, job)
+
+    def _submit(self, key: str, force: bool, func: Callable[..., Any], *args: Any) -> Optional[Future]:
+        now = time.monotonic()
+        with self._lock:
+            self.stats["requested"] += 1
+            pending = self._pending.get(key)
+            if not force and ((pending is not None and not pending.done())
+                              or now - self._last_request.get(key, float("-inf")) < self.min_interval):
+                self.stats["rate_limited"] += 1
+                return None
+            self._last_request[key] = now
+            future = self._executor.submit(func, *args)
+            self._pending[key] = future
+        return future
+
+    def _capture(self, d, device_id: str, step: str, out_path: Optional[str], scale: float) -> Optional[str]:
+        try:
+            image_format = "PNG" if out_path and out_path.lower().endswith(".png") else "JPEG"
+            frame = grab_frame(d, scale, self.quality, image_format)
+            if frame is None:
+                raise RuntimeError("device không trả về ảnh")
+            if out_path:
+                os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+                with open(out_path, "wb") as f:
+                    f.write(frame)
+                result = out_path
+            else:
+                result = store_capture(device_id, step, "screenshot", frame, scale=scale)
+            with self._lock:
+                self.stats["captured"] += 1
+            return result
+        except Exception:
+            with self._lock:
+                self.stats["failed"] += 1
+            raise
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+_service: Optional[ScreenshotService] = None
+_service_lock = threading.Lock()
+
+
+def get_screenshot_service() -> ScreenshotService:
+    """ScreenshotService dùng chung của process (tạo khi cần)"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ScreenshotService()
+        return _service
+
+
+def request_screenshot(d, device_id: str, step: str, **kwargs: Any) -> Optional[Future]:
+    """Xếp screenshot vào service dùng chung; không bao giờ raise (chỉ dùng cho debug)"""
+    try:
+        return get_screenshot_service().request(d, device_id, step, **kwargs)
+    except Exception as e:
+        print(f"⚠️ Không xếp được screenshot cho {device_id}: {e}")
+        return None
+
+
+def request_diagnostics(device_id: str, job: Callable[[], Any]) -> Optional[Future]:
+    """Xếp job chẩn đoán (UI dump, info device...) vào worker dùng chung; không bao giờ raise"""
+    try:
+        return get_screenshot_service().request_job(device_id, job)
+    except Exception as e:
+        print(f"⚠️ Không xếp được job chẩn đoán cho {device_id}: {e}")
+        return None
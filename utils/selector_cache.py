@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Selector Cache
+Nhớ selector nào trong một danh sách fallback đã thành công cho từng phần
+tử logic ("chat_input", "send_button", "search_input"...) theo từng
+(model máy, version Zalo), để lần sau thử selector đó trước.
+
+Trên máy mà chỉ selector thứ 4 khớp, lần gửi đầu vẫn trả 3 timeout; các lần
+sau (kể cả run sau, vì cache được lưu ra file) chỉ tốn một lần exists().
+
+    for selector in ordered_selectors(dev, "send_button", send_selectors):
+        if dev.d(**selector).exists(timeout=2):
+            dev.d(**selector).click()
+            remember_selector(dev, "send_button", selector)
+            break
+
+Tự học lại: khi selector đã học không còn khớp, vòng lặp đi tiếp theo thứ tự
+gốc và selector khớp mới sẽ thay thế. Khi Zalo update, version đổi nên cache
+bắt đầu lại từ đầu cho context mới.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+CACHE_FILE = os.environ.get("AUTOMATION_SELECTOR_CACHE", os.path.join("config", "selector_cache.json"))
+ZALO_PACKAGE = "com.zing.zalo"
+FORMAT_VERSION = 1
+
+
+def selector_key(selector: Any) -> str:
+    """Định danh ổn định của một selector (dict, tuple...)"""
+    return json.dumps(selector, sort_keys=True, ensure_ascii=False)
+
+
+class SelectorResolver:
+    """Thứ tự thử selector theo kết quả đã học, persist ra JSON"""
+
+    def __init__(self, path: Optional[str] = CACHE_FILE):
+        # Đường dẫn tuyệt đối: lần save lúc thoát không phụ thuộc cwd khi đó
+        self.path = os.path.abspath(path) if path else None
+        self._lock = threading.Lock()
+        # context ("model|zalo_version") -> element -> {"winner", "hits", "relearned", "updated"}
+        self._entries: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._contexts: Dict[str, str] = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == FORMAT_VERSION:
+                self._entries = data.get("contexts", {})
+        except Exception as e:
+            print(f"⚠️ Không đọc được selector cache {self.path}: {e}")
+
+    def save(self):
+        """Ghi cache (atomic) nếu có thay đổi"""
+        with self._lock:
+            if not self._dirty or not self.path:
+                return
+            # Serialize trong lock: thread khác có thể đang remember()
+            payload = json.dumps({"version": FORMAT_VERSION, "contexts": self._entries},
+                                 ensure_ascii=False, indent=2)
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"⚠️ Không lưu được selector cache {self.path}: {e}")
+
+    def device_context(self, dev) -> str:
+        """'model|zalo_version' của device (lấy một lần mỗi lần connect)"""
+        device_id = getattr(dev, "device_id", None) or "default"
+        context = self._contexts.get(device_id)
+        if context is not None:
+            return context
+        d = getattr(dev, "d", dev)
+        model = version = "unknown"
+        try:
+            model = d.device_info.get("model") or model
+        except Exception:
+            try:
+                model = d.info.get("productName") or model
+            except Exception:
+                pass
+        try:
+            version = d.app_info(ZALO_PACKAGE).get("versionName") or version
+        except Exception:
+            pass
+        context = f"{model}|{version}"
+        self._contexts[device_id] = context
+        return context
+
+    def forget_device(self, device_id: str):
+        """Bỏ context đã tính của device (gọi khi connect lại: Zalo có thể đã update)"""
+        self._contexts.pop(device_id, None)
+
+    def ordered(self, context: str, element: str, candidates: List[Any]) -> List[Any]:
+        """candidates với selector đã học (nếu có trong danh sách) lên đầu"""
+        entry = self._entries.get(context, {}).get(element)
+        if not entry:
+            return list(candidates)
+        winner = entry["winner"]
+        for index, candidate in enumerate(candidates):
+            if selector_key(candidate) == winner:
+                return [candidate] + list(candidates[:index]) + list(candidates[index + 1:])
+        return list(candidates)
+
+    def remember(self, context: str, element: str, selector: Any):
+        """Ghi nhận selector vừa thành công cho element"""
+        key = selector_key(selector)
+        changed = False
+        with self._lock:
+            elements = self._entries.setdefault(context, {})
+            entry = elements.get(element)
+            if entry is None or entry["winner"] != key:
+                relearned = entry["relearned"] + 1 if entry else 0
+                elements[element] = {"winner": key, "hits": 1, "relearned": relearned,
+                                     "updated": time.strftime("%Y-%m-%d %H:%M:%S")}
+                changed = True
+            else:
+                entry["hits"] += 1
+            self._dirty = True
+        if changed:
+            # Winner mới hiếm khi đổi -> ghi ngay; số hits được ghi lúc thoát
+            self.save()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return json.loads(json.dumps(self._entries))
+
+
+_resolver: Optional[SelectorResolver] = None
+_resolver_lock = threading.Lock()
+
+
+def get_selector_resolver() -> SelectorResolver:
+    """SelectorResolver dùng chung của process (load cache lần đầu dùng)"""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = SelectorResolver()
+            atexit.register(_resolver.save)
+        return _resolver
+
+
+def ordered_selectors(dev, element: str, candidates: List[Any]) -> List[Any]:
+    """Danh sách fallback của element, selector đã thành công trên loại máy này lên trước"""
+    resolver = get_selector_resolver()
+    return resolver.ordered(resolver.device_context(dev), element, candidates)
+
+
+def remember_selector(dev, element: str, selector: Any):
+    """Ghi nhận selector đã thành công cho element trên device"""
+    resolver = get_selector_resolver()
+    resolver.remember(resolver.device_context(dev), element, selector)
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Device Session Recorder
+Ghi toàn bộ chuỗi RPC uiautomator2 của một device (request, response, thời
+gian, UI hierarchy) vào một file session gọn để replay lại flow() không cần
+điện thoại (xem benchmarks/replay_device.py).
+
+File session là JSON lines nén gzip, mỗi device một file:
+    {"type": "header", "device": "...", "version": 1, "started_at": "..."}
+    {"type": "snapshot", "id": "3f2a...", "xml": "<hierarchy>..."}   (mỗi hierarchy chỉ ghi một lần)
+    {"type": "rpc", "seq": 12, "t": 4.512, "dur": 0.031, "method": "selector.exists",
+     "selector": [{"resourceId": "..."}], "args": [], "kwargs": {"timeout": 3}, "result": true}
+    {"type": "meta", "key": "conversation", "value": {...}}
+
+Bật bằng AUTOMATION_RECORD_SESSION=1 (chỉ RPC + các dump mà flow tự gọi) hoặc
+=full (chụp thêm hierarchy sau mỗi thao tác làm đổi màn hình - tốn thêm một
+dump_hierarchy cho mỗi click/set_text/press). Thư mục: AUTOMATION_SESSION_DIR.
+"""
+
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+_MODE = os.environ.get("AUTOMATION_RECORD_SESSION", "0").lower()
+ENABLED = _MODE not in ("0", "false", "no", "")
+SNAPSHOTS = _MODE == "full"
+SESSION_DIR = os.environ.get("AUTOMATION_SESSION_DIR", "sessions")
+FORMAT_VERSION = 1
+FLUSH_EVERY = 50
+
+# RPC làm thay đổi màn hình -> chụp hierarchy sau đó (mode full)
+MUTATING_METHODS = {"click", "long_click", "click_exists", "set_text", "clear_text", "send_keys",
+                    "press", "app_start", "app_stop", "swipe", "shell"}
+# Thuộc tính mà việc đọc là một RPC
+_DEVICE_RPC_PROPERTIES = {"info", "device_info", "window_size", "wlan_ip", "orientation", "clipboard"}
+_SELECTOR_RPC_PROPERTIES = {"info", "count"}
+
+_writers: Dict[str, "SessionWriter"] = {}
+_writers_lock = threading.Lock()
+
+
+def _encode(value: Any) -> Any:
+    """Chuyển response về dạng JSON được (ảnh, object lạ -> placeholder)"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, dict):
+        return {str(k): _encode(v) for k, v in value.items()}
+    if isinstance(value, tuple) and hasattr(value, "_fields"):
+        # namedtuple (vd. ShellResponse của d.shell) -> giữ tên field để replay dựng lại
+        record = {"__type__": type(value).__name__}
+        record.update((field, _encode(v)) for field, v in zip(value._fields, value))
+        return record
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    if isinstance(value, (bytes, bytearray)):
+        return {"$bytes": len(value)}
+    return {"$repr": repr(value)[:200]}
+
+
+class SessionWriter:
+    """Ghi một session (gzip JSON lines) cho một device, thread-safe"""
+
+    def __init__(self, path: str, device_id: str):
+        self.path = path
+        self.device_id = device_id
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._seq = 0
+        self._pending = 0
+        self._snapshots = set()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._write({"type": "header", "device": device_id, "version": FORMAT_VERSION,
+                     "started_at": datetime.now().isoformat(), "snapshots": SNAPSHOTS})
+
+    def _write(self, record: Dict[str, Any]):
+        if self._file is None:
+            return
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._pending += 1
+        if self._pending >= FLUSH_EVERY:
+            # sync flush: phần đã ghi vẫn đọc được nếu process bị kill
+            self._file.flush()
+            self._pending = 0
+
+    def snapshot(self, xml: str) -> str:
+        """Ghi hierarchy (nếu chưa có) và trả về id"""
+        snapshot_id = hashlib.sha1(xml.encode("utf-8")).hexdigest()[:16]
+        with self._lock:
+            if snapshot_id not in self._snapshots:
+                self._snapshots.add(snapshot_id)
+                self._write({"type": "snapshot", "id": snapshot_id, "xml": xml})
+        return snapshot_id
+
+    def rpc(self, method: str, selector: Optional[List[Dict[str, Any]]], args, kwargs,
+            start: float, duration: float, result: Any = None, error: Optional[BaseException] = None,
+            after: Optional[str] = None):
+        record = {"type": "rpc", "t": round(start - self._origin, 4), "dur": round(duration, 4),
+                  "method": method}
+        if selector is not None:
+            record["selector"] = selector
+        if args:
+            record["args"] = _encode(args)
+        if kwargs:
+            record["kwargs"] = _encode(kwargs)
+        if error is not None:
+            record["error"] = type(error).__name__
+            record["message"] = str(error)[:500]
+        elif method == "dump_hierarchy" and isinstance(result, str):
+            record["result"] = {"$snapshot": self.snapshot(result)}
+        else:
+            record["result"] = _encode(result)
+        if after:
+            record["after"] = after
+        with self._lock:
+            self._seq += 1
+            record["seq"] = self._seq
+            self._write(record)
+
+    def meta(self, key: str, value: Any):
+        with self._lock:
+            self._write({"type": "meta", "key": key, "value": _encode(value)})
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class _RecordedExists:
+    """selector.exists đã ghi: dùng như bool hoặc gọi exists(timeout=...)"""
+
+    __slots__ = ("_owner",)
+
+    def __init__(self, owner: "RecordingSelector"):
+        self._owner = owner
+
+    def __bool__(self):
+        return self._owner._record("exists", lambda: bool(self._owner._target.exists))
+
+    def __call__(self, *args, **kwargs):
+        return self._owner._record("exists", lambda: self._owner._target.exists(*args, **kwargs), args, kwargs)
+
+
+class RecordingSelector:
+    """Proxy cho UiObject / XPathSelector, ghi mỗi RPC kèm chuỗi selector"""
+
+    __slots__ = ("_target", "_device", "_chain")
+
+    def __init__(self, target, device: "RecordingDevice", chain: List[Dict[str, Any]]):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_device", device)
+        object.__setattr__(self, "_chain", chain)
+
+    def _record(self, name: str, call, args=(), kwargs=None):
+        return self._device._record(f"selector.{name}", call, args, kwargs, self._chain)
+
+    @property
+    def exists(self):
+        return _RecordedExists(self)
+
+    def child(self, **kwargs) -> "RecordingSelector":
+        return RecordingSelector(self._target.child(**kwargs), self._device, self._chain + [_encode(kwargs)])
+
+    def __getitem__(self, index: int) -> "RecordingSelector":
+        last = dict(self._chain[-1]) if self._chain else {}
+        last["instance"] = index
+        return RecordingSelector(self._target[index], self._device, self._chain[:-1] + [last])
+
+    def __len__(self):
+        return self._record("count", lambda: len(self._target))
+
+    def __getattr__(self, name):
+        if name in _SELECTOR_RPC_PROPERTIES:
+            return self._record(name, lambda: getattr(self._target, name))
+        attr = getattr(self._target, name)
+        if callable(attr) and not name.startswith("_"):
+            def call(*args, **kwargs):
+                return self._record(name, lambda: attr(*args, **kwargs), args, kwargs)
+            return call
+        return attr
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+
+class RecordingDevice:
+    """Proxy cho uiautomator2.Device: ghi mọi RPC vào session của device"""
+
+    __slots__ = ("_target", "_writer")
+
+    def __init__(self, target, writer: SessionWriter):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_writer", writer)
+
+    @property
+    def raw(self):
+        """uiautomator2 device gốc (không ghi)"""
+        return self._target
+
+    def _record(self, method: str, call, args=(), kwargs=None, selector=None):
+        start = time.perf_counter()
+        try:
+            result = call()
+        except Exception as e:
+            self._writer.rpc(method, selector, args, kwargs, start, time.perf_counter() - start, error=e)
+            raise
+        duration = time.perf_counter() - start
+        after = None
+        if SNAPSHOTS and method.rsplit(".", 1)[-1] in MUTATING_METHODS:
+            try:
+                after = self._writer.snapshot(self._target.dump_hierarchy())
+            except Exception:
+                pass
+        self._writer.rpc(method, selector, args, kwargs, start, duration, result=result, after=after)
+        return result
+
+    def __call__(self, **kwargs) -> RecordingSelector:
+        return RecordingSelector(self._target(**kwargs), self, [_encode(kwargs)])
+
+    def xpath(self, xpath: str, *args, **kwargs) -> RecordingSelector:
+        return RecordingSelector(self._target.xpath(xpath, *args, **kwargs), self, [{"xpath": xpath}])
+
+    def __getattr__(self, name):
+        if name in _DEVICE_RPC_PROPERTIES:
+            return self._record(name, lambda: getattr(self._target, name))
+        attr = getattr(self._target, name)
+        if callable(attr) and not name.startswith("_"):
+            def call(*args, **kwargs):
+                return self._record(name, lambda: attr(*args, **kwargs), args, kwargs)
+            return call
+        return attr
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+
+def _session_path(device_id: str) -> str:
+    safe_id = device_id.replace(":", "_").replace(".", "_")
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(SESSION_DIR, f"{safe_id}_{stamp}.session.jsonl.gz")
+
+
+def record_device(d, device_id: str, path: Optional[str] = None):
+    """Bọc uiautomator2 device để ghi session nếu recording đang bật"""
+    if not ENABLED or d is None or isinstance(d, RecordingDevice):
+        return d
+    close_session(device_id)
+    writer = SessionWriter(path or _session_path(device_id), device_id)
+    with _writers_lock:
+        _writers[device_id] = writer
+    if SNAPSHOTS:
+        try:
+            writer.snapshot(d.dump_hierarchy())
+        except Exception:
+            pass
+    print(f"🎬 Recording session: {writer.path}")
+    return RecordingDevice(d, writer)
+
+
+def annotate(device_id: str, key: str, value: Any):
+    """Ghi thêm context (conversation, số đối tác...) vào session của device để replay"""
+    writer = _writers.get(device_id)
+    if writer is not None:
+        writer.meta(key, value)
+
+
+def close_session(device_id: str):
+    with _writers_lock:
+        writer = _writers.pop(device_id, None)
+    if writer is not None:
+        writer.close()
+
+
+def close_all():
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+
+atexit.register(close_all)
+
+
+class Session:
+    """Session đã ghi: header, danh sách RPC, snapshots theo id và meta"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.header: Dict[str, Any] = {}
+        self.rpcs: List[Dict[str, Any]] = []
+        self.snapshots: Dict[str, str] = {}
+        self.meta: Dict[str, Any] = {}
+        # snapshot_at[i]: id của hierarchy mới nhất đã biết trước rpc thứ i
+        self.snapshot_at: List[Optional[str]] = []
+
+    @property
+    def device_id(self) -> str:
+        return self.header.get("device", os.path.basename(self.path))
+
+
+def load_session(path: str) -> Session:
+    """Đọc file session (gzip hoặc JSON lines thường); dòng cuối bị cắt dở được bỏ qua"""
+    session = Session(path)
+    opener = gzip.open if path.endswith(".gz") else open
+    latest = None
+    with opener(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                kind = record.get("type")
+                if kind == "header":
+                    session.header = record
+                elif kind == "snapshot":
+                    session.snapshots[record["id"]] = record["xml"]
+                    latest = record["id"]
+                elif kind == "meta":
+                    session.meta[record["key"]] = record["value"]
+                elif kind == "rpc":
+                    session.snapshot_at.append(latest)
+                    session.rpcs.append(record)
+                    result = record.get("result")
+                    if isinstance(result, dict) and "$snapshot" in result:
+                        latest = result["$snapshot"]
+                    if record.get("after"):
+                        latest = record["after"]
+        except (EOFError, OSError):
+            pass  # file gzip chưa close (process bị kill) - giữ phần đã đọc
+    return session
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Status Hub
+Trạng thái device của automation giữ trong bộ nhớ process. Automation thread
+publish (qua core1.update_shared_status), các consumer nhận delta thay vì đọc
+lại status.json / bảng devices mỗi giây:
+
+- Qt widget: subscribe(callback) -> emit signal, chỉ vẽ lại row đã đổi
+- API: /api/status (snapshot) và /api/status/stream (SSE, wait_for_change)
+
+Mỗi lần publish có nội dung mới tăng version của hub; record của device mang
+version của lần đổi cuối, nên changes_since(v) trả đúng các device đã đổi sau v.
+Publish lặp lại y hệt trạng thái cũ không tạo delta.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+_TRACKED_FIELDS = ("status", "message", "progress", "current_message_id")
+
+
+def compute_overall_status(devices: Dict[str, Dict[str, Any]]) -> str:
+    """Trạng thái tổng (cùng quy tắc với status.json cũ)"""
+    statuses = [d.get("status") for d in devices.values()]
+    if not statuses:
+        return "idle"
+    if all(s == "completed" for s in statuses):
+        return "completed"
+    if any(s == "error" for s in statuses):
+        return "error"
+    if any(s == "running" for s in statuses):
+        return "running"
+    return "idle"
+
+
+class StatusHub:
+    """Bảng trạng thái device in-memory với delta theo version"""
+
+    def __init__(self):
+        self._changed = threading.Condition()
+        self._devices: Dict[str, Dict[str, Any]] = {}
+        self._version = 0
+        self._reset_version = 0
+        self._latest: Optional[str] = None
+        self._subscribers: List[Callable[[Dict[str, Any]], None]] = []
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def publish(self, device_id: str, status: str, message: str = "", progress: int = 0,
+                current_message_id=None, **extra) -> Optional[Dict[str, Any]]:
+        """Cập nhật trạng thái một device, trả về delta (None nếu không có gì đổi)"""
+        now = time.time()
+        record = {
+            "status": status,
+            "message": message,
+            "progress": progress,
+            "current_message_id": current_message_id,
+            **extra,
+        }
+        with self._changed:
+            previous = self._devices.get(device_id)
+            if previous is not None and all(previous.get(k) == record.get(k) for k in _TRACKED_FIELDS) \
+                    and all(previous.get(k) == v for k, v in extra.items()):
+                return None
+            self._version += 1
+            record.update({
+                "device_id": device_id,
+                "last_update": now,
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)),
+                "version": self._version,
+            })
+            self._devices[device_id] = record
+            self._latest = device_id
+            delta = self._delta({device_id: dict(record)})
+            subscribers = list(self._subscribers)
+            self._changed.notify_all()
+        for callback in subscribers:
+            try:
+                callback(delta)
+            except Exception:
+                pass  # consumer lỗi không được làm hỏng automation thread
+        return delta
+
+    def _delta(self, devices: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "version": self._version,
+            "devices": devices,
+            "overall_status": compute_overall_status(self._devices),
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Toàn bộ trạng thái (format giống status.json: devices, overall_status, last_update)"""
+        with self._changed:
+            devices = {device_id: dict(record) for device_id, record in self._devices.items()}
+            return {
+                "devices": devices,
+                "overall_status": compute_overall_status(devices),
+                "last_update": max((d["last_update"] for d in devices.values()), default=0),
+                "version": self._version,
+            }
+
+    def changes_since(self, version: int) -> Dict[str, Any]:
+        """Delta gồm các device đổi sau version (hub đã reset sau version -> trả toàn bộ kèm reset=True)"""
+        with self._changed:
+            if version > self._version or version < self._reset_version:
+                delta = self._delta({k: dict(v) for k, v in self._devices.items()})
+                delta["reset"] = True
+                return delta
+            return self._delta({k: dict(v) for k, v in self._devices.items() if v["version"] > version})
+
+    def wait_for_change(self, version: int, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Chờ tới khi hub có version mới hơn (hoặc timeout -> None), trả về delta"""
+        with self._changed:
+            if not self._changed.wait_for(lambda: self._version != version, timeout=timeout):
+                return None
+        return self.changes_since(version)
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """Record của device cập nhật gần nhất"""
+        with self._changed:
+            record = self._devices.get(self._latest) if self._latest else None
+            return dict(record) if record else None
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]) -> Callable[[], None]:
+        """Đăng ký callback(delta) - gọi trên thread publish; trả về hàm unsubscribe"""
+        with self._changed:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._changed:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def reset(self):
+        """Xóa trạng thái (đầu run); subscriber nhận delta reset"""
+        with self._changed:
+            self._devices.clear()
+            self._latest = None
+            self._version += 1
+            self._reset_version = self._version
+            delta = self._delta({})
+            delta["reset"] = True
+            subscribers = list(self._subscribers)
+            self._changed.notify_all()
+        for callback in subscribers:
+            try:
+                callback(delta)
+            except Exception:
+                pass
+
+
+_hub = StatusHub()
+
+
+def get_status_hub() -> StatusHub:
+    """StatusHub dùng chung của process"""
+    return _hub
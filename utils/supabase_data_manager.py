@@ -273,7 +273,12 @@ class SupabaseDataManager:
             return False
 
 # Backward compatibility - create instance that can be imported
-supabase_data_manager = SupabaseDataManager()
+# (None khi chưa cấu hình Supabase để module vẫn import được khi chạy offline)
+try:
+    supabase_data_manager = SupabaseDataManager()
+except Exception as e:
+    print(f"Supabase data manager unavailable: {e}")
+    supabase_data_manager = None
 
 # Legacy function wrappers for backward compatibility
 def load_phone_mapping():
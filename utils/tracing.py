@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Run Trace Recorder
+Ghi span (start, duration, device, group, message_id) vào buffer trong bộ nhớ
+và export thành Chrome trace JSON (mở bằng chrome://tracing hoặc ui.perfetto.dev).
+
+Mỗi nhóm (cặp máy) là một "process", mỗi device là một "thread" trên timeline,
+nên cả 2 máy của một cặp và tất cả cặp của một run nằm trên cùng một timeline.
+Category "blocked" (barrier, đợi lượt) tách biệt với "ui" (thao tác trên máy).
+
+Các bước đo bởi utils.metrics.step_timer / timed_step tự động ghi span ở đây.
+Ghi span chỉ là một deque.append (atomic dưới GIL) nên chi phí rất thấp.
+Tắt bằng AUTOMATION_TRACE=0.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+ENABLED = os.environ.get("AUTOMATION_TRACE", "1").lower() not in ("0", "false", "no")
+TRACE_DIR = os.environ.get("AUTOMATION_TRACE_DIR", "traces")
+MAX_EVENTS = 200000
+
+# Các bước mà thời gian là chờ máy khác, không phải thao tác UI
+BLOCKING_STEPS = {"barrier_wait", "barrier_signal", "turn_wait"}
+
+_events: deque = deque(maxlen=MAX_EVENTS)
+_origin_ns = time.perf_counter_ns()
+_run_info: Dict[str, Any] = {}
+_thread_context = threading.local()
+
+
+def bind_context(device: Optional[str] = None, group: Any = None):
+    """Gắn device/group cho thread hiện tại (dùng cho span không có dev)"""
+    if device is not None:
+        _thread_context.device = device
+    if group is not None:
+        _thread_context.group = group
+
+
+def _current(name: str, default=None):
+    return getattr(_thread_context, name, default)
+
+
+def record_span(name: str, category: str, start_ns: int, end_ns: int,
+                device: Optional[str] = None, group: Any = None, **args):
+    """Thêm một span đã hoàn thành vào buffer"""
+    if not ENABLED:
+        return
+    _events.append((name, category, start_ns, end_ns,
+                    device or _current("device") or threading.current_thread().name,
+                    group if group is not None else _current("group"),
+                    args))
+
+
+def category_for(step: str) -> str:
+    return "blocked" if step in BLOCKING_STEPS else "ui"
+
+
+@contextmanager
+def span(name: str, category: str = "ui", device: Optional[str] = None, group: Any = None, **args):
+    """with span("barrier_wait", "blocked", group=1): ..."""
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        record_span(name, category, start, time.perf_counter_ns(), device, group, **args)
+
+
+def start_trace(run_id: Optional[str] = None, **info):
+    """Bắt đầu trace cho run mới (xóa buffer cũ)"""
+    global _origin_ns
+    _events.clear()
+    _origin_ns = time.perf_counter_ns()
+    _run_info.clear()
+    _run_info.update(info)
+    _run_info["run_id"] = run_id or datetime.now().strftime("%Y%m%d_%H%M%S")
+    _run_info["started_at"] = datetime.now().isoformat()
+
+
+def build_chrome_trace() -> Dict[str, Any]:
+    """Chuyển buffer thành Chrome trace format (complete events 'X', đơn vị µs)"""
+    events = []
+    pids: Dict[Any, int] = {}
+    tids: Dict[Tuple[int, str], int] = {}
+
+    for name, category, start_ns, end_ns, device, group, args in list(_events):
+        group_key = group if group is not None else "ungrouped"
+        pid = pids.get(group_key)
+        if pid is None:
+            pid = pids[group_key] = len(pids) + 1
+            label = f"Nhóm {group}" if group is not None else "Ungrouped"
+            events.append({"ph": "M", "name": "process_name", "pid": pid, "tid": 0,
+                           "args": {"name": label}})
+        tid = tids.get((pid, device))
+        if tid is None:
+            tid = tids[(pid, device)] = len(tids) + 1
+            events.append({"ph": "M", "name": "thread_name", "pid": pid, "tid": tid,
+                           "args": {"name": device}})
+        events.append({
+            "ph": "X",
+            "name": name,
+            "cat": category,
+            "pid": pid,
+            "tid": tid,
+            "ts": (start_ns - _origin_ns) / 1000.0,
+            "dur": (end_ns - start_ns) / 1000.0,
+            "args": {k: v for k, v in args.items() if v is not None},
+        })
+
+    return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": dict(_run_info)}
+
+
+def export_chrome_trace(path: Optional[str] = None) -> Optional[str]:
+    """Ghi trace ra file JSON, mặc định <TRACE_DIR>/run_<run_id>.trace.json"""
+    if not ENABLED or not _events:
+        return None
+    run_id = _run_info.get("run_id") or datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = path or os.path.join(TRACE_DIR, f"run_{run_id}.trace.json")
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(build_chrome_trace(), f, ensure_ascii=False, default=str)
+        return path
+    except OSError as e:
+        print(f"⚠️ Không thể ghi trace: {e}")
+        return None